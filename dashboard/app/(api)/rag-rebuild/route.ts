@@ -74,3 +74,23 @@ export async function POST() {
   }
 }
 
+export async function GET(request: Request) {
+  const jobId = new URL(request.url).searchParams.get("job_id") || "";
+  if (!/^[0-9a-f]{32}$/.test(jobId)) {
+    return NextResponse.json({ status: "error", message: "Invalid job_id" }, { status: 400 });
+  }
+  try {
+    const response = await fetch(`${API_URL}/rag/rebuild/${jobId}`, {
+      cache: "no-store",
+      signal: AbortSignal.timeout(10000), // 10 second timeout
+    });
+    const data = await response.json();
+    return NextResponse.json(data, { status: response.status });
+  } catch (error: any) {
+    console.error("RAG rebuild job fetch error:", error);
+    return NextResponse.json(
+      { status: "error", message: error.message || "Failed to connect to orchestrator API" },
+      { status: 500 }
+    );
+  }
+}
@@ -63,7 +63,23 @@ export function RAGStatus() {
     setRebuilding(true);
     try {
       const res = await fetch("/rag-rebuild", { method: "POST" });
-      const data = await res.json();
+      let data = await res.json();
+      // Rebuilds run as a background job; poll until the new version is live
+      if (data.status === "accepted" && data.job_id) {
+        while (true) {
+          await new Promise((resolve) => setTimeout(resolve, 1000));
+          const jobRes = await fetch(`/rag-rebuild?job_id=${data.job_id}&t=${Date.now()}`, { cache: "no-store" });
+          const job = await jobRes.json();
+          if (job.status === "succeeded") {
+            data = { ...job, status: "success" };
+            break;
+          }
+          if (job.status === "failed" || !jobRes.ok) {
+            data = { status: "error", message: job.error || job.message || "Rebuild failed" };
+            break;
+          }
+        }
+      }
       if (data.status === "success") {
         await fetchStatus(); // Refresh status
         const fileMsg = data.file_count !== undefined 
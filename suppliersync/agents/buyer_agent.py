@@ -2,26 +2,27 @@
 import json
 from typing import List
 from core.llm import chat_json
+from core.tracing import span
 from core.prompts import BUYER_PROMPT
-from core.types import PriceChange, AgentTelemetry, AgentResult
+from core.types import AgentTelemetry, AgentResult
+from core.records import PRICE_CHANGES, validate_items
 
 def propose_price_changes(context: str) -> AgentResult:
     system = "You output JSON list of price changes."
     user = f"{BUYER_PROMPT}\nCONTEXT:\n{context}"
-    resp, latency, tokens = chat_json(system, user)
+    with span("llm") as s:
+        resp, latency, tokens = chat_json(system, user)
+        s.bytes = len(user.encode("utf-8")) + len((resp or "").encode("utf-8"))
     tokens_in, tokens_out = tokens
     items: List[dict] = []
-    try:
-        raw = json.loads(resp)
-        raw_items = raw.get("prices", raw)
-        for r in raw_items or []:
-            try:
-                pc = PriceChange(**r)
-                items.append(pc.model_dump())
-            except Exception:
-                continue
-    except Exception:
-        items = []
+    with span("parse") as s:
+        try:
+            raw = json.loads(resp)
+            raw_items = raw.get("prices", raw)
+            items = validate_items(PRICE_CHANGES, raw_items, {"reason": None})
+        except Exception:
+            items = []
+        s.rows = len(items)
     telemetry = AgentTelemetry(
         agent="buyer",
         step="propose_price_changes",
@@ -2,26 +2,27 @@
 import json
 from typing import List
 from core.llm import chat_json
+from core.tracing import span
 from core.prompts import CX_PROMPT
-from core.types import CXAction, AgentTelemetry, AgentResult
+from core.types import AgentTelemetry, AgentResult
+from core.records import CX_ACTIONS, validate_items
 
 def propose_cx_actions(context: str) -> AgentResult:
     system = "You output JSON list of CX actions."
     user = f"{CX_PROMPT}\nCONTEXT:\n{context}"
-    resp, latency, tokens = chat_json(system, user)
+    with span("llm") as s:
+        resp, latency, tokens = chat_json(system, user)
+        s.bytes = len(user.encode("utf-8")) + len((resp or "").encode("utf-8"))
     tokens_in, tokens_out = tokens
     items: List[dict] = []
-    try:
-        raw = json.loads(resp)
-        raw_items = raw.get("actions", raw)
-        for r in raw_items or []:
-            try:
-                a = CXAction(**r)
-                items.append(a.model_dump())
-            except Exception:
-                continue
-    except Exception:
-        items = []
+    with span("parse") as s:
+        try:
+            raw = json.loads(resp)
+            raw_items = raw.get("actions", raw)
+            items = validate_items(CX_ACTIONS, raw_items)
+        except Exception:
+            items = []
+        s.rows = len(items)
     telemetry = AgentTelemetry(
         agent="cx",
         step="propose_actions",
@@ -1,5 +1,5 @@
 
-import sqlite3, json, uuid
+import sqlite3, json, uuid, logging
 from datetime import datetime
 from typing import Dict
 from core.governance import enforce_policy
@@ -7,6 +7,18 @@ from .supplier_agent import propose_supplier_updates
 from .buyer_agent import propose_price_changes
 from .cx_agent import propose_cx_actions
 from core.evals import track_cost
+from core.feed_diff import ensure_hash_table, invalidate_row_hashes
+from core.retrieval import get_retriever
+from core.tracing import trace_run, span, ensure_spans_table, save_trace
+from core.profiling import profile
+from core.memory_profile import memory_profile
+from core.records import Catalog, CATALOG_SELECT_SQL, context_json
+from core.catalog_snapshot import ensure_epoch_table, get_catalog_snapshots
+from core.context_cache import get_context_cache
+from core.database import connect
+from core.metrics import AGENT_LATENCY, AGENT_TOKENS, AGENT_COST
+
+logger = logging.getLogger(__name__)
 
 class Orchestrator:
     """
@@ -20,8 +32,12 @@ class Orchestrator:
     - Automatic schema migration and indexing
     - Price history tracking for governance checks
     - Agent telemetry logging for cost tracking
+    - Per-stage span timings (rows/bytes) persisted per run (core/tracing.py)
     - Run ID generation for traceability
-    
+    - Reference snippets from the RAG vectorstore, retrieved per category/supplier
+    - Catalog served from the shared memory-mapped snapshot with CATALOG_SNAPSHOT=1
+    - Agent contexts assembled from cached per-SKU JSON fragments (core/context_cache.py)
+
     Example:
         >>> orch = Orchestrator("suppliersync.db")
         >>> result = orch.step()
@@ -30,14 +46,32 @@ class Orchestrator:
         >>> print(f"Rejected prices: {len(result['rejected_prices'])}")
     """
     
-    def __init__(self, db_path: str = "suppliersync.db"):
+    def __init__(self, db_path: str = "suppliersync.db", retriever=None, snapshots=None, contexts=None,
+                 record_metrics: bool = True):
         """
         Initialize the Orchestrator with database connection.
-        
+
         Args:
             db_path: Path to SQLite database file
+            retriever: Retriever for agent reference docs (default: the shared
+                process-wide retriever; None if retrieval is disabled)
+            snapshots: Catalog snapshot store (default: the process-wide store
+                of ``db_path``; None if CATALOG_SNAPSHOT is off; False for none)
+            contexts: Serialized-row cache for agent contexts (default: the
+                process-wide cache of ``db_path``; None if CONTEXT_CACHE is off;
+                False for none, e.g. for a short-lived scratch database)
+            record_metrics: Record agent latency, tokens and cost in the
+                process metrics (off for replays, whose LLM calls are not real)
         """
-        self.db = sqlite3.connect(db_path)
+        self.retriever = retriever if retriever is not None else get_retriever()
+        if snapshots is None:
+            snapshots = get_catalog_snapshots(db_path)
+        self.snapshots = None if snapshots is False else snapshots
+        if contexts is None:
+            contexts = get_context_cache(db_path)
+        self.contexts = None if contexts is False else contexts
+        self.record_metrics = record_metrics
+        self.db = connect(db_path)
         self.db.row_factory = sqlite3.Row
         # Enable WAL mode for concurrent reads/writes
         self.db.execute("PRAGMA journal_mode=WAL;")
@@ -53,6 +87,9 @@ class Orchestrator:
         It will:
         - Add run_id columns to existing tables if missing
         - Create rejected_prices table if it doesn't exist
+        - Create product_hashes table (feed reconciliation) if it doesn't exist
+        - Create run_spans / run_memory_sites tables (per-run stage timings and memory) if they don't exist
+        - Create catalog_epoch table (catalog snapshot versions) if it doesn't exist
         - Create indexes for performance optimization
         """
         # Add run_id columns if missing
@@ -76,6 +113,9 @@ class Orchestrator:
                 created_at DATETIME DEFAULT CURRENT_TIMESTAMP
             )
         """)
+        ensure_hash_table(self.db)
+        ensure_spans_table(self.db)
+        ensure_epoch_table(self.db)
         # Create indexes
         self.db.execute("CREATE INDEX IF NOT EXISTS idx_products_sku ON products(sku)")
         self.db.execute("CREATE INDEX IF NOT EXISTS idx_products_active ON products(is_active)")
@@ -84,10 +124,40 @@ class Orchestrator:
         self.db.execute("CREATE INDEX IF NOT EXISTS idx_cx_events_sku_created ON cx_events(sku, created_at)")
         self.db.commit()
 
-    def _fetch_catalog(self):
-        cur = self.db.execute("SELECT sku, name, category, wholesale_price, retail_price FROM products WHERE is_active=1")
-        return [dict(r) for r in cur.fetchall()]
-    
+    def _fetch_catalog(self, publish: bool = True):
+        """The active catalog: a Catalog, or the context cache brought up to date."""
+        with span("fetch_catalog") as s:
+            if self.contexts is not None:
+                # Only rows written since the last refresh are re-read and re-encoded
+                with span("refresh_context_cache") as c:
+                    c.rows = self.contexts.refresh(self.db, lambda: self._load_catalog(publish))
+                catalog = self.contexts
+            else:
+                catalog = self._load_catalog(publish)
+            s.rows = len(catalog)
+        return catalog
+
+    def _load_catalog(self, publish: bool = True) -> Catalog:
+        if self.snapshots is not None:
+            # Unchanged catalog: mapped from the snapshot file, no products query
+            return self.snapshots.catalog(self.db, publish=publish)
+        cur = self.db.cursor()
+        cur.row_factory = None  # Plain tuples: Catalog stores them column-wise
+        catalog = Catalog.from_cursor(cur.execute(CATALOG_SELECT_SQL))
+        cur.close()
+        return catalog
+
+    def _fetch_reference_docs(self, catalog: Catalog) -> Dict[str, list]:
+        """Top-k policy/spec snippets per distinct category and supplier of the active catalog."""
+        if self.retriever is None:
+            return {}
+        cur = self.db.execute("""
+            SELECT DISTINCT s.name FROM products p JOIN suppliers s ON s.id = p.supplier_id
+            WHERE p.is_active=1
+        """)
+        suppliers = [r[0] for r in cur.fetchall()]
+        return self.retriever.context_for(catalog.category, suppliers)
+
     def _fetch_price_history(self, skus: list) -> Dict[str, Dict]:
         """Fetch current price and last change date for given SKUs."""
         if not skus:
@@ -135,11 +205,19 @@ class Orchestrator:
     def _apply_supplier_updates(self, updates, run_id: str):
         for u in updates or []:
             sku, field, new_value, reason = u.get("sku"), u.get("field"), u.get("new_value"), u.get("reason","supplier_update")
+            old_value = None
+            if field in ("wholesale_price","name","category"):
+                row = self.db.execute(f"SELECT {field} FROM products WHERE sku=?", (sku,)).fetchone()
+                old_value = str(row[0]) if row and row[0] is not None else None
             self.db.execute("INSERT INTO supplier_updates(sku, field, old_value, new_value, run_id) VALUES (?,?,?,?,?)",
-                            (sku, field, None, str(new_value), run_id))
+                            (sku, field, old_value, str(new_value), run_id))
             if field in ("wholesale_price","name","category"):
                 self.db.execute(f"UPDATE products SET {field}=? WHERE sku=?", (new_value, sku))
-        self.db.commit()
+        invalidate_row_hashes(self.db, (u.get("sku") for u in updates or []))
+        self._commit()
+        # Reported once committed: events rolled back must not count towards the catalog version
+        if self.contexts is not None:
+            self.contexts.invalidate((u.get("sku") for u in updates or []), supplier_updates=len(updates or []))
 
     def _apply_price_changes(self, approved, run_id: str):
         for p in approved or []:
@@ -150,7 +228,10 @@ class Orchestrator:
             self.db.execute("UPDATE products SET retail_price=? WHERE sku=?", (new_price, sku))
             self.db.execute("INSERT INTO price_events(sku, prev_price, new_price, reason, run_id) VALUES (?,?,?,?,?)",
                             (sku, prev, new_price, reason, run_id))
-        self.db.commit()
+        invalidate_row_hashes(self.db, (p.get("sku") for p in approved or []))
+        self._commit()
+        if self.contexts is not None:
+            self.contexts.invalidate((p.get("sku") for p in approved or []), price_events=len(approved or []))
     
     def _store_rejected_prices(self, rejected, sku_to_current_price: Dict[str, float], run_id: str):
         """Store rejected price changes for governance tracking."""
@@ -164,24 +245,36 @@ class Orchestrator:
                 "INSERT INTO rejected_prices(sku, proposed_price, current_price, reject_reason, reject_details, run_id) VALUES (?,?,?,?,?,?)",
                 (sku, proposed_price, current_price, reject_reason, reject_details, run_id)
             )
-        self.db.commit()
+        self._commit()
+
+    def _commit(self):
+        with span("commit"):
+            self.db.commit()
 
     def _log_agent(self, run_id: str, telemetry):
         cost = track_cost(telemetry.tokens_in, telemetry.tokens_out)
-        self.db.execute(
-            "INSERT INTO agent_logs(agent, step, prompt, response, tokens_in, tokens_out, latency_ms, cost_usd, run_id) VALUES (?,?,?,?,?,?,?,?,?)",
-            (
-                telemetry.agent,
-                telemetry.step,
-                telemetry.prompt,
-                telemetry.response,
-                telemetry.tokens_in,
-                telemetry.tokens_out,
-                telemetry.latency_ms,
-                cost,
-                run_id,
-            ),
-        )
+        if self.record_metrics:
+            AGENT_LATENCY.observe(telemetry.latency_ms / 1000.0, telemetry.agent)
+            AGENT_TOKENS.inc(telemetry.agent, "in", amount=telemetry.tokens_in)
+            AGENT_TOKENS.inc(telemetry.agent, "out", amount=telemetry.tokens_out)
+            AGENT_COST.inc(telemetry.agent, amount=cost)
+        with span("log_agent") as s:
+            self.db.execute(
+                "INSERT INTO agent_logs(agent, step, prompt, response, tokens_in, tokens_out, latency_ms, cost_usd, run_id) VALUES (?,?,?,?,?,?,?,?,?)",
+                (
+                    telemetry.agent,
+                    telemetry.step,
+                    telemetry.prompt,
+                    telemetry.response,
+                    telemetry.tokens_in,
+                    telemetry.tokens_out,
+                    telemetry.latency_ms,
+                    cost,
+                    run_id,
+                ),
+            )
+            s.rows = 1
+            s.bytes = len(telemetry.prompt.encode("utf-8")) + len(telemetry.response.encode("utf-8"))
 
     def step(self):
         """
@@ -214,25 +307,70 @@ class Orchestrator:
         """
         # Generate unique run ID for traceability
         run_id = str(uuid.uuid4())
+        with trace_run(run_id) as trace:
+            try:
+                with memory_profile(trace), span("step"), profile("run", run_id):
+                    result = self._step(run_id)
+            except Exception:
+                # Part of the run may have rolled back: the next refresh reloads the whole catalog
+                if self.contexts is not None:
+                    self.contexts.reset()
+                raise
+            finally:
+                self._save_trace(trace)
+        return result
+
+    def _save_trace(self, trace):
+        """Persist the run's spans; profiling must never fail a run."""
+        try:
+            save_trace(self.db, trace)
+        except sqlite3.Error as e:
+            logger.warning(f"Could not persist spans for run {trace.run_id}: {e}")
+
+    def _serialize(self, catalog: Catalog, extra: dict, indent=None) -> str:
+        with span("serialize_context") as s:
+            context = context_json(catalog, extra, indent)
+            s.bytes = len(context)  # ensure_ascii output: characters == UTF-8 bytes
+        return context
+
+    def _step(self, run_id: str):
         # Execute all operations within a transaction
         with self.db:
             catalog = self._fetch_catalog()
-            context = json.dumps({"catalog": catalog}, indent=2)
-            sup_res = propose_supplier_updates(context)
+            # Retrieval cost scales with categories/suppliers, not SKUs; only added when available
+            with span("fetch_reference_docs") as s:
+                reference_docs = self._fetch_reference_docs(catalog)
+                s.rows = sum(len(v) for v in reference_docs.values())
+            grounding = {"reference_docs": reference_docs} if reference_docs else {}
+            context = self._serialize(catalog, grounding, indent=2)
+            with span("supplier_agent"):
+                sup_res = propose_supplier_updates(context)
             self._log_agent(run_id, sup_res.telemetry)
-            self._apply_supplier_updates(sup_res.items, run_id)
-            catalog = self._fetch_catalog()
-            sku_to_wholesale = {c["sku"]: c["wholesale_price"] for c in catalog}
-            sku_to_category = {c["sku"]: c.get("category") for c in catalog}
+            with span("apply_supplier_updates") as s:
+                self._apply_supplier_updates(sup_res.items, run_id)
+                s.rows = len(sup_res.items or [])
+            # Price changes follow: only the run's final catalog is worth publishing as a snapshot
+            catalog = self._fetch_catalog(publish=False)
             
             # Get proposed price changes first
-            pricing_res = propose_price_changes(json.dumps({"catalog": catalog, "supplier_updates": sup_res.items}))
+            context = self._serialize(catalog, {"supplier_updates": sup_res.items, **grounding})
+            with span("buyer_agent"):
+                pricing_res = propose_price_changes(context)
             self._log_agent(run_id, pricing_res.telemetry)
             
             # Gather price history for governance checks (only for proposed SKUs)
             proposed_skus = [pc.get("sku") for pc in pricing_res.items if pc.get("sku")]
-            price_history = self._fetch_price_history(proposed_skus)
-            current_prices = self._fetch_current_prices(proposed_skus)
+            # Governance only looks up proposed SKUs: map those, not the whole catalog
+            proposed_rows = catalog.select(proposed_skus)
+            del catalog
+            sku_to_wholesale = {sku: row.wholesale_price for sku, row in proposed_rows.items()}
+            sku_to_category = {sku: row.category for sku, row in proposed_rows.items()}
+            with span("fetch_price_history") as s:
+                price_history = self._fetch_price_history(proposed_skus)
+                s.rows = len(price_history)
+            with span("fetch_current_prices") as s:
+                current_prices = self._fetch_current_prices(proposed_skus)
+                s.rows = len(current_prices)
             
             sku_to_current_price = {}
             sku_to_last_price_date = {}
@@ -249,19 +387,30 @@ class Orchestrator:
             # MAP pricing (placeholder - can be extended with a products.map_price column)
             sku_to_map_price = {}  # TODO: Fetch from products table or external source
             
-            approved, rejected = enforce_policy(
-                pricing_res.items,
-                sku_to_wholesale,
-                sku_to_category=sku_to_category,
-                sku_to_current_price=sku_to_current_price,
-                sku_to_last_price_date=sku_to_last_price_date,
-                sku_to_map_price=sku_to_map_price,
-            )
-            self._apply_price_changes(approved, run_id)
-            self._store_rejected_prices(rejected, sku_to_current_price, run_id)
-            cx_res = propose_cx_actions(json.dumps({"catalog": self._fetch_catalog()}))
+            with span("enforce_policy") as s:
+                approved, rejected = enforce_policy(
+                    pricing_res.items,
+                    sku_to_wholesale,
+                    sku_to_category=sku_to_category,
+                    sku_to_current_price=sku_to_current_price,
+                    sku_to_last_price_date=sku_to_last_price_date,
+                    sku_to_map_price=sku_to_map_price,
+                )
+                s.rows = len(pricing_res.items)
+            with span("apply_price_changes") as s:
+                self._apply_price_changes(approved, run_id)
+                s.rows = len(approved)
+            with span("store_rejected_prices") as s:
+                self._store_rejected_prices(rejected, sku_to_current_price, run_id)
+                s.rows = len(rejected)
+            context = self._serialize(self._fetch_catalog(), grounding)
+            with span("cx_agent"):
+                cx_res = propose_cx_actions(context)
             self._log_agent(run_id, cx_res.telemetry)
-            for a in cx_res.items or []:
-                self.db.execute("INSERT INTO cx_events(sku, event_type, details, run_id) VALUES (?,?,?,?)",
-                                (a.get("sku"), "agent_action", json.dumps(a), run_id))
+            with span("store_cx_events") as s:
+                for a in cx_res.items or []:
+                    self.db.execute("INSERT INTO cx_events(sku, event_type, details, run_id) VALUES (?,?,?,?)",
+                                    (a.get("sku"), "agent_action", json.dumps(a), run_id))
+                s.rows = len(cx_res.items or [])
+            self._commit()
         return {"run_id": run_id, "supplier_updates": sup_res.items, "approved_prices": approved, "rejected_prices": rejected, "cx_actions": cx_res.items}
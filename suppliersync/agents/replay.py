@@ -0,0 +1,209 @@
+"""
+Deterministic replay of recorded orchestration runs.
+
+Run with: python -m agents.replay <run_id> [--db suppliersync.db] [--snapshot pre_run_backup.db] [--json]
+
+``agent_logs`` keeps the exact prompt and response of every LLM call of a
+run. A replay copies a snapshot database to a scratch file, runs
+``Orchestrator.step`` on it with ``chat_json`` answering each call with the
+next recorded response (``core.llm.override_chat_json``), and diffs the
+approved prices, rejected prices and all rows written against the original
+run, alongside per-stage timings (core/tracing.py) of both runs. Only
+SupplierSync's own code runs: parsing, governance and writes. The live
+database is never modified.
+
+Replay results match the original only when the snapshot matches the state
+the original run saw (e.g. a backup taken just before it). By default the
+current database is used, which already contains the run's own writes, so
+drift checks and previous prices may differ. ``prompt_matches`` per LLM
+call shows whether the replayed context was byte-identical.
+"""
+
+import os
+import sys
+import json
+import shutil
+import sqlite3
+import argparse
+import tempfile
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from core.llm import override_chat_json
+from core.tracing import load_profile
+
+# Rows each run writes, compared column by column (ids, run_id and timestamps excluded)
+RUN_TABLES: Dict[str, Tuple[str, ...]] = {
+    "supplier_updates": ("sku", "field", "old_value", "new_value"),
+    "price_events": ("sku", "prev_price", "new_price", "reason"),
+    "rejected_prices": ("sku", "proposed_price", "current_price", "reject_reason", "reject_details"),
+    "cx_events": ("sku", "event_type", "details"),
+}
+# Rows listed per side in a diff (the counts are always complete)
+MAX_DIFF_ROWS = 20
+
+
+class RecordedResponses:
+    """``chat_json`` stand-in returning a run's recorded responses in call order."""
+
+    def __init__(self, logs: List[dict]):
+        self.logs = logs
+        self.calls: List[dict] = []
+
+    def __call__(self, system: str, user: str, model: Optional[str] = None):
+        if len(self.calls) >= len(self.logs):
+            raise RuntimeError(f"Replay made more LLM calls than the {len(self.logs)} recorded")
+        log = self.logs[len(self.calls)]
+        self.calls.append({"agent": log["agent"], "step": log["step"], "prompt_matches": user == log["prompt"]})
+        # Zero latency and tokens: a replay costs nothing (its orchestrator records no agent metrics)
+        return log["response"], 0, (0, 0)
+
+
+def _rows(conn: sqlite3.Connection, table: str, run_id: str) -> List[tuple]:
+    columns = RUN_TABLES[table]
+    cur = conn.execute(f"SELECT {', '.join(columns)} FROM {table} WHERE run_id=? ORDER BY id", (run_id,))
+    return [tuple(r) for r in cur.fetchall()]
+
+
+def _diff(original: List[tuple], replay: List[tuple], columns: Tuple[str, ...]) -> dict:
+    """Multiset diff of two row lists."""
+    missing = Counter(original) - Counter(replay)
+    extra = Counter(replay) - Counter(original)
+    return {
+        "original": len(original),
+        "replay": len(replay),
+        "identical": not missing and not extra,
+        "missing": [dict(zip(columns, r)) for r in list(missing.elements())[:MAX_DIFF_ROWS]],
+        "extra": [dict(zip(columns, r)) for r in list(extra.elements())[:MAX_DIFF_ROWS]],
+    }
+
+
+def _stage_timings(original: Optional[dict], replay: Optional[dict]) -> dict:
+    """Per-stage total_ms of both runs, slowest replay stage first."""
+    original_ms = {st["path"]: st["total_ms"] for st in (original or {}).get("stages", [])}
+    stages = [{"path": st["path"], "calls": st["calls"], "replay_ms": st["total_ms"],
+               "original_ms": original_ms.get(st["path"])} for st in (replay or {}).get("stages", [])]
+    return {"replay_total_ms": (replay or {}).get("total_ms"), "original_total_ms": (original or {}).get("total_ms"),
+            "stages": stages}
+
+
+def replay_run(db_path: str, run_id: str, snapshot_path: Optional[str] = None,
+               work_dir: Optional[str] = None) -> dict:
+    """
+    Replay a recorded run against a scratch copy of ``snapshot_path`` (default: ``db_path``).
+
+    Args:
+        db_path: Database holding the original run's agent_logs and writes
+        run_id: Run to replay
+        snapshot_path: Database state to replay against
+        work_dir: Keep the scratch database here instead of a deleted temp dir
+
+    Returns:
+        Report dict: run ids, "identical", "llm_calls", "approved", "rejected",
+        "writes" (per-table diffs) and "timings"
+
+    Raises:
+        LookupError: If the run has no recorded LLM calls
+    """
+    from agents.orchestrator import Orchestrator
+
+    source = sqlite3.connect(db_path)
+    source.row_factory = sqlite3.Row
+    try:
+        logs = [dict(r) for r in source.execute(
+            "SELECT agent, step, prompt, response FROM agent_logs WHERE run_id=? ORDER BY id", (run_id,))]
+        if not logs:
+            raise LookupError(f"No recorded LLM calls for run {run_id}")
+        original = {table: _rows(source, table, run_id) for table in RUN_TABLES}
+        original_profile = load_profile(source, run_id)
+    finally:
+        source.close()
+
+    scratch_dir = work_dir or tempfile.mkdtemp(prefix="suppliersync-replay-")
+    os.makedirs(scratch_dir, exist_ok=True)
+    scratch = os.path.join(scratch_dir, f"replay-{run_id}.db")
+    try:
+        snapshot = sqlite3.connect(snapshot_path or db_path)
+        target = sqlite3.connect(scratch)
+        with target:
+            snapshot.backup(target)
+        snapshot.close()
+        target.close()
+
+        # The scratch database is deleted after the run: keep it out of the process-wide caches.
+        # Replayed LLM calls are not real: keep them out of the agent metrics too
+        orch = Orchestrator(scratch, snapshots=False, contexts=False, record_metrics=False)
+        responses = RecordedResponses(logs)
+        with override_chat_json(responses):
+            result = orch.step()
+        replay_id = result["run_id"]
+        replay = {table: _rows(orch.db, table, replay_id) for table in RUN_TABLES}
+        replay_profile = load_profile(orch.db, replay_id)
+        orch.db.close()
+    finally:
+        if work_dir is None:
+            shutil.rmtree(scratch_dir, ignore_errors=True)
+
+    writes = {table: _diff(original[table], replay[table], columns) for table, columns in RUN_TABLES.items()}
+    # Approved prices become price_events rows; rejected ones rejected_prices rows
+    approved = _diff([(r[0], r[2]) for r in original["price_events"]],
+                     [(r[0], r[2]) for r in replay["price_events"]], ("sku", "new_price"))
+    rejected = _diff([(r[0], r[1], r[3]) for r in original["rejected_prices"]],
+                     [(r[0], r[1], r[3]) for r in replay["rejected_prices"]], ("sku", "proposed_price", "reject_reason"))
+    return {
+        "run_id": run_id,
+        "replay_run_id": replay_id,
+        "snapshot": snapshot_path or db_path,
+        "identical": approved["identical"] and rejected["identical"] and all(w["identical"] for w in writes.values()),
+        "llm_calls": responses.calls + [{"agent": log["agent"], "step": log["step"], "prompt_matches": None}
+                                         for log in logs[len(responses.calls):]],
+        "approved": approved,
+        "rejected": rejected,
+        "writes": writes,
+        "timings": _stage_timings(original_profile, replay_profile),
+    }
+
+
+def print_report(report: dict) -> None:
+    print(f"Replay of run {report['run_id']} (replay run {report['replay_run_id']}) "
+          f"against {report['snapshot']}: {'IDENTICAL' if report['identical'] else 'DIFFERENT'}")
+    for call in report["llm_calls"]:
+        match = {True: "same prompt", False: "prompt differs", None: "not replayed"}[call["prompt_matches"]]
+        print(f"  llm {call['agent']:<10} {match}")
+    for name in ("approved", "rejected"):
+        d = report[name]
+        print(f"  {name:<16} original={d['original']:<6} replay={d['replay']:<6} "
+              f"missing={len(d['missing'])} extra={len(d['extra'])}")
+    for table, d in report["writes"].items():
+        print(f"  {table:<16} original={d['original']:<6} replay={d['replay']:<6} "
+              f"{'ok' if d['identical'] else 'DIFFERS'}")
+    timings = report["timings"]
+    print(f"  total: replay {timings['replay_total_ms']} ms, original {timings['original_total_ms']} ms")
+    for st in timings["stages"][:15]:
+        original = "-" if st["original_ms"] is None else f"{st['original_ms']:.1f}"
+        print(f"    {st['path']:<40} {st['replay_ms']:>10.1f} ms  (original {original} ms)")
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Replay a recorded orchestration run and diff the results")
+    parser.add_argument("run_id")
+    parser.add_argument("--db", default=os.getenv("SQLITE_PATH", "suppliersync.db"),
+                        help="Database with the original run (default: SQLITE_PATH)")
+    parser.add_argument("--snapshot", help="Database state to replay against (default: a copy of --db)")
+    parser.add_argument("--keep", metavar="DIR", help="Keep the replayed scratch database in DIR")
+    parser.add_argument("--json", action="store_true", help="Print the full report as JSON")
+    args = parser.parse_args(argv)
+    try:
+        report = replay_run(args.db, args.run_id, args.snapshot, args.keep)
+    except LookupError as e:
+        print(e, file=sys.stderr)
+        return 2
+    if args.json:
+        print(json.dumps(report, indent=2, default=str))
+    else:
+        print_report(report)
+    return 0 if report["identical"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,26 +2,27 @@
 import json
 from typing import List
 from core.llm import chat_json
+from core.tracing import span
 from core.prompts import SUPPLIER_PROMPT
-from core.types import SupplierUpdate, AgentTelemetry, AgentResult
+from core.types import AgentTelemetry, AgentResult
+from core.records import SUPPLIER_UPDATES, validate_items
 
 def propose_supplier_updates(context: str) -> AgentResult:
     system = "You propose supplier updates as JSON."
     user = f"{SUPPLIER_PROMPT}\nCONTEXT:\n{context}"
-    resp, latency, tokens = chat_json(system, user)
+    with span("llm") as s:
+        resp, latency, tokens = chat_json(system, user)
+        s.bytes = len(user.encode("utf-8")) + len((resp or "").encode("utf-8"))
     tokens_in, tokens_out = tokens
     items: List[dict] = []
-    try:
-        raw = json.loads(resp)
-        raw_items = raw.get("updates", raw)
-        for r in raw_items or []:
-            try:
-                su = SupplierUpdate(**r)
-                items.append(su.model_dump())
-            except Exception:
-                continue
-    except Exception:
-        items = []
+    with span("parse") as s:
+        try:
+            raw = json.loads(resp)
+            raw_items = raw.get("updates", raw)
+            items = validate_items(SUPPLIER_UPDATES, raw_items, {"reason": None})
+        except Exception:
+            items = []
+        s.rows = len(items)
     telemetry = AgentTelemetry(
         agent="supplier",
         step="propose_updates",
@@ -4,17 +4,29 @@ Run with: uvicorn api:app --reload --port 8000
 """
 
 import os
+import re
+import hmac
+import time
 import logging
 import sqlite3
 from dotenv import load_dotenv
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, FileResponse
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel, Field
 from typing import Optional, List, Dict, Any
 from agents.orchestrator import Orchestrator
+from agents.replay import replay_run
 from core.security import validate_path
+from core.catalog_loader import load_catalog, detect_format
+from core.rag_status import read_status as read_rag_status, is_stale as rag_status_is_stale
+from core.tracing import load_profile
+from core.database import connect
+from core.query_stats import QUERY_STATS
+from core.profiling import PROFILER, profile
+from core.metrics import REGISTRY, CONTENT_TYPE as METRICS_CONTENT_TYPE, HTTP_REQUESTS, HTTP_LATENCY, HTTP_IN_PROGRESS
 
 # Configure structured logging FIRST (before any logger usage)
 logging.basicConfig(
@@ -27,6 +39,7 @@ logger = logging.getLogger(__name__)
 # RAG is optional - only import if available
 try:
     from core.rag import build_vectorstore
+    from core.rag_jobs import rebuild_jobs
     RAG_AVAILABLE = True
 except ImportError:
     RAG_AVAILABLE = False
@@ -49,7 +62,9 @@ app = FastAPI(title="SupplierSync Orchestrator API")
 
 # Rate limiting (if slowapi is available)
 if SLOWAPI_AVAILABLE:
-    limiter = Limiter(key_func=get_remote_address)
+    # RATE_LIMIT_ENABLED=false lifts the limits (local load tests only; never in production)
+    limiter = Limiter(key_func=get_remote_address,
+                      enabled=os.getenv("RATE_LIMIT_ENABLED", "true").lower() not in ("0", "false", "no"))
     app.state.limiter = limiter
     app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 else:
@@ -91,6 +106,9 @@ app.add_middleware(
 
 DB_PATH = os.getenv("SQLITE_PATH", "suppliersync.db")
 
+# Bearer token for /admin endpoints (unset: admin endpoints disabled)
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
 # Request size limit (10MB default)
 MAX_REQUEST_SIZE = int(os.getenv("MAX_REQUEST_SIZE", 10 * 1024 * 1024))  # 10MB
 
@@ -115,6 +133,21 @@ class RAGRebuildResponse(BaseModel):
     document_count: int = Field(ge=0, description="Number of chunks in vectorstore")
     file_count: int = Field(ge=0, description="Number of original files")
     chunk_count: int = Field(ge=0, description="Number of chunks created")
+    job_id: Optional[str] = Field(default=None, description="Background rebuild job ID (when status is accepted)")
+
+
+class RAGRebuildJobResponse(BaseModel):
+    """Background RAG rebuild job state."""
+    job_id: str = Field(description="Rebuild job ID")
+    status: str = Field(description="Job status: queued, running, succeeded, or failed")
+    full: bool = Field(description="Whether this is a full rebuild")
+    created_at: str = Field(description="Submission time (ISO 8601, UTC)")
+    started_at: Optional[str] = Field(default=None, description="Start time (ISO 8601, UTC)")
+    finished_at: Optional[str] = Field(default=None, description="Completion time (ISO 8601, UTC)")
+    progress: Dict[str, Any] = Field(default_factory=dict, description="Current stage, files_total, files_done and chunks")
+    file_count: Optional[int] = Field(default=None, ge=0, description="Files in the new version (when succeeded)")
+    chunk_count: Optional[int] = Field(default=None, ge=0, description="Chunks in the new version (when succeeded)")
+    error: Optional[str] = Field(default=None, description="Error type (when failed; details are in server logs)")
 
 
 class RAGStatusResponse(BaseModel):
@@ -126,6 +159,11 @@ class RAGStatusResponse(BaseModel):
     document_count: int = Field(ge=0, description="Number of chunks in vectorstore")
     file_count: int = Field(ge=0, description="Number of original files")
     status: str = Field(description="Status: ready, not_ready, or error")
+    stale: bool = Field(default=False, description="Whether the documents directory changed since the last build")
+    built_at: Optional[str] = Field(default=None, description="Completion time of the last build (ISO 8601, UTC)")
+    model: Optional[str] = Field(default=None, description="Embedding model used for the last build")
+    backend: Optional[str] = Field(default=None, description="Vector index backend used for the last build")
+    docs_hash: Optional[str] = Field(default=None, description="Digest of the documents indexed by the last build")
 
 
 class OrchestrateResponse(BaseModel):
@@ -150,6 +188,23 @@ class CatalogResponse(BaseModel):
     products: List[Dict[str, Any]] = Field(description="List of active products")
 
 
+class CatalogLoadResponse(BaseModel):
+    """Bulk catalog load response model."""
+    status: str = Field(description="Operation status")
+    rows_read: int = Field(ge=0, description="Number of feed records read")
+    rows_loaded: int = Field(ge=0, description="Number of products upserted")
+    rows_skipped: int = Field(ge=0, description="Number of invalid records skipped")
+    deactivated: int = Field(ge=0, description="Number of products deactivated because they were missing from the feed")
+    chunks: int = Field(ge=0, description="Number of chunked transactions committed")
+    elapsed_s: float = Field(ge=0, description="Wall-clock load time in seconds")
+    rows_per_sec: float = Field(ge=0, description="Load throughput in feed records per second")
+    run_id: Optional[str] = Field(default=None, description="Reconciliation run ID recorded in supplier_updates")
+    rows_inserted: Optional[int] = Field(default=None, ge=0, description="New products inserted (reconciled loads)")
+    rows_updated: Optional[int] = Field(default=None, ge=0, description="Products whose content changed (reconciled loads)")
+    rows_unchanged: Optional[int] = Field(default=None, ge=0, description="Products left untouched (reconciled loads)")
+    fields_changed: Optional[int] = Field(default=None, ge=0, description="Changed fields recorded in supplier_updates")
+
+
 class PriceEventsResponse(BaseModel):
     """Price events response model."""
     events: List[Dict[str, Any]] = Field(description="List of price events")
@@ -173,6 +228,71 @@ class MetricsResponse(BaseModel):
     runs: List[Dict[str, Any]] = Field(description="Recent orchestration runs")
 
 
+class RunProfileResponse(BaseModel):
+    """Per-stage timing breakdown of one orchestration run."""
+    run_id: str = Field(description="Orchestration run ID")
+    total_ms: float = Field(ge=0, description="Wall-clock time of the run in milliseconds")
+    spans: List[Dict[str, Any]] = Field(description="Timed spans in start order (name, path, parent, start_ms, duration_ms, rows, bytes, mem_net_bytes, mem_peak_bytes)")
+    stages: List[Dict[str, Any]] = Field(description="Spans rolled up by path (calls, total_ms, rows, bytes, mem_net_bytes, mem_peak_bytes), slowest first")
+    memory_sites: List[Dict[str, Any]] = Field(default_factory=list, description="Largest allocation sites of a memory-profiled run (rank, site, stage, size_bytes, count)")
+
+
+class RunReplayResponse(BaseModel):
+    """Diff of a replayed orchestration run against the original."""
+    run_id: str = Field(description="Replayed (original) run ID")
+    replay_run_id: str = Field(description="Run ID of the replay in the scratch database")
+    identical: bool = Field(description="True if approved/rejected prices and all written rows match the original")
+    llm_calls: List[Dict[str, Any]] = Field(description="Recorded LLM calls (agent, step, prompt_matches) in call order")
+    approved: Dict[str, Any] = Field(description="Approved price diff (original, replay, identical, missing, extra)")
+    rejected: Dict[str, Any] = Field(description="Rejected price diff (original, replay, identical, missing, extra)")
+    writes: Dict[str, Dict[str, Any]] = Field(description="Per-table diff of rows written by each run")
+    timings: Dict[str, Any] = Field(description="Per-stage replay_ms vs original_ms, slowest replay stage first")
+
+
+class QueryReportResponse(BaseModel):
+    """Per-fingerprint SQLite statistics and the slow-query log of this process."""
+    since: float = Field(description="Unix time the statistics were started or last reset")
+    slow_query_ms: float = Field(description="Slow-query threshold in milliseconds (SLOW_QUERY_MS)")
+    fingerprints: int = Field(ge=0, description="Distinct statement fingerprints seen")
+    queries: List[Dict[str, Any]] = Field(description="Top fingerprints (calls, total/mean/max ms, bucket p50/p95/p99, rows, slow, full_scan, plan)")
+    slow_queries: List[Dict[str, Any]] = Field(description="Most recent slow statements with their EXPLAIN QUERY PLAN, newest first")
+
+
+class ProfilingStatusResponse(BaseModel):
+    """Current profiling arming and the stored profiles."""
+    armed: Optional[Dict[str, Any]] = Field(description="Current arming (id, target, count, used, mode, interval_ms, expires_at), or null")
+    profiles: List[Dict[str, Any]] = Field(description="Stored profiles, newest first (key, target, format, mode, started_at, duration_ms, samples)")
+
+
+# Request metrics middleware
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """Record per-route latency, status counts and in-flight requests for /metrics."""
+    started = time.perf_counter()
+    HTTP_IN_PROGRESS.inc()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        HTTP_IN_PROGRESS.dec()
+        # Route templates (not raw paths) keep label cardinality bounded
+        route = getattr(request.scope.get("route"), "path", "unmatched")
+        HTTP_LATENCY.observe(time.perf_counter() - started, request.method, route)
+        HTTP_REQUESTS.inc(request.method, route, status)
+
+
+# On-demand request profiling (core/profiling.py); a no-op unless armed for "request"
+@app.middleware("http")
+async def profile_requests(request: Request, call_next):
+    """Profile the request if profiling is armed for API requests (admin routes are never profiled)."""
+    if request.url.path.startswith("/admin/"):
+        return await call_next(request)
+    with profile("request", method=request.method, path=request.url.path):
+        return await call_next(request)
+
+
 # Request size limit middleware
 @app.middleware("http")
 async def check_request_size(request: Request, call_next):
@@ -200,10 +320,18 @@ async def health(request: Request):
 
 @app.post("/rag/rebuild", response_model=RAGRebuildResponse)
 @limiter.limit("5/minute")  # Rate limit: 5 rebuilds per minute (expensive operation)
-async def rebuild_rag(request: Request):
+async def rebuild_rag(request: Request, full: bool = False, wait: bool = False):
     """
     Rebuild the RAG vectorstore from documents in data/docs.
-    Returns status and document count.
+    
+    The rebuild runs as a background job into a new versioned collection
+    and returns 202 with a job_id; poll /rag/rebuild/{job_id} for progress.
+    The live collection keeps serving queries until the new version is
+    atomically swapped in. Pass ?wait=true to block until the build is done
+    and get the counts directly.
+    
+    Rebuilds are incremental: only new or changed files are embedded.
+    Pass ?full=true to re-ingest everything.
     
     Security: Validates paths and rate-limited to prevent abuse.
     """
@@ -237,31 +365,45 @@ async def rebuild_rag(request: Request):
                 "chunk_count": 0,
             })
         
-        result = build_vectorstore(path=docs_path, persist=persist_path, clear_existing=True)
-        if result is None:
-            logger.error("Failed to build vectorstore")
+        if wait:
+            result = await run_in_threadpool(build_vectorstore, path=docs_path, persist=persist_path,
+                                             clear_existing=full)
+            if result is None:
+                logger.error("Failed to build vectorstore")
+                return JSONResponse({
+                    "status": "error",
+                    "message": "Failed to build vectorstore",
+                    "docs_path": docs_path,
+                    "persist_path": persist_path,
+                    "document_count": 0,
+                    "file_count": 0,
+                    "chunk_count": 0,
+                })
+            vs, file_count, chunk_count = result
+            logger.info(f"RAG vectorstore rebuilt: {file_count} files, {chunk_count} chunks")
             return JSONResponse({
-                "status": "error",
-                "message": "Failed to build vectorstore",
+                "status": "success",
+                "message": f"Vectorstore rebuilt successfully. {file_count} files split into {chunk_count} chunks.",
                 "docs_path": docs_path,
                 "persist_path": persist_path,
-                "document_count": 0,
-                "file_count": 0,
-                "chunk_count": 0,
+                "document_count": chunk_count,  # Total chunks in vectorstore
+                "file_count": file_count,  # Original number of files
+                "chunk_count": chunk_count,  # Number of chunks created
             })
-        
-        vs, file_count, chunk_count = result
-        logger.info(f"RAG vectorstore rebuilt: {file_count} files, {chunk_count} chunks")
-        
+
+        # Background blue/green rebuild: the live collection keeps serving until the new one is swapped in
+        job = rebuild_jobs.submit(docs_path, persist_path, full=full)
+        logger.info(f"RAG rebuild job {job['job_id']} {job['status']}")
         return JSONResponse({
-            "status": "success",
-            "message": f"Vectorstore rebuilt successfully. {file_count} files split into {chunk_count} chunks.",
+            "status": "accepted",
+            "message": f"Rebuild job {job['status']}. Poll /rag/rebuild/{job['job_id']} for progress.",
             "docs_path": docs_path,
             "persist_path": persist_path,
-            "document_count": chunk_count,  # Total chunks in vectorstore
-            "file_count": file_count,  # Original number of files
-            "chunk_count": chunk_count,  # Number of chunks created
-        })
+            "document_count": 0,
+            "file_count": 0,
+            "chunk_count": 0,
+            "job_id": job["job_id"],
+        }, status_code=202)
     except HTTPException:
         raise
     except Exception as e:
@@ -271,10 +413,28 @@ async def rebuild_rag(request: Request):
         raise HTTPException(status_code=500, detail="Failed to rebuild vectorstore. Check server logs for details.")
 
 
+@app.get("/rag/rebuild/{job_id}", response_model=RAGRebuildJobResponse)
+@limiter.limit("120/minute")  # Rate limit: 120 requests per minute (polled while a rebuild runs)
+async def rebuild_rag_job(request: Request, job_id: str):
+    """Progress of a background RAG rebuild job."""
+    if not RAG_AVAILABLE:
+        raise HTTPException(status_code=503, detail="RAG functionality not available.")
+    persist_path = os.getenv("RAG_PERSIST_PATH", ".chroma")
+    try:
+        persist_path = validate_path(persist_path, base_dir=os.getcwd(), allow_absolute=False)
+    except ValueError as e:
+        logger.error(f"Invalid path in RAG job status: {e}")
+        raise HTTPException(status_code=400, detail="Invalid path configuration")
+    job = rebuild_jobs.get(job_id, persist_path)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Rebuild job not found")
+    return RAGRebuildJobResponse(**{k: v for k, v in job.items() if k != "persist_path"})
+
+
 @app.get("/rag/status", response_model=RAGStatusResponse)
-@limiter.limit("30/minute")  # Rate limit: 30 requests per minute
+@limiter.limit("120/minute")  # Rate limit: 120 requests per minute (cheap manifest read; safe to poll)
 async def rag_status(request: Request):
-    """Check RAG vectorstore status."""
+    """Check RAG vectorstore status from the build status manifest."""
     if not RAG_AVAILABLE:
         return JSONResponse({
             "status": "not_available",
@@ -308,48 +468,35 @@ async def rag_status(request: Request):
                 "status": "error",
             })
         
+        # O(1): read the status manifest written at the end of each build,
+        # plus one stat() of the docs directory for staleness
         has_docs_dir = os.path.isdir(docs_path)
-        has_vectorstore = os.path.exists(persist_path)
-        
-        count = 0
-        if has_vectorstore:
-            try:
-                from langchain_community.embeddings import SentenceTransformerEmbeddings
-                from langchain_community.vectorstores import Chroma
-                EMB = SentenceTransformerEmbeddings(model_name="all-MiniLM-L6-v2")
-                # Try to get count from all collections (in case of multiple)
-                import chromadb
-                client = chromadb.PersistentClient(path=persist_path)
-                collections = client.list_collections()
-                count = 0
-                for col in collections:
-                    count += col.count()
-                # Fallback to langchain collection if no collections found
-                if count == 0:
-                    vs = Chroma(persist_directory=persist_path, embedding_function=EMB)
-                    collection = vs._collection
-                    count = collection.count() if hasattr(collection, 'count') else 0
-            except Exception as e:
-                logger.warning(f"Error counting vectorstore documents: {e}")
-                pass
-        
-        # Try to get file count from docs directory
-        file_count = 0
-        if has_docs_dir:
-            try:
-                file_count = len([f for f in os.listdir(docs_path) if os.path.isfile(os.path.join(docs_path, f))])
-            except Exception as e:
-                logger.warning(f"Error counting files in {docs_path}: {e}")
-                pass
-        
+        build = read_rag_status(persist_path)
+        if build is None:
+            return JSONResponse({
+                "has_docs_directory": has_docs_dir,
+                "has_vectorstore": False,
+                "docs_path": docs_path,
+                "persist_path": persist_path,
+                "document_count": 0,
+                "file_count": 0,
+                "status": "not_ready",
+            })
+
+        count = int(build.get("chunk_count", 0))
         return JSONResponse({
             "has_docs_directory": has_docs_dir,
-            "has_vectorstore": has_vectorstore,
+            "has_vectorstore": True,
             "docs_path": docs_path,
             "persist_path": persist_path,
             "document_count": count,  # Chunk count
-            "file_count": file_count,  # Original file count
-            "status": "ready" if (has_vectorstore and count > 0) else "not_ready",
+            "file_count": int(build.get("file_count", 0)),  # Original file count
+            "status": "ready" if count > 0 else "not_ready",
+            "stale": has_docs_dir and rag_status_is_stale(build, docs_path),
+            "built_at": build.get("built_at"),
+            "model": build.get("model"),
+            "backend": build.get("backend"),
+            "docs_hash": build.get("docs_hash"),
         })
     except Exception as e:
         # Log detailed error server-side (for debugging)
@@ -397,13 +544,36 @@ async def orchestrate(request: Request):
         raise HTTPException(status_code=500, detail="Orchestration failed. Check server logs for details.")
 
 
+def require_admin(request: Request) -> None:
+    """Reject requests without ``Authorization: Bearer <ADMIN_TOKEN>`` (403 if no token is configured)."""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled (ADMIN_TOKEN not set)")
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(token.encode("utf-8"), ADMIN_TOKEN.encode("utf-8")):
+        logger.warning(f"Rejected admin request to {request.url.path}")
+        raise HTTPException(status_code=401, detail="Invalid admin token", headers={"WWW-Authenticate": "Bearer"})
+
+
 def get_db_connection():
     """Get database connection for dashboard endpoints."""
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect(DB_PATH)
     conn.row_factory = sqlite3.Row
     return conn
 
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics(request: Request):
+    """
+    Service metrics in the Prometheus text exposition format.
+
+    Request latency per route, SQLite statement time, LLM latency and tokens
+    per model and per agent, and in-flight requests; merged across uvicorn
+    workers when METRICS_DIR is set. Not rate-limited, so scrapers are never throttled.
+    """
+    body = await run_in_threadpool(REGISTRY.render)
+    return PlainTextResponse(body, media_type=METRICS_CONTENT_TYPE)
+
+
 @app.get("/api/stats", response_model=StatsResponse)
 @limiter.limit("60/minute")  # Rate limit: 60 requests per minute
 async def get_stats(request: Request):
@@ -474,6 +644,43 @@ async def generate_price_events_endpoint(request: Request, count: int = 10):
         raise HTTPException(status_code=500, detail="Failed to generate price events. Check server logs for details.")
 
 
+@app.post("/api/catalog/load", response_model=CatalogLoadResponse)
+@limiter.limit("5/minute")  # Rate limit: 5 bulk loads per minute (expensive operation)
+async def load_catalog_endpoint(request: Request, path: str, deactivate_missing: bool = False, full: bool = False):
+    """
+    Stream a CSV/JSONL catalog feed into the products table.
+    
+    Query params:
+        path: Feed file path, relative to CATALOG_FEED_DIR (default: data/feeds)
+        deactivate_missing: Deactivate active products whose SKU is not in the feed
+        full: Rewrite every row instead of only rows whose content hash changed
+    
+    Security: Requires the ADMIN_TOKEN bearer token. The feed path must
+    resolve inside CATALOG_FEED_DIR.
+    """
+    require_admin(request)
+    logger.info(f"Catalog load requested (path={path}, deactivate_missing={deactivate_missing})")
+    feed_dir = os.getenv("CATALOG_FEED_DIR", "data/feeds")
+    try:
+        base_dir = validate_path(feed_dir, base_dir=os.getcwd(), allow_absolute=False)
+        feed_path = validate_path(os.path.join(feed_dir, path), base_dir=base_dir, allow_absolute=False)
+        detect_format(feed_path)
+    except ValueError as e:
+        logger.error(f"Invalid feed path in catalog load: {e}")
+        raise HTTPException(status_code=400, detail="Invalid feed path or format")
+    if not os.path.isfile(feed_path):
+        raise HTTPException(status_code=404, detail="Feed file not found")
+    try:
+        # Run the blocking load in a worker thread so the event loop keeps serving requests
+        stats = await run_in_threadpool(
+            load_catalog, feed_path, DB_PATH, deactivate_missing=deactivate_missing, reconcile=not full
+        )
+        return CatalogLoadResponse(status="success", **stats)
+    except Exception as e:
+        logger.error(f"Catalog load error: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Failed to load catalog. Check server logs for details.")
+
+
 @app.get("/api/catalog", response_model=CatalogResponse)
 @limiter.limit("60/minute")  # Rate limit: 60 requests per minute
 async def get_catalog(request: Request):
@@ -581,6 +788,8 @@ async def get_metrics(request: Request, limit: int = 10):
                       SUM(tokens_in + COALESCE(tokens_out, 0)) as total_tokens,
                       SUM(COALESCE(cost_usd, 0)) as total_cost,
                       AVG(latency_ms) as avg_latency_ms,
+                      SUM(COALESCE(latency_ms, 0)) as total_latency_ms,
+                      COUNT(latency_ms) as latency_count,
                       COUNT(*) as agent_count
                FROM agent_logs 
                WHERE run_id IS NOT NULL
@@ -593,17 +802,19 @@ async def get_metrics(request: Request, limit: int = 10):
         runs = []
         total_cost = 0.0
         total_tokens = 0
-        latencies = []
+        total_latency_ms = 0
+        latency_count = 0
         
         for row in rows:
             run_data = dict(row)
+            total_latency_ms += run_data.pop("total_latency_ms") or 0
+            latency_count += run_data.pop("latency_count") or 0
             runs.append(run_data)
             total_cost += run_data.get("total_cost", 0) or 0
             total_tokens += run_data.get("total_tokens", 0) or 0
-            if run_data.get("avg_latency_ms"):
-                latencies.append(run_data["avg_latency_ms"] / 1000.0)  # Convert to seconds
         
-        avg_latency = sum(latencies) / len(latencies) if latencies else 0.0
+        # Mean over all agent calls (not a mean of per-run means); see /metrics for percentiles
+        avg_latency = total_latency_ms / latency_count / 1000.0 if latency_count else 0.0
         
         conn.close()
         
@@ -618,6 +829,131 @@ async def get_metrics(request: Request, limit: int = 10):
         raise HTTPException(status_code=500, detail="Failed to fetch metrics. Check server logs for details.")
 
 
+@app.get("/api/runs/{run_id}/profile", response_model=RunProfileResponse)
+@limiter.limit("60/minute")  # Rate limit: 60 requests per minute
+async def get_run_profile(request: Request, run_id: str):
+    """Get the per-stage timing breakdown recorded for an orchestration run."""
+    logger.info(f"Run profile requested (run_id={run_id})")
+    try:
+        conn = get_db_connection()
+        profile = load_profile(conn, run_id)
+        conn.close()
+    except Exception as e:
+        logger.error(f"Run profile error: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Failed to fetch run profile. Check server logs for details.")
+    if profile is None:
+        raise HTTPException(status_code=404, detail="No profile recorded for this run")
+    return RunProfileResponse(**profile)
+
+
+@app.post("/api/runs/{run_id}/replay", response_model=RunReplayResponse)
+@limiter.limit("5/minute")  # Rate limit: 5 replays per minute (copies the database)
+async def replay_orchestration_run(request: Request, run_id: str):
+    """
+    Replay a recorded run with its logged LLM responses on a scratch copy of
+    the current database and diff the results (see agents/replay.py).
+    The live database is not modified.
+
+    Security: Requires the ADMIN_TOKEN bearer token (the response carries
+    the run's prompts and written rows).
+    """
+    require_admin(request)
+    logger.info(f"Run replay requested (run_id={run_id})")
+    try:
+        report = await run_in_threadpool(replay_run, DB_PATH, run_id)
+    except LookupError:
+        raise HTTPException(status_code=404, detail="No recorded LLM calls for this run")
+    except Exception as e:
+        logger.error(f"Run replay error: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Replay failed. Check server logs for details.")
+    logger.info(f"Run replay completed: run_id={run_id}, identical={report['identical']}")
+    return RunReplayResponse(**report)
+
+
+@app.get("/admin/queries", response_model=QueryReportResponse)
+@limiter.limit("60/minute")  # Rate limit: 60 requests per minute
+async def get_query_report(request: Request, limit: int = 20, order_by: str = "total_ms"):
+    """
+    Top SQLite statement fingerprints by time, with plans and the slow-query log.
+
+    Security: Requires the ADMIN_TOKEN bearer token. Statistics cover the
+    serving worker process only.
+    """
+    require_admin(request)
+    if order_by not in ("total_ms", "max_ms", "mean_ms", "calls", "slow"):
+        raise HTTPException(status_code=400, detail="order_by must be one of total_ms, max_ms, mean_ms, calls, slow")
+    return QueryReportResponse(**QUERY_STATS.report(max(1, min(limit, 500)), order_by))
+
+
+@app.post("/admin/queries/reset")
+@limiter.limit("10/minute")  # Rate limit: 10 requests per minute
+async def reset_query_report(request: Request):
+    """Clear the SQLite statement statistics and slow-query log. Requires the ADMIN_TOKEN bearer token."""
+    require_admin(request)
+    QUERY_STATS.reset()
+    logger.info("Query statistics reset")
+    return {"status": "reset"}
+
+
+# Profile keys are run ids (UUIDs) or generated "request-<hex>" ids; anything else is rejected
+_PROFILE_KEY = re.compile(r"^[A-Za-z0-9-]{1,64}$")
+
+
+@app.post("/admin/profiling", response_model=ProfilingStatusResponse)
+@limiter.limit("10/minute")  # Rate limit: 10 requests per minute
+async def arm_profiling(request: Request, target: str = "run", count: int = 1, mode: str = "auto",
+                        interval_ms: float = 5.0, ttl_s: float = 3600.0):
+    """
+    Profile the next ``count`` orchestration runs (target=run) or API requests
+    (target=request). Mode "sample" uses the stack sampler, "cprofile" uses
+    cProfile, and "auto" samples where possible. The arming expires after
+    ``ttl_s`` seconds and replaces any earlier one.
+
+    Security: Requires the ADMIN_TOKEN bearer token.
+    """
+    require_admin(request)
+    try:
+        PROFILER.arm(target, max(1, min(count, 100)), mode, interval_ms, max(1.0, min(ttl_s, 86400.0)))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return ProfilingStatusResponse(armed=PROFILER.armed(), profiles=PROFILER.list())
+
+
+@app.post("/admin/profiling/stop")
+@limiter.limit("10/minute")  # Rate limit: 10 requests per minute
+async def disarm_profiling(request: Request):
+    """Cancel the current arming (profiles in progress still complete). Requires the ADMIN_TOKEN bearer token."""
+    require_admin(request)
+    PROFILER.disarm()
+    logger.info("Profiling disarmed")
+    return {"status": "disarmed"}
+
+
+@app.get("/admin/profiling", response_model=ProfilingStatusResponse)
+@limiter.limit("60/minute")  # Rate limit: 60 requests per minute
+async def get_profiling_status(request: Request):
+    """Current arming and stored profiles. Requires the ADMIN_TOKEN bearer token."""
+    require_admin(request)
+    return ProfilingStatusResponse(armed=PROFILER.armed(), profiles=PROFILER.list())
+
+
+@app.get("/admin/profiles/{key}")
+@limiter.limit("60/minute")  # Rate limit: 60 requests per minute
+async def download_profile(request: Request, key: str):
+    """
+    Download a stored profile: collapsed stacks as text/plain (render with
+    flamegraph.pl, speedscope or inferno) or a pstats file (load with
+    ``pstats.Stats`` or snakeviz). Requires the ADMIN_TOKEN bearer token.
+    """
+    require_admin(request)
+    path = PROFILER.path(key) if _PROFILE_KEY.match(key) else None
+    if path is None:
+        raise HTTPException(status_code=404, detail="No profile stored under this key")
+    if path.endswith(".collapsed"):
+        return FileResponse(path, media_type="text/plain", filename=os.path.basename(path))
+    return FileResponse(path, media_type="application/octet-stream", filename=os.path.basename(path))
+
+
 if __name__ == "__main__":
     import uvicorn
     port = int(os.getenv("API_PORT", "8000"))
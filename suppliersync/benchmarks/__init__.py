@@ -0,0 +1,6 @@
+"""
+Performance benchmarks for SupplierSync hot paths.
+
+Run with: python -m benchmarks.run --scale 1k --scale 100k
+See benchmarks/run.py for baselines and regression thresholds.
+"""
@@ -0,0 +1,317 @@
+"""
+API load-test harness.
+
+Run with: python -m benchmarks.loadtest --scale 1k --concurrency 20 --duration 30 \\
+              [--workers 2] [--llm-latency lognormal:800:0.6] [--mix stats=30,orchestrate=5] \\
+              [--llm fake --llm-faults 429=0.05,5xx=0.02,timeout=0.01]
+
+Starts a local uvicorn server on a scratch copy of a generated dataset
+(see benchmarks/run.py) with rate limits lifted and RAG grounding disabled.
+LLM calls go to the in-process stub (``--llm stub``) or, with ``--llm fake``,
+through the real OpenAI client to a local fake server (core/fake_openai.py)
+that can inject 429s, 5xx and timeouts. The harness then drives the server
+with ``--concurrency`` virtual users (asyncio + httpx). Each user repeatedly picks a route from the weighted mix
+(dashboard polls, orchestration triggers, RAG status checks) until the
+duration elapses. ``--url`` targets an already running server instead.
+
+The report gives throughput, p50/p95/p99 latency and error counts per route,
+and the ``database is locked`` rate taken from the server's
+``db_errors_total{error="locked"}`` counter (scraped from /metrics before
+and after the run), since lock timeouts reach clients only as generic 500s.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, APP_DIR)
+
+from benchmarks.run import DEFAULT_DATA_DIR, dataset_path  # noqa: E402
+from benchmarks.suite import SCALES, copy_database  # noqa: E402
+
+# Route name -> (method, path)
+ROUTES: Dict[str, Tuple[str, str]] = {
+    "stats": ("GET", "/api/stats"),
+    "catalog": ("GET", "/api/catalog"),
+    "metrics": ("GET", "/api/metrics?limit=10"),
+    "price_events": ("GET", "/api/price-events?limit=20"),
+    "rag_status": ("GET", "/rag/status"),
+    "orchestrate": ("POST", "/orchestrate"),
+}
+
+# Dashboard-heavy default: every open dashboard polls stats/metrics; runs are occasional
+DEFAULT_MIX = "stats=30,metrics=30,catalog=10,rag_status=25,orchestrate=5"
+
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    """Parse ``name=weight,...`` into route weights."""
+    mix = {}
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        name, _, weight = part.partition("=")
+        if name not in ROUTES:
+            raise ValueError(f"Unknown route {name!r} (choose from {', '.join(ROUTES)})")
+        mix[name] = float(weight or 1)
+    if not mix or sum(mix.values()) <= 0:
+        raise ValueError("Route mix needs at least one positive weight")
+    return mix
+
+
+def parse_faults(spec: str) -> Dict[str, float]:
+    """Parse ``429=0.05,5xx=0.02,timeout=0.01`` into FakeOpenAIServer keyword arguments."""
+    faults = {}
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        kind, _, rate = part.partition("=")
+        if kind not in ("429", "5xx", "timeout"):
+            raise ValueError(f"Unknown fault {kind!r} (choose from 429, 5xx, timeout)")
+        faults[f"rate_{kind}"] = float(rate)
+    return faults
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(-(-q * len(sorted_values) // 100)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def locked_errors(metrics_text: str) -> float:
+    """Sum of ``db_errors_total{...error="locked"...}`` samples in Prometheus text output."""
+    total = 0.0
+    for line in metrics_text.splitlines():
+        if line.startswith("db_errors_total{") and 'error="locked"' in line:
+            total += float(line.rsplit(" ", 1)[1])
+    return total
+
+
+async def _scrape_locked(client: httpx.AsyncClient) -> Optional[float]:
+    try:
+        response = await client.get("/metrics")
+        return locked_errors(response.text) if response.status_code == 200 else None
+    except httpx.HTTPError:
+        return None
+
+
+async def _user(client: httpx.AsyncClient, names: List[str], weights: List[float], deadline: float,
+                think_s: float, rng: random.Random, samples: List[tuple]) -> None:
+    while time.perf_counter() < deadline:
+        name = rng.choices(names, weights)[0]
+        method, path = ROUTES[name]
+        started = time.perf_counter()
+        try:
+            status = (await client.request(method, path)).status_code
+        except httpx.HTTPError:
+            status = 0  # Timeout or connection error
+        samples.append((name, status, (time.perf_counter() - started) * 1000))
+        if think_s:
+            await asyncio.sleep(rng.expovariate(1 / think_s))
+
+
+async def run_load(base_url: str, mix: Dict[str, float], concurrency: int, duration_s: float,
+                   think_s: float = 0.0, timeout_s: float = 120.0, seed: int = 0,
+                   transport: Optional[httpx.AsyncBaseTransport] = None) -> dict:
+    """
+    Drive the API with ``concurrency`` closed-loop virtual users for ``duration_s`` seconds.
+
+    Args:
+        base_url: Server root (e.g. http://127.0.0.1:8000)
+        mix: Route name -> relative weight (see ROUTES)
+        think_s: Mean pause between a user's requests (exponentially distributed; 0 = none)
+        transport: Optional httpx transport (e.g. ``httpx.ASGITransport`` to test in-process)
+
+    Returns:
+        Report dict (see ``summarize``)
+    """
+    names, weights = list(mix), [mix[n] for n in mix]
+    samples: List[tuple] = []
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout_s, limits=limits, transport=transport) as client:
+        locked_before = await _scrape_locked(client)
+        started = time.perf_counter()
+        await asyncio.gather(*(_user(client, names, weights, started + duration_s, think_s,
+                                     random.Random(seed + i), samples) for i in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        locked_after = await _scrape_locked(client)
+    locked = None if locked_before is None or locked_after is None else locked_after - locked_before
+    return summarize(samples, elapsed, locked)
+
+
+def summarize(samples: List[tuple], elapsed_s: float, db_locked: Optional[float]) -> dict:
+    """
+    Aggregate ``(route, status, latency_ms)`` samples.
+
+    Errors are transport failures (status 0) and 5xx responses; 429s are
+    reported separately as ``rate_limited``.
+    """
+    by_route: Dict[str, List[tuple]] = {}
+    for sample in samples:
+        by_route.setdefault(sample[0], []).append(sample)
+    routes = {}
+    for name, rows in sorted(by_route.items()):
+        latencies = sorted(r[2] for r in rows)
+        errors = sum(1 for r in rows if r[1] == 0 or r[1] >= 500)
+        routes[name] = {
+            "requests": len(rows),
+            "throughput_rps": round(len(rows) / elapsed_s, 2),
+            "p50_ms": round(percentile(latencies, 50), 1),
+            "p95_ms": round(percentile(latencies, 95), 1),
+            "p99_ms": round(percentile(latencies, 99), 1),
+            "max_ms": round(latencies[-1], 1),
+            "errors": errors,
+            "error_rate": round(errors / len(rows), 4),
+            "rate_limited": sum(1 for r in rows if r[1] == 429),
+        }
+    total = len(samples)
+    errors = sum(r["errors"] for r in routes.values())
+    return {
+        "duration_s": round(elapsed_s, 2),
+        "requests": total,
+        "throughput_rps": round(total / elapsed_s, 2) if elapsed_s else 0.0,
+        "errors": errors,
+        "error_rate": round(errors / total, 4) if total else 0.0,
+        "db_locked": db_locked,
+        "db_locked_rate": round(db_locked / total, 4) if total and db_locked is not None else None,
+        "routes": routes,
+    }
+
+
+def print_report(report: dict) -> None:
+    print(f"{'route':<14}{'requests':>9}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}{'429':>6}")
+    for name, r in report["routes"].items():
+        print(f"{name:<14}{r['requests']:>9}{r['throughput_rps']:>9.2f}{r['p50_ms']:>10.1f}{r['p95_ms']:>10.1f}"
+              f"{r['p99_ms']:>10.1f}{r['errors']:>8}{r['rate_limited']:>6}")
+    print(f"Total: {report['requests']} requests in {report['duration_s']}s "
+          f"({report['throughput_rps']} req/s), error rate {report['error_rate']:.2%}")
+    if report["db_locked"] is None:
+        print("database is locked: unknown (/metrics not reachable)")
+    else:
+        print(f"database is locked: {report['db_locked']:.0f} ({report['db_locked_rate']:.2%} of requests)")
+    if "llm" in report:
+        llm = report["llm"]
+        print(f"LLM (fake OpenAI): {llm['requests']} requests, {llm['ok']} ok, {llm['rate_limited']} 429, "
+              f"{llm['server_error']} 5xx, {llm['timeout']} timeouts, max {llm['max_in_flight']} in flight")
+
+
+class LocalServer:
+    """uvicorn serving api:app on a scratch database with the stub LLM by default (context manager)."""
+
+    def __init__(self, db_path: str, port: int, workers: int = 1, stub_latency: str = "0", env: dict = None):
+        self.db_path = db_path
+        self.port = port
+        self.workers = workers
+        self.stub_latency = stub_latency  # Ignored when env selects another LLM_BACKEND
+        self.extra_env = env or {}
+        self.url = f"http://127.0.0.1:{port}"
+        self.proc: Optional[subprocess.Popen] = None
+        self.tmp_dir: Optional[str] = None
+
+    def __enter__(self) -> "LocalServer":
+        self.tmp_dir = tempfile.mkdtemp(prefix="suppliersync-loadtest-")
+        env = dict(os.environ, SQLITE_PATH=self.db_path, LLM_BACKEND="stub", STUB_LLM_LATENCY=self.stub_latency,
+                   RATE_LIMIT_ENABLED="false", RAG_RETRIEVAL="0",
+                   # Worker processes share counters through snapshot files (see core.metrics)
+                   METRICS_DIR=os.path.join(self.tmp_dir, "metrics"))
+        env.update(self.extra_env)
+        self.log_path = os.path.join(self.tmp_dir, "server.log")
+        self._log = open(self.log_path, "w")
+        self.proc = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "api:app", "--host", "127.0.0.1", "--port", str(self.port),
+             "--workers", str(self.workers), "--log-level", "warning"],
+            cwd=APP_DIR, env=env, stdout=self._log, stderr=subprocess.STDOUT)
+        self._wait_ready()
+        return self
+
+    def _wait_ready(self, timeout_s: float = 60.0) -> None:
+        deadline = time.time() + timeout_s
+        while time.time() < deadline:
+            if self.proc.poll() is not None:
+                raise RuntimeError(f"Server exited with code {self.proc.returncode}; see {self.log_path}")
+            try:
+                if httpx.get(self.url + "/health", timeout=1.0).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.2)
+        raise RuntimeError(f"Server not ready after {timeout_s}s; see {self.log_path}")
+
+    def __exit__(self, *exc) -> None:
+        if self.proc and self.proc.poll() is None:
+            self.proc.terminate()
+            try:
+                self.proc.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+        self._log.close()
+        shutil.rmtree(os.path.join(self.tmp_dir, "metrics"), ignore_errors=True)
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Load-test the SupplierSync API")
+    parser.add_argument("--url", help="Target a running server instead of starting one")
+    parser.add_argument("--scale", choices=list(SCALES), default="1k", help="Dataset scale for the local server")
+    parser.add_argument("--data-dir", default=DEFAULT_DATA_DIR, help="Cache directory for generated datasets")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes (default: 1)")
+    parser.add_argument("--port", type=int, default=8765, help="Port for the local server (default: 8765)")
+    parser.add_argument("--llm", choices=("stub", "fake"), default="stub",
+                        help="stub: in-process stub backend; fake: OpenAI client against core/fake_openai.py")
+    parser.add_argument("--llm-latency", default="lognormal:800:0.5",
+                        help="LLM latency spec: <ms>, uniform:<lo>:<hi> or lognormal:<median_ms>:<sigma>")
+    parser.add_argument("--llm-faults", default="",
+                        help="Fault rates for --llm fake, e.g. 429=0.05,5xx=0.02,timeout=0.01")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"Weighted route mix (default: {DEFAULT_MIX})")
+    parser.add_argument("--concurrency", type=int, default=10, help="Virtual users (default: 10)")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds to run (default: 30)")
+    parser.add_argument("--think", type=float, default=0.0, help="Mean think time between requests in seconds")
+    parser.add_argument("--output", help="Also write the report to a JSON file")
+    args = parser.parse_args(argv)
+
+    # Validate before generating data or starting a server
+    from core.llm_stub import latency_sampler
+    mix = parse_mix(args.mix)
+    latency_sampler(args.llm_latency)
+    faults = parse_faults(args.llm_faults)
+
+    def load(url: str) -> dict:
+        print(f"Running {args.concurrency} users for {args.duration}s against {url} (mix: {args.mix})")
+        return asyncio.run(run_load(url, mix, args.concurrency, args.duration, args.think))
+
+    if args.url:
+        report = load(args.url)
+    else:
+        scratch = os.path.join(args.data_dir, f"{args.scale}-loadtest.db")
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(scratch + suffix):
+                os.unlink(scratch + suffix)
+        copy_database(dataset_path(args.data_dir, args.scale), scratch)
+        if args.llm == "fake":
+            from core.fake_openai import FakeOpenAIServer
+            with FakeOpenAIServer(latency=args.llm_latency, **faults) as fake:
+                env = {"LLM_BACKEND": "openai", "OPENAI_BASE_URL": fake.url, "OPENAI_API_KEY": "fake"}
+                with LocalServer(scratch, args.port, args.workers, env=env) as server:
+                    report = load(server.url)
+                report["llm"] = dict(fake.stats)
+        else:
+            with LocalServer(scratch, args.port, args.workers, args.llm_latency) as server:
+                report = load(server.url)
+        print(f"Server log: {server.log_path}")
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
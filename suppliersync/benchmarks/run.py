@@ -0,0 +1,169 @@
+"""
+Benchmark runner with stored baselines.
+
+Run with: python -m benchmarks.run --scale 1k --scale 100k [--only enforce_policy] [--update-baseline]
+
+Datasets are generated once per scale with generate_fixtures.py and cached
+in benchmarks/.data/. Each benchmark runs one untimed warm-up call and then
+``repeat`` timed calls; the median is compared with the stored baseline
+(benchmarks/baseline.json) and the run fails (exit code 1) when a median
+exceeds its baseline by more than the threshold (BENCH_THRESHOLD, default
+25%) and by more than --min-delta-ms (so sub-millisecond jitter never
+fails a run). --update-baseline records the new medians instead.
+
+The LLM is stubbed (LLM_BACKEND=stub) and RAG grounding disabled, so
+results measure SupplierSync's own code. Baselines are machine-specific:
+record and compare them on the same hardware (e.g. a fixed CI runner).
+"""
+
+import os
+import sys
+import json
+import time
+import hashlib
+import logging
+import argparse
+import platform
+import statistics
+from datetime import datetime, timezone
+from typing import Dict, List
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from benchmarks.suite import BENCHMARKS, SCALES, BenchContext, copy_database  # noqa: E402
+
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, "baseline.json")
+DEFAULT_DATA_DIR = os.path.join(BENCH_DIR, ".data")
+BENCH_THRESHOLD = float(os.getenv("BENCH_THRESHOLD", "0.25"))
+
+
+def dataset_path(data_dir: str, scale: str) -> str:
+    """Cached dataset for a scale (regenerated whenever the scale's parameters or the data format change)."""
+    from generate_fixtures import DATA_FORMAT, generate_dataset
+    params = SCALES[scale]
+    key = json.dumps({**params, "format": DATA_FORMAT}, sort_keys=True)
+    digest = hashlib.sha256(key.encode("utf-8")).hexdigest()[:8]
+    path = os.path.join(data_dir, f"{scale}-{digest}.db")
+    if not os.path.exists(path):
+        os.makedirs(data_dir, exist_ok=True)
+        print(f"Generating {scale} dataset -> {path}")
+        stats = generate_dataset(path + ".tmp", **params, reset=True)
+        os.replace(path + ".tmp", path)
+        print(f"  {stats['elapsed_s']}s ({stats['rows_per_sec']} rows/s)")
+    return path
+
+
+def time_call(fn, repeat: int) -> Dict[str, float]:
+    fn()  # Warm-up: page cache, statement cache, imports
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return {"median_ms": round(statistics.median(samples), 3), "min_ms": round(min(samples), 3), "repeat": repeat}
+
+
+def run(scales: List[str], only: List[str] = None, data_dir: str = DEFAULT_DATA_DIR) -> Dict[str, Dict[str, dict]]:
+    """
+    Run the selected benchmarks at each scale.
+
+    Returns:
+        {scale: {benchmark: {"median_ms", "min_ms", "repeat"}}}
+    """
+    results: Dict[str, Dict[str, dict]] = {}
+    for scale in scales:
+        db_path = dataset_path(data_dir, scale)
+        scratch = os.path.join(data_dir, f"{scale}-scratch.db")
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(scratch + suffix):
+                os.unlink(scratch + suffix)
+        copy_database(db_path, scratch)
+        ctx = BenchContext(scale=scale, db_path=db_path, scratch_db=scratch, skus=SCALES[scale]["skus"])
+        results[scale] = {}
+        for name, bench in BENCHMARKS.items():
+            if (only and name not in only) or (bench.scales is not None and scale not in bench.scales):
+                continue
+            results[scale][name] = time_call(bench.setup(ctx), bench.repeat)
+            print(f"  {scale:>5} {name:<22} {results[scale][name]['median_ms']:>10.3f} ms (median of {bench.repeat})")
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float = BENCH_THRESHOLD, min_delta_ms: float = 1.0) -> List[dict]:
+    """Benchmarks whose median regressed past the threshold (benchmarks missing from the baseline are skipped)."""
+    regressions = []
+    for scale, benches in results.items():
+        for name, result in benches.items():
+            base = baseline.get(scale, {}).get(name)
+            if not base:
+                continue
+            delta = result["median_ms"] - base["median_ms"]
+            if result["median_ms"] > base["median_ms"] * (1 + threshold) and delta > min_delta_ms:
+                regressions.append({"scale": scale, "benchmark": name, "baseline_ms": base["median_ms"],
+                                    "median_ms": result["median_ms"],
+                                    "ratio": round(result["median_ms"] / base["median_ms"], 2)})
+    return regressions
+
+
+def load_baseline(path: str) -> dict:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"meta": {}, "results": {}}
+
+
+def save_baseline(path: str, baseline: dict, results: dict) -> None:
+    """Merge new results into the baseline file (other scales/benchmarks are kept)."""
+    for scale, benches in results.items():
+        baseline["results"].setdefault(scale, {}).update(benches)
+    baseline["meta"] = {"updated_at": datetime.now(timezone.utc).isoformat(), "python": platform.python_version(),
+                        "platform": platform.platform(), "machine": platform.machine()}
+    with open(path, "w") as f:
+        json.dump(baseline, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Run SupplierSync hot-path benchmarks")
+    parser.add_argument("--scale", action="append", choices=list(SCALES),
+                        help="Dataset scale (repeatable; default: 1k)")
+    parser.add_argument("--only", action="append", choices=list(BENCHMARKS), help="Run only these benchmarks")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Baseline JSON file")
+    parser.add_argument("--update-baseline", action="store_true", help="Record results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=BENCH_THRESHOLD,
+                        help=f"Allowed slowdown as a fraction (default: {BENCH_THRESHOLD})")
+    parser.add_argument("--min-delta-ms", type=float, default=1.0,
+                        help="Ignore regressions smaller than this many milliseconds (default: 1.0)")
+    parser.add_argument("--data-dir", default=DEFAULT_DATA_DIR, help="Cache directory for generated datasets")
+    parser.add_argument("--output", help="Also write this run's results to a JSON file")
+    args = parser.parse_args(argv)
+
+    # Read by core.llm / core.retrieval at import, which the benchmark setups trigger: stub LLM, no vectorstore
+    os.environ.setdefault("LLM_BACKEND", "stub")
+    os.environ.setdefault("RAG_RETRIEVAL", "0")
+    # Per-request INFO logs from the API and slow-query warnings would dominate the output
+    logging.disable(logging.WARNING)
+    results = run(args.scale or ["1k"], args.only, args.data_dir)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"results": results}, f, indent=2, sort_keys=True)
+
+    baseline = load_baseline(args.baseline)
+    if args.update_baseline:
+        save_baseline(args.baseline, baseline, results)
+        print(f"Baseline updated: {args.baseline}")
+        return 0
+
+    regressions = compare(results, baseline["results"], args.threshold, args.min_delta_ms)
+    for r in regressions:
+        print(f"REGRESSION {r['scale']} {r['benchmark']}: {r['median_ms']} ms vs baseline "
+              f"{r['baseline_ms']} ms ({r['ratio']}x)")
+    if regressions:
+        return 1
+    print(f"No regressions beyond {args.threshold:.0%} of baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,200 @@
+"""
+Benchmark definitions.
+
+Each benchmark is a function registered with ``@benchmark`` that receives a
+``BenchContext`` and returns a zero-argument callable (the timed body), so
+setup such as building inputs or opening connections is never timed.
+Benchmarks that write get ``ctx.scratch_db``, a per-scale copy of the
+generated dataset made fresh for every run, so the cached dataset's rows
+are never modified.
+"""
+
+import random
+import sqlite3
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+# Dataset parameters per scale (generate_fixtures.generate_dataset keyword arguments)
+SCALES: Dict[str, dict] = {
+    "1k": dict(skus=1_000, suppliers=50, years=1.0, price_events=1_000, rejected_prices=1_000,
+               cx_events=1_000, runs=100),
+    "100k": dict(skus=100_000, suppliers=1_000, years=1.0, price_events=100_000, rejected_prices=100_000,
+                 cx_events=100_000, runs=10_000),
+    "1m": dict(skus=1_000_000, suppliers=5_000, years=1.0, price_events=1_000_000, rejected_prices=1_000_000,
+               cx_events=1_000_000, runs=100_000),
+}
+
+# SKUs per batch for the per-run paths (an orchestration run touches a handful to a few hundred)
+PROPOSAL_BATCH = 500
+
+
+@dataclass
+class BenchContext:
+    scale: str
+    db_path: str
+    scratch_db: str
+    skus: int
+    seed: int = 0
+
+
+@dataclass
+class Benchmark:
+    name: str
+    setup: Callable[[BenchContext], Callable[[], object]]
+    repeat: int = 5
+    scales: Optional[List[str]] = None  # None: every scale
+
+
+BENCHMARKS: Dict[str, Benchmark] = {}
+
+
+def benchmark(name: str, repeat: int = 5, scales: Optional[List[str]] = None):
+    """Register a benchmark setup function under ``name``."""
+    def register(setup):
+        BENCHMARKS[name] = Benchmark(name, setup, repeat, scales)
+        return setup
+    return register
+
+
+def _sample_skus(ctx: BenchContext, n: int) -> List[str]:
+    from generate_fixtures import sku_strings
+    import numpy as np
+    rng = random.Random(ctx.seed)
+    idx = np.array(rng.sample(range(ctx.skus), min(n, ctx.skus)))
+    return sku_strings(idx).tolist()
+
+
+def _orchestrator(db_path: str):
+    # RAG grounding is disabled by the runner (RAG_RETRIEVAL=0): these measure the catalog/DB paths
+    from agents.orchestrator import Orchestrator
+    return Orchestrator(db_path)
+
+
+@benchmark("enforce_policy")
+def bench_enforce_policy(ctx: BenchContext):
+    from core.governance import enforce_policy
+    from datetime import datetime, timedelta
+    rng = random.Random(ctx.seed)
+    skus = _sample_skus(ctx, PROPOSAL_BATCH)
+    wholesale = {s: rng.uniform(10, 300) for s in skus}
+    current = {s: wholesale[s] * rng.uniform(1.05, 2.0) for s in skus}
+    last = {s: datetime(2024, 1, 1) - timedelta(hours=rng.uniform(1, 96)) for s in skus}
+    categories = {s: "Office" for s in skus}
+    proposals = [{"sku": s, "new_price": round(current[s] * rng.uniform(0.8, 1.3), 2)} for s in skus]
+    return lambda: enforce_policy(proposals, wholesale, sku_to_category=categories, sku_to_current_price=current,
+                                  sku_to_last_price_date=last, sku_to_map_price={})
+
+
+@benchmark("fetch_catalog")
+def bench_fetch_catalog(ctx: BenchContext):
+    orch = _orchestrator(ctx.db_path)
+    return orch._load_catalog  # The database read itself, not the context cache in front of it
+
+
+@benchmark("fetch_catalog_snapshot")
+def bench_fetch_catalog_snapshot(ctx: BenchContext):
+    # Another worker's first read of an unchanged catalog: version query, mmap and materialization
+    from core.catalog_snapshot import CatalogSnapshots, snapshot_path
+    orch = _orchestrator(ctx.db_path)
+    CatalogSnapshots(snapshot_path(ctx.db_path)).catalog(orch.db)
+    return lambda: CatalogSnapshots(snapshot_path(ctx.db_path)).catalog(orch.db)
+
+
+@benchmark("fetch_price_history")
+def bench_fetch_price_history(ctx: BenchContext):
+    orch = _orchestrator(ctx.db_path)
+    skus = _sample_skus(ctx, PROPOSAL_BATCH)
+    return lambda: orch._fetch_price_history(skus)
+
+
+@benchmark("apply_price_changes")
+def bench_apply_price_changes(ctx: BenchContext):
+    orch = _orchestrator(ctx.scratch_db)
+    rng = random.Random(ctx.seed)
+    approved = [{"sku": s, "new_price": round(rng.uniform(20, 400), 2), "reason": "benchmark"}
+                for s in _sample_skus(ctx, PROPOSAL_BATCH)]
+    return lambda: orch._apply_price_changes(approved, "bench-run")
+
+
+@benchmark("orchestrator_step", repeat=3)
+def bench_orchestrator_step(ctx: BenchContext):
+    # Full run with the stub LLM (LLM_BACKEND=stub is set by the runner)
+    orch = _orchestrator(ctx.scratch_db)
+    return orch.step
+
+
+def _endpoint(path: str):
+    def setup(ctx: BenchContext):
+        from fastapi.testclient import TestClient
+        import api
+        api.DB_PATH = ctx.db_path
+        api.limiter.enabled = False  # Benchmarks would trip the per-minute limits
+        client = TestClient(api.app)
+
+        def call():
+            response = client.get(path)
+            if response.status_code != 200:
+                raise RuntimeError(f"GET {path} returned {response.status_code}")
+            return response
+        return call
+    return setup
+
+
+for _name, _path in (("api_stats", "/api/stats"), ("api_price_events", "/api/price-events?limit=20"),
+                     ("api_rejected_prices", "/api/rejected-prices?limit=20"), ("api_cx_events", "/api/cx-events?limit=20"),
+                     ("api_metrics", "/api/metrics?limit=10"), ("api_catalog", "/api/catalog")):
+    benchmark(_name, repeat=5 if _name != "api_catalog" else 3)(_endpoint(_path))
+
+
+# Synthetic documents per SKU for the RAG rebuild (1k: 20 files, 100k: 2,000 files)
+RAG_DOCS_PER_SKU = 1 / 50
+RAG_DOC_CHARS = 3_000  # about four chunks per file
+
+
+class _HashEmbedder:
+    """Deterministic stand-in for the embedding model (8 dims from a text hash)."""
+
+    def embed(self, texts):
+        import hashlib
+        return [[b / 255 for b in hashlib.blake2b(t.encode(), digest_size=8).digest()] for t in texts]
+
+
+@benchmark("rag_rebuild", repeat=3, scales=["1k", "100k"])
+def bench_rag_rebuild(ctx: BenchContext):
+    # Incremental rebuild after a one-file edit: embedding is O(changed), but every
+    # unchanged chunk is still copied into the new version, so this grows with the corpus
+    import os
+    import shutil
+    from core import embeddings
+    from core.rag import build_vectorstore
+    embeddings.set_embedder(_HashEmbedder())  # Nothing later in the suite embeds (RAG_RETRIEVAL=0)
+    root = os.path.join(os.path.dirname(ctx.scratch_db), f"{ctx.scale}-rag")
+    shutil.rmtree(root, ignore_errors=True)
+    docs = os.path.join(root, "docs")
+    os.makedirs(docs)
+    rng = random.Random(ctx.seed)
+    words = ["supplier", "margin", "wholesale", "policy", "lead", "time", "refund", "stock", "freight", "tier"]
+    n_files = max(1, int(ctx.skus * RAG_DOCS_PER_SKU))
+    for i in range(n_files):
+        with open(os.path.join(docs, f"doc-{i:05d}.md"), "w") as f:
+            f.write(" ".join(rng.choice(words) for _ in range(RAG_DOC_CHARS // 7)))
+    kwargs = dict(path=docs, persist=os.path.join(root, "store"), cache_path=os.path.join(root, "cache.db"),
+                  workers=0)
+    build_vectorstore(**kwargs)
+    edits = iter(range(1_000_000))
+
+    def rebuild():
+        with open(os.path.join(docs, "doc-00000.md"), "a") as f:
+            f.write(f" edit {next(edits)}")
+        return build_vectorstore(**kwargs)
+    return rebuild
+
+
+def copy_database(source: str, target: str) -> None:
+    """Consistent copy of a SQLite database (including WAL content)."""
+    src = sqlite3.connect(source)
+    dst = sqlite3.connect(target)
+    with dst:
+        src.backup(dst)
+    src.close()
+    dst.close()
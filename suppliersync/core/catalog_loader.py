@@ -0,0 +1,309 @@
+"""
+Streaming bulk catalog loader for SupplierSync.
+
+This module loads supplier catalog feeds (CSV or JSONL) into the products
+table without materializing the whole feed in memory. Records are read
+lazily, validated, grouped into fixed-size chunks and written with a single
+``executemany`` UPSERT per chunk, each chunk in its own transaction.
+
+SKUs that are missing from the feed can optionally be deactivated. The SKUs
+seen in the feed are staged in a temporary table, so deactivation is a single
+``UPDATE ... WHERE sku NOT IN (SELECT ...)`` regardless of catalog size.
+
+With ``reconcile=True`` each chunk goes through the row-hash diff engine
+(core.feed_diff) and only rows whose content changed are written.
+"""
+
+import csv
+import json
+import os
+import sqlite3
+import time
+import uuid
+import logging
+from itertools import islice
+from typing import Iterable, Iterator, List, Dict, Optional, Tuple
+
+from core.security import validate_sku, validate_price
+from core.database import connect
+from core.feed_diff import ensure_hash_table, invalidate_row_hashes, reconcile_rows
+from core.catalog_snapshot import ensure_epoch_table, bump_catalog_epoch
+
+logger = logging.getLogger(__name__)
+
+# Rows per executemany() batch / transaction
+DEFAULT_CHUNK_SIZE = int(os.getenv("CATALOG_LOAD_CHUNK_SIZE", "5000"))
+
+# Column order used for every product tuple produced by this module
+PRODUCT_COLUMNS = ("sku", "name", "category", "wholesale_price", "retail_price", "supplier_id", "is_active")
+
+UPSERT_PRODUCTS_SQL = """
+    INSERT INTO products(sku, name, category, wholesale_price, retail_price, supplier_id, is_active)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(sku) DO UPDATE SET
+        name = excluded.name,
+        category = excluded.category,
+        wholesale_price = excluded.wholesale_price,
+        retail_price = excluded.retail_price,
+        supplier_id = excluded.supplier_id,
+        is_active = excluded.is_active
+"""
+
+FEED_FORMATS = {".csv": "csv", ".jsonl": "jsonl", ".ndjson": "jsonl"}
+
+
+def connect_for_bulk_load(db_path: str) -> sqlite3.Connection:
+    """
+    Open a connection tuned for bulk writes.
+
+    Args:
+        db_path: Path to SQLite database file
+
+    Returns:
+        SQLite connection with WAL and in-memory temp storage enabled
+    """
+    conn = connect(db_path, timeout=30.0)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL;")
+    conn.execute("PRAGMA synchronous=NORMAL;")
+    conn.execute("PRAGMA temp_store=MEMORY;")
+    return conn
+
+
+def detect_format(path: str) -> str:
+    """
+    Detect the feed format from the file extension.
+
+    Raises:
+        ValueError: If the extension is not a supported feed format
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in FEED_FORMATS:
+        raise ValueError(f"Unsupported feed format: {ext or path} (expected .csv, .jsonl or .ndjson)")
+    return FEED_FORMATS[ext]
+
+
+def iter_feed_records(path: str, fmt: Optional[str] = None) -> Iterator[Dict]:
+    """
+    Lazily yield raw records from a CSV or JSONL feed.
+
+    Only one line is held in memory at a time. Malformed JSONL lines are
+    logged and skipped.
+
+    Args:
+        path: Path to the feed file
+        fmt: "csv" or "jsonl" (detected from the extension if omitted)
+    """
+    fmt = fmt or detect_format(path)
+    with open(path, "r", newline="", encoding="utf-8") as f:
+        if fmt == "csv":
+            yield from csv.DictReader(f)
+        elif fmt == "jsonl":
+            for line_no, line in enumerate(f, start=1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning(f"Skipping malformed JSONL line {line_no} in {path}")
+        else:
+            raise ValueError(f"Unsupported feed format: {fmt}")
+
+
+def normalize_record(record: Dict) -> Optional[Tuple]:
+    """
+    Validate a raw feed record and convert it to a product tuple.
+
+    Args:
+        record: Mapping with at least sku, wholesale_price and retail_price
+
+    Returns:
+        Tuple in PRODUCT_COLUMNS order, or None if the record is invalid
+    """
+    try:
+        sku = str(record.get("sku") or "").strip()
+        if not validate_sku(sku):
+            return None
+        wholesale = float(record["wholesale_price"])
+        retail = float(record["retail_price"])
+        if not (validate_price(wholesale) and validate_price(retail)):
+            return None
+        supplier_id = record.get("supplier_id")
+        supplier_id = int(supplier_id) if supplier_id not in (None, "") else None
+        is_active = record.get("is_active")
+        is_active = 1 if is_active in (None, "") else int(str(is_active).lower() in ("1", "true", "yes"))
+        return (
+            sku,
+            record.get("name"),
+            record.get("category"),
+            wholesale,
+            retail,
+            supplier_id,
+            is_active,
+        )
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def iter_chunks(items: Iterable, size: int) -> Iterator[List]:
+    """Yield successive lists of at most ``size`` items from ``items``."""
+    it = iter(items)
+    while True:
+        chunk = list(islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _stage_skus(conn: sqlite3.Connection, rows: List[Tuple]) -> None:
+    """Record the SKUs of a chunk in the temp staging table."""
+    conn.executemany("INSERT OR IGNORE INTO temp.feed_skus(sku) VALUES (?)", ((r[0],) for r in rows))
+
+
+def _deactivate_unstaged(conn: sqlite3.Connection, run_id: Optional[str] = None) -> int:
+    """
+    Deactivate active products whose SKU was not staged. Returns affected rows.
+
+    When ``run_id`` is given the deactivations are recorded in supplier_updates.
+    """
+    if run_id is not None:
+        conn.execute(
+            "INSERT INTO supplier_updates(sku, field, old_value, new_value, run_id) "
+            "SELECT sku, 'is_active', '1', '0', ? FROM products "
+            "WHERE is_active = 1 AND sku NOT IN (SELECT sku FROM temp.feed_skus)",
+            (run_id,),
+        )
+    conn.execute(
+        "DELETE FROM product_hashes WHERE sku IN ("
+        "SELECT sku FROM products WHERE is_active = 1 AND sku NOT IN (SELECT sku FROM temp.feed_skus))"
+    )
+    cur = conn.execute(
+        "UPDATE products SET is_active = 0 "
+        "WHERE is_active = 1 AND sku NOT IN (SELECT sku FROM temp.feed_skus)"
+    )
+    return cur.rowcount
+
+
+def load_records(
+    conn: sqlite3.Connection,
+    records: Iterable[Dict],
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    deactivate_missing: bool = False,
+    reconcile: bool = False,
+    run_id: Optional[str] = None,
+) -> Dict:
+    """
+    Validate and UPSERT catalog records in chunked transactions.
+
+    Args:
+        conn: Open database connection
+        records: Iterable of raw feed records (consumed lazily)
+        chunk_size: Number of rows per executemany() batch / transaction
+        deactivate_missing: Deactivate active SKUs that do not appear in ``records``
+        reconcile: Only write rows whose content hash changed, recording each
+            changed field in supplier_updates
+        run_id: Identifier for the supplier_updates rows (generated if omitted)
+
+    Returns:
+        Dict with rows_read, rows_loaded, rows_skipped, deactivated, chunks,
+        elapsed_s and rows_per_sec. Reconciled loads also report run_id,
+        rows_inserted, rows_updated, rows_unchanged and fields_changed.
+    """
+    t0 = time.perf_counter()
+    stats = {"rows_read": 0, "rows_loaded": 0, "rows_skipped": 0, "deactivated": 0, "chunks": 0}
+    if reconcile:
+        run_id = run_id or str(uuid.uuid4())
+        stats.update({"run_id": run_id, "rows_inserted": 0, "rows_updated": 0,
+                      "rows_unchanged": 0, "fields_changed": 0})
+
+    ensure_hash_table(conn)
+    ensure_epoch_table(conn)
+
+    if deactivate_missing:
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS feed_skus (sku TEXT PRIMARY KEY)")
+        conn.execute("DELETE FROM temp.feed_skus")
+
+    try:
+        for raw_chunk in iter_chunks(records, chunk_size):
+            rows = [r for r in map(normalize_record, raw_chunk) if r is not None]
+            stats["rows_read"] += len(raw_chunk)
+            stats["rows_skipped"] += len(raw_chunk) - len(rows)
+            if not rows:
+                continue
+            with conn:
+                if reconcile:
+                    diff = reconcile_rows(conn, rows, run_id)
+                    for key, count in diff.items():
+                        stats[key] += count
+                    # Updates are recorded in supplier_updates; inserts record no event
+                    if diff["rows_inserted"]:
+                        bump_catalog_epoch(conn)
+                else:
+                    conn.executemany(UPSERT_PRODUCTS_SQL, rows)
+                    invalidate_row_hashes(conn, (r[0] for r in rows))
+                    bump_catalog_epoch(conn)
+                if deactivate_missing:
+                    _stage_skus(conn, rows)
+            stats["rows_loaded"] += len(rows)
+            stats["chunks"] += 1
+
+        # Never deactivate the whole catalog because of an empty or unreadable feed
+        if deactivate_missing and stats["rows_loaded"] > 0:
+            with conn:
+                stats["deactivated"] = _deactivate_unstaged(conn, run_id if reconcile else None)
+                if stats["deactivated"] and not reconcile:
+                    bump_catalog_epoch(conn)
+    finally:
+        if deactivate_missing:
+            conn.execute("DROP TABLE IF EXISTS temp.feed_skus")
+        if reconcile:
+            conn.execute("DROP TABLE IF EXISTS temp.feed_stage")
+
+    elapsed = time.perf_counter() - t0
+    stats["elapsed_s"] = round(elapsed, 3)
+    stats["rows_per_sec"] = round(stats["rows_read"] / elapsed, 1) if elapsed > 0 else 0.0
+    return stats
+
+
+def load_catalog(
+    path: str,
+    db_path: str,
+    fmt: Optional[str] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    deactivate_missing: bool = False,
+    reconcile: bool = True,
+) -> Dict:
+    """
+    Stream a CSV/JSONL catalog feed into the products table.
+
+    Args:
+        path: Path to the feed file
+        db_path: Path to SQLite database file
+        fmt: "csv" or "jsonl" (detected from the extension if omitted)
+        chunk_size: Number of rows per executemany() batch / transaction
+        deactivate_missing: Deactivate active SKUs that do not appear in the feed
+        reconcile: Only write changed rows (see core.feed_diff); set False to
+            blindly UPSERT every row
+
+    Returns:
+        Load statistics (see load_records)
+    """
+    fmt = fmt or detect_format(path)
+    conn = connect_for_bulk_load(db_path)
+    try:
+        stats = load_records(
+            conn,
+            iter_feed_records(path, fmt),
+            chunk_size=chunk_size,
+            deactivate_missing=deactivate_missing,
+            reconcile=reconcile,
+        )
+    finally:
+        conn.close()
+    logger.info(
+        f"Catalog load from {path}: {stats['rows_loaded']} rows loaded, "
+        f"{stats['rows_skipped']} skipped, {stats['deactivated']} deactivated "
+        f"({stats['rows_per_sec']} rows/s)"
+    )
+    return stats
@@ -0,0 +1,424 @@
+"""
+Memory-mapped columnar snapshot of the active catalog, shared by workers.
+
+With CATALOG_SNAPSHOT=1, the first reader that finds the snapshot stale
+writes the active catalog to a sidecar file next to the database
+(``<db>-catalog``, like SQLite's own ``-wal``). The file holds the columns
+sku, name, category, wholesale_price, retail_price and supplier_id:
+
+- numbers as little-endian int64/float64 arrays
+- strings as one UTF-8 blob of NUL-terminated values plus their code-point
+  start offsets
+- categories dictionary-encoded (int32 codes into a small string table)
+- a validity mask for each column that contains NULLs
+
+All arrays are 64-byte aligned after a JSON header, so every process maps
+the same pages of the page cache and reads the arrays in place
+(``np.frombuffer`` over the mmap). Only the Python objects a consumer asks
+for, e.g. the ``core.records.Catalog`` used to build agent contexts, are
+materialized.
+
+The snapshot is stamped with a catalog version made of:
+
+- a random token, created with the ``catalog_epoch`` table, so a new
+  database at the same path never matches an old snapshot
+- ``MAX(id)`` of price_events and supplier_updates, the events every
+  orchestrator write and reconciled feed update records
+- the ``catalog_epoch`` counter, which writers that record no event (the
+  bulk loaders) bump with ``bump_catalog_epoch``
+
+Reading the version is a single query of a few index lookups, so a
+snapshot is reused until the catalog changes and rewritten only then. Any
+code path that modifies products without recording an event must call
+``bump_catalog_epoch`` in the same transaction.
+"""
+
+import os
+import gc
+import json
+import mmap
+import struct
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from core.records import CATALOG_COLUMNS, Catalog
+from core.tracing import span
+
+logger = logging.getLogger(__name__)
+
+CATALOG_SNAPSHOT = os.getenv("CATALOG_SNAPSHOT", "0").lower() in ("1", "true", "yes")
+
+SNAPSHOT_COLUMNS = CATALOG_COLUMNS + ("supplier_id",)
+SNAPSHOT_SELECT_SQL = f"SELECT {', '.join(SNAPSHOT_COLUMNS)} FROM products WHERE is_active=1"
+
+CREATE_EPOCH_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS catalog_epoch (
+        id INTEGER PRIMARY KEY CHECK (id = 1), token TEXT NOT NULL, epoch INTEGER NOT NULL
+    )
+"""
+INIT_EPOCH_SQL = "INSERT OR IGNORE INTO catalog_epoch(id, token, epoch) VALUES (1, lower(hex(randomblob(8))), 0)"
+CATALOG_VERSION_SQL = """
+    SELECT e.token, e.epoch,
+           (SELECT COALESCE(MAX(id), 0) FROM price_events),
+           (SELECT COALESCE(MAX(id), 0) FROM supplier_updates)
+    FROM catalog_epoch e WHERE e.id = 1
+"""
+
+_MAGIC = b"SSCATSN1"
+_PREFIX = struct.Struct("<8sI")  # Magic, header length
+_ALIGN = 64
+_FLOAT_OR_NONE = frozenset((float, type(None)))
+_INT_OR_NONE = frozenset((int, type(None)))
+_STR_OR_NONE = frozenset((str, type(None)))
+
+
+def ensure_epoch_table(conn) -> None:
+    """Create the catalog_epoch table (and its single row) if it does not exist."""
+    conn.execute(CREATE_EPOCH_TABLE_SQL)
+    conn.execute(INIT_EPOCH_SQL)
+
+
+def bump_catalog_epoch(conn) -> None:
+    """
+    Mark the catalog as changed by a write that records no event.
+
+    Safe to call on databases that predate the catalog_epoch table.
+    """
+    try:
+        conn.execute("UPDATE catalog_epoch SET epoch = epoch + 1 WHERE id = 1")
+    except Exception as e:
+        if "no such table" not in str(e):
+            raise
+
+
+def catalog_version(conn) -> Optional[str]:
+    """The current catalog version, or None if the database has no catalog_epoch row."""
+    try:
+        row = conn.execute(CATALOG_VERSION_SQL).fetchone()
+    except Exception as e:
+        if "no such table" not in str(e):
+            raise
+        return None
+    return None if row is None else ".".join(str(v) for v in tuple(row))
+
+
+def snapshot_path(db_path: str) -> Optional[str]:
+    """Sidecar snapshot file of a database file (None for in-memory databases)."""
+    if not db_path or db_path == ":memory:" or db_path.startswith("file:"):
+        return None
+    return f"{db_path}-catalog"
+
+
+def _check_types(name: str, values: tuple, allowed: frozenset) -> None:
+    if not allowed.issuperset(map(type, values)):
+        bad = next(type(v).__name__ for v in values if type(v) not in allowed)
+        raise ValueError(f"Column {name} holds a {bad} value; it cannot be stored in the snapshot")
+
+
+def _mask(values: tuple) -> Optional[np.ndarray]:
+    if None not in values:
+        return None
+    return np.fromiter((v is not None for v in values), dtype=np.bool_, count=len(values))
+
+
+def _encode_strings(name: str, values: tuple) -> Dict[str, np.ndarray]:
+    _check_types(name, values, _STR_OR_NONE)
+    mask = _mask(values)
+    if mask is not None:
+        values = tuple(v or "" for v in values)
+    # Values are NUL-terminated, so readers without NULs inside values can decode with one str.split
+    text = "\x00".join(values) + "\x00"
+    starts = np.zeros(len(values) + 1, dtype=np.int64)
+    np.cumsum(np.fromiter(map(len, values), dtype=np.int64, count=len(values)) + 1, out=starts[1:])
+    arrays = {f"{name}.starts": starts, f"{name}.data": np.frombuffer(text.encode("utf-8"), dtype=np.uint8)}
+    if mask is not None:
+        arrays[f"{name}.valid"] = mask
+    return arrays
+
+
+def _encode_numbers(name: str, values: tuple, allowed: frozenset, dtype) -> Dict[str, np.ndarray]:
+    _check_types(name, values, allowed)
+    mask = _mask(values)
+    if mask is not None:
+        values = tuple(0 if v is None else v for v in values)
+    arrays = {name: np.array(values, dtype=dtype)}
+    if mask is not None:
+        arrays[f"{name}.valid"] = mask
+    return arrays
+
+
+def encode_columns(columns: Dict[str, tuple]) -> Dict[str, np.ndarray]:
+    """
+    Encode SNAPSHOT_COLUMNS value tuples into the snapshot's named arrays.
+
+    Raises:
+        ValueError: If a column holds a value of another type than its schema
+            (e.g. text stored in a REAL column)
+    """
+    arrays = {}
+    arrays.update(_encode_strings("sku", columns["sku"]))
+    arrays.update(_encode_strings("name", columns["name"]))
+    categories: Dict[str, int] = {}
+    category = columns["category"]
+    _check_types("category", category, _STR_OR_NONE)
+    arrays["category.codes"] = np.fromiter(
+        (-1 if c is None else categories.setdefault(c, len(categories)) for c in category),
+        dtype=np.int32, count=len(category))
+    arrays.update(_encode_strings("category.table", tuple(categories)))
+    arrays.update(_encode_numbers("wholesale_price", columns["wholesale_price"], _FLOAT_OR_NONE, "<f8"))
+    arrays.update(_encode_numbers("retail_price", columns["retail_price"], _FLOAT_OR_NONE, "<f8"))
+    arrays.update(_encode_numbers("supplier_id", columns["supplier_id"], _INT_OR_NONE, "<i8"))
+    return arrays
+
+
+def _aligned(n: int) -> int:
+    return -(-n // _ALIGN) * _ALIGN
+
+
+def write_snapshot(path: str, version: str, rows: int, arrays: Dict[str, np.ndarray]) -> int:
+    """
+    Atomically write a snapshot file (readers keep the mapping of any file it replaces).
+
+    Returns:
+        File size in bytes
+    """
+    layout, offset = {}, 0
+    for name, array in arrays.items():
+        layout[name] = [array.dtype.str, offset, len(array)]
+        offset = _aligned(offset + array.nbytes)
+    header = json.dumps({"version": version, "rows": rows, "created_at": datetime.now(timezone.utc).isoformat(),
+                         "arrays": layout}).encode("utf-8")
+    data_start = _aligned(_PREFIX.size + len(header))
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp, "wb") as f:
+            f.write(_PREFIX.pack(_MAGIC, len(header)))
+            f.write(header)
+            for name, array in arrays.items():
+                f.seek(data_start + layout[name][1])
+                f.write(memoryview(np.ascontiguousarray(array)).cast("B"))
+            f.truncate(data_start + offset)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+    return data_start + offset
+
+
+class CatalogSnapshot:
+    """
+    A mapped snapshot file; ``arrays`` are read-only views of the mapping.
+
+    Example:
+        >>> snapshot = CatalogSnapshot.open("suppliersync.db-catalog")
+        >>> snapshot.arrays["retail_price"].mean()  # No copy of the column
+        >>> catalog = snapshot.to_catalog()
+    """
+
+    def __init__(self, path: str, version: str, rows: int, created_at: str, arrays: Dict[str, np.ndarray],
+                 stat: Tuple[int, int, int]):
+        self.path = path
+        self.version = version
+        self.rows = rows
+        self.created_at = created_at
+        self.arrays = arrays
+        self.stat = stat
+
+    @classmethod
+    def open(cls, path: str) -> "CatalogSnapshot":
+        """
+        Map a snapshot file.
+
+        Raises:
+            FileNotFoundError: If there is no snapshot
+            ValueError: If the file is not a snapshot
+        """
+        with open(path, "rb") as f:
+            st = os.fstat(f.fileno())
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(buffer) < _PREFIX.size:
+            raise ValueError(f"{path} is not a catalog snapshot")
+        magic, header_len = _PREFIX.unpack_from(buffer)
+        if magic != _MAGIC:
+            raise ValueError(f"{path} is not a catalog snapshot")
+        header = json.loads(bytes(buffer[_PREFIX.size:_PREFIX.size + header_len]))
+        data_start = _aligned(_PREFIX.size + header_len)
+        arrays = {name: np.frombuffer(buffer, dtype=dtype, count=count, offset=data_start + offset)
+                  for name, (dtype, offset, count) in header["arrays"].items()}
+        return cls(path, header["version"], header["rows"], header["created_at"], arrays,
+                   (st.st_ino, st.st_mtime_ns, st.st_size))
+
+    def _valid(self, name: str, values: List) -> List:
+        mask = self.arrays.get(f"{name}.valid")
+        if mask is None:
+            return values
+        return [v if ok else None for v, ok in zip(values, mask.tolist())]
+
+    def strings(self, name: str) -> List[Optional[str]]:
+        """Decode a string column ("sku", "name" or "category.table")."""
+        text = str(self.arrays[f"{name}.data"], "utf-8")
+        starts = self.arrays[f"{name}.starts"]
+        values = text.split("\x00")
+        if len(values) != len(starts):  # A value contains NUL: cut at the stored code-point starts
+            starts = starts.tolist()
+            values = [text[a:b - 1] for a, b in zip(starts, starts[1:])]
+        else:
+            values.pop()  # Empty string after the last terminator
+        return self._valid(name, values)
+
+    def numbers(self, name: str) -> List:
+        """A numeric column as Python values (None for NULL)."""
+        return self._valid(name, self.arrays[name].tolist())
+
+    def categories(self) -> List[Optional[str]]:
+        """The category column; repeated categories share one string object."""
+        table = self.strings("category.table") + [None]  # Code -1 (NULL) indexes the trailing None
+        return list(map(table.__getitem__, self.arrays["category.codes"].tolist()))
+
+    def to_catalog(self) -> Catalog:
+        """Materialize the columns of ``core.records.Catalog``."""
+        enabled = gc.isenabled()
+        gc.disable()  # As in Catalog.from_cursor: no cycles among 100k+ new strings and floats
+        try:
+            return Catalog(tuple(self.strings("sku")), tuple(self.strings("name")), tuple(self.categories()),
+                           tuple(self.numbers("wholesale_price")), tuple(self.numbers("retail_price")))
+        finally:
+            if enabled:
+                gc.enable()
+
+
+class CatalogSnapshots:
+    """
+    Serves the active catalog of one database from its snapshot file.
+
+    ``catalog(conn)`` reads the catalog version. If the mapped (or on-disk)
+    snapshot has that version, the catalog comes from it without querying
+    products; otherwise it is fetched from the database and the snapshot is
+    rewritten. The materialized ``Catalog`` is cached per snapshot, so
+    repeated reads in a process reuse it.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._snapshot: Optional[CatalogSnapshot] = None
+        self._catalog: Optional[Catalog] = None
+
+    def current(self, version: Optional[str]) -> Optional[CatalogSnapshot]:
+        """The snapshot with this version, remapping the file if another process rewrote it."""
+        if version is None:
+            return None
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.version == version:
+            return snapshot
+        try:
+            st = os.stat(self.path)
+            if snapshot is None or (st.st_ino, st.st_mtime_ns, st.st_size) != snapshot.stat:
+                snapshot = CatalogSnapshot.open(self.path)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable catalog snapshot {self.path}: {e}")
+            return None
+        if snapshot.version != version:
+            return None
+        with self._lock:
+            if self._snapshot is not snapshot:
+                self._snapshot, self._catalog = snapshot, None
+        return snapshot
+
+    def catalog(self, conn, publish: bool = True) -> Catalog:
+        """
+        The active catalog as seen by ``conn``.
+
+        The version and rows are read in one read transaction. A stale
+        snapshot is rewritten only when ``conn`` has no transaction of its own
+        open, so uncommitted writes never reach other processes.
+
+        Args:
+            conn: Database connection
+            publish: Rewrite a stale snapshot (False for intermediate states
+                that are about to change again)
+        """
+        own_transaction = not conn.in_transaction
+        if own_transaction:
+            conn.execute("BEGIN")
+        try:
+            version = catalog_version(conn)
+            snapshot = self.current(version)
+            if snapshot is not None:
+                return self._materialize(snapshot)
+            with span("fetch_rows") as s:
+                cur = conn.cursor()
+                cur.row_factory = None
+                enabled = gc.isenabled()
+                gc.disable()  # As in Catalog.from_cursor
+                try:
+                    rows = cur.execute(SNAPSHOT_SELECT_SQL).fetchall()
+                finally:
+                    if enabled:
+                        gc.enable()
+                cur.close()
+                s.rows = len(rows)
+        finally:
+            if own_transaction:
+                conn.commit()
+        columns = dict(zip(SNAPSHOT_COLUMNS, zip(*rows))) if rows else {c: () for c in SNAPSHOT_COLUMNS}
+        catalog = Catalog.from_columns(*(columns[c] for c in CATALOG_COLUMNS))
+        if publish and own_transaction and version is not None:
+            self._publish(version, len(rows), columns, catalog)
+        return catalog
+
+    def _materialize(self, snapshot: CatalogSnapshot) -> Catalog:
+        with self._lock:
+            if self._snapshot is snapshot and self._catalog is not None:
+                return self._catalog
+        with span("snapshot_catalog") as s:
+            catalog = snapshot.to_catalog()
+            s.rows = len(catalog)
+        with self._lock:
+            if self._snapshot is snapshot:
+                self._catalog = catalog
+        return catalog
+
+    def _publish(self, version: str, rows: int, columns: Dict[str, tuple], catalog: Catalog) -> None:
+        with span("publish_snapshot") as s:
+            try:
+                s.bytes = write_snapshot(self.path, version, rows, encode_columns(columns))
+                snapshot = CatalogSnapshot.open(self.path)
+            except (OSError, ValueError) as e:
+                # The caller still gets the catalog; the next reader retries
+                logger.warning(f"Could not publish catalog snapshot {self.path}: {e}")
+                return
+        with self._lock:
+            self._snapshot, self._catalog = snapshot, catalog
+
+
+# Databases with a store per process (replays create a scratch database per run)
+_MAX_STORES = 4
+_stores: "OrderedDict[str, CatalogSnapshots]" = OrderedDict()
+_stores_lock = threading.Lock()
+
+
+def get_catalog_snapshots(db_path: str, enabled: Optional[bool] = None) -> Optional[CatalogSnapshots]:
+    """The process-wide snapshot store of a database (None if snapshots are disabled)."""
+    path = snapshot_path(db_path)
+    if path is None or not (CATALOG_SNAPSHOT if enabled is None else enabled):
+        return None
+    key = os.path.abspath(path)
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = _stores[key] = CatalogSnapshots(path)
+            while len(_stores) > _MAX_STORES:
+                _stores.popitem(last=False)
+        _stores.move_to_end(key)
+        return store
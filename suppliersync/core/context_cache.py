@@ -0,0 +1,217 @@
+"""
+Per-SKU serialized catalog fragments, reused across agent contexts and runs.
+
+Every agent context embeds the whole active catalog as JSON, and
+``Orchestrator.step`` builds three of them per run, though a run changes
+only the rows it writes. ``ContextCache`` keeps the catalog rows of one
+database together with each row's JSON object text (one list per indent
+layout). A context is the join of the cached fragments, a single
+C-level copy.
+
+The cache is stamped with the catalog version of core/catalog_snapshot.py.
+The write paths report what they changed through ``invalidate``:
+
+- ``_apply_supplier_updates`` and ``_apply_price_changes`` pass the SKUs
+  they touched and the number of events they recorded, once committed. If
+  the version has moved by exactly those events, ``refresh`` re-reads and
+  re-encodes only those SKUs. A failed run calls ``reset``, so nothing it
+  reported is trusted.
+- Any other change, e.g. a bulk load (which bumps ``catalog_epoch`` or
+  records supplier_updates) or another process's run, moves the version
+  further. ``refresh`` then reloads the catalog and re-encodes only the rows
+  that differ from the cached ones.
+
+``ContextCache`` offers the part of ``core.records.Catalog`` the
+orchestrator uses (``to_json``, ``select``, ``category``, ``len``), so it
+can stand in for the catalog once refreshed.
+"""
+
+import os
+import operator
+import threading
+from collections import OrderedDict
+from itertools import compress
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from core.catalog_snapshot import catalog_version
+from core.records import CATALOG_COLUMNS, Catalog, CatalogRow, join_fragments
+
+CONTEXT_CACHE = os.getenv("CONTEXT_CACHE", "1").lower() in ("1", "true", "yes")
+
+# Databases with a cache per process (replays create a scratch database per run)
+_MAX_CACHES = 4
+
+
+def _advanced(version: str, price_events: int, supplier_updates: int) -> str:
+    """The version after this process recorded the given numbers of events."""
+    token, epoch, last_price_event, last_supplier_update = version.rsplit(".", 3)
+    return f"{token}.{epoch}.{int(last_price_event) + price_events}.{int(last_supplier_update) + supplier_updates}"
+
+
+class ContextCache:
+    """
+    Catalog rows of one database with their serialized JSON fragments.
+
+    Example:
+        >>> cache = get_context_cache("suppliersync.db")
+        >>> cache.refresh(db, load=lambda: Catalog.from_cursor(db.execute(CATALOG_SELECT_SQL)))
+        >>> context = context_json(cache, extra)  # Only rows changed since the last refresh were re-encoded
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.version: Optional[str] = None
+        self._sku: tuple = ()
+        self._rows: List[tuple] = []
+        self._index: Dict[str, int] = {}
+        # (indent, level) -> row fragments, and their joined array text
+        self._fragments: Dict[Tuple[Optional[int], int], List[str]] = {}
+        self._joined: Dict[Tuple[Optional[int], int], str] = {}
+        self._dirty: set = set()
+        self._events = [0, 0]  # price_events, supplier_updates recorded since ``version``
+
+    def invalidate(self, skus: Iterable[str], price_events: int = 0, supplier_updates: int = 0) -> None:
+        """
+        Record a committed write to products made through this process.
+
+        Args:
+            skus: SKUs whose rows were written
+            price_events: price_events rows recorded with the write
+            supplier_updates: supplier_updates rows recorded with the write
+        """
+        with self._lock:
+            self._dirty.update(sku for sku in skus if sku)
+            self._events[0] += price_events
+            self._events[1] += supplier_updates
+
+    def reset(self) -> None:
+        """
+        Forget the cached version, e.g. after a rollback, so the next
+        ``refresh`` reloads the catalog (unchanged rows keep their fragments).
+        """
+        with self._lock:
+            self.version = None
+            self._dirty.clear()
+            self._events = [0, 0]
+
+    def refresh(self, conn, load: Callable[[], Catalog]) -> int:
+        """
+        Bring the cache up to the catalog ``conn`` sees.
+
+        Args:
+            conn: Database connection
+            load: Fetches the whole active catalog, when the cache cannot be
+                patched from the invalidated SKUs alone
+
+        Returns:
+            Number of rows re-encoded
+        """
+        with self._lock:
+            version = catalog_version(conn)
+            if version is not None and version == self.version and not self._dirty:
+                return 0
+            changed = None
+            if version is not None and self.version is not None and version == _advanced(self.version, *self._events):
+                changed = self._patch(conn, self._dirty)
+            if changed is None:
+                changed = self._reload(load())
+            self.version = version
+            self._dirty.clear()
+            self._events = [0, 0]
+            return changed
+
+    def _patch(self, conn, skus: set) -> Optional[int]:
+        """Re-read the given SKUs; None if the set of active SKUs changed."""
+        if not skus:
+            return 0
+        cur = conn.cursor()
+        cur.row_factory = None
+        placeholders = ",".join(["?"] * len(skus))
+        # By SKU alone: with "is_active=1" in the WHERE clause SQLite scans the is_active index instead
+        cur.execute(f"SELECT {', '.join(CATALOG_COLUMNS)}, is_active FROM products WHERE sku IN ({placeholders})",
+                    list(skus))
+        found = {row[0]: row[:-1] for row in cur.fetchall() if row[-1] == 1}
+        cur.close()
+        if any((sku in self._index) != (sku in found) for sku in skus):
+            return None  # Activated or deactivated: row positions move
+        positions = [self._index[sku] for sku, row in found.items() if self._rows[self._index[sku]] != row]
+        self._replace(positions, [found[self._sku[i]] for i in positions])
+        return len(positions)
+
+    def _reload(self, catalog: Catalog) -> int:
+        """Take the rows of ``catalog``, re-encoding those not cached unchanged."""
+        rows = list(zip(catalog.sku, catalog.name, catalog.category, catalog.wholesale_price, catalog.retail_price))
+        if catalog.sku == self._sku:
+            # Same SKUs in the same order: compare rows pairwise
+            positions = list(compress(range(len(rows)), map(operator.ne, self._rows, rows)))
+            self._rows = rows
+            self._replace(positions, [rows[i] for i in positions])
+            return len(positions)
+        # Cached rows that are unchanged keep their fragments, whatever their new position
+        old_rows, old_index = self._rows, self._index
+        keep = [j if j is not None and old_rows[j] == row else None
+                for j, row in zip(map(old_index.get, catalog.sku), rows)]
+        positions = [i for i, j in enumerate(keep) if j is None]
+        for key, old in self._fragments.items():
+            self._fragments[key] = [None if j is None else old[j] for j in keep]
+        self._sku, self._rows = catalog.sku, rows
+        self._index = {sku: i for i, sku in enumerate(catalog.sku)}
+        self._joined.clear()
+        self._replace(positions, [rows[i] for i in positions])
+        return len(positions)
+
+    def _replace(self, positions: List[int], rows: List[tuple]) -> None:
+        for i, row in zip(positions, rows):
+            self._rows[i] = row
+        if not positions:
+            return
+        self._joined.clear()
+        if not self._fragments:
+            return  # Nothing serialized yet: to_json encodes every row on first use
+        changed = Catalog.from_rows(rows)
+        for key, fragments in self._fragments.items():
+            for i, fragment in zip(positions, changed.fragments(*key)):
+                fragments[i] = fragment
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    @property
+    def category(self) -> List[Optional[str]]:
+        return [row[2] for row in self._rows]
+
+    def select(self, skus: Iterable[str]) -> Dict[str, CatalogRow]:
+        """Rows of the given SKUs (absent SKUs are left out)."""
+        with self._lock:
+            return {sku: CatalogRow._make(self._rows[self._index[sku]]) for sku in set(skus) if sku in self._index}
+
+    def to_json(self, indent: Optional[int] = None, level: int = 0) -> str:
+        """Same text as ``Catalog.to_json`` of the cached rows."""
+        key = (indent, level)
+        with self._lock:
+            text = self._joined.get(key)
+            if text is None:
+                fragments = self._fragments.get(key)
+                if fragments is None:
+                    fragments = self._fragments[key] = Catalog.from_rows(self._rows).fragments(indent, level)
+                text = self._joined[key] = join_fragments(fragments, indent, level)
+            return text
+
+
+_caches: "OrderedDict[str, ContextCache]" = OrderedDict()
+_caches_lock = threading.Lock()
+
+
+def get_context_cache(db_path: str, enabled: Optional[bool] = None) -> Optional[ContextCache]:
+    """The process-wide context cache of a database (None if the cache is disabled)."""
+    if not db_path or db_path == ":memory:" or not (CONTEXT_CACHE if enabled is None else enabled):
+        return None
+    key = os.path.abspath(db_path)
+    with _caches_lock:
+        cache = _caches.get(key)
+        if cache is None:
+            cache = _caches[key] = ContextCache()
+            while len(_caches) > _MAX_CACHES:
+                _caches.popitem(last=False)
+        _caches.move_to_end(key)
+        return cache
@@ -6,14 +6,177 @@ including access controls, backup utilities, and encryption helpers.
 """
 
 import os
+import time
 import sqlite3
 import logging
 from pathlib import Path
+from functools import lru_cache
 from typing import Optional
 from datetime import datetime
 
+from core.metrics import DB_ERRORS, DB_QUERY_LATENCY
+from core.query_stats import QUERY_STATS
+
 logger = logging.getLogger(__name__)
 
+# Statement types reported as-is in metrics; anything else is "OTHER"
+_OPERATIONS = frozenset(("SELECT", "INSERT", "UPDATE", "DELETE", "REPLACE", "WITH", "CREATE", "ALTER",
+                         "DROP", "PRAGMA", "BEGIN", "COMMIT", "ROLLBACK"))
+
+
+@lru_cache(maxsize=2048)
+def _operation(sql: str) -> str:
+    head = sql.lstrip()[:8].split(None, 1)
+    op = head[0].upper() if head else ""
+    return op if op in _OPERATIONS else "OTHER"
+
+
+def _count_error(operation: str, exc: sqlite3.OperationalError) -> None:
+    # "database is locked" (busy timeout expired) is the contention signal load tests watch
+    DB_ERRORS.inc(operation, "locked" if "locked" in str(exc) else "operational")
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """
+    Cursor that records statement execution time in ``db_query_duration_seconds``
+    and operational errors (e.g. lock timeouts) in ``db_errors_total``.
+
+    Each statement is also reported to ``core.query_stats`` with its execute
+    time plus the time spent in ``fetchone``/``fetchmany``/``fetchall``
+    (where SQLite does most of the work of a SELECT). A statement is
+    finished, and reported, once fully fetched, when the cursor runs its
+    next statement or is closed or collected. Rows consumed by iterating
+    over the cursor are not timed, to keep per-row overhead at zero.
+    """
+
+    _pending = None  # [sql, parameters, elapsed_s, rows] of the statement in progress
+
+    def execute(self, sql, parameters=()):
+        if self._pending is not None:
+            self._finish()
+        started = time.perf_counter()
+        try:
+            result = super().execute(sql, parameters)
+        except sqlite3.OperationalError as e:
+            _count_error(_operation(sql), e)
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            DB_QUERY_LATENCY.observe(elapsed, _operation(sql))
+        if self.description is None:
+            # No result rows to fetch (DML/DDL): finished now
+            QUERY_STATS.record(self.connection, sql, parameters, elapsed,
+                               self.rowcount if self.rowcount >= 0 else None)
+        else:
+            self._pending = [sql, parameters, elapsed, None]
+        return result
+
+    def executemany(self, sql, seq_of_parameters):
+        if self._pending is not None:
+            self._finish()
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        except sqlite3.OperationalError as e:
+            _count_error(_operation(sql), e)
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            DB_QUERY_LATENCY.observe(elapsed, _operation(sql))
+            # No single parameter set to EXPLAIN with
+            QUERY_STATS.record(None, sql, None, elapsed, self.rowcount if self.rowcount >= 0 else None)
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(started, 0 if row is None else 1, done=row is None)
+        return row
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._fetched(started, len(rows), done=len(rows) < (self.arraysize if size is None else size))
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(started, len(rows), done=True)
+        return rows
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        if self._pending is not None:
+            try:
+                self._finish()
+            except Exception:
+                pass  # Connection already closed or interpreter shutting down
+
+    def _fetched(self, started: float, rows: int, done: bool) -> None:
+        pending = self._pending
+        if pending is not None:
+            pending[2] += time.perf_counter() - started
+            pending[3] = (pending[3] or 0) + rows
+            if done:
+                self._finish()
+
+    def _finish(self) -> None:
+        pending, self._pending = self._pending, None
+        if pending is not None:
+            QUERY_STATS.record(self.connection, *pending)
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """
+    Connection whose statements are timed (pass as ``factory=`` to ``sqlite3.connect``).
+
+    The C implementation of ``Connection.execute``/``executemany`` runs the
+    statement on a new cursor without calling its Python ``execute``, so
+    both are routed through an InstrumentedCursor explicitly. Commits are
+    timed too, since with WAL they are where the fsync happens; the C
+    ``__exit__`` of ``with conn:`` commits without calling ``commit``, so it
+    is routed through it the same way.
+    """
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def commit(self):
+        started = time.perf_counter()
+        try:
+            return super().commit()
+        except sqlite3.OperationalError as e:
+            _count_error("COMMIT", e)
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            DB_QUERY_LATENCY.observe(elapsed, "COMMIT")
+            QUERY_STATS.record(None, "COMMIT", None, elapsed)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None and self.in_transaction:
+            try:
+                self.commit()
+            except BaseException:
+                self.rollback()  # As the C __exit__ does when its commit fails
+                raise
+            return False
+        return super().__exit__(exc_type, exc_value, traceback)
+
+
+def connect(db_path: str, **kwargs) -> sqlite3.Connection:
+    """``sqlite3.connect`` returning an InstrumentedConnection."""
+    return sqlite3.connect(db_path, factory=InstrumentedConnection, **kwargs)
+
 
 class SecureDatabase:
     """
@@ -70,7 +233,7 @@ class SecureDatabase:
             sqlite3.Error: If connection fails
         """
         try:
-            conn = sqlite3.connect(
+            conn = connect(
                 self.db_path,
                 timeout=10.0,  # 10 second timeout
                 check_same_thread=False  # Allow multi-threading
@@ -0,0 +1,119 @@
+"""
+Persistent chunk-embedding cache for SupplierSync RAG builds.
+
+Embeddings are stored in a small SQLite database keyed by (model name,
+SHA-256 of the chunk text), as packed float32 blobs. Rebuilds consult the
+cache before calling the model, so re-embedding identical chunk texts after
+a chunking change or collection reset is a disk read instead of a model call.
+"""
+
+import os
+import hashlib
+import threading
+import logging
+from array import array
+from typing import Callable, Dict, List, Sequence
+
+from core.database import connect
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_CACHE_PATH = os.getenv("RAG_EMBEDDING_CACHE_PATH", ".embedding_cache.db")
+
+# SQLite limits the number of bound parameters per statement
+_LOOKUP_BATCH = 500
+
+
+def text_hash(text: str) -> bytes:
+    """Cache key for a chunk text."""
+    return hashlib.sha256(text.encode("utf-8")).digest()
+
+
+class EmbeddingCache:
+    """
+    SQLite-backed (model, text hash) -> float32 vector store.
+
+    Safe to share between threads; each call holds an internal lock for
+    the duration of its SQLite work.
+    """
+
+    def __init__(self, path: str = EMBEDDING_CACHE_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = connect(path, timeout=30.0, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL;")
+        self._conn.execute("PRAGMA synchronous=NORMAL;")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL, text_hash BLOB NOT NULL, vector BLOB NOT NULL,
+                PRIMARY KEY (model, text_hash)
+            ) WITHOUT ROWID
+        """)
+        self._conn.commit()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, model: str, keys: Sequence[bytes]) -> Dict[bytes, List[float]]:
+        """Return cached vectors for the given keys (missing keys are omitted)."""
+        found = {}
+        unique = list(dict.fromkeys(keys))
+        with self._lock:
+            for i in range(0, len(unique), _LOOKUP_BATCH):
+                batch = unique[i:i + _LOOKUP_BATCH]
+                placeholders = ",".join(["?"] * len(batch))
+                cur = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                    [model, *batch],
+                )
+                for key, blob in cur:
+                    vec = array("f")
+                    vec.frombytes(blob)
+                    found[key] = vec.tolist()
+        return found
+
+    def put_many(self, model: str, items: Dict[bytes, List[float]]) -> None:
+        """Store vectors, replacing any existing entry for the same key."""
+        if not items:
+            return
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings(model, text_hash, vector) VALUES (?, ?, ?)",
+                ((model, key, array("f", vec).tobytes()) for key, vec in items.items()),
+            )
+
+    def embed(self, model: str, texts: List[str], embed_fn: Callable[[List[str]], List[List[float]]]) -> List[List[float]]:
+        """
+        Embed texts, calling ``embed_fn`` only for texts not already cached.
+
+        Args:
+            model: Model name the vectors belong to
+            texts: Texts to embed
+            embed_fn: Batched embedding function used for cache misses
+
+        Returns:
+            One vector per input text, in input order
+        """
+        keys = [text_hash(t) for t in texts]
+        cached = self.get_many(model, keys)
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+        if missing:
+            vectors = embed_fn(list(missing.values()))
+            fresh = dict(zip(missing.keys(), vectors))
+            self.put_many(model, fresh)
+            cached.update(fresh)
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+        return [cached[key] for key in keys]
+
+    def count(self, model: str) -> int:
+        """Number of cached vectors for a model."""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings WHERE model = ?", (model,)).fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
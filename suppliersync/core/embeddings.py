@@ -0,0 +1,264 @@
+"""
+Shared embedding model service for SupplierSync.
+
+The SentenceTransformer model is expensive to load (hundreds of MB of RAM and
+seconds of startup), so it must never be constructed per request or per
+import. This module provides a single ``embed(texts)`` entry point backed by
+one of two providers:
+
+- LocalEmbedder: a lazily loaded, process-wide singleton. The model is only
+  loaded on the first embed call.
+- SocketEmbedder: a client for a sidecar process that holds the only copy
+  of the model on the host, reached over a local Unix socket. Set
+  EMBEDDING_SOCKET to use it; start the sidecar with
+  ``python -m core.embeddings --socket /tmp/suppliersync-embed.sock``.
+
+Whoever holds the model micro-batches concurrent requests: calls arriving
+within EMBEDDING_BATCH_WAIT_MS of each other (from threads, or from other
+workers via the sidecar) are encoded in one model call. With the sidecar,
+memory stays flat in the number of uvicorn workers.
+"""
+
+import os
+import json
+import queue
+import socket
+import struct
+import logging
+import argparse
+import threading
+import socketserver
+from array import array
+from concurrent.futures import Future
+from time import monotonic
+from typing import Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+EMBEDDING_SOCKET = os.getenv("EMBEDDING_SOCKET", "")
+MAX_BATCH = int(os.getenv("EMBEDDING_MAX_BATCH", "64"))
+BATCH_WAIT_MS = float(os.getenv("EMBEDDING_BATCH_WAIT_MS", "5"))
+
+
+class MicroBatcher:
+    """
+    Coalesce concurrent embed requests into batched model calls.
+
+    A single daemon thread drains the request queue: it takes the first
+    pending request, then waits up to ``max_wait_ms`` for more until
+    ``max_batch`` texts are collected, encodes them in one call and hands
+    each caller its slice of the result.
+    """
+
+    def __init__(self, encode: Callable[[List[str]], List[List[float]]],
+                 max_batch: int = MAX_BATCH, max_wait_ms: float = BATCH_WAIT_MS):
+        self._encode = encode
+        self._max_batch = max_batch
+        self._max_wait = max_wait_ms / 1000.0
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def submit(self, texts: List[str]) -> List[List[float]]:
+        """Embed ``texts``, blocking until the batch containing them is encoded."""
+        if not texts:
+            return []
+        self._ensure_thread()
+        fut: Future = Future()
+        self._queue.put((list(texts), fut))
+        return fut.result()
+
+    def _ensure_thread(self) -> None:
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+                    self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            size = len(batch[0][0])
+            deadline = monotonic() + self._max_wait
+            while size < self._max_batch:
+                remaining = deadline - monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                batch.append(item)
+                size += len(item[0])
+
+            flat = [t for texts, _ in batch for t in texts]
+            try:
+                vectors = self._encode(flat)
+            except Exception as e:
+                for _, fut in batch:
+                    fut.set_exception(e)
+                continue
+            offset = 0
+            for texts, fut in batch:
+                fut.set_result(vectors[offset:offset + len(texts)])
+                offset += len(texts)
+
+
+class LocalEmbedder:
+    """In-process embedder; the model is loaded on first use and shared by all threads."""
+
+    def __init__(self, model_name: str = EMBEDDING_MODEL):
+        self.model_name = model_name
+        self._model = None
+        self._load_lock = threading.Lock()
+        self._batcher = MicroBatcher(self._encode)
+
+    @property
+    def loaded(self) -> bool:
+        """Whether the model has been loaded (never triggers a load)."""
+        return self._model is not None
+
+    def _get_model(self):
+        if self._model is None:
+            with self._load_lock:
+                if self._model is None:
+                    from sentence_transformers import SentenceTransformer
+                    logger.info(f"Loading embedding model: {self.model_name}")
+                    self._model = SentenceTransformer(self.model_name)
+        return self._model
+
+    def _encode(self, texts: List[str]) -> List[List[float]]:
+        return self._get_model().encode(texts, batch_size=MAX_BATCH, convert_to_numpy=True).tolist()
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        return self._batcher.submit(texts)
+
+
+# Wire format: 4-byte big-endian length followed by that many bytes.
+# Request payload is JSON {"texts": [...]}; response is JSON {"n", "dim"}
+# or {"error"}, followed (on success) by a frame of n*dim float32 values.
+
+def _send_frame(sock: socket.socket, payload: bytes) -> None:
+    sock.sendall(struct.pack(">I", len(payload)) + payload)
+
+
+def _recv_exact(sock: socket.socket, n: int) -> bytes:
+    buf = bytearray()
+    while len(buf) < n:
+        part = sock.recv(n - len(buf))
+        if not part:
+            raise ConnectionError("Embedding socket closed")
+        buf.extend(part)
+    return bytes(buf)
+
+
+def _recv_frame(sock: socket.socket) -> bytes:
+    (length,) = struct.unpack(">I", _recv_exact(sock, 4))
+    return _recv_exact(sock, length)
+
+
+class SocketEmbedder:
+    """Client for the embedding sidecar; holds no model memory itself."""
+
+    def __init__(self, socket_path: str, model_name: str = EMBEDDING_MODEL, timeout: float = 60.0):
+        self.socket_path = socket_path
+        self.model_name = model_name
+        self.timeout = timeout
+        self.loaded = False
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(self.timeout)
+            sock.connect(self.socket_path)
+            _send_frame(sock, json.dumps({"texts": list(texts)}).encode("utf-8"))
+            header = json.loads(_recv_frame(sock))
+            if "error" in header:
+                raise RuntimeError(f"Embedding sidecar error: {header['error']}")
+            values = array("f")
+            values.frombytes(_recv_frame(sock))
+        dim = header["dim"]
+        return [values[i * dim:(i + 1) * dim].tolist() for i in range(header["n"])]
+
+
+class _EmbeddingRequestHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        try:
+            texts = json.loads(_recv_frame(self.request))["texts"]
+            vectors = self.server.embedder.embed(texts)
+        except Exception as e:
+            logger.error(f"Embedding request failed: {e}", exc_info=True)
+            _send_frame(self.request, json.dumps({"error": type(e).__name__}).encode("utf-8"))
+            return
+        dim = len(vectors[0]) if vectors else 0
+        _send_frame(self.request, json.dumps({"n": len(vectors), "dim": dim}).encode("utf-8"))
+        _send_frame(self.request, array("f", (v for vec in vectors for v in vec)).tobytes())
+
+
+class EmbeddingServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Sidecar serving embeddings over a Unix socket; one model copy per host."""
+
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, embedder: Optional[LocalEmbedder] = None):
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        self.embedder = embedder or LocalEmbedder()
+        super().__init__(socket_path, _EmbeddingRequestHandler)
+        os.chmod(socket_path, 0o600)
+
+
+_embedder = None
+_embedder_lock = threading.Lock()
+
+
+def get_embedder():
+    """
+    Return the process-wide embedding provider.
+
+    Uses the sidecar when EMBEDDING_SOCKET is set, otherwise a lazily
+    loaded in-process model. Constructing the provider never loads a model.
+    """
+    global _embedder
+    if _embedder is None:
+        with _embedder_lock:
+            if _embedder is None:
+                if EMBEDDING_SOCKET:
+                    _embedder = SocketEmbedder(EMBEDDING_SOCKET)
+                else:
+                    _embedder = LocalEmbedder()
+    return _embedder
+
+
+def set_embedder(embedder) -> None:
+    """Replace the process-wide provider (e.g. with a stub in tests or benchmarks)."""
+    global _embedder
+    with _embedder_lock:
+        _embedder = embedder
+
+
+def embed(texts: List[str]) -> List[List[float]]:
+    """Embed a batch of texts with the shared provider."""
+    return get_embedder().embed(texts)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Run the shared embedding sidecar")
+    parser.add_argument("--socket", default=EMBEDDING_SOCKET or "/tmp/suppliersync-embed.sock",
+                        help="Unix socket path (default: $EMBEDDING_SOCKET or /tmp/suppliersync-embed.sock)")
+    parser.add_argument("--preload", action="store_true", help="Load the model before accepting requests")
+    args = parser.parse_args()
+
+    server = EmbeddingServer(args.socket)
+    if args.preload:
+        server.embedder.embed(["warmup"])
+    logger.info(f"Embedding sidecar ({server.embedder.model_name}) listening on {args.socket}")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if os.path.exists(args.socket):
+            os.unlink(args.socket)
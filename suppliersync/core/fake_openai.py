@@ -0,0 +1,218 @@
+"""
+Local fake of the OpenAI chat-completions API.
+
+Run with: python -m core.fake_openai --port 8100 --latency lognormal:800:0.5 \\
+              [--rate-429 0.05] [--rate-5xx 0.02] [--rate-timeout 0.01]
+
+then point the app at it:
+
+    OPENAI_BASE_URL=http://127.0.0.1:8100/v1 OPENAI_API_KEY=fake
+
+``POST /v1/chat/completions`` answers with the same agent-shaped JSON as
+the stub backend (``core.llm_stub.respond``) wrapped in a real completion
+envelope, including ``usage`` token counts, so the OpenAI client, its
+retries and timeouts (OPENAI_TIMEOUT, OPENAI_MAX_RETRIES) and our error
+handling run unmodified. Faults are injected per request: 429s with a
+``retry-after`` header, 500/503s, and timeouts (the request hangs until
+the client gives up). ``GET /stats`` reports request, outcome, token and
+concurrency counters; ``POST /stats/reset`` clears them.
+"""
+
+import json
+import time
+import uuid
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+from core.llm_stub import estimate_tokens, latency_sampler, respond
+
+COMPLETIONS_PATHS = ("/v1/chat/completions", "/chat/completions")
+
+
+class FakeOpenAIServer:
+    """
+    Threaded fake OpenAI server (context manager; ``port=0`` picks a free port).
+
+    Latency and fault rates are plain attributes and may be changed while
+    the server runs.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: str = "0", rate_429: float = 0.0,
+                 rate_5xx: float = 0.0, rate_timeout: float = 0.0, hang_s: float = 600.0,
+                 retry_after_s: float = 0.5, seed: Optional[int] = None):
+        self.latency = latency
+        self.rate_429 = rate_429
+        self.rate_5xx = rate_5xx
+        self.rate_timeout = rate_timeout
+        self.hang_s = hang_s
+        self.retry_after_s = retry_after_s
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self.reset_stats()
+        self.httpd = ThreadingHTTPServer((host, port), _handler(self))
+        self.httpd.daemon_threads = True
+        self.url = f"http://{host}:{self.httpd.server_address[1]}/v1"
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def latency(self) -> str:
+        return self._latency_spec
+
+    @latency.setter
+    def latency(self, spec: str) -> None:
+        self._sample_latency = latency_sampler(spec)
+        self._latency_spec = spec
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self.stats = {"requests": 0, "ok": 0, "rate_limited": 0, "server_error": 0, "timeout": 0,
+                          "bad_request": 0, "prompt_tokens": 0, "completion_tokens": 0, "in_flight": 0,
+                          "max_in_flight": 0}
+
+    def _count(self, **deltas) -> None:
+        with self._lock:
+            for key, delta in deltas.items():
+                self.stats[key] += delta
+            self.stats["max_in_flight"] = max(self.stats["max_in_flight"], self.stats["in_flight"])
+
+    def _fault(self) -> Optional[str]:
+        with self._lock:
+            roll = self._rng.random()
+        for fault, rate in (("429", self.rate_429), ("5xx", self.rate_5xx), ("timeout", self.rate_timeout)):
+            if roll < rate:
+                return fault
+            roll -= rate
+        return None
+
+    def start(self) -> "FakeOpenAIServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="fake-openai", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stopping.set()  # Releases hanging "timeout" requests
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self) -> "FakeOpenAIServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+def _handler(server: FakeOpenAIServer):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # Keep-alive, like the real API
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, status: int, payload: dict, headers: dict = None) -> None:
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _error(self, status: int, message: str, kind: str, headers: dict = None) -> None:
+            self._send(status, {"error": {"message": message, "type": kind, "param": None, "code": None}}, headers)
+
+        def do_GET(self):
+            if self.path == "/stats":
+                with server._lock:
+                    self._send(200, dict(server.stats))
+            else:
+                self._error(404, f"Unknown path {self.path}", "invalid_request_error")
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            if self.path == "/stats/reset":
+                server.reset_stats()
+                self._send(200, {"reset": True})
+                return
+            if self.path not in COMPLETIONS_PATHS:
+                self._error(404, f"Unknown path {self.path}", "invalid_request_error")
+                return
+            server._count(requests=1, in_flight=1)
+            try:
+                self._complete(body)
+            finally:
+                server._count(in_flight=-1)
+
+        def _complete(self, body: bytes) -> None:
+            try:
+                request = json.loads(body)
+                messages = {m["role"]: m["content"] for m in request["messages"]}
+                model = request.get("model", "gpt-4o-mini")
+            except (ValueError, KeyError, TypeError):
+                server._count(bad_request=1)
+                self._error(400, "Invalid chat completion request", "invalid_request_error")
+                return
+
+            fault = server._fault()
+            if fault == "timeout":
+                server._count(timeout=1)
+                server._stopping.wait(server.hang_s)  # The client times out and retries or gives up
+                self.close_connection = True
+                return
+            time.sleep(max(0.0, server._sample_latency()) / 1000.0)
+            if fault == "429":
+                server._count(rate_limited=1)
+                self._error(429, "Rate limit reached (injected)", "rate_limit_error",
+                            {"retry-after": str(server.retry_after_s)})
+                return
+            if fault == "5xx":
+                server._count(server_error=1)
+                self._error(server._rng.choice((500, 503)), "Server error (injected)", "server_error")
+                return
+
+            system, user = messages.get("system", ""), messages.get("user", "")
+            content = json.dumps(respond(system, user))
+            prompt_tokens, completion_tokens = estimate_tokens(system, user, content)
+            server._count(ok=1, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+            self._send(200, {
+                "id": f"chatcmpl-{uuid.uuid4().hex[:24]}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                             "logprobs": None, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                          "total_tokens": prompt_tokens + completion_tokens},
+            })
+    return Handler
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Fake OpenAI chat-completions server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--latency", default="0",
+                        help="Latency spec: <ms>, uniform:<lo>:<hi> or lognormal:<median_ms>:<sigma>")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="Fraction of requests answered with 429")
+    parser.add_argument("--rate-5xx", type=float, default=0.0, help="Fraction of requests answered with 500/503")
+    parser.add_argument("--rate-timeout", type=float, default=0.0, help="Fraction of requests that hang")
+    parser.add_argument("--hang", type=float, default=600.0, help="Seconds a hanging request is held open")
+    parser.add_argument("--seed", type=int, help="Seed for fault injection")
+    args = parser.parse_args(argv)
+    server = FakeOpenAIServer(args.host, args.port, args.latency, args.rate_429, args.rate_5xx, args.rate_timeout,
+                              args.hang, seed=args.seed)
+    print(f"Fake OpenAI listening on {server.url} (set OPENAI_BASE_URL={server.url})")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+Row-hash diff engine for supplier feed reconciliation.
+
+Each product's content (name, category, wholesale_price, retail_price,
+supplier_id, is_active) is summarized by a short hash stored in the
+``product_hashes`` table. When a feed is reconciled, incoming rows are hashed
+chunk by chunk and compared against the stored hashes with a single join, so
+only rows whose content actually changed are written to ``products``.
+Every changed field is recorded in ``supplier_updates`` with its old value.
+
+Any code path that modifies products outside of reconciliation must call
+``invalidate_row_hashes`` for the SKUs it touched; a missing hash simply
+falls back to a field-by-field comparison against the products row.
+"""
+
+import hashlib
+import sqlite3
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Hashed product columns, in the order they appear after the SKU in product tuples
+HASHED_COLUMNS = ("name", "category", "wholesale_price", "retail_price", "supplier_id", "is_active")
+
+CREATE_HASH_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS product_hashes (
+        sku TEXT PRIMARY KEY, row_hash TEXT NOT NULL
+    ) WITHOUT ROWID
+"""
+
+
+def _canonical(value) -> str:
+    """Canonical text form of a column value (shared by hashing and field diffs)."""
+    if value is None:
+        return "\x00"
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+def row_hash(values: Iterable) -> str:
+    """
+    Hash the content columns of a product.
+
+    Args:
+        values: Column values in HASHED_COLUMNS order
+
+    Returns:
+        32-character hex digest
+    """
+    payload = "\x1f".join(_canonical(v) for v in values)
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def ensure_hash_table(conn: sqlite3.Connection) -> None:
+    """Create the product_hashes table if it does not exist."""
+    conn.execute(CREATE_HASH_TABLE_SQL)
+
+
+def invalidate_row_hashes(conn: sqlite3.Connection, skus: Iterable[str]) -> None:
+    """
+    Drop stored hashes for SKUs modified outside of feed reconciliation.
+
+    Safe to call on databases that predate the product_hashes table.
+    """
+    try:
+        conn.executemany("DELETE FROM product_hashes WHERE sku = ?", ((s,) for s in skus if s))
+    except sqlite3.OperationalError as e:
+        if "no such table" not in str(e):
+            raise
+
+
+def _diff_fields(old_values: Tuple, new_values: Tuple) -> List[Tuple[str, Optional[str], Optional[str]]]:
+    """Return (field, old_value, new_value) for every column that differs."""
+    changes = []
+    for field, old, new in zip(HASHED_COLUMNS, old_values, new_values):
+        if _canonical(old) != _canonical(new):
+            changes.append((
+                field,
+                None if old is None else str(old),
+                None if new is None else str(new),
+            ))
+    return changes
+
+
+def reconcile_rows(conn: sqlite3.Connection, rows: List[Tuple], run_id: str) -> Dict[str, int]:
+    """
+    Write only the product rows whose content hash changed.
+
+    Must be called inside a transaction. Rows use the catalog loader's
+    PRODUCT_COLUMNS order (sku followed by HASHED_COLUMNS).
+
+    Args:
+        conn: Open database connection
+        rows: Product tuples for one chunk of the feed
+        run_id: Identifier recorded on the supplier_updates rows
+
+    Returns:
+        Dict with rows_inserted, rows_updated, rows_unchanged and fields_changed counts
+    """
+    from core.catalog_loader import UPSERT_PRODUCTS_SQL
+
+    # Last occurrence of a SKU within the chunk wins, matching plain UPSERT semantics
+    by_sku = {r[0]: r for r in rows}
+    hashes = {sku: row_hash(r[1:]) for sku, r in by_sku.items()}
+
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS feed_stage (sku TEXT PRIMARY KEY, row_hash TEXT)")
+    conn.execute("DELETE FROM temp.feed_stage")
+    conn.executemany("INSERT INTO temp.feed_stage(sku, row_hash) VALUES (?, ?)", hashes.items())
+
+    # One join finds every row whose stored hash is missing or different
+    cur = conn.execute("""
+        SELECT s.sku, p.sku IS NOT NULL, p.name, p.category, p.wholesale_price,
+               p.retail_price, p.supplier_id, p.is_active
+        FROM temp.feed_stage s
+        LEFT JOIN product_hashes h ON h.sku = s.sku
+        LEFT JOIN products p ON p.sku = s.sku
+        WHERE h.row_hash IS NULL OR h.row_hash <> s.row_hash
+    """)
+
+    to_write, updates, hash_rows = [], [], []
+    inserted = updated = 0
+    for sku, exists, *old_values in cur.fetchall():
+        new_row = by_sku[sku]
+        hash_rows.append((sku, hashes[sku]))
+        if not exists:
+            to_write.append(new_row)
+            inserted += 1
+            continue
+        changes = _diff_fields(tuple(old_values), new_row[1:])
+        if changes:
+            to_write.append(new_row)
+            updates.extend((sku, field, old, new, run_id) for field, old, new in changes)
+            updated += 1
+        # Unchanged rows without a stored hash only get their hash recorded
+
+    if to_write:
+        conn.executemany(UPSERT_PRODUCTS_SQL, to_write)
+    if updates:
+        conn.executemany(
+            "INSERT INTO supplier_updates(sku, field, old_value, new_value, run_id) VALUES (?,?,?,?,?)",
+            updates,
+        )
+    if hash_rows:
+        conn.executemany("INSERT OR REPLACE INTO product_hashes(sku, row_hash) VALUES (?, ?)", hash_rows)
+
+    return {
+        "rows_inserted": inserted,
+        "rows_updated": updated,
+        "rows_unchanged": len(by_sku) - inserted - updated,
+        "fields_changed": len(updates),
+    }
@@ -0,0 +1,72 @@
+"""
+BM25 keyword index over RAG chunks (SQLite FTS5).
+
+Built next to each vectorstore version by ``build_vectorstore``, one SQLite
+file per version (``fts-<collection>.db`` in the persist directory). The
+retriever uses it to prefilter candidates lexically before reranking only
+that subset by embedding similarity; exact SKU, category and policy-section
+terms are matched precisely and cheaply this way.
+"""
+
+import os
+import re
+from typing import List, Tuple
+
+from core.database import connect
+
+FTS_FILE = "fts-{collection}.db"
+
+# Dropped from queries: they match nearly every chunk and only add cost
+STOPWORDS = frozenset("""
+a an and are as at be by for from in into is it of on or that the this to with
+""".split())
+
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+
+
+def fts_path(persist: str, collection: str) -> str:
+    return os.path.join(persist, FTS_FILE.format(collection=collection))
+
+
+def match_expression(query: str) -> str:
+    """FTS5 MATCH expression OR-ing the query's terms (each quoted, so no query syntax leaks through)."""
+    terms = dict.fromkeys(t.lower() for t in _TOKEN.findall(query) if t.lower() not in STOPWORDS)
+    return " OR ".join(f'"{t}"' for t in terms)
+
+
+class LexicalIndex:
+    """FTS5 table of (chunk id, text) with BM25 ranking."""
+
+    def __init__(self, path: str, readonly: bool = False):
+        self.path = path
+        if readonly:
+            self._conn = connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+        else:
+            # Written once per build by a single writer, so the default rollback journal suffices
+            # (and read-only readers need no -shm/-wal files)
+            self._conn = connect(path, check_same_thread=False)
+            self._conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS chunks USING fts5(chunk_id UNINDEXED, text)")
+
+    def add(self, ids: List[str], texts: List[str]) -> None:
+        with self._conn:
+            self._conn.executemany("INSERT INTO chunks(chunk_id, text) VALUES (?, ?)", zip(ids, texts))
+
+    def search(self, query: str, limit: int) -> List[Tuple[str, float]]:
+        """
+        Best-matching chunk ids for ``query``.
+
+        Returns:
+            List of (chunk id, BM25 score), best first (higher is better)
+        """
+        expr = match_expression(query)
+        if not expr:
+            return []
+        cur = self._conn.execute(
+            "SELECT chunk_id, bm25(chunks) AS score FROM chunks WHERE chunks MATCH ? ORDER BY score LIMIT ?",
+            (expr, limit),
+        )
+        # FTS5's bm25() is negated so that ascending order is best-first
+        return [(cid, -score) for cid, score in cur]
+
+    def close(self) -> None:
+        self._conn.close()
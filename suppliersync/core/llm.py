@@ -1,15 +1,39 @@
 
 import time, os, json
+import contextvars
+from contextlib import contextmanager
 from openai import OpenAI
 from openai import APITimeoutError, APIConnectionError, APIError
-from typing import Optional
+from typing import Callable, Optional
+from core.metrics import LLM_LATENCY, LLM_TOKENS
 
 # Model selection from env (defaults to gpt-4o-mini)
 DEFAULT_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+# "openai" (default) or "stub" (deterministic offline responses, see core/llm_stub.py)
+LLM_BACKEND = os.getenv("LLM_BACKEND", "openai").lower()
 
 # Lazy client initialization
 _client = None
 
+# Per-context replacement for the model call (e.g. recorded responses in agents/replay.py).
+# A context variable, so a replay never affects runs in other threads or requests.
+_override: contextvars.ContextVar[Optional[Callable]] = contextvars.ContextVar("chat_json_override", default=None)
+
+
+@contextmanager
+def override_chat_json(fn: Callable):
+    """
+    Answer ``chat_json`` calls in the enclosed block with ``fn(system, user, model)``.
+
+    ``fn`` must return the same (text, latency_ms, (tokens_in, tokens_out)) tuple.
+    """
+    token = _override.set(fn)
+    try:
+        yield
+    finally:
+        _override.reset(token)
+
+
 def _get_client():
     """
     Get or create OpenAI client (lazy initialization).
@@ -31,6 +55,8 @@ def _get_client():
             raise ValueError("OPENAI_API_KEY environment variable is not set")
         _client = OpenAI(
             api_key=api_key,
+            # Alternative endpoint, e.g. the local fake server (python -m core.fake_openai)
+            base_url=os.getenv("OPENAI_BASE_URL") or None,
             timeout=float(os.getenv("OPENAI_TIMEOUT", "60.0")),  # 60s default
             max_retries=int(os.getenv("OPENAI_MAX_RETRIES", "3")),
         )
@@ -53,9 +79,16 @@ def chat_json(system: str, user: str, model: Optional[str] = None):
         APIError: If all retries fail
     """
     model = model or DEFAULT_MODEL
+    override = _override.get()
+    if override is not None:
+        return override(system, user, model)
+    if LLM_BACKEND == "stub":
+        from core import llm_stub
+        return llm_stub.chat_json(system, user, model)
     t0 = time.time()
     client = _get_client()
     
+    started = time.perf_counter()
     try:
         msg = client.chat.completions.create(
             model=model,
@@ -63,15 +96,21 @@ def chat_json(system: str, user: str, model: Optional[str] = None):
             response_format={"type": "json_object"}
         )
     except APITimeoutError as e:
-        raise APIError(f"OpenAI API timeout after {os.getenv('OPENAI_TIMEOUT', '60')}s: {str(e)}")
+        LLM_LATENCY.observe(time.perf_counter() - started, model, "timeout")
+        raise APIError(f"OpenAI API timeout after {os.getenv('OPENAI_TIMEOUT', '60')}s: {str(e)}", e.request, body=None) from e
     except APIConnectionError as e:
-        raise APIError(f"OpenAI API connection error: {str(e)}")
+        LLM_LATENCY.observe(time.perf_counter() - started, model, "connection_error")
+        raise APIError(f"OpenAI API connection error: {str(e)}", e.request, body=None) from e
     except APIError as e:
-        raise APIError(f"OpenAI API error: {str(e)}")
+        LLM_LATENCY.observe(time.perf_counter() - started, model, "error")
+        raise APIError(f"OpenAI API error: {str(e)}", e.request, body=getattr(e, "body", None)) from e
+    LLM_LATENCY.observe(time.perf_counter() - started, model, "ok")
     
     t1 = time.time()
     text = msg.choices[0].message.content
     usage = getattr(msg, "usage", None)
     tokens_in = usage.prompt_tokens if usage else 0
     tokens_out = usage.completion_tokens if usage else 0
+    LLM_TOKENS.inc(model, "in", amount=tokens_in or 0)
+    LLM_TOKENS.inc(model, "out", amount=tokens_out or 0)
     return text, int(1000 * (t1 - t0)), (tokens_in, tokens_out)
@@ -0,0 +1,91 @@
+"""
+Deterministic stand-in for the OpenAI chat model.
+
+Selected with LLM_BACKEND=stub (see ``core.llm.chat_json``). Responses are
+derived from the SKUs in the prompt context, so orchestration runs exercise
+the full parse -> governance -> write path without network calls or API
+cost; benchmarks and load tests use it to measure our own code alone.
+
+STUB_LLM_LATENCY adds a per-call delay to mimic model latency:
+"0" (none), "<ms>" (fixed), "uniform:<lo_ms>:<hi_ms>" or
+"lognormal:<median_ms>:<sigma>" (long right tail, like real models).
+"""
+
+import os
+import re
+import json
+import math
+import time
+import zlib
+import random
+from itertools import islice
+from typing import Callable, List, Optional
+
+STUB_LLM_LATENCY = os.getenv("STUB_LLM_LATENCY", "0")
+# Items proposed per call (the agent prompts ask for a handful)
+STUB_LLM_ITEMS = int(os.getenv("STUB_LLM_ITEMS", "3"))
+
+_SKU = re.compile(r'"sku":\s*"([^"]+)"')
+
+
+def _skus(context: str, limit: int) -> List[str]:
+    # First matches only: the context can be a multi-megabyte catalog dump
+    return list(dict.fromkeys(m.group(1) for m in islice(_SKU.finditer(context), limit * 4)))[:limit]
+
+
+def latency_sampler(spec: str) -> Callable[[], float]:
+    """Parse a STUB_LLM_LATENCY spec into a function returning delays in milliseconds."""
+    kind, _, args = spec.partition(":")
+    try:
+        if not args:
+            fixed = float(kind)
+            return lambda: fixed
+        params = [float(a) for a in args.split(":")]
+        if kind == "uniform":
+            lo, hi = params
+            return lambda: random.uniform(lo, hi)
+        if kind == "lognormal":
+            median, sigma = params
+            return lambda: random.lognormvariate(math.log(median), sigma)
+    except ValueError:
+        pass
+    raise ValueError(f"Invalid STUB_LLM_LATENCY: {spec!r}")
+
+
+_latency = latency_sampler(STUB_LLM_LATENCY)
+
+
+def _unit(sku: str, salt: str) -> float:
+    """Stable pseudo-random number in [0, 1) per SKU."""
+    return zlib.crc32(f"{salt}:{sku}".encode("utf-8")) / 2**32
+
+
+def respond(system: str, user: str) -> dict:
+    """Agent-shaped JSON payload for the prompt (supplier, buyer or CX)."""
+    skus = _skus(user, STUB_LLM_ITEMS)
+    kind = system.lower()
+    if "supplier" in kind:
+        return {"updates": [{"sku": s, "field": "wholesale_price", "new_value": round(20 + 200 * _unit(s, "w"), 2),
+                             "reason": "stub_supplier_update"} for s in skus]}
+    if "price" in kind:
+        return {"prices": [{"sku": s, "new_price": round(25 + 400 * _unit(s, "p"), 2), "reason": "stub_pricing"}
+                           for s in skus]}
+    if "cx" in kind:
+        return {"actions": [{"sku": s, "action": "update_description", "details": "stub: clarify dimensions"}
+                            for s in skus]}
+    return {}
+
+
+def estimate_tokens(system: str, user: str, text: str):
+    """Rough (prompt, completion) token counts at ~4 characters per token."""
+    return (len(system) + len(user)) // 4, len(text) // 4
+
+
+def chat_json(system: str, user: str, model: Optional[str] = None):
+    """Same contract as ``core.llm.chat_json``: (text, latency_ms, (tokens_in, tokens_out))."""
+    t0 = time.perf_counter()
+    text = json.dumps(respond(system, user))
+    delay_ms = _latency()
+    if delay_ms > 0:
+        time.sleep(delay_ms / 1000.0)
+    return text, int(1000 * (time.perf_counter() - t0)), estimate_tokens(system, user, text)
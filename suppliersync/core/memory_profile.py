@@ -0,0 +1,183 @@
+"""
+Opt-in memory profiling of orchestration runs with tracemalloc.
+
+With MEMORY_PROFILE=1, ``Orchestrator.step`` starts tracemalloc for the
+run and attaches a ``MemoryTracker`` to its trace (core/tracing.py). At
+every span boundary the tracker reads the traced size and peak, and
+records two values on the span:
+
+- ``mem_net_bytes``: allocations still alive when the stage ends, minus
+  those freed
+- ``mem_peak_bytes``: the high-water mark above the stage's starting size,
+  including its child stages
+
+A snapshot is taken at the end of the run and of each top-level stage
+(spans up to MEMORY_PROFILE_SNAPSHOT_DEPTH deep), but only when the traced
+size has grown at least 10% since the last snapshot. Snapshots of large
+catalogs hold millions of traces, so they are taken where the live
+structures are largest. For every source line the tracker keeps the
+largest live size seen in any snapshot, and which stage that was. The
+MEMORY_PROFILE_TOP_SITES largest sites are stored in ``run_memory_sites``
+and the per-span figures in ``run_spans``; both are served by
+``/api/runs/{run_id}/profile``.
+
+tracemalloc is process-wide, so only one run per process is profiled at a
+time. Runs that overlap it, or that start while tracemalloc is already
+tracing (e.g. ``python -X tracemalloc``), run unprofiled. Everything runs
+about 10x slower under tracing: enable it to investigate, not in production.
+"""
+
+import os
+import logging
+import threading
+import tracemalloc
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+MEMORY_PROFILE = os.getenv("MEMORY_PROFILE", "0").lower() in ("1", "true", "yes")
+MEMORY_PROFILE_TOP_SITES = int(os.getenv("MEMORY_PROFILE_TOP_SITES", "20"))
+# Snapshots are taken when spans up to this depth end ("step" = 1, "step/fetch_catalog" = 2)
+MEMORY_PROFILE_SNAPSHOT_DEPTH = int(os.getenv("MEMORY_PROFILE_SNAPSHOT_DEPTH", "2"))
+
+# A boundary snapshot is taken only once the traced size exceeds the last one's by this factor
+_SNAPSHOT_GROWTH = 1.1
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_EXCLUDED_FILES = (tracemalloc.__file__, __file__, "<frozen importlib._bootstrap>",
+                   "<frozen importlib._bootstrap_external>", "<unknown>")
+_lock = threading.Lock()
+
+
+def _raw_traces(snapshot) -> Optional[list]:
+    """
+    The snapshot's raw ``(domain, size, frames, ...)`` trace tuples, or None
+    if this Python stores them differently (``Snapshot.traces._traces`` is
+    private to tracemalloc).
+    """
+    raw = getattr(snapshot.traces, "_traces", None)
+    if not isinstance(raw, (list, tuple)):
+        return None
+    if raw:
+        trace = raw[0]
+        if not (isinstance(trace, tuple) and len(trace) >= 3 and isinstance(trace[1], int)
+                and isinstance(trace[2], tuple) and trace[2] and isinstance(trace[2][0], tuple)):
+            return None
+    return raw
+
+
+def _line_totals(snapshot) -> Dict[Tuple[str, int], Tuple[int, int]]:
+    """(filename, lineno) -> (size, count) of the live allocations of a snapshot."""
+    raw = _raw_traces(snapshot)
+    if raw is None:
+        # Public API: builds objects per trace, so several times slower on large snapshots
+        return {(stat.traceback[0].filename, stat.traceback[0].lineno): (stat.size, stat.count)
+                for stat in snapshot.statistics("lineno")}
+    # Group the raw trace tuples directly: Snapshot.filter_traces() and statistics() build
+    # objects per trace and take seconds per million traces under tracing
+    sizes: Dict[tuple, int] = defaultdict(int)
+    counts: Dict[tuple, int] = defaultdict(int)
+    for trace in raw:
+        frame = trace[2][0]
+        sizes[frame] += trace[1]
+        counts[frame] += 1
+    return {frame: (size, counts[frame]) for frame, size in sizes.items()}
+
+
+def _site(filename: str, lineno: int) -> str:
+    if filename.startswith(_ROOT + os.sep):
+        filename = os.path.relpath(filename, _ROOT)
+    return f"{filename}:{lineno}"
+
+
+class MemoryTracker:
+    """Per-span net/peak allocation and per-site maxima across stage-boundary snapshots."""
+
+    def __init__(self, top_sites: int = MEMORY_PROFILE_TOP_SITES,
+                 snapshot_depth: int = MEMORY_PROFILE_SNAPSHOT_DEPTH):
+        self.top_sites = top_sites
+        self.snapshot_depth = snapshot_depth
+        self.snapshots = 0
+        self._snapshot_size = 0
+        # Open spans: [span, traced size at start, highest traced size seen so far]
+        self._open: List[list] = []
+        # site -> (size_bytes, count, stage) at its largest
+        self._sites: Dict[str, Tuple[int, int, str]] = {}
+
+    def enter(self, span) -> None:
+        current, peak = tracemalloc.get_traced_memory()
+        # The peak counter is reset per span, so hand it to the open ancestors first
+        for frame in self._open:
+            frame[2] = max(frame[2], peak)
+        tracemalloc.reset_peak()
+        self._open.append([span, current, current])
+
+    def exit(self, span) -> None:
+        current, peak = tracemalloc.get_traced_memory()
+        _, start, high = self._open.pop()
+        high = max(high, peak)
+        span.mem_net_bytes = current - start
+        span.mem_peak_bytes = high - start
+        if self._open:
+            self._open[-1][2] = max(self._open[-1][2], high)
+        if span.path.count("/") < self.snapshot_depth and current > self._snapshot_size * _SNAPSHOT_GROWTH:
+            self._snapshot_size = current
+            self._snapshot(span.path)
+        tracemalloc.reset_peak()  # Drops the snapshot's own allocations from the parent's peak
+
+    def _snapshot(self, stage: str) -> None:
+        totals = _line_totals(tracemalloc.take_snapshot())
+        self.snapshots += 1
+        sites = self._sites
+        for (filename, lineno), (size, count) in totals.items():
+            if filename in _EXCLUDED_FILES:
+                continue
+            site = _site(filename, lineno)
+            best = sites.get(site)
+            if best is None or size > best[0]:
+                sites[site] = (size, count, stage)
+
+    def top(self) -> List[dict]:
+        """Largest allocation sites of the run, largest first."""
+        ranked = sorted(self._sites.items(), key=lambda item: item[1][0], reverse=True)[:self.top_sites]
+        return [{"rank": rank, "site": site, "stage": stage, "size_bytes": size, "count": count}
+                for rank, (site, (size, count, stage)) in enumerate(ranked, 1)]
+
+
+@contextmanager
+def memory_profile(trace, enabled: Optional[bool] = None):
+    """
+    Trace allocations of the enclosed run when memory profiling is enabled.
+
+    Yields the ``MemoryTracker`` (or None if the run is not profiled). On
+    exit, the top sites are stored on ``trace.memory_sites``.
+
+    Example:
+        >>> with trace_run(run_id) as trace, memory_profile(trace), span("step"):
+        ...     result = self._step(run_id)
+    """
+    if not (MEMORY_PROFILE if enabled is None else enabled):
+        yield None
+        return
+    if not _lock.acquire(blocking=False):
+        logger.info(f"Memory profiling skipped for run {trace.run_id}: another run is being profiled")
+        yield None
+        return
+    if tracemalloc.is_tracing():
+        _lock.release()
+        logger.info(f"Memory profiling skipped for run {trace.run_id}: tracemalloc is already tracing")
+        yield None
+        return
+    tracemalloc.start(1)
+    tracker = trace.memory = MemoryTracker()
+    try:
+        yield tracker
+    finally:
+        trace.memory = None
+        trace.memory_sites = tracker.top()
+        tracemalloc.stop()
+        _lock.release()
+        logger.info(f"Memory profile of run {trace.run_id}: {tracker.snapshots} snapshots, "
+                    f"{len(trace.memory_sites)} top sites")
@@ -0,0 +1,395 @@
+"""
+Service-level metrics in the Prometheus text exposition format.
+
+Counters, gauges and histograms are kept in an in-process registry and fed
+by the FastAPI middleware (per-route request latency and in-flight
+requests), ``core.llm.chat_json`` (LLM latency and tokens per model),
+``Orchestrator._log_agent`` (latency, tokens and cost per agent) and
+``core.database.InstrumentedConnection`` (query time per statement type).
+``GET /metrics`` renders them.
+
+Multi-process: with several uvicorn workers each process has its own
+registry, so set METRICS_DIR to a directory shared by the workers (and
+empty it on deploy). Every process then flushes a snapshot of its registry
+to ``<METRICS_DIR>/<pid>-<token>.json`` (at most once per
+METRICS_FLUSH_INTERVAL seconds, from a background thread) and ``/metrics``
+merges all snapshots: counters and histograms are summed across live and
+exited workers, gauges across live workers only. Each process holds a lock
+on ``<pid>-<token>.lock`` while it runs, so a snapshot whose lock is free
+belongs to an exited worker even if its pid has been reused; on the next
+merge its counters and histograms are folded into ``exited.json`` and its
+files are deleted. Without METRICS_DIR the endpoint reports the serving
+process alone.
+"""
+
+import os
+import json
+import time
+import uuid
+import atexit
+import bisect
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Sequence, Tuple
+try:
+    import fcntl
+except ImportError:  # Windows: liveness falls back to the pid and exited workers' files are kept
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+METRICS_DIR = os.getenv("METRICS_DIR", "")
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", "1.0"))
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Summed counters and histograms of exited workers, in METRICS_DIR
+EXITED_FILE = "exited.json"
+
+# Seconds; request latency (Prometheus client defaults), SQLite statements and LLM calls
+HTTP_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DB_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+LLM_BUCKETS = (0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 15.0, 30.0, 60.0, 120.0)
+
+
+class _Family:
+    """A metric name with a fixed set of label names; one sample per label-value tuple."""
+
+    kind = ""
+
+    def __init__(self, registry: "Registry", name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = registry._lock
+        self._registry = registry
+        self._samples: Dict[Tuple[str, ...], object] = {}
+        registry._families[name] = self
+
+    def _key(self, values: Sequence) -> Tuple[str, ...]:
+        if len(values) != len(self.labels):
+            raise ValueError(f"{self.name} expects labels {self.labels}")
+        # Hot path (every SQLite statement): label values are usually strings already
+        for v in values:
+            if type(v) is not str:
+                return tuple(str(v) for v in values)
+        return tuple(values)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            samples = [[list(k), v if not isinstance(v, list) else list(v)] for k, v in self._samples.items()]
+        return {"type": self.kind, "help": self.help, "labels": list(self.labels), "samples": samples}
+
+
+class Counter(_Family):
+    """Monotonically increasing total."""
+
+    kind = "counter"
+
+    def inc(self, *labels, amount: float = 1.0) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._samples[key] = self._samples.get(key, 0.0) + amount
+        self._registry._touched()
+
+
+class Gauge(_Family):
+    """Value that goes up and down (e.g. requests in flight)."""
+
+    kind = "gauge"
+
+    def inc(self, *labels, amount: float = 1.0) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._samples[key] = self._samples.get(key, 0.0) + amount
+        self._registry._touched()
+
+    def dec(self, *labels, amount: float = 1.0) -> None:
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram(_Family):
+    """Observations counted into fixed buckets, plus their sum and count."""
+
+    kind = "histogram"
+
+    def __init__(self, registry: "Registry", name: str, help: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = HTTP_BUCKETS):
+        super().__init__(registry, name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labels) -> None:
+        key = self._key(labels)
+        slot = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            # Per-bucket (non-cumulative) counts, then +Inf, sum and count
+            sample = self._samples.get(key)
+            if sample is None:
+                sample = self._samples[key] = [0.0] * (len(self.buckets) + 3)
+            sample[slot] += 1
+            sample[-2] += value
+            sample[-1] += 1
+        self._registry._touched()
+
+    def snapshot(self) -> dict:
+        snap = super().snapshot()
+        snap["buckets"] = list(self.buckets)
+        return snap
+
+
+class Registry:
+    """All metric families of this process, with optional snapshot files for multi-process merging."""
+
+    def __init__(self, directory: str = METRICS_DIR, flush_interval: float = METRICS_FLUSH_INTERVAL):
+        self._lock = threading.Lock()
+        self._families: Dict[str, _Family] = {}
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._dirty = threading.Event()
+        self._flusher: Optional[threading.Thread] = None
+        self._file = ""
+        self._file_pid = None
+        self._lease = None
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        return Counter(self, name, help, labels)
+
+    def gauge(self, name: str, help: str, labels: Sequence[str] = ()) -> Gauge:
+        return Gauge(self, name, help, labels)
+
+    def histogram(self, name: str, help: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = HTTP_BUCKETS) -> Histogram:
+        return Histogram(self, name, help, labels, buckets)
+
+    def snapshot(self) -> dict:
+        return {"pid": os.getpid(), "metrics": {name: f.snapshot() for name, f in self._families.items()}}
+
+    # -- multi-process -----------------------------------------------------
+
+    def _touched(self) -> None:
+        if not self.directory:
+            return
+        self._dirty.set()
+        if self._flusher is None or self._flusher.pid != os.getpid():
+            self._start_flusher()
+
+    def _start_flusher(self) -> None:
+        with self._lock:
+            if self._flusher is not None and self._flusher.pid == os.getpid():
+                return
+            self._flusher = threading.Thread(target=self._flush_loop, name="metrics-flush", daemon=True)
+            self._flusher.pid = os.getpid()
+            self._flusher.start()
+        atexit.register(self.flush)
+
+    def _flush_loop(self) -> None:
+        while True:
+            self._dirty.wait()
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def _snapshot_file(self) -> str:
+        """This process's snapshot file name, taking its lease (the lock file) on first use."""
+        with self._lock:
+            if self._file_pid != os.getpid():
+                # A forked worker inherits the parent's samples but must not share its file; closing
+                # the inherited lease descriptor leaves the parent's lock held
+                if self._lease is not None:
+                    self._lease.close()
+                    self._lease = None
+                self._file = f"{os.getpid()}-{uuid.uuid4().hex[:8]}.json"
+                self._file_pid = os.getpid()
+            if fcntl is not None and self._lease is None:
+                # Held until the process exits: the snapshot is written only once the lease exists
+                self._lease = open(os.path.join(self.directory, self._file[:-len(".json")] + ".lock"), "w")
+                fcntl.flock(self._lease, fcntl.LOCK_EX)
+            return self._file
+
+    def flush(self) -> None:
+        """Write this process's snapshot file (no-op without a metrics directory)."""
+        if not self.directory:
+            return
+        self._dirty.clear()
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            target = os.path.join(self.directory, self._snapshot_file())
+            tmp = f"{target}.tmp"
+            with open(tmp, "w") as f:
+                json.dump(self.snapshot(), f)
+            os.replace(tmp, target)
+        except OSError as e:
+            logger.warning(f"Could not write metrics snapshot: {e}")
+
+    def collect(self) -> List[dict]:
+        """
+        Snapshots to render: every process's file when multi-process, else this registry.
+
+        Files of exited workers are folded into ``EXITED_FILE`` and deleted
+        (kept, with their gauges dropped, where file locks are unavailable).
+        """
+        if not self.directory:
+            return [self.snapshot()]
+        self.flush()
+        with _directory_lock(self.directory):
+            try:
+                names = sorted(n for n in os.listdir(self.directory) if n.endswith(".json"))
+            except OSError:
+                names = []
+            snapshots, exited = [], []
+            for name in names:
+                try:
+                    with open(os.path.join(self.directory, name)) as f:
+                        snap = json.load(f)
+                except (OSError, ValueError):
+                    continue  # Replaced or removed while reading
+                if name == EXITED_FILE or name == self._file or _writer_alive(self.directory, name):
+                    snapshots.append(snap)
+                else:
+                    exited.append((name, snap))
+            if not exited:
+                return snapshots
+            if fcntl is None:
+                return snapshots + [_without_gauges(snap) for _, snap in exited]
+            previous = [snap for snap in snapshots if snap.get("pid") is None]
+            folded = _fold(previous + [snap for _, snap in exited])
+            try:
+                target = os.path.join(self.directory, EXITED_FILE)
+                with open(f"{target}.tmp", "w") as f:
+                    json.dump(folded, f)
+                os.replace(f"{target}.tmp", target)
+                for name, _ in exited:
+                    for path in (name, name[:-len(".json")] + ".lock"):
+                        try:
+                            os.unlink(os.path.join(self.directory, path))
+                        except FileNotFoundError:
+                            pass
+            except OSError as e:
+                logger.warning(f"Could not fold exited workers' metrics: {e}")
+            return [snap for snap in snapshots if snap.get("pid") is not None] + [folded]
+
+    def render(self) -> str:
+        """All metrics, merged across processes, in the text exposition format."""
+        return render(self.collect())
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _writer_alive(directory: str, name: str) -> bool:
+    """Whether the process that writes snapshot ``name`` (``<pid>-<token>.json``) is still running."""
+    if fcntl is None:
+        return _pid_alive(int(name.split("-", 1)[0]))
+    try:
+        with open(os.path.join(directory, name[:-len(".json")] + ".lock")) as lease:
+            fcntl.flock(lease, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return True
+    except FileNotFoundError:
+        pass
+    return False
+
+
+@contextmanager
+def _directory_lock(directory: str):
+    """Serialize merges across processes sharing ``directory``, so exited files are folded once."""
+    if fcntl is None:
+        yield
+        return
+    with open(os.path.join(directory, ".merge.lock"), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        yield
+
+
+def _without_gauges(snap: dict) -> dict:
+    return {**snap, "metrics": {name: f for name, f in snap["metrics"].items() if f["type"] != "gauge"}}
+
+
+def _fold(snapshots: List[dict]) -> dict:
+    """One snapshot (pid None) holding the summed counters and histograms of ``snapshots``."""
+    merged = _merge([_without_gauges(snap) for snap in snapshots])
+    return {"pid": None, "metrics": {name: {**family, "samples": [[list(k), v] for k, v in family["samples"].items()]}
+                                     for name, family in merged.items()}}
+
+
+def _merge(snapshots: List[dict]) -> Dict[str, dict]:
+    merged: Dict[str, dict] = {}
+    for snap in snapshots:
+        for name, family in snap["metrics"].items():
+            target = merged.setdefault(name, {**family, "samples": {}})
+            for labels, value in family["samples"]:
+                key = tuple(labels)
+                if isinstance(value, list):
+                    current = target["samples"].get(key)
+                    target["samples"][key] = value if current is None else [a + b for a, b in zip(current, value)]
+                else:
+                    target["samples"][key] = target["samples"].get(key, 0.0) + value
+    return merged
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def render(snapshots: List[dict]) -> str:
+    lines = []
+    for name, family in sorted(_merge(snapshots).items()):
+        lines.append(f"# HELP {name} {family['help']}")
+        lines.append(f"# TYPE {name} {family['type']}")
+        for values, value in sorted(family["samples"].items()):
+            if family["type"] != "histogram":
+                lines.append(f"{name}{_labels(family['labels'], values)} {_number(value)}")
+                continue
+            cumulative = 0.0
+            for bound, count in zip(list(family["buckets"]) + ["+Inf"], value[:-2]):
+                cumulative += count
+                le = f'le="{bound if bound == "+Inf" else repr(float(bound))}"'
+                lines.append(f"{name}_bucket{_labels(family['labels'], values, le)} {_number(cumulative)}")
+            lines.append(f"{name}_sum{_labels(family['labels'], values)} {_number(value[-2])}")
+            lines.append(f"{name}_count{_labels(family['labels'], values)} {_number(value[-1])}")
+    return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+HTTP_REQUESTS = REGISTRY.counter(
+    "http_requests_total", "HTTP requests by route template and status code.", ("method", "route", "status"))
+HTTP_LATENCY = REGISTRY.histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template.", ("method", "route"))
+HTTP_IN_PROGRESS = REGISTRY.gauge(
+    "http_requests_in_progress", "HTTP requests currently being served (queue depth).")
+DB_QUERY_LATENCY = REGISTRY.histogram(
+    "db_query_duration_seconds", "SQLite statement execution time by statement type.", ("operation",),
+    buckets=DB_BUCKETS)
+DB_ERRORS = REGISTRY.counter(
+    "db_errors_total", "SQLite operational errors by statement type (error=\"locked\" for lock timeouts).",
+    ("operation", "error"))
+LLM_LATENCY = REGISTRY.histogram(
+    "llm_request_duration_seconds", "LLM chat completion latency by model and outcome.", ("model", "outcome"),
+    buckets=LLM_BUCKETS)
+LLM_TOKENS = REGISTRY.counter(
+    "llm_tokens_total", "LLM tokens by model and direction.", ("model", "direction"))
+AGENT_LATENCY = REGISTRY.histogram(
+    "agent_llm_duration_seconds", "LLM latency per orchestration agent.", ("agent",), buckets=LLM_BUCKETS)
+AGENT_TOKENS = REGISTRY.counter(
+    "agent_tokens_total", "LLM tokens per orchestration agent and direction.", ("agent", "direction"))
+AGENT_COST = REGISTRY.counter(
+    "agent_cost_usd_total", "Estimated LLM cost per orchestration agent.", ("agent",))
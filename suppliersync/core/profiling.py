@@ -0,0 +1,308 @@
+"""
+On-demand profiling of orchestration runs and API requests.
+
+Profiling is off by default. An admin arms it for the next N orchestration
+runs (target "run") or API requests (target "request") through
+``POST /admin/profiling``. Each profiled run or request is then recorded by a
+statistical stack sampler: a background thread reads the profiled thread's
+stack from ``sys._current_frames()`` every ``interval_ms``. The result is
+stored as collapsed stacks (``frame;frame;frame count`` per line), which
+flamegraph.pl, speedscope and inferno render directly. With mode "cprofile",
+or where stack sampling is unavailable, ``cProfile`` runs instead and a
+pstats file is stored. Results are keyed by run_id (or a generated request
+id), written to PROFILE_DIR and pruned to the newest PROFILE_KEEP.
+
+The armed state lives in ``<PROFILE_DIR>/armed.json`` so that every uvicorn
+worker sees it. A profile slot is claimed by creating a claim file with
+O_EXCL, so exactly N runs are profiled across all workers. When nothing is
+armed, ``profile()`` costs one clock read and comparison. The state file is
+re-read at most once per PROFILE_POLL_INTERVAL seconds.
+
+Only the thread that enters ``profile()`` is sampled. For async requests
+that is the event loop thread, so concurrent requests on it show up too.
+cProfile hooks are per thread and cannot be nested, so while a cProfile
+session is active on a thread, further cProfile-mode claims on that thread
+are skipped without taking a slot.
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import pstats
+import logging
+import cProfile
+import threading
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "100"))
+PROFILE_POLL_INTERVAL = float(os.getenv("PROFILE_POLL_INTERVAL", "1.0"))
+
+TARGETS = ("run", "request")
+MODES = ("auto", "sample", "cprofile")
+SAMPLING_AVAILABLE = hasattr(sys, "_current_frames")
+
+_NULL = nullcontext()
+# Threads with an active cProfile session (``.active``)
+_cprofile = threading.local()
+
+
+def _mode(arm: dict) -> str:
+    if arm["mode"] == "auto":
+        return "sample" if SAMPLING_AVAILABLE else "cprofile"
+    return arm["mode"]
+
+
+class StackSampler:
+    """Sample one thread's Python stack at a fixed interval into collapsed-stack counts."""
+
+    def __init__(self, thread_id: int, interval_s: float = 0.005):
+        self.thread_id = thread_id
+        self.interval_s = interval_s
+        self.counts: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def start(self) -> "StackSampler":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        # Frame labels are cached per code object: only the walk itself is per sample
+        labels = {}
+        while not self._stop.wait(self.interval_s):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                label = labels.get(code)
+                if label is None:
+                    name = getattr(code, "co_qualname", code.co_name)
+                    label = labels[code] = f"{name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+                stack.append(label)
+                frame = frame.f_back
+            if stack:
+                self.counts[";".join(reversed(stack))] += 1
+                self.samples += 1
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.counts.most_common())
+
+
+class Profiler:
+    """Armed state (shared through PROFILE_DIR), slot claiming and result storage."""
+
+    def __init__(self, directory: str = PROFILE_DIR, keep: int = PROFILE_KEEP,
+                 poll_interval: float = PROFILE_POLL_INTERVAL):
+        self.directory = directory
+        self.keep = keep
+        self.poll_interval = poll_interval
+        self._arm: Optional[dict] = None
+        self._arm_mtime: Optional[float] = None
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def _state_path(self) -> str:
+        return os.path.join(self.directory, "armed.json")
+
+    def arm(self, target: str, count: int, mode: str = "auto", interval_ms: float = 5.0,
+            ttl_s: float = 3600.0) -> dict:
+        """Profile the next ``count`` runs or requests (replaces any current arming)."""
+        if target not in TARGETS:
+            raise ValueError(f"target must be one of {TARGETS}")
+        if mode not in MODES:
+            raise ValueError(f"mode must be one of {MODES}")
+        if count < 1 or not 0.5 <= interval_ms <= 1000:
+            raise ValueError("count must be >= 1 and interval_ms between 0.5 and 1000")
+        arm = {"id": uuid.uuid4().hex[:12], "target": target, "count": count, "mode": mode,
+               "interval_ms": interval_ms, "armed_at": time.time(), "expires_at": time.time() + ttl_s}
+        claims = os.path.join(self.directory, "claims")
+        os.makedirs(claims, exist_ok=True)
+        for name in os.listdir(claims):  # Slots of earlier armings
+            os.unlink(os.path.join(claims, name))
+        tmp = f"{self._state_path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(arm, f)
+        os.replace(tmp, self._state_path)
+        self._next_check = 0.0
+        logger.info(f"Profiling armed: next {count} {target}(s), mode={mode}")
+        return arm
+
+    def disarm(self) -> None:
+        try:
+            os.unlink(self._state_path)
+        except FileNotFoundError:
+            pass
+        self._next_check = 0.0
+
+    def armed(self) -> Optional[dict]:
+        """Current arming with the number of slots already used, or None."""
+        arm = self._load()
+        if arm is None:
+            return None
+        used = sum(1 for name in self._claims() if name.startswith(arm["id"] + "-"))
+        return {**arm, "used": min(used, arm["count"])}
+
+    def _claims(self) -> List[str]:
+        try:
+            return os.listdir(os.path.join(self.directory, "claims"))
+        except FileNotFoundError:
+            return []
+
+    def _load(self) -> Optional[dict]:
+        try:
+            mtime = os.stat(self._state_path).st_mtime
+        except FileNotFoundError:
+            self._arm, self._arm_mtime = None, None
+            return None
+        if mtime != self._arm_mtime:
+            try:
+                with open(self._state_path) as f:
+                    self._arm, self._arm_mtime = json.load(f), mtime
+            except (OSError, ValueError):
+                return None
+        if self._arm is not None and time.time() > self._arm["expires_at"]:
+            return None
+        return self._arm
+
+    def claim(self, target: str, cprofile: bool = True) -> Optional[dict]:
+        """
+        Claim a profile slot for ``target``; None when not armed for it (the hot path).
+
+        Args:
+            target: "run" or "request"
+            cprofile: Whether a cProfile session may start; if not, armings
+                that would use cProfile are skipped without taking a slot
+        """
+        now = time.monotonic()
+        if now < self._next_check and self._arm is None:
+            return None
+        with self._lock:
+            if now >= self._next_check:
+                self._next_check = now + self.poll_interval
+                self._load()
+            arm = self._arm
+        if arm is None or arm["target"] != target or time.time() > arm["expires_at"]:
+            return None
+        if not cprofile and _mode(arm) == "cprofile":
+            return None
+        for slot in range(arm["count"]):
+            path = os.path.join(self.directory, "claims", f"{arm['id']}-{slot}")
+            try:
+                os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            except FileExistsError:
+                continue
+            except FileNotFoundError:
+                return None  # Disarmed (directory removed) meanwhile
+            if slot == arm["count"] - 1:
+                self.disarm()  # Last slot: no further claims anywhere
+            return arm
+        self._arm = None  # Exhausted by other workers; re-read on the next poll
+        return None
+
+    def save(self, key: str, meta: dict, collapsed: Optional[str] = None,
+             profile: Optional[cProfile.Profile] = None) -> dict:
+        """Store a result as ``<key>.collapsed`` or ``<key>.pstats`` plus ``<key>.json`` metadata."""
+        os.makedirs(self.directory, exist_ok=True)
+        if collapsed is not None:
+            meta["format"], filename = "collapsed", f"{key}.collapsed"
+            with open(os.path.join(self.directory, filename), "w") as f:
+                f.write(collapsed)
+        else:
+            meta["format"], filename = "pstats", f"{key}.pstats"
+            pstats.Stats(profile).dump_stats(os.path.join(self.directory, filename))
+        meta.update(key=key, file=filename)
+        with open(os.path.join(self.directory, f"{key}.json"), "w") as f:
+            json.dump(meta, f)
+        self._prune()
+        return meta
+
+    def list(self) -> List[dict]:
+        """Stored profiles, newest first."""
+        profiles = []
+        for name in os.listdir(self.directory) if os.path.isdir(self.directory) else []:
+            if name.endswith(".json") and name != "armed.json":
+                try:
+                    with open(os.path.join(self.directory, name)) as f:
+                        profiles.append(json.load(f))
+                except (OSError, ValueError):
+                    continue
+        return sorted(profiles, key=lambda m: m.get("started_at", 0), reverse=True)
+
+    def path(self, key: str) -> Optional[str]:
+        """File of a stored profile, or None (keys are validated by the caller)."""
+        for ext in (".collapsed", ".pstats"):
+            path = os.path.join(self.directory, key + ext)
+            if os.path.exists(path):
+                return path
+        return None
+
+    def _prune(self) -> None:
+        for meta in self.list()[self.keep:]:
+            for name in (meta["file"], f"{meta['key']}.json"):
+                try:
+                    os.unlink(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    pass
+
+
+PROFILER = Profiler()
+
+
+def profile(target: str, key: Optional[str] = None, **meta):
+    """
+    Profile the enclosed block if profiling is armed for ``target``.
+
+    Returns a shared no-op context manager when it is not, so callers can
+    wrap hot paths unconditionally.
+
+    Example:
+        >>> with profile("run", run_id):
+        ...     result = self._step(run_id)
+    """
+    arm = PROFILER.claim(target, cprofile=not getattr(_cprofile, "active", False))
+    if arm is None:
+        return _NULL
+    return _session(arm, key or f"{target}-{uuid.uuid4().hex[:12]}", meta)
+
+
+@contextmanager
+def _session(arm: dict, key: str, meta: dict):
+    mode = _mode(arm)
+    started_at, started = time.time(), time.perf_counter()
+    sampler = prof = None
+    if mode == "sample":
+        sampler = StackSampler(threading.get_ident(), arm["interval_ms"] / 1000.0).start()
+    else:
+        prof = cProfile.Profile()
+        prof.enable()
+        _cprofile.active = True
+    try:
+        yield
+    finally:
+        duration_ms = round((time.perf_counter() - started) * 1000, 3)
+        if sampler is not None:
+            sampler.stop()
+        else:
+            prof.disable()
+            _cprofile.active = False
+        meta = {**meta, "target": arm["target"], "mode": mode, "interval_ms": arm["interval_ms"],
+                "started_at": started_at, "duration_ms": duration_ms,
+                "samples": sampler.samples if sampler is not None else None}
+        try:
+            PROFILER.save(key, meta, collapsed=sampler.collapsed() if sampler is not None else None, profile=prof)
+            logger.info(f"Profile stored: {key} ({mode}, {duration_ms} ms)")
+        except OSError as e:
+            logger.warning(f"Could not store profile {key}: {e}")
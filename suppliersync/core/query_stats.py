@@ -0,0 +1,206 @@
+"""
+Per-statement SQLite statistics: fingerprints, latency histograms, slow-query log.
+
+``core.database.InstrumentedCursor`` reports every statement here with its
+execute-plus-fetch time. Statements are normalized into fingerprints
+(literals become ``?``, ``IN (?, ?, ...)`` lists collapse to ``IN (...)``,
+whitespace is collapsed), so the dynamic IN lists of the orchestrator and
+API aggregate into one entry each. Per fingerprint we keep call counts,
+total/max time, a fixed-bucket histogram (for p50/p95/p99 estimates) and the
+``EXPLAIN QUERY PLAN`` captured the first time it runs. Plans with a
+``SCAN`` that uses no index are flagged ``full_scan``, so missing indexes
+show up in the report.
+
+Statements slower than SLOW_QUERY_MS are logged (WARNING, logger
+``core.query_stats``) with their plan and kept in a ring buffer of the last
+SLOW_QUERY_LOG_SIZE entries. ``GET /admin/queries`` serves the top-N
+report. Statistics are per process (each uvicorn worker has its own).
+"""
+
+import os
+import re
+import time
+import bisect
+import logging
+import sqlite3
+import threading
+from collections import deque
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "100"))
+SLOW_QUERY_LOG_SIZE = int(os.getenv("SLOW_QUERY_LOG_SIZE", "100"))
+# Bound on distinct fingerprints; later ones are aggregated under OTHER_FINGERPRINT
+QUERY_STATS_MAX_FINGERPRINTS = int(os.getenv("QUERY_STATS_MAX_FINGERPRINTS", "500"))
+OTHER_FINGERPRINT = "<other>"
+
+# Milliseconds; from sub-0.1 ms point lookups to multi-second scans of 1M-row tables
+QUERY_BUCKETS_MS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 25.0, 50.0, 100.0, 250.0, 500.0, 1000.0, 2500.0,
+                    5000.0, 10000.0)
+# Statement types EXPLAIN QUERY PLAN works on
+_EXPLAINABLE = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE", "REPLACE")
+# Characters of SQL kept in slow-log entries
+_MAX_SQL_CHARS = 2000
+
+_COMMENTS = re.compile(r"--[^\n]*|/\*.*?\*/", re.S)
+_STRINGS = re.compile(r"'(?:[^']|'')*'")
+_NUMBERS = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?\b")
+_NAMED = re.compile(r"[:@$]\w+|\?\d*")
+_IN_LIST = re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)", re.I)
+_VALUES_LIST = re.compile(r"\bVALUES\s*\(\s*\?(?:\s*,\s*\?)*\s*\)(?:\s*,\s*\(\s*\?(?:\s*,\s*\?)*\s*\))*", re.I)
+_SPACE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=2048)
+def fingerprint(sql: str) -> str:
+    """Normalize a statement so calls differing only in literals or IN-list length share an entry."""
+    fp = _COMMENTS.sub(" ", sql)
+    fp = _STRINGS.sub("?", fp)
+    fp = _NUMBERS.sub("?", fp)
+    fp = _NAMED.sub("?", fp)
+    fp = _IN_LIST.sub("IN (...)", fp)
+    fp = _VALUES_LIST.sub("VALUES (...)", fp)
+    return _SPACE.sub(" ", fp).strip().rstrip(";")
+
+
+def _bucket_percentile(buckets: List[int], count: int, q: float) -> Optional[float]:
+    """Upper bound of the bucket holding the q-th percentile (None if it is in the overflow bucket)."""
+    rank, seen = q / 100.0 * count, 0
+    for bound, n in zip(QUERY_BUCKETS_MS, buckets):
+        seen += n
+        if seen >= rank:
+            return bound
+    return None
+
+
+def explain(conn: sqlite3.Connection, sql: str, parameters=()) -> Optional[List[str]]:
+    """``EXPLAIN QUERY PLAN`` detail lines, or None if the statement cannot be explained."""
+    head = sql.lstrip()[:8].split(None, 1)
+    if not head or head[0].upper() not in _EXPLAINABLE:
+        return None
+    try:
+        # A plain cursor, so the EXPLAIN itself is not recorded
+        cur = sqlite3.Cursor(conn)
+        rows = cur.execute("EXPLAIN QUERY PLAN " + sql, parameters).fetchall()
+        cur.close()
+    except (sqlite3.Error, ValueError):
+        return None
+    return [row[-1] for row in rows]
+
+
+def _full_scan(plan: Optional[List[str]]) -> Optional[bool]:
+    if plan is None:
+        return None
+    # "SCAN products" is a table scan; "SCAN products USING INDEX ..." / "COVERING INDEX" walks an index
+    return any(line.startswith("SCAN ") and "INDEX" not in line and "VIRTUAL TABLE" not in line for line in plan)
+
+
+class _Entry:
+    __slots__ = ("calls", "total_ms", "max_ms", "rows", "slow", "buckets", "plan")
+
+    def __init__(self):
+        self.calls = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.rows = 0
+        self.slow = 0
+        self.buckets = [0] * (len(QUERY_BUCKETS_MS) + 1)
+        self.plan: Optional[List[str]] = None
+
+
+class QueryStats:
+    """Thread-safe per-fingerprint statistics and slow-query ring buffer."""
+
+    def __init__(self, slow_ms: float = SLOW_QUERY_MS, log_size: int = SLOW_QUERY_LOG_SIZE,
+                 max_fingerprints: int = QUERY_STATS_MAX_FINGERPRINTS):
+        self.slow_ms = slow_ms
+        self.max_fingerprints = max_fingerprints
+        self._lock = threading.Lock()
+        self._entries: Dict[str, _Entry] = {}
+        self._slow = deque(maxlen=log_size)
+        self.started_at = time.time()
+
+    def record(self, conn: Optional[sqlite3.Connection], sql: str, parameters, elapsed_s: float,
+               rows: Optional[int] = None) -> None:
+        """Record one statement; captures its plan on first sight and logs it if slow."""
+        fp = fingerprint(sql)
+        ms = elapsed_s * 1000.0
+        with self._lock:
+            entry = self._entries.get(fp)
+            new = entry is None
+            if new:
+                if len(self._entries) >= self.max_fingerprints:
+                    fp, new = OTHER_FINGERPRINT, OTHER_FINGERPRINT not in self._entries
+                    entry = self._entries.setdefault(OTHER_FINGERPRINT, _Entry())
+                else:
+                    entry = self._entries[fp] = _Entry()
+            entry.calls += 1
+            entry.total_ms += ms
+            entry.max_ms = max(entry.max_ms, ms)
+            entry.rows += rows or 0
+            entry.buckets[bisect.bisect_left(QUERY_BUCKETS_MS, ms)] += 1
+            slow = ms >= self.slow_ms
+            if slow:
+                entry.slow += 1
+        # EXPLAIN outside the lock: it runs a statement of its own. Once per fingerprint: repeated
+        # slow executions reuse the captured plan rather than paying for EXPLAIN again
+        if conn is not None and fp != OTHER_FINGERPRINT and (new or (slow and entry.plan is None)):
+            plan = explain(conn, sql, parameters)
+            if plan is not None:
+                entry.plan = plan
+        if slow:
+            self._log_slow(fp, sql, ms, rows, entry.plan)
+
+    def _log_slow(self, fp: str, sql: str, ms: float, rows: Optional[int], plan: Optional[List[str]]) -> None:
+        item = {"at": time.time(), "duration_ms": round(ms, 3), "fingerprint": fp, "sql": sql[:_MAX_SQL_CHARS],
+                "rows": rows, "plan": plan, "full_scan": _full_scan(plan)}
+        with self._lock:
+            self._slow.append(item)
+        logger.warning(f"Slow query ({ms:.1f} ms, rows={rows}): {fp[:500]} | plan: {' / '.join(plan or ['n/a'])}")
+
+    def report(self, limit: int = 20, order_by: str = "total_ms") -> dict:
+        """
+        Top fingerprints plus the slow-query log (most recent first).
+
+        Args:
+            order_by: "total_ms", "max_ms", "mean_ms", "calls" or "slow"
+        """
+        with self._lock:
+            items = [(fp, e.calls, e.total_ms, e.max_ms, e.rows, e.slow, list(e.buckets), e.plan)
+                     for fp, e in self._entries.items()]
+            slow = list(self._slow)
+        queries = []
+        for fp, calls, total_ms, max_ms, rows, slow_calls, buckets, plan in items:
+            queries.append({
+                "fingerprint": fp,
+                "calls": calls,
+                "total_ms": round(total_ms, 3),
+                "mean_ms": round(total_ms / calls, 3),
+                "max_ms": round(max_ms, 3),
+                "p50_ms": _bucket_percentile(buckets, calls, 50),
+                "p95_ms": _bucket_percentile(buckets, calls, 95),
+                "p99_ms": _bucket_percentile(buckets, calls, 99),
+                "rows": rows,
+                "slow": slow_calls,
+                "full_scan": _full_scan(plan),
+                "plan": plan,
+            })
+        queries.sort(key=lambda q: q[order_by], reverse=True)
+        return {
+            "since": self.started_at,
+            "slow_query_ms": self.slow_ms,
+            "fingerprints": len(queries),
+            "queries": queries[:limit],
+            "slow_queries": slow[::-1],
+        }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._slow.clear()
+            self.started_at = time.time()
+
+
+QUERY_STATS = QueryStats()
@@ -1,79 +1,324 @@
 
-import os, chromadb
-from langchain_community.embeddings import SentenceTransformerEmbeddings
-from langchain_community.vectorstores import Chroma
-from langchain_community.document_loaders import DirectoryLoader, PyPDFLoader, TextLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+import os, json, uuid, hashlib
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Callable, Optional
+try:
+    import fcntl
+except ImportError:  # Windows: builds are not serialized across processes
+    fcntl = None
+from langchain_core.embeddings import Embeddings
+from core.embeddings import EMBEDDING_MODEL, embed
+from core.embedding_cache import EmbeddingCache, EMBEDDING_CACHE_PATH
+from core.rag_pipeline import ingest, INGEST_WORKERS, EMBED_BATCH_SIZE
+from core.vector_index import open_backend, list_collections, drop_collection, RAG_BACKEND, RAG_INDEX_DTYPE
+from core.rag_status import read_status, write_status, docs_hash, docs_mtime_ns
+from core.lexical_index import LexicalIndex, fts_path
 
-EMB = SentenceTransformerEmbeddings(model_name="all-MiniLM-L6-v2")
 
-def build_vectorstore(path: str="data/docs", persist: str=".chroma", clear_existing: bool=True, collection_name: str="langchain"):
+class SharedEmbeddings(Embeddings):
     """
-    Build RAG vectorstore from documents.
-    
+    LangChain adapter over the shared embedding provider; never loads a model itself.
+
+    With a ``cache``, document embeddings are served from the persistent
+    embedding cache and only cache misses reach the model.
+    """
+
+    model_name = EMBEDDING_MODEL
+
+    def __init__(self, cache: EmbeddingCache = None):
+        self.cache = cache
+
+    def embed_documents(self, texts):
+        if self.cache is not None:
+            return self.cache.embed(self.model_name, texts, embed)
+        return embed(texts)
+
+    def embed_query(self, text):
+        return embed([text])[0]
+
+
+EMB = SharedEmbeddings()
+
+# Chunking parameters are recorded in the manifest; changing them forces a full rebuild
+CHUNK_SIZE = 800
+CHUNK_OVERLAP = 120
+
+# Manifest of file path -> content hash -> chunk ids, one per collection version
+MANIFEST_FILE = "manifest-{collection}.json"
+MANIFEST_VERSION = 2
+
+# Previous versions kept alive for in-flight readers; older ones are garbage-collected
+RAG_KEEP_VERSIONS = int(os.getenv("RAG_KEEP_VERSIONS", "1"))
+
+
+def _file_hash(path: str) -> str:
+    """SHA-256 of a file's contents, read in blocks."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _list_doc_files(path: str) -> list:
+    """Relative paths of all (non-hidden) files under ``path``, sorted."""
+    files = []
+    for root, dirs, names in os.walk(path):
+        dirs[:] = [d for d in dirs if not d.startswith(".")]
+        for name in names:
+            if not name.startswith("."):
+                files.append(os.path.relpath(os.path.join(root, name), path))
+    return sorted(files)
+
+
+def _version_name(collection_name: str) -> str:
+    """New versioned collection name; versions sort by creation time."""
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%d%H%M%S%f")
+    return f"{collection_name}__v{stamp}_{uuid.uuid4().hex[:6]}"
+
+
+def load_manifest(persist: str, collection: str) -> dict:
+    """Read a version's build manifest, returning an empty manifest if missing or unreadable."""
+    try:
+        with open(os.path.join(persist, MANIFEST_FILE.format(collection=collection))) as f:
+            manifest = json.load(f)
+        if manifest.get("version") == MANIFEST_VERSION:
+            return manifest
+    except (OSError, ValueError):
+        pass
+    return {}
+
+
+def write_manifest(persist: str, collection: str, manifest: dict) -> None:
+    """Atomically replace a version's build manifest (write to a temp file, then rename)."""
+    os.makedirs(persist, exist_ok=True)
+    target = os.path.join(persist, MANIFEST_FILE.format(collection=collection))
+    tmp = f"{target}.tmp.{os.getpid()}"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f)
+    os.replace(tmp, target)
+
+
+def gc_versions(persist: str, collection_name: str, backend: str, live: str, previous: Optional[str] = None) -> list:
+    """
+    Drop old versions of ``collection_name`` and their manifests.
+
+    The live version is always kept, plus RAG_KEEP_VERSIONS earlier ones
+    (the previously live version first) so in-flight readers can finish.
+    Leftovers of aborted builds are dropped.
+
+    Returns:
+        Names of the dropped versions
+    """
+    prefix = f"{collection_name}__v"
+    versions = sorted((n for n in list_collections(persist, backend) if n.startswith(prefix) and n != live),
+                      reverse=True)
+    if previous in versions:
+        versions.remove(previous)
+        versions.insert(0, previous)
+    dropped = versions[RAG_KEEP_VERSIONS:]
+    for name in dropped:
+        drop_collection(persist, name, backend)
+        for stale in (os.path.join(persist, MANIFEST_FILE.format(collection=name)), fts_path(persist, name)):
+            try:
+                os.unlink(stale)
+            except OSError:
+                pass
+    return dropped
+
+
+class _IndexingSink:
+    """Upsert target that writes chunks to the vector backend and the BM25 index together."""
+
+    def __init__(self, vs, lexical: LexicalIndex):
+        self.vs = vs
+        self.lexical = lexical
+
+    def upsert(self, ids, embeddings, documents, metadatas) -> None:
+        self.vs.upsert(ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas)
+        self.lexical.add(ids, documents)
+
+
+def _copy_chunks(source, target, ids: list, batch_size: int) -> None:
+    """Copy stored chunks (with their embeddings) between versions without re-embedding."""
+    for i in range(0, len(ids), batch_size):
+        got = source.get(ids[i:i + batch_size])
+        if got["ids"]:
+            target.upsert(ids=got["ids"], embeddings=got["embeddings"], documents=got["documents"],
+                          metadatas=got["metadatas"])
+
+
+def build_vectorstore(path: str="data/docs", persist: str=".chroma", clear_existing: bool=False, collection_name: str="langchain",
+                      cache_path: str=EMBEDDING_CACHE_PATH, workers: int=INGEST_WORKERS, batch_size: int=EMBED_BATCH_SIZE,
+                      backend: str=RAG_BACKEND, progress: Optional[Callable[[dict], None]]=None):
+    """
+    Build a new version of the RAG vectorstore from documents (blue/green).
+
+    Every build writes into a fresh versioned collection
+    (``<collection_name>__v<timestamp>``) while the live version keeps
+    serving queries. A manifest of file path -> content hash -> chunk ids is
+    kept per version: chunks of unchanged files are copied from the live
+    version with their embeddings, and only new or changed files are loaded,
+    split and embedded. A BM25 keyword index (``core.lexical_index``) of the
+    version's chunks is written alongside for hybrid retrieval. ``clear_existing`` ignores the live version and
+    re-ingests everything.
+
+    Versions share no storage, so embedding cost scales with what changed
+    but the copy (and the disk a version takes) scales with the whole
+    corpus: a one-file edit still rewrites every chunk (about 7.5 s for
+    10k chunks on Chroma, see the ``rag_rebuild`` benchmark).
+
+    When the new version is complete, the status manifest
+    (``core.rag_status``) is atomically replaced to point at it; that write
+    is the switch-over, so readers see either the old or the new version,
+    never a partial one. Versions older than the previous live one are then
+    garbage-collected.
+
+    Chunk embeddings are looked up in the persistent embedding cache at
+    ``cache_path`` (kept outside the persist directory so it survives
+    vectorstore resets) before the model is called.
+
+    Documents are ingested as a stream (see ``core.rag_pipeline``): loading
+    and splitting run in ``workers`` processes and chunks are embedded and
+    upserted ``batch_size`` at a time, so memory stays bounded by the batch
+    size rather than the corpus size.
+
+    ``backend`` selects the vector index (see ``core.vector_index``);
+    switching backends triggers a full rebuild. ``progress``, if given, is
+    called with a dict (stage, files_total, files_done, chunks) as the build
+    advances. Builds sharing a persist directory are serialized; a build
+    started while another is running raises RuntimeError.
+
     Security: Validates paths to prevent path traversal attacks.
     Uses security utilities for path validation.
+
+    Returns:
+        Tuple of (vector backend, file_count, chunk_count) for the whole corpus,
+        or None if the documents directory does not exist
     """
     # Validate and sanitize paths to prevent path traversal
     # Use security utilities for proper validation
     try:
         from core.security import validate_path
         base_dir = os.getcwd()
-        path = validate_path(path, base_dir=base_dir, allow_absolute=False)
-        persist = validate_path(persist, base_dir=base_dir, allow_absolute=False)
+        # Already-resolved absolute paths (e.g. from the API) are accepted if inside base_dir
+        path = validate_path(path, base_dir=base_dir, allow_absolute=True)
+        persist = validate_path(persist, base_dir=base_dir, allow_absolute=True)
+        cache_path = validate_path(cache_path, base_dir=base_dir, allow_absolute=True)
     except (ValueError, ImportError) as e:
         raise ValueError(f"Invalid path: {e}")
-    
+
     # Ensure paths are within allowed directories (defense in depth)
     # In production, restrict to specific allowed directories
     if not os.path.isdir(path):
         return None
-    docs = []
-    def loader_cls(p): 
-        return PyPDFLoader(p) if p.lower().endswith(".pdf") else TextLoader(p)
-    loader = DirectoryLoader(path, glob="**/*", use_multithreading=True, loader_cls=loader_cls)
-    for d in loader.load():
-        docs.append(d)
-    
-    # Clear existing collection if requested (for rebuild)
-    if clear_existing:
-        try:
-            # Delete all collections to ensure clean state (using ChromaDB API directly)
+
+    with _build_lock(persist):
+        return _build_version(path, persist, clear_existing, collection_name, cache_path, workers, batch_size,
+                              backend, progress)
+
+
+@contextmanager
+def _build_lock(persist: str):
+    """Serialize builds across threads and processes sharing ``persist``."""
+    os.makedirs(persist, exist_ok=True)
+    with open(os.path.join(persist, ".build.lock"), "w") as lock:
+        if fcntl is not None:
             try:
-                client = chromadb.PersistentClient(path=persist)
-                collections = client.list_collections()
-                for col in collections:
-                    print(f"Deleting collection: {col.name} ({col.count()} documents)")
-                    client.delete_collection(col.name)
-                print(f"Deleted {len(collections)} existing collection(s) via ChromaDB API")
-            except Exception as e1:
-                print(f"Could not delete via ChromaDB API: {e1}")
-                # Fallback: try to delete directory directly
-                import shutil
-                import time
-                if os.path.exists(persist):
-                    # Wait a bit for any locks to release
-                    time.sleep(0.5)
-                    if os.path.isdir(persist):
-                        print(f"Deleting existing vectorstore directory: {persist}")
-                        shutil.rmtree(persist)
-                        print(f"Successfully deleted vectorstore directory")
-                    elif os.path.isfile(persist):
-                        print(f"Deleting existing vectorstore file: {persist}")
-                        os.remove(persist)
-                        print(f"Successfully deleted vectorstore file")
-        except Exception as e:
-            print(f"Warning: Could not clear existing vectorstore: {e}")
-    
-    splitter = RecursiveCharacterTextSplitter(chunk_size=800, chunk_overlap=120)
-    chunks = splitter.split_documents(docs)
-    
-    # Create new vectorstore with explicit collection name
-    vs = Chroma.from_documents(
-        chunks, 
-        EMB, 
-        persist_directory=persist,
-        collection_name=collection_name
-    )
-    vs.persist()
-    return vs, len(docs), len(chunks)  # Return original doc count and chunk count
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                raise RuntimeError("Another vectorstore build is in progress")
+        yield
+
+
+def _build_version(path, persist, clear_existing, collection_name, cache_path, workers, batch_size, backend, progress):
+    def report(stage, **fields):
+        if progress is not None:
+            progress({"stage": stage, **fields})
+
+    report("scanning")
+    settings = {"collection": collection_name, "chunk_size": CHUNK_SIZE, "chunk_overlap": CHUNK_OVERLAP,
+                "model": EMB.model_name, "backend": backend}
+    if backend == "numpy":
+        # Copied chunks would otherwise carry vectors dequantized from the previous dtype
+        settings["index_dtype"] = RAG_INDEX_DTYPE
+    live_status = read_status(persist) or {}
+    live = live_status.get("collection") if live_status.get("backend") == backend else None
+    manifest = load_manifest(persist, live) if live else {}
+    if clear_existing or manifest.get("settings") != settings:
+        manifest = {}
+    live_vs = None
+    if manifest:
+        try:
+            live_vs = open_backend(persist, live, backend=backend, create=False)
+        except Exception:
+            manifest = {}  # Live version deleted out of band; its manifest cannot be trusted
+
+    target = _version_name(collection_name)
+    vs = open_backend(persist, target, backend=backend)
+    lexical = LexicalIndex(fts_path(persist, target))
+    sink = _IndexingSink(vs, lexical)
+
+    old_files = manifest.get("files", {})
+    # Taken before hashing so changes made during the build still flag the status as stale
+    mtime_ns = docs_mtime_ns(path)
+    current = {rel: _file_hash(os.path.join(path, rel)) for rel in _list_doc_files(path)}
+    changed = [rel for rel, digest in current.items() if old_files.get(rel, {}).get("hash") != digest]
+    removed = [rel for rel in old_files if rel not in current]
+    files = {rel: entry for rel, entry in old_files.items() if rel in current and rel not in changed}
+
+    # Carry unchanged files over from the live version
+    report("copying", files_total=len(current), files_done=0, chunks=0)
+    if files:
+        _copy_chunks(live_vs, sink, [cid for entry in files.values() for cid in entry["chunk_ids"]], batch_size)
+
+    done = {"files": len(files), "chunks": sum(len(e["chunk_ids"]) for e in files.values())}
+
+    def on_file(rel, n_chunks):
+        done["files"] += 1
+        done["chunks"] += n_chunks
+        report("ingesting", files_total=len(current), files_done=done["files"], chunks=done["chunks"])
+
+    # Stream new/changed files through load -> split -> embed -> upsert with bounded memory
+    cache = EmbeddingCache(cache_path)
+    emb = SharedEmbeddings(cache=cache)
+    try:
+        chunk_ids, stats = ingest(path, {rel: current[rel] for rel in changed}, sink, emb.embed_documents,
+                                  CHUNK_SIZE, CHUNK_OVERLAP, workers=workers, batch_size=batch_size,
+                                  on_file=on_file)
+    finally:
+        cache.close()
+        lexical.close()
+    for rel in changed:
+        files[rel] = {"hash": current[rel], "chunk_ids": chunk_ids.get(rel, [])}
+
+    report("finalizing", files_total=len(current), files_done=len(current), chunks=done["chunks"])
+    vs.save()
+    recall = getattr(vs, "recall", None)
+    write_manifest(persist, target, {"version": MANIFEST_VERSION, "settings": settings, "files": files})
+    chunk_count = sum(len(entry["chunk_ids"]) for entry in files.values())
+    # Atomic switch-over: readers follow the collection named in the status manifest
+    write_status(persist, {
+        "chunk_count": chunk_count,
+        "file_count": len(files),
+        "built_at": datetime.now(timezone.utc).isoformat(),
+        "model": EMB.model_name,
+        "backend": backend,
+        "collection": target,
+        "collection_name": collection_name,
+        "docs_hash": docs_hash(current),
+        "docs_mtime_ns": mtime_ns,
+        "index_recall": recall,
+    })
+    dropped = gc_versions(persist, collection_name, backend, live=target, previous=live)
+    print(f"Vectorstore {target} live: {len(changed)} new/changed, {len(removed)} removed, "
+          f"{len(files) - len(changed)} unchanged files ({chunk_count} chunks); "
+          f"embedding cache: {cache.hits} hits, {cache.misses} misses; {len(dropped)} old versions dropped")
+    if changed:
+        print(f"Ingestion: {stats.summary()}")
+    if recall:
+        reranked = f", {recall['recall_reranked']:.3f} with float32 rerank" if recall["recall_reranked"] is not None else ""
+        print(f"Index {recall['dtype']}: recall@{recall['k']} {recall['recall_quantized']:.3f} quantized{reranked} "
+              f"({recall['index_bytes']} bytes vs {recall['float32_bytes']} float32)")
+    return vs, len(files), chunk_count
@@ -0,0 +1,137 @@
+"""
+Background RAG rebuild jobs.
+
+``/rag/rebuild`` submits a job and returns immediately; the build runs in a
+daemon thread (document splitting fans out to worker processes from there),
+so the API worker is never blocked on embedding. Builds are blue/green (see
+``core.rag.build_vectorstore``): the live collection keeps serving queries
+until the new version atomically replaces it.
+
+Job state is kept in memory and mirrored to ``<persist>/jobs/<job_id>.json``
+so any API worker can report progress for a job started by another.
+"""
+
+import os
+import re
+import json
+import uuid
+import logging
+import threading
+from datetime import datetime, timezone
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+JOBS_DIR = "jobs"
+MAX_JOB_FILES = 20
+_JOB_ID = re.compile(r"^[0-9a-f]{32}$")
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class RebuildJobs:
+    """Runs at most one rebuild at a time per process and tracks job progress."""
+
+    def __init__(self, build: Optional[Callable] = None):
+        # build(docs_path, persist_path, clear_existing, progress) -> (vs, file_count, chunk_count) | None
+        self._build = build
+        self._jobs: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+        self._running: Optional[str] = None
+
+    def _build_fn(self):
+        if self._build is None:
+            from core.rag import build_vectorstore
+            self._build = lambda docs, persist, full, progress: build_vectorstore(
+                path=docs, persist=persist, clear_existing=full, progress=progress)
+        return self._build
+
+    def submit(self, docs_path: str, persist_path: str, full: bool = False) -> dict:
+        """
+        Start a rebuild job, or return the one already running in this process.
+
+        Returns:
+            Snapshot of the job state
+        """
+        with self._lock:
+            if self._running is not None:
+                return dict(self._jobs[self._running])
+            job_id = uuid.uuid4().hex
+            job = {"job_id": job_id, "status": "queued", "full": full, "created_at": _now(),
+                   "started_at": None, "finished_at": None, "progress": {}, "file_count": None,
+                   "chunk_count": None, "error": None, "persist_path": persist_path}
+            self._jobs[job_id] = job
+            self._running = job_id
+            for old_id in list(self._jobs)[:-MAX_JOB_FILES]:
+                del self._jobs[old_id]
+        self._save(job)
+        threading.Thread(target=self._run, args=(job_id, docs_path, persist_path, full),
+                         name=f"rag-rebuild-{job_id[:8]}", daemon=True).start()
+        return dict(job)
+
+    def _run(self, job_id: str, docs_path: str, persist_path: str, full: bool) -> None:
+        job = self._jobs[job_id]
+        self._update(job, status="running", started_at=_now())
+        try:
+            result = self._build_fn()(docs_path, persist_path, full, lambda p: self._update(job, progress=p))
+            if result is None:
+                raise RuntimeError(f"Documents directory not found: {docs_path}")
+            _, file_count, chunk_count = result
+            self._update(job, status="succeeded", file_count=file_count, chunk_count=chunk_count)
+        except Exception as e:
+            logger.error(f"RAG rebuild job {job_id} failed: {e}", exc_info=True)
+            # Keep details in server logs; the job only reports the error type
+            self._update(job, status="failed", error=type(e).__name__)
+        finally:
+            self._update(job, finished_at=_now())
+            with self._lock:
+                self._running = None
+
+    def _update(self, job: dict, **fields) -> None:
+        with self._lock:
+            job.update(fields)
+        self._save(job)
+
+    def _save(self, job: dict) -> None:
+        directory = os.path.join(job["persist_path"], JOBS_DIR)
+        try:
+            os.makedirs(directory, exist_ok=True)
+            target = os.path.join(directory, f"{job['job_id']}.json")
+            tmp = f"{target}.tmp.{os.getpid()}.{threading.get_ident()}"
+            with self._lock:
+                payload = json.dumps(job)
+            with open(tmp, "w") as f:
+                f.write(payload)
+            os.replace(tmp, target)
+            if job["status"] == "queued":
+                self._prune(directory)
+        except OSError as e:
+            logger.warning(f"Could not persist RAG job state: {e}")
+
+    @staticmethod
+    def _prune(directory: str) -> None:
+        files = sorted((os.path.join(directory, f) for f in os.listdir(directory) if f.endswith(".json")),
+                       key=os.path.getmtime, reverse=True)
+        for path in files[MAX_JOB_FILES:]:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+
+    def get(self, job_id: str, persist_path: str) -> Optional[dict]:
+        """Job state from this process, or from the job file written by another worker."""
+        if not _JOB_ID.match(job_id):
+            return None
+        with self._lock:
+            if job_id in self._jobs:
+                return dict(self._jobs[job_id])
+        try:
+            with open(os.path.join(persist_path, JOBS_DIR, f"{job_id}.json")) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+
+rebuild_jobs = RebuildJobs()
@@ -0,0 +1,197 @@
+"""
+Streaming document ingestion pipeline for the RAG vectorstore.
+
+Documents flow through four stages as generators, so only a bounded window
+of work is in memory at any time regardless of corpus size:
+
+    load + split (process pool) -> batch -> embed -> upsert
+
+PDF parsing and splitting run in worker processes. At most ``max_pending``
+files are in flight in the pool; the pool is only fed as the main thread
+consumes split results, and embedding/upserting happen in fixed-size
+batches. Per-stage counts and rates are collected in ``PipelineStats``.
+"""
+
+import os
+import multiprocessing
+from time import perf_counter
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+INGEST_WORKERS = int(os.getenv("RAG_INGEST_WORKERS", str(min(4, os.cpu_count() or 1))))
+EMBED_BATCH_SIZE = int(os.getenv("RAG_EMBED_BATCH_SIZE", "256"))
+
+# (chunk id, text, metadata)
+Chunk = Tuple[str, str, dict]
+
+
+class PipelineStats:
+    """Per-stage item counts and busy time."""
+
+    STAGES = ("load_split", "embed", "upsert")
+
+    def __init__(self):
+        self.documents = 0
+        self.chunks = 0
+        self.embeddings = 0
+        self.upserted = 0
+        self.seconds = {stage: 0.0 for stage in self.STAGES}
+        self._started = perf_counter()
+        self.elapsed_s = 0.0
+
+    def finish(self) -> None:
+        self.elapsed_s = perf_counter() - self._started
+
+    def as_dict(self) -> Dict[str, dict]:
+        def rate(n, s):
+            return round(n / s, 1) if s > 0 else 0.0
+        return {
+            "load_split": {"documents": self.documents, "chunks": self.chunks,
+                           "seconds": round(self.seconds["load_split"], 3),
+                           "documents_per_sec": rate(self.documents, self.seconds["load_split"]),
+                           "chunks_per_sec": rate(self.chunks, self.seconds["load_split"])},
+            "embed": {"embeddings": self.embeddings, "seconds": round(self.seconds["embed"], 3),
+                      "embeddings_per_sec": rate(self.embeddings, self.seconds["embed"])},
+            "upsert": {"chunks": self.upserted, "seconds": round(self.seconds["upsert"], 3),
+                       "chunks_per_sec": rate(self.upserted, self.seconds["upsert"])},
+            "elapsed_s": round(self.elapsed_s, 3),
+        }
+
+    def summary(self) -> str:
+        s = self.as_dict()
+        return (f"load+split {s['load_split']['documents_per_sec']} docs/s "
+                f"({s['load_split']['chunks_per_sec']} chunks/s), "
+                f"embed {s['embed']['embeddings_per_sec']}/s, "
+                f"upsert {s['upsert']['chunks_per_sec']}/s, total {s['elapsed_s']}s")
+
+
+def load_and_split(root: str, rel: str, digest: str, chunk_size: int, chunk_overlap: int) -> Tuple[str, List[Chunk], float]:
+    """
+    Load and split one document (runs in a worker process).
+
+    Returns:
+        Tuple of (relative path, chunks, seconds spent)
+    """
+    from langchain_community.document_loaders import PyPDFLoader, TextLoader
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+    t0 = perf_counter()
+    p = os.path.join(root, rel)
+    loader = PyPDFLoader(p) if p.lower().endswith(".pdf") else TextLoader(p)
+    splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    chunks = []
+    # lazy_load yields one page at a time for PDFs
+    for doc in splitter.split_documents(loader.lazy_load()):
+        chunks.append((f"{rel}:{digest[:16]}:{len(chunks)}", doc.page_content, doc.metadata))
+    return rel, chunks, perf_counter() - t0
+
+
+def iter_split(root: str, files: Dict[str, str], chunk_size: int, chunk_overlap: int,
+               stats: PipelineStats, workers: int = INGEST_WORKERS,
+               max_pending: int = 0) -> Iterator[Tuple[str, List[Chunk]]]:
+    """
+    Yield (relative path, chunks) for each file, splitting in a process pool.
+
+    Args:
+        root: Documents directory
+        files: Relative path -> content hash for the files to ingest
+        workers: Worker processes; 0 or 1 splits in-process
+        max_pending: Files in flight at once (default 2 * workers)
+    """
+    items = list(files.items())
+    workers = min(workers, len(items))
+    if workers <= 1:
+        for rel, digest in items:
+            rel, chunks, seconds = load_and_split(root, rel, digest, chunk_size, chunk_overlap)
+            stats.documents += 1
+            stats.chunks += len(chunks)
+            stats.seconds["load_split"] += seconds
+            yield rel, chunks
+        return
+
+    max_pending = max_pending or 2 * workers
+    # spawn: the API process runs threads, which fork() does not copy safely
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as pool:
+        todo = iter(items)
+        pending = set()
+        while True:
+            # Backpressure: only submit while fewer than max_pending files are in flight
+            for rel, digest in todo:
+                pending.add(pool.submit(load_and_split, root, rel, digest, chunk_size, chunk_overlap))
+                if len(pending) >= max_pending:
+                    break
+            if not pending:
+                break
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                rel, chunks, seconds = fut.result()
+                stats.documents += 1
+                stats.chunks += len(chunks)
+                # Worker time is summed across processes
+                stats.seconds["load_split"] += seconds
+                yield rel, chunks
+
+
+def iter_batches(split: Iterable[Tuple[str, List[Chunk]]], batch_size: int = EMBED_BATCH_SIZE) -> Iterator[List[Chunk]]:
+    """Re-chunk per-file chunk lists into fixed-size batches."""
+    batch: List[Chunk] = []
+    for _, chunks in split:
+        for chunk in chunks:
+            batch.append(chunk)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+def ingest(root: str, files: Dict[str, str], collection, embed_documents: Callable[[List[str]], List[List[float]]],
+           chunk_size: int, chunk_overlap: int, workers: int = INGEST_WORKERS,
+           batch_size: int = EMBED_BATCH_SIZE,
+           on_file: Optional[Callable[[str, int], None]] = None) -> Tuple[Dict[str, List[str]], PipelineStats]:
+    """
+    Stream ``files`` into a vector backend: load -> split -> embed -> upsert.
+
+    Args:
+        root: Documents directory
+        files: Relative path -> content hash for the files to ingest
+        collection: Vector backend (``core.vector_index``) to upsert into
+        embed_documents: Batched embedding function
+        chunk_size: Splitter chunk size
+        chunk_overlap: Splitter chunk overlap
+        workers: Worker processes for load/split
+        batch_size: Chunks per embed/upsert batch
+        on_file: Called with (relative path, chunk count) as each file is split
+
+    Returns:
+        Tuple of (relative path -> chunk ids, pipeline stats)
+    """
+    stats = PipelineStats()
+    chunk_ids: Dict[str, List[str]] = {}
+
+    def record(split):
+        for rel, chunks in split:
+            chunk_ids[rel] = [cid for cid, _, _ in chunks]
+            if on_file is not None:
+                on_file(rel, len(chunks))
+            yield rel, chunks
+
+    split = record(iter_split(root, files, chunk_size, chunk_overlap, stats, workers=workers))
+    for batch in iter_batches(split, batch_size):
+        ids = [cid for cid, _, _ in batch]
+        texts = [text for _, text, _ in batch]
+        metadatas = [meta or {"source": cid.split(":", 1)[0]} for _, _, meta in batch]
+
+        t0 = perf_counter()
+        vectors = embed_documents(texts)
+        stats.seconds["embed"] += perf_counter() - t0
+        stats.embeddings += len(vectors)
+
+        t0 = perf_counter()
+        collection.upsert(ids=ids, embeddings=vectors, documents=texts, metadatas=metadatas)
+        stats.seconds["upsert"] += perf_counter() - t0
+        stats.upserted += len(ids)
+
+    stats.finish()
+    return chunk_ids, stats
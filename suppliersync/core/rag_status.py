@@ -0,0 +1,59 @@
+"""
+Build status manifest for the RAG vectorstore.
+
+``build_vectorstore`` writes a small ``status.json`` into the persist
+directory at the end of every build. ``/rag/status`` reads only this file
+plus one stat() of the documents directory, so it is O(1) and safe to poll:
+it never opens the vector backend, loads a model or lists documents.
+
+This module has no RAG dependencies, so status is available even when
+the vectorstore stack is not installed.
+"""
+
+import os
+import json
+import hashlib
+from typing import Dict, Optional
+
+STATUS_FILE = "status.json"
+
+
+def docs_hash(files: Dict[str, str]) -> str:
+    """Digest of the corpus: sorted (relative path, content hash) pairs."""
+    h = hashlib.sha256()
+    for rel in sorted(files):
+        h.update(f"{rel}\0{files[rel]}\n".encode("utf-8"))
+    return h.hexdigest()
+
+
+def docs_mtime_ns(path: str) -> Optional[int]:
+    """Modification time of the documents directory (changes when files are added, removed or replaced)."""
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def write_status(persist: str, status: dict) -> None:
+    """Atomically replace the status manifest."""
+    os.makedirs(persist, exist_ok=True)
+    target = os.path.join(persist, STATUS_FILE)
+    tmp = f"{target}.tmp.{os.getpid()}"
+    with open(tmp, "w") as f:
+        json.dump(status, f)
+    os.replace(tmp, target)
+
+
+def read_status(persist: str) -> Optional[dict]:
+    """Read the status manifest, or None if no build has completed."""
+    try:
+        with open(os.path.join(persist, STATUS_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def is_stale(status: dict, docs_path: str) -> bool:
+    """Whether the documents directory changed after the last build."""
+    current = docs_mtime_ns(docs_path)
+    return current is not None and current != status.get("docs_mtime_ns")
@@ -0,0 +1,231 @@
+"""
+Compact record types for the orchestration hot path.
+
+``Orchestrator.step`` used to hold the active catalog as one
+``dict(sqlite3.Row)`` per SKU. It also rebuilt full-catalog ``sku_to_*``
+dicts and validated every agent item through a pydantic model, only to
+``model_dump()`` it back into a dict. These types replace that inside the
+orchestrator:
+
+- ``Catalog``: the active catalog as columns (one tuple per field, with
+  category strings shared). It serializes straight from the columns to
+  exactly the JSON ``json.dumps`` produces for the equivalent dicts, so
+  prompts are unchanged. ``CatalogRow`` is the per-row view.
+- ``validate_items``: validates a whole list of agent items in one
+  ``TypeAdapter`` call over TypedDicts, so valid items come back as plain
+  dicts without a model instance per item. Invalid items are dropped, as
+  before.
+
+The pydantic models in core/types.py remain the schema at the API boundary.
+"""
+
+import gc
+import json
+import math
+from itertools import compress
+from json.encoder import encode_basestring_ascii
+from typing import Dict, Iterable, Iterator, List, Literal, NamedTuple, Optional, Union
+
+from pydantic import Field, TypeAdapter, ValidationError
+from typing_extensions import Annotated, NotRequired, TypedDict
+
+CATALOG_COLUMNS = ("sku", "name", "category", "wholesale_price", "retail_price")
+CATALOG_SELECT_SQL = f"SELECT {', '.join(CATALOG_COLUMNS)} FROM products WHERE is_active=1"
+
+
+class CatalogRow(NamedTuple):
+    sku: str
+    name: Optional[str]
+    category: Optional[str]
+    wholesale_price: Optional[float]
+    retail_price: Optional[float]
+
+
+def _encode_value(value) -> str:
+    # Scalars the fast paths below cannot take (None, ints, NaN/Infinity), exactly as json.dumps writes them
+    return json.dumps(value)
+
+
+def _encode_column(values: tuple) -> List[str]:
+    """JSON text of every value of a column; C-level map for all-str and all-finite-float columns."""
+    first = values[0]
+    try:
+        if type(first) is str:
+            return list(map(encode_basestring_ascii, values))
+        if type(first) is float and all(map(math.isfinite, values)):
+            return list(map(float.__repr__, values))
+    except TypeError:
+        pass  # A None (or another type) further down the column
+    return list(map(_encode_value, values))
+
+
+class Catalog:
+    """
+    Active catalog rows stored column-wise.
+
+    Example:
+        >>> catalog = Catalog.from_cursor(db.execute(CATALOG_SELECT_SQL))
+        >>> text = catalog.to_json()  # == json.dumps([row._asdict() for row in catalog])
+    """
+
+    __slots__ = CATALOG_COLUMNS
+
+    def __init__(self, sku: tuple = (), name: tuple = (), category: tuple = (), wholesale_price: tuple = (),
+                 retail_price: tuple = ()):
+        self.sku = sku
+        self.name = name
+        self.category = category
+        self.wholesale_price = wholesale_price
+        self.retail_price = retail_price
+
+    @classmethod
+    def from_rows(cls, rows: List[tuple]) -> "Catalog":
+        """Build from ``CATALOG_COLUMNS``-ordered tuples (a cursor without a row factory)."""
+        if not rows:
+            return cls()
+        return cls.from_columns(*zip(*rows))
+
+    @classmethod
+    def from_columns(cls, sku: tuple, name: tuple, category: tuple, wholesale_price: tuple,
+                     retail_price: tuple) -> "Catalog":
+        """Build from column tuples, sharing repeated category strings."""
+        # A few hundred distinct categories repeat across the catalog: keep one string object each
+        shared: Dict[str, str] = {}
+        category = tuple(map(lambda c: shared.setdefault(c, c), category))
+        return cls(sku, name, category, wholesale_price, retail_price)
+
+    @classmethod
+    def from_cursor(cls, cursor) -> "Catalog":
+        """Fetch all rows of an executed ``CATALOG_SELECT_SQL`` cursor that returns plain tuples."""
+        # Row tuples cannot form cycles, but allocating 100k+ of them triggers several full
+        # collections that scan the whole heap; pause the cyclic GC for the bulk fetch
+        enabled = gc.isenabled()
+        gc.disable()
+        try:
+            return cls.from_rows(cursor.fetchall())
+        finally:
+            if enabled:
+                gc.enable()
+
+    def __len__(self) -> int:
+        return len(self.sku)
+
+    def __iter__(self) -> Iterator[CatalogRow]:
+        return map(CatalogRow._make, zip(self.sku, self.name, self.category, self.wholesale_price, self.retail_price))
+
+    def select(self, skus: Iterable[str]) -> Dict[str, CatalogRow]:
+        """Rows of the given SKUs (absent SKUs are left out; a repeated SKU maps to its last row)."""
+        wanted = set(skus)
+        columns = (self.sku, self.name, self.category, self.wholesale_price, self.retail_price)
+        rows = {}
+        for i in compress(range(len(self.sku)), map(wanted.__contains__, self.sku)):
+            rows[self.sku[i]] = CatalogRow._make(column[i] for column in columns)
+        return rows
+
+    def fragments(self, indent: Optional[int] = None, level: int = 0) -> List[str]:
+        """
+        The JSON object text of every row, as ``to_json`` lays it out.
+
+        Args:
+            indent: As for ``json.dumps``
+            level: Nesting depth of the array in an enclosing indented document
+        """
+        if not self.sku:
+            return []
+        encoded = [_encode_column(getattr(self, column)) for column in CATALOG_COLUMNS]
+        keys = [encode_basestring_ascii(column) + ": %s" for column in CATALOG_COLUMNS]
+        if indent is None:
+            template = "{" + ", ".join(keys) + "}"
+        else:
+            field = "\n" + " " * (indent * (level + 2))
+            template = "{" + ",".join(field + key for key in keys) + "\n" + " " * (indent * (level + 1)) + "}"
+        return [template % row for row in zip(*encoded)]
+
+    def to_json(self, indent: Optional[int] = None, level: int = 0) -> str:
+        """
+        The rows as a JSON array of objects, identical to ``json.dumps`` of the
+        row dicts (default separators, ``ensure_ascii``).
+
+        Args:
+            indent: As for ``json.dumps``
+            level: Nesting depth of the array in an enclosing indented document
+        """
+        return join_fragments(self.fragments(indent, level), indent, level)
+
+
+def join_fragments(fragments: List[str], indent: Optional[int] = None, level: int = 0) -> str:
+    """The JSON array of row fragments from ``Catalog.fragments`` with the same ``indent`` and ``level``."""
+    if not fragments:
+        return "[]"
+    if indent is None:
+        return "[" + ", ".join(fragments) + "]"
+    item = "\n" + " " * (indent * (level + 1))
+    return "[" + item + ("," + item).join(fragments) + "\n" + " " * (indent * level) + "]"
+
+
+def context_json(catalog: Catalog, extra: Optional[dict] = None, indent: Optional[int] = None) -> str:
+    """Same text as ``json.dumps({"catalog": <row dicts>, **extra}, indent=indent)``."""
+    extra = extra or {}
+    # One join, so the catalog text (most of the context) is copied once
+    if indent is None:
+        parts = ['{"catalog": ', catalog.to_json()]
+        for key, value in extra.items():
+            parts += [", ", encode_basestring_ascii(key), ": ", json.dumps(value)]
+        parts.append("}")
+        return "".join(parts)
+    pad = " " * indent
+    parts = ["{\n", pad, '"catalog": ', catalog.to_json(indent, level=1)]
+    for key, value in extra.items():
+        # JSON text has no raw newlines inside strings, so re-indenting line starts is safe
+        parts += [",\n", pad, encode_basestring_ascii(key), ": ", json.dumps(value, indent=indent).replace("\n", "\n" + pad)]
+    parts.append("\n}")
+    return "".join(parts)
+
+
+# Agent items: same fields and constraints as SupplierUpdate / PriceChange / CXAction in core/types.py
+
+class SupplierUpdateItem(TypedDict):
+    sku: str
+    field: Literal["wholesale_price", "name", "category"]
+    new_value: Union[float, str]
+    reason: NotRequired[Optional[str]]
+
+
+class PriceChangeItem(TypedDict):
+    sku: str
+    new_price: Annotated[float, Field(gt=0)]
+    reason: NotRequired[Optional[str]]
+
+
+class CXActionItem(TypedDict):
+    sku: str
+    action: str
+    details: str
+
+
+SUPPLIER_UPDATES = TypeAdapter(List[SupplierUpdateItem])
+PRICE_CHANGES = TypeAdapter(List[PriceChangeItem])
+CX_ACTIONS = TypeAdapter(List[CXActionItem])
+
+
+def validate_items(adapter: TypeAdapter, raw_items, defaults: Optional[dict] = None) -> List[dict]:
+    """
+    Validate a list of agent items in one call, dropping invalid items.
+
+    Args:
+        adapter: SUPPLIER_UPDATES, PRICE_CHANGES or CX_ACTIONS
+        raw_items: Parsed LLM output; anything but a list yields no items
+        defaults: Values for optional keys the item left out (as ``model_dump`` includes them)
+    """
+    if not isinstance(raw_items, list):
+        return []
+    try:
+        items = adapter.validate_python(raw_items)
+    except ValidationError as e:
+        invalid = {error["loc"][0] for error in e.errors() if error["loc"]}
+        items = adapter.validate_python([r for i, r in enumerate(raw_items) if i not in invalid])
+    if defaults:
+        for item in items:
+            for key, value in defaults.items():
+                item.setdefault(key, value)
+    return items
@@ -0,0 +1,310 @@
+"""
+Retrieval stage for agent grounding.
+
+The orchestrator asks for policy/spec context once per distinct product
+category and supplier, not once per SKU. All cache misses of a run are
+embedded and searched in a single batched query, and results are kept in an
+LRU cache keyed on (query, vectorstore version), so repeated runs against an
+unchanged vectorstore do no retrieval work at all.
+
+Retrieval is optional: if the vectorstore has not been built, or the RAG
+dependencies are not installed, agents simply get no reference snippets.
+"""
+
+import os
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from time import perf_counter
+from typing import Dict, Iterable, List, Optional, Tuple
+from core.rag_status import STATUS_FILE, read_status
+from core.lexical_index import LexicalIndex, fts_path
+
+logger = logging.getLogger(__name__)
+
+RAG_PERSIST_PATH = os.getenv("RAG_PERSIST_PATH", ".chroma")
+RAG_COLLECTION = os.getenv("RAG_COLLECTION", "langchain")
+RAG_TOP_K = int(os.getenv("RAG_TOP_K", "3"))
+RAG_SNIPPET_CHARS = int(os.getenv("RAG_SNIPPET_CHARS", "400"))
+RAG_CACHE_SIZE = int(os.getenv("RAG_CACHE_SIZE", "256"))
+RAG_RETRIEVAL_ENABLED = os.getenv("RAG_RETRIEVAL", "1").lower() not in ("0", "false", "no")
+# Hybrid retrieval: BM25 prefilter of this many candidates, then dense rerank
+RAG_HYBRID_ENABLED = os.getenv("RAG_HYBRID", "1").lower() not in ("0", "false", "no")
+RAG_PREFILTER_K = int(os.getenv("RAG_PREFILTER_K", "50"))
+
+
+def category_query(category: str) -> str:
+    return f"Pricing policy, product specifications and quality requirements for {category} products"
+
+
+def supplier_query(supplier: str) -> str:
+    return f"Supplier terms, specifications and agreements for {supplier}"
+
+
+class LRUCache:
+    """Small thread-safe LRU mapping."""
+
+    def __init__(self, maxsize: int = RAG_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._data: "OrderedDict" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value) -> None:
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class LatencyStats:
+    """Call count and total/max latency per retrieval stage."""
+
+    def __init__(self):
+        self._stages: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def time(self, stage: str):
+        t0 = perf_counter()
+        try:
+            yield
+        finally:
+            ms = (perf_counter() - t0) * 1000.0
+            with self._lock:
+                st = self._stages.setdefault(stage, {"calls": 0, "total_ms": 0.0, "max_ms": 0.0})
+                st["calls"] += 1
+                st["total_ms"] += ms
+                st["max_ms"] = max(st["max_ms"], ms)
+            logger.debug(f"retrieval {stage}: {ms:.2f} ms")
+
+    def snapshot(self) -> Dict[str, dict]:
+        with self._lock:
+            return {stage: {**st, "avg_ms": st["total_ms"] / st["calls"]} for stage, st in self._stages.items()}
+
+
+class Retriever:
+    """
+    Batched, cached similarity search over the RAG vectorstore.
+
+    When the live version has a BM25 index, each query is first prefiltered
+    lexically to ``prefilter_k`` candidates, which are then reranked by
+    embedding similarity; queries with fewer than ``k`` lexical hits are
+    topped up from a plain dense query. Templated queries prefilter on their
+    key term (the category or supplier name) only: the template's own words
+    ("pricing", "policy", "products", ...) match nearly every chunk. Per-stage latencies (embed, lexical,
+    dense) are recorded in ``latency``.
+    """
+
+    def __init__(self, persist: str = RAG_PERSIST_PATH, collection_name: str = RAG_COLLECTION,
+                 k: int = RAG_TOP_K, cache_size: int = RAG_CACHE_SIZE, hybrid: bool = RAG_HYBRID_ENABLED,
+                 prefilter_k: int = RAG_PREFILTER_K):
+        self.persist = persist
+        self.collection_name = collection_name
+        self.k = k
+        self.hybrid = hybrid
+        self.prefilter_k = prefilter_k
+        self.cache = LRUCache(cache_size)
+        self.latency = LatencyStats()
+        self._collection = None
+        self._lexical = None
+        self._collection_version = None
+        # Guards the swap above; lexical indexes are closed once no search holds them
+        self._lock = threading.Lock()
+        self._readers: Dict[int, int] = {}
+        self._retired: List[LexicalIndex] = []
+
+    def version(self) -> Optional[str]:
+        """
+        Current vectorstore version, or None if no vectorstore has been built.
+
+        Derived from the status manifest's mtime and size; the status
+        manifest is rewritten when a rebuild switches the live collection,
+        so this costs one stat() call.
+        """
+        try:
+            st = os.stat(os.path.join(self.persist, STATUS_FILE))
+        except OSError:
+            return None
+        return f"{st.st_mtime_ns}:{st.st_size}"
+
+    def _get_collection(self, version: str):
+        """
+        (collection, lexical index or None) of ``version``, opened on first use.
+
+        The lexical index is held until passed to ``_release``: a rebuild
+        switching versions retires the old index but leaves it open while
+        searches started before the switch are still using it.
+        """
+        with self._lock:
+            if self._collection is None or self._collection_version != version:
+                from core.vector_index import open_backend
+                status = read_status(self.persist) or {}
+                if status.get("collection_name", self.collection_name) != self.collection_name:
+                    raise ValueError(f"Live vectorstore is not a version of {self.collection_name}")
+                # Follow the pointer to the live (versioned) collection
+                live = status.get("collection", self.collection_name)
+                self._collection = open_backend(self.persist, live, backend=status.get("backend", "chroma"),
+                                                create=False)
+                if self._lexical is not None:
+                    if self._readers.get(id(self._lexical)):
+                        self._retired.append(self._lexical)
+                    else:
+                        self._lexical.close()
+                    self._lexical = None
+                if self.hybrid and os.path.exists(fts_path(self.persist, live)):
+                    self._lexical = LexicalIndex(fts_path(self.persist, live), readonly=True)
+                self._collection_version = version
+            if self._lexical is not None:
+                self._readers[id(self._lexical)] = self._readers.get(id(self._lexical), 0) + 1
+            return self._collection, self._lexical
+
+    def _release(self, lexical: Optional[LexicalIndex]) -> None:
+        """Drop a ``_get_collection`` hold on ``lexical``, closing it if it was retired meanwhile."""
+        if lexical is None:
+            return
+        with self._lock:
+            self._readers[id(lexical)] -= 1
+            if self._readers[id(lexical)]:
+                return
+            del self._readers[id(lexical)]
+            if lexical in self._retired:
+                self._retired.remove(lexical)
+                lexical.close()
+
+    def _rerank(self, collection, vectors, candidates: List[List[str]]) -> List[List[str]]:
+        """Top-k documents per query among its lexical candidates, by cosine similarity."""
+        import numpy as np
+        got = collection.get(list({cid for ids in candidates for cid in ids}))
+        row = {cid: n for n, cid in enumerate(got["ids"])}
+        stored = np.asarray(got["embeddings"], dtype=np.float32)
+        stored /= np.maximum(np.linalg.norm(stored, axis=1, keepdims=True), 1e-12)
+        results = []
+        for vec, ids in zip(vectors, candidates):
+            rows = [row[cid] for cid in ids if cid in row]
+            q = np.asarray(vec, dtype=np.float32)
+            scores = stored[rows] @ (q / max(float(np.linalg.norm(q)), 1e-12))
+            results.append([got["documents"][rows[i]] for i in np.argsort(-scores)[:self.k]])
+        return results
+
+    def _search(self, queries: List[str], version: str, key_terms: Dict[str, str]) -> List[List[str]]:
+        """One embedding call, then BM25 prefilter + rerank, or one batched vector query, for all ``queries``."""
+        from core.embeddings import embed
+        collection, lexical = self._get_collection(version)
+        try:
+            with self.latency.time("embed"):
+                vectors = embed(queries)
+            candidates: List[List[str]] = [[] for _ in queries]
+            if lexical is not None:
+                with self.latency.time("lexical"):
+                    candidates = [[cid for cid, _ in lexical.search(key_terms.get(q, q), self.prefilter_k)]
+                                  for q in queries]
+        finally:
+            self._release(lexical)
+        hybrid = [i for i, ids in enumerate(candidates) if ids]
+
+        docs: List[List[str]] = [[] for _ in queries]
+        with self.latency.time("dense"):
+            if hybrid:
+                for i, found in zip(hybrid, self._rerank(collection, [vectors[i] for i in hybrid],
+                                                         [candidates[i] for i in hybrid])):
+                    docs[i] = found
+            # Queries with fewer than k lexical hits are topped up from a full dense search
+            short = [i for i, found in enumerate(docs) if len(found) < self.k]
+            if short:
+                result = collection.query(query_embeddings=[vectors[i] for i in short], n_results=self.k,
+                                          include=["documents"])
+                for i, found in zip(short, result["documents"]):
+                    docs[i] += [d for d in found if d not in docs[i]][:self.k - len(docs[i])]
+        return [[doc[:RAG_SNIPPET_CHARS] for doc in found] for found in docs]
+
+    def retrieve(self, queries: Iterable[str], key_terms: Optional[Dict[str, str]] = None) -> Dict[str, List[str]]:
+        """
+        Return up to ``k`` snippets per query, serving repeats from the cache.
+
+        Args:
+            queries: Query texts
+            key_terms: Query -> the text the lexical prefilter matches
+                (default: the whole query)
+
+        Returns:
+            Query -> snippets; empty if no vectorstore is available
+        """
+        queries = list(dict.fromkeys(queries))
+        version = self.version()
+        if not queries or version is None:
+            return {}
+
+        results: Dict[str, List[str]] = {}
+        misses = []
+        for q in queries:
+            cached = self.cache.get((q, version))
+            if cached is None:
+                misses.append(q)
+            else:
+                results[q] = cached
+        if misses:
+            for q, snippets in zip(misses, self._search(misses, version, key_terms or {})):
+                self.cache.put((q, version), snippets)
+                results[q] = snippets
+        return results
+
+    def context_for(self, categories: Iterable[str], suppliers: Iterable[str] = ()) -> Dict[str, List[str]]:
+        """
+        Reference snippets grouped by category and supplier.
+
+        Snippets already shown for an earlier group are not repeated, to keep
+        prompts small. Failures are logged and yield no context rather than
+        failing the orchestration run.
+        """
+        groups: List[Tuple[str, str, str]] = [(f"category:{c}", category_query(c), c)
+                                              for c in sorted({c for c in categories if c})]
+        groups += [(f"supplier:{s}", supplier_query(s), s) for s in sorted({s for s in suppliers if s})]
+        try:
+            found = self.retrieve((q for _, q, _ in groups), key_terms={q: term for _, q, term in groups})
+        except Exception as e:
+            logger.warning(f"Retrieval unavailable, continuing without reference docs: {e}")
+            return {}
+
+        seen = set()
+        context = {}
+        for label, q, _ in groups:
+            snippets = []
+            for s in found.get(q, []):
+                if s not in seen:
+                    seen.add(s)
+                    snippets.append(s)
+            if snippets:
+                context[label] = snippets
+        return context
+
+
+_retriever = None
+_retriever_lock = threading.Lock()
+
+
+def get_retriever() -> Optional[Retriever]:
+    """Process-wide retriever (so the cache outlives each Orchestrator), or None if disabled."""
+    global _retriever
+    if not RAG_RETRIEVAL_ENABLED:
+        return None
+    if _retriever is None:
+        with _retriever_lock:
+            if _retriever is None:
+                _retriever = Retriever()
+    return _retriever
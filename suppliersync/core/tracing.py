@@ -0,0 +1,238 @@
+"""
+Lightweight span tracing for orchestration runs.
+
+``Orchestrator.step`` opens a ``RunTrace`` for its run_id; code anywhere
+below it (orchestrator stages, agent modules, governance) wraps work in
+``span(name)`` to record a monotonic-clock timing plus optional row and
+byte counts. The active trace lives in a context variable, so agents need
+no extra arguments, and ``span`` is a near-free no-op outside a run.
+
+Spans are persisted to the ``run_spans`` table once the run finishes and
+served by ``/api/runs/{run_id}/profile``. With MEMORY_PROFILE=1 they also
+carry per-stage allocation figures and the run's top allocation sites
+(``run_memory_sites``); see core/memory_profile.py. Only the most recent
+SPAN_RETENTION_RUNS runs are kept: each save drops the spans and memory
+sites of older runs (checked every tenth of that many saves per process,
+so the tables may briefly exceed it by about 10%).
+"""
+
+import os
+import time
+import sqlite3
+import itertools
+import contextvars
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+CREATE_SPANS_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS run_spans (
+        id INTEGER PRIMARY KEY, run_id TEXT NOT NULL, seq INTEGER NOT NULL, parent INTEGER,
+        name TEXT NOT NULL, path TEXT NOT NULL, start_ms REAL, duration_ms REAL,
+        rows INTEGER, bytes INTEGER, mem_net_bytes INTEGER, mem_peak_bytes INTEGER
+    )
+"""
+CREATE_SPANS_INDEX_SQL = "CREATE INDEX IF NOT EXISTS idx_run_spans_run_id ON run_spans(run_id, seq)"
+CREATE_MEMORY_SITES_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS run_memory_sites (
+        id INTEGER PRIMARY KEY, run_id TEXT NOT NULL, rank INTEGER NOT NULL, site TEXT NOT NULL,
+        stage TEXT, size_bytes INTEGER, count INTEGER
+    )
+"""
+CREATE_MEMORY_SITES_INDEX_SQL = "CREATE INDEX IF NOT EXISTS idx_run_memory_sites_run_id ON run_memory_sites(run_id, rank)"
+# Traced runs kept in run_spans / run_memory_sites (0: keep all)
+SPAN_RETENTION_RUNS = int(os.getenv("SPAN_RETENTION_RUNS", "1000"))
+SPAN_COLUMNS = ("seq", "parent", "name", "path", "start_ms", "duration_ms", "rows", "bytes", "mem_net_bytes",
+                "mem_peak_bytes")
+
+_saves = itertools.count(1)
+
+_current: contextvars.ContextVar[Optional["RunTrace"]] = contextvars.ContextVar("run_trace", default=None)
+
+
+class Span:
+    """One timed stage; set ``rows`` / ``bytes`` while it is open."""
+
+    __slots__ = SPAN_COLUMNS
+
+    def __init__(self, seq: int, parent: Optional[int], name: str, path: str, start_ms: float):
+        self.seq = seq
+        self.parent = parent
+        self.name = name
+        self.path = path
+        self.start_ms = start_ms
+        self.duration_ms: Optional[float] = None
+        self.rows: Optional[int] = None
+        self.bytes: Optional[int] = None
+        self.mem_net_bytes: Optional[int] = None
+        self.mem_peak_bytes: Optional[int] = None
+
+    def as_dict(self) -> dict:
+        return {column: getattr(self, column) for column in SPAN_COLUMNS}
+
+
+class _NoopSpan:
+    """Stand-in yielded when no run is being traced; attribute writes are discarded."""
+
+    __slots__ = ()
+
+    def __setattr__(self, name, value):
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+class RunTrace:
+    """Spans recorded for one orchestration run, in start order."""
+
+    def __init__(self, run_id: str):
+        self.run_id = run_id
+        self.spans: List[Span] = []
+        self._stack: List[Span] = []
+        self._t0 = time.perf_counter()
+        # Set by core.memory_profile.memory_profile while the run's allocations are traced
+        self.memory = None
+        self.memory_sites: List[dict] = []
+
+    @contextmanager
+    def span(self, name: str) -> Iterator[Span]:
+        parent = self._stack[-1] if self._stack else None
+        path = f"{parent.path}/{name}" if parent else name
+        started = time.perf_counter()
+        s = Span(len(self.spans), parent.seq if parent else None, name, path,
+                 round((started - self._t0) * 1000, 3))
+        self.spans.append(s)
+        self._stack.append(s)
+        memory = self.memory
+        if memory is not None:
+            memory.enter(s)
+        try:
+            yield s
+        finally:
+            s.duration_ms = round((time.perf_counter() - started) * 1000, 3)
+            if memory is not None:
+                memory.exit(s)
+            self._stack.pop()
+
+
+@contextmanager
+def trace_run(run_id: str) -> Iterator[RunTrace]:
+    """Make a new trace for ``run_id`` the active one for the enclosed code."""
+    trace = RunTrace(run_id)
+    token = _current.set(trace)
+    try:
+        yield trace
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def span(name: str):
+    """
+    Time the enclosed block as a child of the current span.
+
+    Example:
+        >>> with span("fetch_catalog") as s:
+        ...     catalog = fetch()
+        ...     s.rows = len(catalog)
+    """
+    trace = _current.get()
+    if trace is None:
+        yield _NOOP
+        return
+    with trace.span(name) as s:
+        yield s
+
+
+def ensure_spans_table(conn: sqlite3.Connection) -> None:
+    """Create the run_spans and run_memory_sites tables and indexes, adding columns missing from older run_spans."""
+    conn.execute(CREATE_SPANS_TABLE_SQL)
+    conn.execute(CREATE_SPANS_INDEX_SQL)
+    for column in ("mem_net_bytes", "mem_peak_bytes"):
+        try:
+            conn.execute(f"ALTER TABLE run_spans ADD COLUMN {column} INTEGER")
+        except sqlite3.OperationalError:
+            pass  # Column already exists
+    conn.execute(CREATE_MEMORY_SITES_TABLE_SQL)
+    conn.execute(CREATE_MEMORY_SITES_INDEX_SQL)
+
+
+def save_trace(conn: sqlite3.Connection, trace: RunTrace, keep_runs: int = SPAN_RETENTION_RUNS) -> None:
+    """
+    Persist all spans of a trace (and its memory sites, if profiled) in one transaction.
+
+    Every ``keep_runs // 10`` saves, spans and memory sites of runs older
+    than the ``keep_runs`` most recent are deleted in the same transaction
+    (0 keeps everything).
+    """
+    with conn:
+        conn.executemany(
+            f"INSERT INTO run_spans(run_id, {', '.join(SPAN_COLUMNS)}) VALUES (?{',?' * len(SPAN_COLUMNS)})",
+            [(trace.run_id, *(getattr(s, column) for column in SPAN_COLUMNS)) for s in trace.spans],
+        )
+        if trace.memory_sites:
+            conn.executemany(
+                "INSERT INTO run_memory_sites(run_id, rank, site, stage, size_bytes, count) VALUES (?,?,?,?,?,?)",
+                [(trace.run_id, m["rank"], m["site"], m["stage"], m["size_bytes"], m["count"])
+                 for m in trace.memory_sites],
+            )
+        # The cutoff scan reads every retained span, so it runs once per tenth of keep_runs saves
+        if keep_runs > 0 and next(_saves) % max(1, keep_runs // 10) == 0:
+            _prune(conn, keep_runs)
+
+
+def _prune(conn: sqlite3.Connection, keep_runs: int) -> None:
+    # Every run's first span has seq 0 and its spans are inserted in one transaction, so span ids
+    # order runs by save time
+    row = conn.execute("SELECT id FROM run_spans WHERE seq = 0 ORDER BY id DESC LIMIT 1 OFFSET ?",
+                       (keep_runs - 1,)).fetchone()
+    if row is not None and conn.execute("DELETE FROM run_spans WHERE id < ?", (row[0],)).rowcount:
+        conn.execute("DELETE FROM run_memory_sites WHERE run_id NOT IN (SELECT run_id FROM run_spans)")
+
+
+def load_profile(conn: sqlite3.Connection, run_id: str) -> Optional[dict]:
+    """
+    Spans of a run plus a per-stage rollup, hottest stage first.
+
+    Returns:
+        Dict with "run_id", "total_ms", "spans", "stages" and "memory_sites"
+        (empty unless the run was memory-profiled), or None if the run has
+        no recorded spans
+    """
+    try:
+        rows = conn.execute(
+            f"SELECT {', '.join(SPAN_COLUMNS)} FROM run_spans WHERE run_id=? ORDER BY seq", (run_id,)
+        ).fetchall()
+    except sqlite3.OperationalError:
+        return None  # No run has been traced yet (or run_spans predates the memory columns)
+    if not rows:
+        return None
+    spans = [dict(zip(SPAN_COLUMNS, row)) for row in rows]
+    try:
+        memory_sites = [dict(zip(("rank", "site", "stage", "size_bytes", "count"), row)) for row in conn.execute(
+            "SELECT rank, site, stage, size_bytes, count FROM run_memory_sites WHERE run_id=? ORDER BY rank",
+            (run_id,)
+        ).fetchall()]
+    except sqlite3.OperationalError:
+        memory_sites = []
+
+    stages: Dict[str, dict] = {}
+    for s in spans:
+        stage = stages.setdefault(s["path"], {"path": s["path"], "calls": 0, "total_ms": 0.0, "rows": 0, "bytes": 0,
+                                              "mem_net_bytes": None, "mem_peak_bytes": None})
+        stage["calls"] += 1
+        stage["total_ms"] = round(stage["total_ms"] + (s["duration_ms"] or 0.0), 3)
+        stage["rows"] += s["rows"] or 0
+        stage["bytes"] += s["bytes"] or 0
+        if s["mem_peak_bytes"] is not None:
+            # Net allocations add up across calls; the peak is the largest single call's
+            stage["mem_net_bytes"] = (stage["mem_net_bytes"] or 0) + s["mem_net_bytes"]
+            stage["mem_peak_bytes"] = max(stage["mem_peak_bytes"] or 0, s["mem_peak_bytes"])
+    total_ms = sum(s["duration_ms"] or 0.0 for s in spans if s["parent"] is None)
+    return {
+        "run_id": run_id,
+        "total_ms": round(total_ms, 3),
+        "spans": spans,
+        "stages": sorted(stages.values(), key=lambda st: st["total_ms"], reverse=True),
+        "memory_sites": memory_sites,
+    }
@@ -1,4 +1,5 @@
 
+from dataclasses import dataclass
 from pydantic import BaseModel, Field
 from typing import Optional, Literal, Union, List
 
@@ -23,6 +24,7 @@ class CXEvent(BaseModel):
     details: str
 
 
+# Agent item schemas; the orchestrator validates LLM output with the equivalent TypedDicts in core/records.py
 class SupplierUpdate(BaseModel):
     sku: str
     field: Literal["wholesale_price", "name", "category"]
@@ -42,7 +44,9 @@ class CXAction(BaseModel):
     details: str
 
 
-class AgentTelemetry(BaseModel):
+# Internal results of one agent call: plain slotted records, no validation on the hot path
+@dataclass(slots=True)
+class AgentTelemetry:
     agent: str
     step: str
     prompt: str
@@ -53,6 +57,7 @@ class AgentTelemetry(BaseModel):
     cost_usd: float
 
 
-class AgentResult(BaseModel):
+@dataclass(slots=True)
+class AgentResult:
     items: List[dict]
     telemetry: AgentTelemetry
@@ -0,0 +1,510 @@
+"""
+Vectorstore backends for the SupplierSync RAG stack.
+
+Both backends expose the same small, Chroma-collection-shaped interface
+(``count``, ``upsert``, ``delete``, ``get``, ``reset``, ``query``, ``save``), so the
+ingestion pipeline and the retriever do not care which one is in use:
+
+- ChromaBackend: a persistent ChromaDB collection (default).
+- NumpyIndex: an in-process index for small/medium corpora. Normalized
+  embeddings live in a ``.npy`` file that readers memory-map read-only (so
+  worker processes share the pages), with a JSON sidecar for ids, documents
+  and metadata. Queries are one batched matrix multiply plus
+  ``argpartition`` top-k. For larger corpora an IVF coarse quantizer
+  (spherical k-means) restricts each query to the closest lists.
+
+  Vectors can be stored quantized (RAG_INDEX_DTYPE=float16, or int8 with a
+  per-vector scale) to cut memory and disk roughly 2x/4x. Quantized search
+  picks ``n_results * RAG_RERANK_FACTOR`` candidates and rescores only those
+  against a memory-mapped float32 copy, so just the candidates' pages are
+  read; RAG_RERANK_FACTOR=0 skips the float32 copy entirely. Each save
+  measures recall@k of quantized search against exact float32 search.
+
+Select the backend with RAG_BACKEND=chroma|numpy. Chroma always stores
+float32. Both report cosine distances (1 - cosine similarity): Chroma
+collections are created in its "cosine" space rather than the default l2.
+"""
+
+import os
+import json
+import uuid
+import logging
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+# Distance space of new Chroma collections, matching NumpyIndex's cosine distances
+CHROMA_METADATA = {"hnsw:space": "cosine"}
+
+RAG_BACKEND = os.getenv("RAG_BACKEND", "chroma").lower()
+RAG_INDEX_DTYPE = os.getenv("RAG_INDEX_DTYPE", "float32")
+# IVF kicks in at this many vectors; nlist defaults to sqrt(n)
+RAG_IVF_MIN_VECTORS = int(os.getenv("RAG_IVF_MIN_VECTORS", "20000"))
+RAG_IVF_NPROBE = int(os.getenv("RAG_IVF_NPROBE", "8"))
+# Quantized indexes rescore n_results * factor candidates with exact float32 vectors (0 disables)
+RAG_RERANK_FACTOR = int(os.getenv("RAG_RERANK_FACTOR", "4"))
+# Synthetic queries used to measure recall@k when a quantized index is saved
+RAG_RECALL_SAMPLE = int(os.getenv("RAG_RECALL_SAMPLE", "200"))
+
+BACKENDS = ("chroma", "numpy")
+DTYPES = ("float32", "float16", "int8")
+RECALL_K = 10
+
+# Rows scored per block when assigning vectors to IVF lists
+_ASSIGN_BLOCK = 16384
+
+
+class VectorBackend(ABC):
+    """Interface shared by all vectorstore backends."""
+
+    @abstractmethod
+    def count(self) -> int:
+        """Number of stored vectors."""
+
+    @abstractmethod
+    def upsert(self, ids: List[str], embeddings: List[List[float]], documents: List[str],
+               metadatas: List[dict]) -> None:
+        """Insert vectors, replacing any already stored under the same ids."""
+
+    @abstractmethod
+    def delete(self, ids: List[str]) -> None:
+        """Remove the given ids."""
+
+    @abstractmethod
+    def get(self, ids: List[str]) -> Dict[str, list]:
+        """Stored "ids", "embeddings", "documents" and "metadatas" for the given ids (missing ids are skipped)."""
+
+    @abstractmethod
+    def reset(self) -> None:
+        """Drop all vectors."""
+
+    @abstractmethod
+    def query(self, query_embeddings: List[List[float]], n_results: int = 4,
+              include: Sequence[str] = ("documents", "metadatas", "distances")) -> Dict[str, list]:
+        """
+        Nearest neighbours for each query vector.
+
+        Returns:
+            Dict with "ids" plus the requested fields, each a list (one per
+            query) of lists (one per hit), as returned by ChromaDB
+        """
+
+    def save(self) -> None:
+        """Persist pending changes (no-op for backends that write through)."""
+
+
+class ChromaBackend(VectorBackend):
+    """A persistent ChromaDB collection."""
+
+    def __init__(self, persist: str, collection_name: str, create: bool = True):
+        import chromadb
+        self.persist = persist
+        self.collection_name = collection_name
+        self._client = chromadb.PersistentClient(path=persist)
+        if create:
+            self.collection = self._client.get_or_create_collection(collection_name, metadata=CHROMA_METADATA)
+        else:
+            self.collection = self._client.get_collection(collection_name)
+
+    def count(self) -> int:
+        return self.collection.count()
+
+    def upsert(self, ids, embeddings, documents, metadatas) -> None:
+        self.collection.upsert(ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas)
+
+    def delete(self, ids) -> None:
+        if ids:
+            self.collection.delete(ids=ids)
+
+    def get(self, ids):
+        if not ids:
+            return {"ids": [], "embeddings": [], "documents": [], "metadatas": []}
+        got = self.collection.get(ids=ids, include=["embeddings", "documents", "metadatas"])
+        return {"ids": got["ids"], "embeddings": [list(map(float, e)) for e in got["embeddings"]],
+                "documents": got["documents"], "metadatas": got["metadatas"]}
+
+    def reset(self) -> None:
+        try:
+            self._client.delete_collection(self.collection_name)
+        except Exception:
+            pass  # Collection did not exist yet
+        self.collection = self._client.get_or_create_collection(self.collection_name, metadata=CHROMA_METADATA)
+
+    def query(self, query_embeddings, n_results=4, include=("documents", "metadatas", "distances")):
+        return self.collection.query(query_embeddings=query_embeddings, n_results=n_results, include=list(include))
+
+
+def _normalize(x):
+    import numpy as np
+    norms = np.linalg.norm(x, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return x / norms
+
+
+def _spherical_kmeans(x, nlist: int, iters: int = 10, seed: int = 0):
+    """Cluster unit vectors by cosine similarity; returns (centroids, assignment)."""
+    import numpy as np
+    rng = np.random.default_rng(seed)
+    centroids = x[rng.choice(len(x), nlist, replace=False)].astype(np.float32)
+    assign = np.zeros(len(x), dtype=np.int64)
+    for _ in range(iters):
+        for start in range(0, len(x), _ASSIGN_BLOCK):
+            block = x[start:start + _ASSIGN_BLOCK].astype(np.float32)
+            assign[start:start + _ASSIGN_BLOCK] = np.argmax(block @ centroids.T, axis=1)
+        order = np.argsort(assign, kind="stable")
+        lists, starts = np.unique(assign[order], return_index=True)
+        sums = np.add.reduceat(x[order].astype(np.float32), starts, axis=0)
+        # Empty lists keep their previous centroid
+        centroids[lists] = _normalize(sums)
+    return centroids, assign
+
+
+def _quantize(x, dtype: str):
+    """Stored form of unit vectors: (values, per-vector scales or None)."""
+    import numpy as np
+    if dtype != "int8":
+        return x.astype(dtype), None
+    # Symmetric per-vector scale: each row's largest component maps to +-127
+    scales = np.abs(x).max(axis=1) / 127.0 if len(x) else np.zeros(0, dtype=np.float32)
+    scales[scales == 0] = 1.0
+    return np.rint(x / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+
+
+def _top(scores, k: int):
+    """Indices of the ``k`` largest scores, best first."""
+    import numpy as np
+    k = min(k, len(scores))
+    top = np.argpartition(-scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+    return top[np.argsort(-scores[top])]
+
+
+class NumpyIndex(VectorBackend):
+    """
+    Memory-mapped NumPy vector index.
+
+    On disk (under ``path``):
+        meta.json          ids, documents, metadatas, dtype and the current vectors file
+        vectors-<v>.npy    normalized embeddings, rows in ``meta["ids"]`` order
+        scales-<v>.npy     per-vector scales (int8 only)
+        full-<v>.npy       float32 copy used to rerank quantized candidates
+        ivf-<v>.npz        optional IVF centroids and per-list row offsets
+
+    ``save`` writes a new vectors/IVF file pair and then atomically replaces
+    ``meta.json``, so readers always see a consistent snapshot, and readers
+    that still have the old file mapped keep working.
+
+    After saving a quantized index, ``recall`` holds the recall@k report
+    for the new snapshot (None for float32).
+    """
+
+    META_FILE = "meta.json"
+
+    def __init__(self, path: str, dtype: str = RAG_INDEX_DTYPE, ivf_min_vectors: int = RAG_IVF_MIN_VECTORS,
+                 nprobe: int = RAG_IVF_NPROBE, rerank_factor: int = RAG_RERANK_FACTOR):
+        import numpy as np
+        if dtype not in DTYPES:
+            raise ValueError(f"Unsupported index dtype: {dtype}")
+        self.path = path
+        self.dtype = dtype
+        self.ivf_min_vectors = ivf_min_vectors
+        self.nprobe = nprobe
+        self.rerank_factor = rerank_factor
+        self.recall: Optional[dict] = None
+        self._ids: List[str] = []
+        self._documents: List[str] = []
+        self._metadatas: List[dict] = []
+        self._vectors = np.zeros((0, 0), dtype=np.float32)
+        self._scales = None
+        self._full = None
+        self._centroids = None
+        self._offsets = None
+        self._files: List[str] = []
+        # id -> (vector, document, metadata) while the index is being modified
+        self._pending: Optional[Dict[str, tuple]] = None
+        self._load()
+
+    def _load(self) -> None:
+        import numpy as np
+        try:
+            with open(os.path.join(self.path, self.META_FILE)) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return
+        self._ids, self._documents, self._metadatas = meta["ids"], meta["documents"], meta["metadatas"]
+        self._files = [meta[key] for key in ("vectors", "scales", "full", "ivf") if meta.get(key)]
+        self._vectors = np.load(os.path.join(self.path, meta["vectors"]), mmap_mode="r")
+        self._scales = np.load(os.path.join(self.path, meta["scales"]), mmap_mode="r") if meta.get("scales") else None
+        self._full = np.load(os.path.join(self.path, meta["full"]), mmap_mode="r") if meta.get("full") else None
+        if meta.get("ivf"):
+            with np.load(os.path.join(self.path, meta["ivf"])) as ivf:
+                self._centroids, self._offsets = ivf["centroids"], ivf["offsets"]
+
+    def _float32(self, rows=slice(None)):
+        """Stored vectors as float32: exact when a float32 copy exists, else dequantized."""
+        import numpy as np
+        if self._full is not None:
+            return np.asarray(self._full[rows], dtype=np.float32)
+        vectors = np.asarray(self._vectors[rows], dtype=np.float32)
+        if self._scales is not None:
+            vectors *= np.asarray(self._scales[rows], dtype=np.float32)[..., None]
+        return vectors
+
+    def _materialize(self) -> Dict[str, tuple]:
+        if self._pending is None:
+            vectors = self._float32()
+            self._pending = {i: (vectors[n], self._documents[n], self._metadatas[n]) for n, i in enumerate(self._ids)}
+        return self._pending
+
+    def count(self) -> int:
+        return len(self._pending) if self._pending is not None else len(self._ids)
+
+    def upsert(self, ids, embeddings, documents, metadatas) -> None:
+        import numpy as np
+        pending = self._materialize()
+        vectors = _normalize(np.asarray(embeddings, dtype=np.float32))
+        for i, vec, doc, meta in zip(ids, vectors, documents, metadatas):
+            pending[i] = (vec, doc, meta)
+
+    def delete(self, ids) -> None:
+        pending = self._materialize()
+        for i in ids:
+            pending.pop(i, None)
+
+    def get(self, ids):
+        import numpy as np
+        got = {"ids": [], "embeddings": [], "documents": [], "metadatas": []}
+        if self._pending is not None:
+            rows = {i: self._pending[i] for i in ids if i in self._pending}
+        else:
+            position = {i: n for n, i in enumerate(self._ids)}
+            rows = {i: (self._float32(position[i]), self._documents[position[i]], self._metadatas[position[i]])
+                    for i in ids if i in position}
+        for i, (vec, doc, meta) in rows.items():
+            got["ids"].append(i)
+            got["embeddings"].append(np.asarray(vec, dtype=np.float32).tolist())
+            got["documents"].append(doc)
+            got["metadatas"].append(meta)
+        return got
+
+    def reset(self) -> None:
+        self._pending = {}
+
+    def save(self) -> None:
+        import numpy as np
+        if self._pending is None:
+            if os.path.exists(os.path.join(self.path, self.META_FILE)):
+                return
+            self._pending = {}  # First save of an empty index
+        ids = list(self._pending)
+        dim = len(next(iter(self._pending.values()))[0]) if ids else 0
+        vectors = np.empty((len(ids), dim), dtype=np.float32)
+        for n, i in enumerate(ids):
+            vectors[n] = self._pending[i][0]
+
+        centroids = offsets = None
+        if len(ids) >= self.ivf_min_vectors:
+            nlist = max(1, int(np.sqrt(len(ids))))
+            centroids, assign = _spherical_kmeans(vectors, nlist)
+            # Store rows grouped by list so each list is one contiguous slice
+            order = np.argsort(assign, kind="stable")
+            vectors, ids = vectors[order], [ids[n] for n in order]
+            offsets = np.searchsorted(assign[order], np.arange(nlist + 1))
+
+        os.makedirs(self.path, exist_ok=True)
+        version = uuid.uuid4().hex[:12]
+        values, scales = _quantize(vectors, self.dtype)
+        vectors_file = f"vectors-{version}.npy"
+        np.save(os.path.join(self.path, vectors_file), values)
+        scales_file = full_file = ivf_file = None
+        if scales is not None:
+            scales_file = f"scales-{version}.npy"
+            np.save(os.path.join(self.path, scales_file), scales)
+        if self.dtype != "float32" and self.rerank_factor > 0:
+            full_file = f"full-{version}.npy"
+            np.save(os.path.join(self.path, full_file), vectors)
+        if centroids is not None:
+            ivf_file = f"ivf-{version}.npz"
+            np.savez(os.path.join(self.path, ivf_file), centroids=centroids, offsets=offsets)
+        meta = {"dtype": self.dtype, "dim": dim, "vectors": vectors_file, "scales": scales_file, "full": full_file,
+                "ivf": ivf_file, "ids": ids, "documents": [self._pending[i][1] for i in ids],
+                "metadatas": [self._pending[i][2] for i in ids]}
+        target = os.path.join(self.path, self.META_FILE)
+        tmp = f"{target}.tmp.{os.getpid()}"
+        with open(tmp, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp, target)
+
+        # Mapped readers keep their open files; remove them from the directory
+        for name in self._files:
+            try:
+                os.unlink(os.path.join(self.path, name))
+            except OSError:
+                pass
+        self._pending = None
+        self._load()
+        self.recall = self._measure_recall(vectors) if self.dtype != "float32" and ids else None
+
+    def _measure_recall(self, vectors, k: int = RECALL_K, sample: int = RAG_RECALL_SAMPLE) -> dict:
+        """
+        Recall@k of this snapshot's search against exact float32 search.
+
+        Queries are synthetic: normalized sums of random pairs of stored
+        vectors, so they land between chunks rather than on one.
+        """
+        import numpy as np
+        rng = np.random.default_rng(0)
+        pairs = rng.integers(0, len(vectors), size=(min(sample, len(vectors)), 2))
+        queries = _normalize(vectors[pairs[:, 0]] + vectors[pairs[:, 1]])
+        # Small query batches bound the (batch, n) score matrices
+        batches = [queries[start:start + 16] for start in range(0, len(queries), 16)]
+        exact = [set(_top(s, k).tolist()) for batch in batches for s in batch @ vectors.T]
+
+        def recall(rerank: bool) -> float:
+            found = [hit for batch in batches for hit in self._search(batch, k, rerank)]
+            return round(float(np.mean([len(exact[n] & set(rows.tolist())) / len(exact[n])
+                                        for n, (rows, _) in enumerate(found)])), 4)
+
+        n, dim = vectors.shape
+        return {
+            "dtype": self.dtype,
+            "k": k,
+            "queries": len(queries),
+            "recall_quantized": recall(False),
+            "recall_reranked": recall(True) if self._full is not None else None,
+            "index_bytes": int(self._vectors.nbytes + (self._scales.nbytes if self._scales is not None else 0)),
+            "float32_bytes": n * dim * 4,
+        }
+
+    def _candidates(self, q):
+        """Row ranges to score for one query (all rows without IVF)."""
+        import numpy as np
+        if self._centroids is None:
+            return None
+        nprobe = min(self.nprobe, len(self._centroids))
+        lists = np.argpartition(-(self._centroids @ q), nprobe - 1)[:nprobe]
+        return np.concatenate([np.arange(self._offsets[l], self._offsets[l + 1]) for l in lists])
+
+    def _scan(self, queries):
+        """Scores of every stored row against each query, shape (m, n)."""
+        import numpy as np
+        n = len(self._ids)
+        scores = np.empty((len(queries), n), dtype=np.float32)
+        # Blocked, so quantized rows are widened to float32 a slice at a time
+        for start in range(0, n, _ASSIGN_BLOCK):
+            stop = min(start + _ASSIGN_BLOCK, n)
+            block = np.asarray(self._vectors[start:stop], dtype=np.float32) @ queries.T
+            if self._scales is not None:
+                block *= np.asarray(self._scales[start:stop], dtype=np.float32)[:, None]
+            scores[:, start:stop] = block.T
+        return scores
+
+    def _search(self, queries, n_results: int, rerank: bool = True) -> list:
+        """Top rows per normalized query as (row indices, scores), best first."""
+        import numpy as np
+        rerank = rerank and self._full is not None and self.rerank_factor > 0
+        shortlist = n_results * self.rerank_factor if rerank else n_results
+        if self._centroids is None:
+            # One batched matrix multiply for all queries: (n, d) @ (d, m)
+            rows = [np.arange(len(self._ids))] * len(queries)
+            scores = self._scan(queries)
+        else:
+            rows = [self._candidates(q) for q in queries]
+            scores = []
+            for r, q in zip(rows, queries):
+                s = np.asarray(self._vectors[r], dtype=np.float32) @ q
+                if self._scales is not None:
+                    s *= np.asarray(self._scales[r], dtype=np.float32)
+                scores.append(s)
+
+        found = []
+        for row_ids, s, q in zip(rows, scores, queries):
+            top = _top(s, shortlist)
+            hits, hit_scores = row_ids[top], s[top]
+            if rerank:
+                # Exact float32 scores for the shortlist only; sorted rows keep mmap reads sequential
+                hits = np.sort(hits)
+                hit_scores = np.asarray(self._full[hits], dtype=np.float32) @ q
+                best = _top(hit_scores, n_results)
+                hits, hit_scores = hits[best], hit_scores[best]
+            found.append((hits, hit_scores))
+        return found
+
+    def query(self, query_embeddings, n_results=4, include=("documents", "metadatas", "distances")):
+        import numpy as np
+        if self._pending is not None:
+            raise RuntimeError("NumpyIndex has unsaved changes; call save() before querying")
+        result = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        if len(self._ids) == 0:
+            for _ in query_embeddings:
+                for key in result:
+                    result[key].append([])
+            return {k: v for k, v in result.items() if k == "ids" or k in include}
+
+        queries = _normalize(np.asarray(query_embeddings, dtype=np.float32))
+        for hits, scores in self._search(queries, n_results):
+            hits = [int(h) for h in hits]
+            result["ids"].append([self._ids[h] for h in hits])
+            result["documents"].append([self._documents[h] for h in hits])
+            result["metadatas"].append([self._metadatas[h] for h in hits])
+            # Cosine distance, as ChromaBackend reports it (CHROMA_METADATA)
+            result["distances"].append([float(1.0 - s) for s in scores])
+        return {k: v for k, v in result.items() if k == "ids" or k in include}
+
+
+def _numpy_path(persist: str, collection_name: str) -> str:
+    return os.path.join(persist, f"numpy-{collection_name}")
+
+
+def list_collections(persist: str, backend: str = RAG_BACKEND) -> List[str]:
+    """Names of all collections stored under ``persist`` for a backend."""
+    if backend == "chroma":
+        import chromadb
+        if not os.path.isdir(persist):
+            return []
+        return [getattr(c, "name", c) for c in chromadb.PersistentClient(path=persist).list_collections()]
+    if backend == "numpy":
+        try:
+            names = os.listdir(persist)
+        except OSError:
+            return []
+        return [n[len("numpy-"):] for n in names if n.startswith("numpy-") and os.path.isdir(os.path.join(persist, n))]
+    raise ValueError(f"Unknown RAG backend: {backend}")
+
+
+def drop_collection(persist: str, collection_name: str, backend: str = RAG_BACKEND) -> None:
+    """Delete a collection and its storage (missing collections are ignored)."""
+    if backend == "chroma":
+        import chromadb
+        try:
+            chromadb.PersistentClient(path=persist).delete_collection(collection_name)
+        except Exception:
+            pass  # Already gone
+    elif backend == "numpy":
+        import shutil
+        shutil.rmtree(_numpy_path(persist, collection_name), ignore_errors=True)
+    else:
+        raise ValueError(f"Unknown RAG backend: {backend}")
+
+
+def open_backend(persist: str, collection_name: str, backend: str = RAG_BACKEND, create: bool = True) -> VectorBackend:
+    """
+    Open the configured vectorstore backend.
+
+    Args:
+        persist: Vectorstore persistence directory
+        collection_name: Collection (index) name
+        backend: "chroma" or "numpy"
+        create: Create the collection if missing (read-only callers pass False
+            and get an exception for a missing Chroma collection)
+    """
+    if backend == "chroma":
+        if RAG_INDEX_DTYPE != "float32":
+            logger.warning(f"RAG_INDEX_DTYPE={RAG_INDEX_DTYPE} only applies to the numpy backend; Chroma stores float32")
+        return ChromaBackend(persist, collection_name, create=create)
+    if backend == "numpy":
+        path = _numpy_path(persist, collection_name)
+        if not create and not os.path.exists(os.path.join(path, NumpyIndex.META_FILE)):
+            raise ValueError(f"Collection does not exist: {collection_name}")
+        return NumpyIndex(path)
+    raise ValueError(f"Unknown RAG backend: {backend}")
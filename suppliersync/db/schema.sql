@@ -24,6 +24,15 @@ CREATE TABLE IF NOT EXISTS supplier_updates (
   id INTEGER PRIMARY KEY, sku TEXT, field TEXT, old_value TEXT, new_value TEXT, run_id TEXT,
   created_at DATETIME DEFAULT CURRENT_TIMESTAMP
 );
+-- Content hash per SKU for supplier feed reconciliation (core/feed_diff.py)
+CREATE TABLE IF NOT EXISTS product_hashes (
+  sku TEXT PRIMARY KEY, row_hash TEXT NOT NULL
+) WITHOUT ROWID;
+-- Catalog version for memory-mapped catalog snapshots (core/catalog_snapshot.py)
+CREATE TABLE IF NOT EXISTS catalog_epoch (
+  id INTEGER PRIMARY KEY CHECK (id = 1), token TEXT NOT NULL, epoch INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO catalog_epoch(id, token, epoch) VALUES (1, lower(hex(randomblob(8))), 0);
 CREATE TABLE IF NOT EXISTS cx_events (
   id INTEGER PRIMARY KEY, sku TEXT, event_type TEXT, details TEXT, run_id TEXT,
   created_at DATETIME DEFAULT CURRENT_TIMESTAMP
@@ -37,6 +46,19 @@ CREATE TABLE IF NOT EXISTS agent_logs (
   latency_ms INTEGER, cost_usd REAL,
   created_at DATETIME DEFAULT CURRENT_TIMESTAMP
 );
+-- Per-stage timings of each orchestration run (core/tracing.py)
+CREATE TABLE IF NOT EXISTS run_spans (
+  id INTEGER PRIMARY KEY, run_id TEXT NOT NULL, seq INTEGER NOT NULL, parent INTEGER,
+  name TEXT NOT NULL, path TEXT NOT NULL, start_ms REAL, duration_ms REAL,
+  rows INTEGER, bytes INTEGER, mem_net_bytes INTEGER, mem_peak_bytes INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_run_spans_run_id ON run_spans(run_id, seq);
+-- Top allocation sites of memory-profiled runs (MEMORY_PROFILE=1, core/memory_profile.py)
+CREATE TABLE IF NOT EXISTS run_memory_sites (
+  id INTEGER PRIMARY KEY, run_id TEXT NOT NULL, rank INTEGER NOT NULL, site TEXT NOT NULL,
+  stage TEXT, size_bytes INTEGER, count INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_run_memory_sites_run_id ON run_memory_sites(run_id, rank);
 CREATE TABLE IF NOT EXISTS eval_metrics (
   id INTEGER PRIMARY KEY,
   run_id TEXT, metric TEXT, value REAL,
@@ -0,0 +1,287 @@
+"""
+Generate reproducible, production-scale SupplierSync datasets for benchmarking.
+Run with: python generate_fixtures.py --skus 1000000 --suppliers 5000 --years 3 [--seed 42]
+Or use from tests via the ``scale_db`` fixture in tests/conftest.py.
+
+All random draws are vectorized with NumPy and written with executemany() in
+chunked transactions, so 10M-SKU catalogs never need to fit in memory as
+Python objects. The same seed and parameters always produce the same data.
+"""
+
+import os
+import time
+import sqlite3
+import argparse
+from typing import Dict
+
+import numpy as np
+
+from core.catalog_snapshot import bump_catalog_epoch
+from generate_price_events import PRICE_REASONS
+from migrate_db import SCHEMA_SQL
+
+DB_PATH = os.getenv("SQLITE_PATH", "suppliersync.db")
+# Bumped when the generated values change format, so cached benchmark datasets are regenerated
+DATA_FORMAT = 2
+
+CATEGORIES = np.array(["Couches", "Dining", "Bedroom", "Office", "Living", "Kitchen", "Seating", "Storage", "Outdoor"])
+REJECT_REASONS = np.array([
+    "retail_below_wholesale",
+    "margin_below_minimum",
+    "daily_drift_exceeded",
+    "category_blocked",
+    "below_map_price",
+])
+CX_EVENT_TYPES = np.array(["return", "incident", "question", "agent_action"])
+AGENT_STEPS = (("supplier", "propose_updates"), ("buyer", "propose_price_changes"), ("cx", "propose_actions"))
+
+# Indexes created after the bulk load (same set the Orchestrator maintains)
+INDEXES = (
+    "CREATE INDEX IF NOT EXISTS idx_products_sku ON products(sku)",
+    "CREATE INDEX IF NOT EXISTS idx_products_active ON products(is_active)",
+    "CREATE INDEX IF NOT EXISTS idx_price_events_sku_created ON price_events(sku, created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_rejected_prices_sku_created ON rejected_prices(sku, created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_cx_events_sku_created ON cx_events(sku, created_at)",
+)
+TABLES = ("agent_logs", "cx_events", "rejected_prices", "supplier_updates", "price_events",
+          "product_hashes", "products", "suppliers")
+
+DEFAULT_CHUNK_SIZE = 100_000
+
+
+def sku_strings(idx: np.ndarray) -> np.ndarray:
+    """Vectorized SKU formatting: 42 -> 'SKU-00000042'."""
+    return np.char.add("SKU-", np.char.zfill(idx.astype(str), 8))
+
+
+def run_id_strings(idx: np.ndarray) -> np.ndarray:
+    """Vectorized run ID formatting: 7 -> 'run-00000007'."""
+    return np.char.add("run-", np.char.zfill(idx.astype(str), 8))
+
+
+def _timestamps(start: np.datetime64, offsets_s: np.ndarray) -> np.ndarray:
+    """``YYYY-MM-DD HH:MM:SS`` timestamps (as CURRENT_TIMESTAMP writes them) for second offsets from ``start``."""
+    text = np.datetime_as_string(start + offsets_s.astype("timedelta64[s]"), unit="s")
+    # Replace the ISO "T" separator in place, on the UCS-4 code points
+    text.view(np.uint32).reshape(-1, text.itemsize // 4)[:, 10] = ord(" ")
+    return text
+
+
+def _chunk_bounds(total: int, chunk_size: int):
+    for lo in range(0, total, chunk_size):
+        yield lo, min(lo + chunk_size, total)
+
+
+def _insert_suppliers(conn, rng, n_suppliers: int) -> None:
+    ids = np.arange(1, n_suppliers + 1)
+    names = np.char.add("Supplier ", np.char.zfill(ids.astype(str), 5))
+    sla = rng.integers(1, 8, n_suppliers)
+    with conn:
+        conn.executemany("INSERT INTO suppliers(id, name, sla_days) VALUES (?,?,?)",
+                         zip(ids.tolist(), names.tolist(), sla.tolist()))
+
+
+def _insert_products(conn, rng, n_skus: int, n_suppliers: int, active_ratio: float, chunk_size: int) -> None:
+    for lo, hi in _chunk_bounds(n_skus, chunk_size):
+        n = hi - lo
+        idx = np.arange(lo, hi)
+        cat = CATEGORIES[rng.integers(0, len(CATEGORIES), n)]
+        names = np.char.add(np.char.add(cat, " Item "), idx.astype(str))
+        wholesale = np.round(np.clip(rng.lognormal(5.0, 0.8, n), 5.0, 5000.0), 2)
+        retail = np.round(wholesale * rng.uniform(1.3, 2.2, n), 2)
+        supplier = rng.integers(1, n_suppliers + 1, n)
+        active = (rng.random(n) < active_ratio).astype(np.int64)
+        with conn:
+            conn.executemany(
+                "INSERT INTO products(sku, name, category, wholesale_price, retail_price, supplier_id, is_active) "
+                "VALUES (?,?,?,?,?,?,?)",
+                zip(sku_strings(idx).tolist(), names.tolist(), cat.tolist(), wholesale.tolist(),
+                    retail.tolist(), supplier.tolist(), active.tolist()),
+            )
+
+
+def _event_chunks(rng, total: int, n_skus: int, n_runs: int, span_s: int, chunk_size: int):
+    """
+    Yield (n, skus, run_ids, offsets_s) for time-ordered event chunks.
+
+    Each chunk covers its proportional slice of the time span, so ids
+    increase with created_at just like in production.
+    """
+    for lo, hi in _chunk_bounds(total, chunk_size):
+        n = hi - lo
+        t_lo, t_hi = span_s * lo / total, span_s * hi / total
+        offsets = np.sort(rng.uniform(t_lo, t_hi, n)).astype(np.int64)
+        run_idx = np.minimum(offsets * n_runs // max(span_s, 1), n_runs - 1)
+        skus = sku_strings(rng.integers(0, n_skus, n))
+        yield n, skus, run_id_strings(run_idx), offsets
+
+
+def generate_dataset(
+    db_path: str,
+    skus: int = 100_000,
+    suppliers: int = 1_000,
+    years: float = 1.0,
+    price_events: int = 500_000,
+    rejected_prices: int = 100_000,
+    cx_events: int = 200_000,
+    runs: int = 10_000,
+    active_ratio: float = 0.95,
+    seed: int = 42,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    reset: bool = False,
+) -> Dict:
+    """
+    Generate a synthetic dataset at the requested scale.
+
+    Args:
+        db_path: Path to SQLite database file (created if missing)
+        skus: Number of products
+        suppliers: Number of suppliers
+        years: Length of the event history (ending at a fixed date, 2024-01-01)
+        price_events: Number of approved price events
+        rejected_prices: Number of rejected price proposals
+        cx_events: Number of CX events
+        runs: Number of orchestration runs (3 agent_logs rows each)
+        active_ratio: Fraction of products marked active
+        seed: Random seed; identical parameters and seed give identical data
+        chunk_size: Rows per executemany() batch / transaction
+        reset: Delete existing data first (otherwise the database must be empty)
+
+    Returns:
+        Dict with per-table row counts, elapsed_s and rows_per_sec
+
+    Raises:
+        ValueError: If the database already contains products and reset is False
+    """
+    t0 = time.perf_counter()
+    rng = np.random.default_rng(seed)
+    runs = max(1, runs)
+    span_s = int(years * 365 * 86400)
+    # Fixed reference date keeps the data reproducible across days
+    start = np.datetime64("2024-01-01T00:00:00") - np.timedelta64(span_s, "s")
+
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode=WAL;")
+    conn.execute("PRAGMA synchronous=OFF;")
+    conn.executescript(SCHEMA_SQL)
+    if reset:
+        with conn:
+            for table in TABLES:
+                conn.execute(f"DELETE FROM {table}")
+            # Reinserted rows reuse the event ids of the catalog version: the epoch must move
+            bump_catalog_epoch(conn)
+    elif conn.execute("SELECT EXISTS(SELECT 1 FROM products)").fetchone()[0]:
+        conn.close()
+        raise ValueError(f"Database {db_path} already contains products (use reset=True)")
+
+    _insert_suppliers(conn, rng, suppliers)
+    _insert_products(conn, rng, skus, suppliers, active_ratio, chunk_size)
+
+    for n, sku, run_id, offsets in _event_chunks(rng, price_events, skus, runs, span_s, chunk_size):
+        prev = np.round(np.clip(rng.lognormal(5.5, 0.8, n), 5.0, 10000.0), 2)
+        new = np.round(prev * (1 + rng.uniform(-0.15, 0.10, n)), 2)
+        reason = np.array(PRICE_REASONS)[rng.integers(0, len(PRICE_REASONS), n)]
+        with conn:
+            conn.executemany(
+                "INSERT INTO price_events(sku, prev_price, new_price, reason, run_id, created_at) VALUES (?,?,?,?,?,?)",
+                zip(sku.tolist(), prev.tolist(), new.tolist(), reason.tolist(), run_id.tolist(),
+                    _timestamps(start, offsets).tolist()),
+            )
+
+    for n, sku, run_id, offsets in _event_chunks(rng, rejected_prices, skus, runs, span_s, chunk_size):
+        current = np.round(np.clip(rng.lognormal(5.5, 0.8, n), 5.0, 10000.0), 2)
+        proposed = np.round(current * rng.uniform(0.3, 1.6, n), 2)
+        reason = REJECT_REASONS[rng.integers(0, len(REJECT_REASONS), n)]
+        with conn:
+            conn.executemany(
+                "INSERT INTO rejected_prices(sku, proposed_price, current_price, reject_reason, reject_details, run_id, created_at) "
+                "VALUES (?,?,?,?,?,?,?)",
+                zip(sku.tolist(), proposed.tolist(), current.tolist(), reason.tolist(), reason.tolist(),
+                    run_id.tolist(), _timestamps(start, offsets).tolist()),
+            )
+
+    for n, sku, run_id, offsets in _event_chunks(rng, cx_events, skus, runs, span_s, chunk_size):
+        event_type = CX_EVENT_TYPES[rng.integers(0, len(CX_EVENT_TYPES), n)]
+        details = np.char.add("synthetic ", event_type)
+        with conn:
+            conn.executemany(
+                "INSERT INTO cx_events(sku, event_type, details, run_id, created_at) VALUES (?,?,?,?,?)",
+                zip(sku.tolist(), event_type.tolist(), details.tolist(), run_id.tolist(),
+                    _timestamps(start, offsets).tolist()),
+            )
+
+    # agent_logs: one row per agent per run, runs evenly spread over the span
+    for lo, hi in _chunk_bounds(runs, max(1, chunk_size // len(AGENT_STEPS))):
+        run_idx = np.arange(lo, hi)
+        offsets = run_idx * span_s // runs
+        for agent, step in AGENT_STEPS:
+            n = hi - lo
+            tokens_in = rng.lognormal(7.0, 0.5, n).astype(np.int64)
+            tokens_out = rng.lognormal(5.0, 0.5, n).astype(np.int64)
+            latency = rng.lognormal(7.5, 0.6, n).astype(np.int64)
+            cost = tokens_in / 1000.0 * 0.005 + tokens_out / 1000.0 * 0.015
+            with conn:
+                conn.executemany(
+                    "INSERT INTO agent_logs(agent, step, prompt, response, tokens_in, tokens_out, latency_ms, cost_usd, run_id, created_at) "
+                    "VALUES (?,?,?,?,?,?,?,?,?,?)",
+                    zip([agent] * n, [step] * n, ["synthetic prompt"] * n, ["{}"] * n,
+                        tokens_in.tolist(), tokens_out.tolist(), latency.tolist(), cost.tolist(),
+                        run_id_strings(run_idx).tolist(), _timestamps(start, offsets).tolist()),
+                )
+
+    for statement in INDEXES:
+        conn.execute(statement)
+    # Readers between the chunked transactions may have cached a partial catalog
+    bump_catalog_epoch(conn)
+    conn.commit()
+    conn.close()
+
+    counts = {
+        "suppliers": suppliers,
+        "products": skus,
+        "price_events": price_events,
+        "rejected_prices": rejected_prices,
+        "cx_events": cx_events,
+        "agent_logs": runs * len(AGENT_STEPS),
+    }
+    elapsed = time.perf_counter() - t0
+    total_rows = sum(counts.values())
+    return {
+        **counts,
+        "elapsed_s": round(elapsed, 3),
+        "rows_per_sec": round(total_rows / elapsed, 1) if elapsed > 0 else 0.0,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a reproducible production-scale dataset")
+    parser.add_argument("--db", default=DB_PATH, help=f"Target database (default: {DB_PATH})")
+    parser.add_argument("--skus", type=int, default=100_000, help="Number of products (default: 100000)")
+    parser.add_argument("--suppliers", type=int, default=1_000, help="Number of suppliers (default: 1000)")
+    parser.add_argument("--years", type=float, default=1.0, help="Years of event history (default: 1)")
+    parser.add_argument("--price-events", type=int, default=500_000, help="Approved price events (default: 500000)")
+    parser.add_argument("--rejected-prices", type=int, default=100_000, help="Rejected prices (default: 100000)")
+    parser.add_argument("--cx-events", type=int, default=200_000, help="CX events (default: 200000)")
+    parser.add_argument("--runs", type=int, default=10_000, help="Orchestration runs in agent_logs (default: 10000)")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed (default: 42)")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="Rows per transaction")
+    parser.add_argument("--reset", action="store_true", help="Delete existing data before generating")
+    args = parser.parse_args()
+
+    print(f"Generating dataset in {args.db} (seed={args.seed})...")
+    stats = generate_dataset(
+        args.db,
+        skus=args.skus,
+        suppliers=args.suppliers,
+        years=args.years,
+        price_events=args.price_events,
+        rejected_prices=args.rejected_prices,
+        cx_events=args.cx_events,
+        runs=args.runs,
+        seed=args.seed,
+        chunk_size=args.chunk_size,
+        reset=args.reset,
+    )
+    for table in ("suppliers", "products", "price_events", "rejected_prices", "cx_events", "agent_logs"):
+        print(f"  {table:<16} {stats[table]:>12,}")
+    print(f"\n✅ Generated in {stats['elapsed_s']}s ({stats['rows_per_sec']} rows/s)")
@@ -11,6 +11,8 @@ from datetime import datetime, timedelta
 import random
 import argparse
 
+from core.feed_diff import invalidate_row_hashes
+
 DB_PATH = os.getenv("SQLITE_PATH", "suppliersync.db")
 
 # Realistic price change reasons
@@ -52,6 +54,7 @@ def generate_price_events(count: int = 10):
     print(f"Found {len(products)} active products")
     
     events_created = 0
+    touched_skus = set()
     base_time = datetime.now()
     
     for i in range(count):
@@ -96,8 +99,11 @@ def generate_price_events(count: int = 10):
         )
         
         events_created += 1
+        touched_skus.add(sku)
         print(f"  ✓ Created event {i+1}/{count}: {sku} ${current_price:.2f} → ${new_price:.2f} ({reason})")
     
+    # Retail prices changed outside of feed reconciliation
+    invalidate_row_hashes(conn, touched_skus)
     conn.commit()
     conn.close()
     
@@ -0,0 +1,59 @@
+"""
+Bulk-load a supplier catalog feed (CSV or JSONL) into the products table.
+Run with: python load_catalog.py path/to/feed.csv [--chunk-size N] [--deactivate-missing] [--full]
+Or use via API: POST /api/catalog/load?path=feed.csv
+"""
+
+import os
+import argparse
+
+from core.catalog_loader import load_catalog, DEFAULT_CHUNK_SIZE
+
+DB_PATH = os.getenv("SQLITE_PATH", "suppliersync.db")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stream a catalog feed into the products table")
+    parser.add_argument("path", help="Path to a .csv, .jsonl or .ndjson feed")
+    parser.add_argument(
+        "--format",
+        choices=["csv", "jsonl"],
+        default=None,
+        help="Feed format (default: detected from the file extension)"
+    )
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=DEFAULT_CHUNK_SIZE,
+        help=f"Rows per batch/transaction (default: {DEFAULT_CHUNK_SIZE})"
+    )
+    parser.add_argument(
+        "--deactivate-missing",
+        action="store_true",
+        help="Deactivate active products whose SKU is not in the feed"
+    )
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="Rewrite every row instead of only rows whose content hash changed"
+    )
+    args = parser.parse_args()
+
+    print(f"Loading catalog feed {args.path} into {DB_PATH}...")
+    stats = load_catalog(
+        args.path,
+        DB_PATH,
+        fmt=args.format,
+        chunk_size=args.chunk_size,
+        deactivate_missing=args.deactivate_missing,
+        reconcile=not args.full,
+    )
+    print(f"  Rows read:     {stats['rows_read']}")
+    print(f"  Rows loaded:   {stats['rows_loaded']}")
+    print(f"  Rows skipped:  {stats['rows_skipped']}")
+    if "run_id" in stats:
+        print(f"  Inserted:      {stats['rows_inserted']}")
+        print(f"  Updated:       {stats['rows_updated']} ({stats['fields_changed']} fields changed)")
+        print(f"  Unchanged:     {stats['rows_unchanged']}")
+    print(f"  Deactivated:   {stats['deactivated']}")
+    print(f"\n✅ Loaded in {stats['elapsed_s']}s ({stats['rows_per_sec']} rows/s)")
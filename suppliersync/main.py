@@ -1,6 +1,7 @@
 
-import os, sqlite3, pandas as pd
+import os, csv, sqlite3
 from agents.orchestrator import Orchestrator
+from core.catalog_loader import iter_feed_records, load_records
 
 DB_PATH = os.getenv("SQLITE_PATH", "suppliersync.db")
 
@@ -18,16 +19,12 @@ def init_db():
     conn.executescript(SCHEMA)
     if need_seed:
         # Seed suppliers
-        df_sup = pd.read_csv(SEED_SUPPLIERS)
-        for _, r in df_sup.iterrows():
-            conn.execute("INSERT INTO suppliers(id, name, sla_days) VALUES (?,?,?)",
-                         (int(r.id), r.name, int(r.sla_days)))
-        # Seed products
-        df = pd.read_csv(SEED_PRODUCTS)
-        for _, r in df.iterrows():
-            conn.execute("INSERT INTO products(sku, name, category, wholesale_price, retail_price, supplier_id) VALUES (?,?,?,?,?,?)",
-                         (r.sku, r.name, r.category, float(r.wholesale_price), float(r.retail_price), int(r.supplier_id)))
+        with open(SEED_SUPPLIERS, newline="") as f:
+            conn.executemany("INSERT INTO suppliers(id, name, sla_days) VALUES (?,?,?)",
+                             ((int(r["id"]), r["name"], int(r["sla_days"])) for r in csv.DictReader(f)))
         conn.commit()
+        # Seed products (streamed in chunked transactions)
+        load_records(conn, iter_feed_records(SEED_PRODUCTS))
     conn.close()
 
 def run_once():
@@ -6,6 +6,8 @@ Run with: python populate_inventory.py
 import os
 import sqlite3
 
+from core.catalog_loader import load_records
+
 DB_PATH = os.getenv("SQLITE_PATH", "suppliersync.db")
 
 # Wayfair-style products with realistic pricing
@@ -207,48 +209,13 @@ def populate_database():
             )
             print(f"  Added supplier: {supplier['name']}")
     
-    # Update or insert products
-    for product in PRODUCTS:
-        cursor = conn.execute("SELECT sku FROM products WHERE sku = ?", (product["sku"],))
-        if cursor.fetchone():
-            conn.execute(
-                """UPDATE products 
-                   SET name = ?, category = ?, wholesale_price = ?, retail_price = ?, supplier_id = ?, is_active = 1
-                   WHERE sku = ?""",
-                (
-                    product["name"],
-                    product["category"],
-                    product["wholesale_price"],
-                    product["retail_price"],
-                    product["supplier_id"],
-                    product["sku"],
-                )
-            )
-            print(f"  Updated product: {product['sku']} - {product['name'][:50]}...")
-        else:
-            conn.execute(
-                """INSERT INTO products(sku, name, category, wholesale_price, retail_price, supplier_id, is_active)
-                   VALUES (?, ?, ?, ?, ?, ?, 1)""",
-                (
-                    product["sku"],
-                    product["name"],
-                    product["category"],
-                    product["wholesale_price"],
-                    product["retail_price"],
-                    product["supplier_id"],
-                )
-            )
-            print(f"  Added product: {product['sku']} - {product['name'][:50]}...")
+    conn.commit()
     
-    # Deactivate any products not in the new inventory list
-    valid_skus = {p["sku"] for p in PRODUCTS}
-    cursor = conn.execute("SELECT sku FROM products WHERE is_active = 1")
-    all_skus = {row["sku"] for row in cursor.fetchall()}
-    deactivated = all_skus - valid_skus
-    if deactivated:
-        placeholders = ",".join(["?"] * len(deactivated))
-        conn.execute(f"UPDATE products SET is_active = 0 WHERE sku IN ({placeholders})", list(deactivated))
-        print(f"\n  Deactivated {len(deactivated)} old products not in new inventory")
+    # Upsert products in one batch and deactivate any products not in the new inventory list
+    stats = load_records(conn, PRODUCTS, deactivate_missing=True)
+    print(f"  Upserted {stats['rows_loaded']} products")
+    if stats["deactivated"]:
+        print(f"\n  Deactivated {stats['deactivated']} old products not in new inventory")
     
     conn.commit()
     conn.close()
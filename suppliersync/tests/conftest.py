@@ -6,7 +6,36 @@ This file ensures the suppliersync modules can be imported.
 import sys
 from pathlib import Path
 
+import pytest
+
 # Add the suppliersync directory to Python path
 suppliersync_dir = Path(__file__).parent.parent
 sys.path.insert(0, str(suppliersync_dir))
 
+
+@pytest.fixture(scope="session")
+def scale_db(tmp_path_factory):
+    """
+    Factory fixture for generated datasets (see generate_fixtures.py).
+
+    Usage:
+        def test_something(scale_db):
+            db_path = scale_db(skus=1000, price_events=5000)
+
+    Datasets are generated once per parameter set and reused for the whole
+    session, so treat them as read-only or copy them before writing.
+    """
+    pytest.importorskip("numpy")
+    from generate_fixtures import generate_dataset
+
+    cache = {}
+
+    def _make(**params):
+        key = tuple(sorted(params.items()))
+        if key not in cache:
+            path = str(tmp_path_factory.mktemp("scale") / "scale.db")
+            generate_dataset(path, **params)
+            cache[key] = path
+        return cache[key]
+
+    return _make
@@ -4,10 +4,12 @@ API endpoint tests for SupplierSync.
 
 import sys
 import os
+import json
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
 
 import pytest
 from fastapi.testclient import TestClient
+import api
 from api import app
 
 
@@ -45,16 +47,88 @@ class TestRAGEndpoints:
         assert isinstance(data["document_count"], int)
         assert data["document_count"] >= 0
     
-    def test_rag_rebuild(self, client):
+    def test_rag_status_reads_build_manifest(self, client, tmp_path, monkeypatch):
+        """Test that status comes from the build status manifest and flags stale docs."""
+        if not api.RAG_AVAILABLE:
+            pytest.skip("RAG dependencies not installed")
+        from core.rag_status import write_status, docs_mtime_ns
+        monkeypatch.chdir(tmp_path)
+        monkeypatch.setenv("RAG_DOCS_PATH", "docs")
+        monkeypatch.setenv("RAG_PERSIST_PATH", "store")
+        (tmp_path / "docs").mkdir()
+        write_status("store", {"chunk_count": 12, "file_count": 2, "built_at": "2024-01-01T00:00:00+00:00",
+                               "model": "test-model", "backend": "numpy", "docs_hash": "abc",
+                               "docs_mtime_ns": docs_mtime_ns("docs")})
+
+        data = client.get("/rag/status").json()
+        assert data["status"] == "ready"
+        assert (data["document_count"], data["file_count"]) == (12, 2)
+        assert data["model"] == "test-model"
+        assert data["stale"] is False
+
+        (tmp_path / "docs" / "new.txt").write_text("new policy")
+        os.utime(tmp_path / "docs", ns=(0, docs_mtime_ns("docs") + 1))
+        assert client.get("/rag/status").json()["stale"] is True
+    
+    def test_rag_rebuild(self, client, tmp_path, monkeypatch):
         """Test that RAG rebuild endpoint works."""
+        # Run outside the repo so no vectorstore or embedding cache is written there
+        monkeypatch.chdir(tmp_path)
         response = client.post("/rag/rebuild")
-        # May return 200 (success), 400 (bad request), or 500 (error if docs directory missing)
-        assert response.status_code in [200, 400, 500]
+        # May return 202 (background job accepted), 200 (success), 400 (bad request), or 500 (error)
+        assert response.status_code in [200, 202, 400, 500, 503]
         data = response.json()
         assert "status" in data or "detail" in data
         if response.status_code == 200 and data.get("status") == "success":
             assert "file_count" in data
             assert "chunk_count" in data
+        if response.status_code == 202:
+            assert data["job_id"]
+
+    def test_rag_rebuild_job_swaps_in_new_version(self, client, tmp_path, monkeypatch):
+        """Test that a background rebuild reports progress and atomically switches the live collection."""
+        if not api.RAG_AVAILABLE:
+            pytest.skip("RAG dependencies not installed")
+        import time
+        from core import embeddings
+
+        class FakeEmbedder:
+            def embed(self, texts):
+                return [[float(len(t)), 1.0, 0.5] for t in texts]
+
+        monkeypatch.setattr(embeddings, "_embedder", FakeEmbedder())
+        monkeypatch.chdir(tmp_path)
+        monkeypatch.setenv("RAG_DOCS_PATH", "docs")
+        monkeypatch.setenv("RAG_PERSIST_PATH", "store")
+        (tmp_path / "docs").mkdir()
+        (tmp_path / "docs" / "policy.txt").write_text("Minimum margin is five percent. " * 50)
+
+        def run_job():
+            response = client.post("/rag/rebuild")
+            assert response.status_code == 202
+            job_id = response.json()["job_id"]
+            for _ in range(200):
+                job = client.get(f"/rag/rebuild/{job_id}").json()
+                if job["status"] in ("succeeded", "failed"):
+                    return job
+                time.sleep(0.05)
+            raise AssertionError("rebuild job did not finish")
+
+        job = run_job()
+        assert job["status"] == "succeeded", job
+        assert job["file_count"] == 1 and job["chunk_count"] > 0
+        first = client.get("/rag/status").json()
+        assert first["document_count"] == job["chunk_count"]
+
+        (tmp_path / "docs" / "specs.txt").write_text("Widgets ship in cartons of twelve.")
+        job = run_job()
+        assert job["status"] == "succeeded", job
+        assert job["file_count"] == 2
+        assert job["progress"]["stage"] == "finalizing"
+        live = json.loads((tmp_path / "store" / "status.json").read_text())["collection"]
+        assert live.startswith("langchain__v")
+
+        assert client.get("/rag/rebuild/" + "0" * 32).status_code == 404
 
 
 class TestOrchestrateEndpoint:
@@ -0,0 +1,66 @@
+"""
+Benchmark runner and stub LLM tests.
+"""
+
+import sys
+import os
+import json
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import pytest
+
+pytest.importorskip("numpy")
+
+from benchmarks import run as bench_run, suite
+from core import llm_stub
+
+
+class TestBenchmarkRunner:
+    """Test baseline comparison and a tiny end-to-end run."""
+
+    def test_compare_flags_only_real_regressions(self):
+        """Test that regressions need both the relative threshold and the absolute floor."""
+        baseline = {"1k": {"a": {"median_ms": 10.0}, "b": {"median_ms": 0.2}, "c": {"median_ms": 10.0}}}
+        results = {"1k": {"a": {"median_ms": 14.0}, "b": {"median_ms": 0.6}, "c": {"median_ms": 12.0},
+                          "new": {"median_ms": 99.0}}}
+        regressions = bench_run.compare(results, baseline, threshold=0.25, min_delta_ms=1.0)
+        assert [r["benchmark"] for r in regressions] == ["a"]
+        assert regressions[0]["ratio"] == 1.4
+
+    def test_tiny_run_and_baseline_roundtrip(self, tmp_path, monkeypatch):
+        """Test that a run times each benchmark on a generated dataset and merges into the baseline."""
+        monkeypatch.setitem(suite.SCALES, "tiny", dict(skus=200, suppliers=5, years=0.1, price_events=300,
+                                                        rejected_prices=50, cx_events=50, runs=10))
+        monkeypatch.setattr("core.llm.LLM_BACKEND", "stub")
+        monkeypatch.setattr("core.retrieval.RAG_RETRIEVAL_ENABLED", False)
+        # Endpoint benchmarks repoint the API at the dataset and lift rate limits; restore both afterwards
+        import api
+        monkeypatch.setattr(api, "DB_PATH", api.DB_PATH)
+        monkeypatch.setattr(api.limiter, "enabled", getattr(api.limiter, "enabled", True), raising=False)
+        results = bench_run.run(["tiny"], only=["fetch_price_history", "orchestrator_step", "api_stats"],
+                                data_dir=str(tmp_path))
+        assert set(results["tiny"]) == {"fetch_price_history", "orchestrator_step", "api_stats"}
+        assert all(r["median_ms"] > 0 for r in results["tiny"].values())
+
+        path = str(tmp_path / "baseline.json")
+        bench_run.save_baseline(path, {"meta": {}, "results": {"1k": {"x": {"median_ms": 1.0}}}}, results)
+        with open(path) as f:
+            saved = json.load(f)
+        assert saved["results"]["1k"] == {"x": {"median_ms": 1.0}}
+        assert bench_run.compare(results, saved["results"]) == []
+
+
+class TestStubLLM:
+    """Test the deterministic LLM stub."""
+
+    def test_agent_shaped_responses(self):
+        """Test that each agent gets its payload shape for SKUs taken from the context."""
+        context = json.dumps({"catalog": [{"sku": f"SKU-{i}"} for i in range(10)]})
+        text, _, (tokens_in, tokens_out) = llm_stub.chat_json("You output JSON list of price changes.", context)
+        prices = json.loads(text)["prices"]
+        assert [p["sku"] for p in prices] == ["SKU-0", "SKU-1", "SKU-2"]
+        assert all(p["new_price"] > 0 for p in prices)
+        assert tokens_in > 0 and tokens_out > 0
+        assert llm_stub.chat_json("You output JSON list of price changes.", context)[0] == text
+        assert "updates" in llm_stub.respond("You propose supplier updates as JSON.", context)
+        assert "actions" in llm_stub.respond("You output JSON list of CX actions.", context)
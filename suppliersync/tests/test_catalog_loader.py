@@ -0,0 +1,175 @@
+"""
+Bulk catalog loader tests.
+"""
+
+import sys
+import os
+import json
+import sqlite3
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import pytest
+from core.catalog_loader import load_catalog, load_records, normalize_record, detect_format
+
+SCHEMA_PATH = os.path.join(os.path.dirname(__file__), '..', 'db', 'schema.sql')
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    """Create an empty database with the SupplierSync schema."""
+    path = str(tmp_path / "catalog.db")
+    conn = sqlite3.connect(path)
+    with open(SCHEMA_PATH) as f:
+        conn.executescript(f.read())
+    conn.close()
+    return path
+
+
+def _products(db_path):
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    rows = {r["sku"]: dict(r) for r in conn.execute("SELECT * FROM products")}
+    conn.close()
+    return rows
+
+
+class TestCatalogLoader:
+    """Test streaming catalog loads."""
+
+    def test_csv_load_and_upsert(self, db_path, tmp_path):
+        """Test that CSV feeds insert new rows and update existing ones in place."""
+        feed = tmp_path / "feed.csv"
+        feed.write_text(
+            "sku,name,category,wholesale_price,retail_price,supplier_id\n"
+            "A-1,Sofa,Couches,100,150,1\n"
+            "B-2,Table,Dining,50,80,2\n"
+        )
+        stats = load_catalog(str(feed), db_path, chunk_size=1)
+        assert stats["rows_loaded"] == 2
+        assert stats["chunks"] == 2
+
+        feed.write_text(
+            "sku,name,category,wholesale_price,retail_price,supplier_id\n"
+            "A-1,Sofa v2,Couches,110,165,1\n"
+        )
+        load_catalog(str(feed), db_path)
+        products = _products(db_path)
+        assert len(products) == 2
+        assert products["A-1"]["name"] == "Sofa v2"
+        assert products["A-1"]["retail_price"] == 165.0
+        assert products["B-2"]["is_active"] == 1
+
+    def test_load_endpoint_requires_admin(self, db_path, tmp_path, monkeypatch):
+        """Test that POST /api/catalog/load rejects requests without the admin token."""
+        from fastapi.testclient import TestClient
+        import api
+        monkeypatch.chdir(tmp_path)
+        monkeypatch.setenv("CATALOG_FEED_DIR", "feeds")
+        monkeypatch.setattr(api, "DB_PATH", db_path)
+        monkeypatch.setattr(api, "ADMIN_TOKEN", "s3cret")
+        (tmp_path / "feeds").mkdir()
+        (tmp_path / "feeds" / "feed.csv").write_text("sku,name,wholesale_price,retail_price\nA-1,Sofa,100,150\n")
+        client = TestClient(api.app)
+        assert client.post("/api/catalog/load?path=feed.csv").status_code == 401
+        assert _products(db_path) == {}
+        response = client.post("/api/catalog/load?path=feed.csv", headers={"Authorization": "Bearer s3cret"})
+        assert response.status_code == 200 and response.json()["rows_loaded"] == 1
+
+    def test_jsonl_load_skips_invalid_rows(self, db_path, tmp_path):
+        """Test that invalid and malformed JSONL records are skipped, not fatal."""
+        feed = tmp_path / "feed.jsonl"
+        lines = [
+            json.dumps({"sku": "A-1", "name": "Sofa", "wholesale_price": 100, "retail_price": 150}),
+            "{not json",
+            json.dumps({"sku": "'; DROP TABLE products; --", "wholesale_price": 1, "retail_price": 2}),
+            json.dumps({"sku": "C-3", "wholesale_price": "abc", "retail_price": 2}),
+        ]
+        feed.write_text("\n".join(lines) + "\n")
+        stats = load_catalog(str(feed), db_path)
+        assert stats["rows_loaded"] == 1
+        assert stats["rows_skipped"] == 2
+        assert list(_products(db_path)) == ["A-1"]
+
+    def test_deactivate_missing(self, db_path):
+        """Test that SKUs missing from the feed are deactivated via the staging table."""
+        conn = sqlite3.connect(db_path)
+        records = [{"sku": f"S-{i}", "wholesale_price": 10, "retail_price": 20} for i in range(10)]
+        load_records(conn, records)
+        stats = load_records(conn, records[:4], chunk_size=3, deactivate_missing=True)
+        assert stats["deactivated"] == 6
+        active = conn.execute("SELECT COUNT(*) FROM products WHERE is_active=1").fetchone()[0]
+        assert active == 4
+        conn.close()
+
+    def test_empty_feed_does_not_deactivate(self, db_path):
+        """Test that an empty feed never deactivates the whole catalog."""
+        conn = sqlite3.connect(db_path)
+        load_records(conn, [{"sku": "A-1", "wholesale_price": 10, "retail_price": 20}])
+        stats = load_records(conn, [], deactivate_missing=True)
+        assert stats["deactivated"] == 0
+        assert conn.execute("SELECT is_active FROM products").fetchone()[0] == 1
+        conn.close()
+
+    def test_normalize_record(self):
+        """Test record validation and coercion."""
+        row = normalize_record({"sku": "A-1", "wholesale_price": "10", "retail_price": "20.5", "supplier_id": "3"})
+        assert row == ("A-1", None, None, 10.0, 20.5, 3, 1)
+        assert normalize_record({"sku": "A-1", "wholesale_price": -1, "retail_price": 2}) is None
+        assert normalize_record({"sku": "A-1"}) is None
+
+    def test_detect_format(self):
+        """Test feed format detection."""
+        assert detect_format("feed.CSV") == "csv"
+        assert detect_format("feed.ndjson") == "jsonl"
+        with pytest.raises(ValueError):
+            detect_format("feed.xlsx")
+
+
+class TestFeedReconciliation:
+    """Test row-hash reconciliation of supplier feeds."""
+
+    def _records(self, n, price=20.0):
+        return [{"sku": f"S-{i}", "name": f"Item {i}", "wholesale_price": 10, "retail_price": price}
+                for i in range(n)]
+
+    def test_unchanged_feed_writes_nothing(self, db_path):
+        """Test that reapplying an identical feed leaves products untouched."""
+        conn = sqlite3.connect(db_path)
+        first = load_records(conn, self._records(50), reconcile=True)
+        assert first["rows_inserted"] == 50
+        changes_before = conn.total_changes
+        second = load_records(conn, self._records(50), reconcile=True)
+        assert second["rows_unchanged"] == 50
+        assert second["rows_updated"] == 0
+        # Only temp staging tables were written
+        assert conn.execute("SELECT COUNT(*) FROM supplier_updates").fetchone()[0] == 0
+        assert conn.total_changes - changes_before == 50  # staged hashes only
+        conn.close()
+
+    def test_changed_fields_recorded_with_old_value(self, db_path):
+        """Test that only changed rows are written and old values are recorded."""
+        conn = sqlite3.connect(db_path)
+        load_records(conn, self._records(5), reconcile=True)
+        records = self._records(5)
+        records[2]["retail_price"] = 25.5
+        stats = load_records(conn, records, reconcile=True, run_id="feed-run")
+        assert stats["rows_updated"] == 1
+        assert stats["fields_changed"] == 1
+        row = conn.execute(
+            "SELECT sku, field, old_value, new_value, run_id FROM supplier_updates"
+        ).fetchone()
+        assert row == ("S-2", "retail_price", "20.0", "25.5", "feed-run")
+        assert conn.execute("SELECT retail_price FROM products WHERE sku='S-2'").fetchone()[0] == 25.5
+        conn.close()
+
+    def test_invalidated_hash_falls_back_to_row_compare(self, db_path):
+        """Test that out-of-band writes are detected after hash invalidation."""
+        from core.feed_diff import invalidate_row_hashes
+        conn = sqlite3.connect(db_path)
+        load_records(conn, self._records(3), reconcile=True)
+        conn.execute("UPDATE products SET retail_price = 99 WHERE sku = 'S-1'")
+        invalidate_row_hashes(conn, ["S-1"])
+        stats = load_records(conn, self._records(3), reconcile=True)
+        assert stats["rows_updated"] == 1
+        assert conn.execute("SELECT retail_price FROM products WHERE sku='S-1'").fetchone()[0] == 20.0
+        conn.close()
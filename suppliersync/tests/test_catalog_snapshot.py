@@ -0,0 +1,208 @@
+"""
+Memory-mapped catalog snapshot tests.
+"""
+
+import sys
+import os
+import json
+import sqlite3
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import pytest
+
+from agents.orchestrator import Orchestrator
+from core import context_cache, llm, retrieval
+from core.catalog_loader import load_records
+from core.catalog_snapshot import (
+    CatalogSnapshot, CatalogSnapshots, catalog_version, encode_columns, get_catalog_snapshots, snapshot_path,
+    write_snapshot,
+)
+from core.context_cache import ContextCache
+from core.records import context_json
+from migrate_db import SCHEMA_SQL
+
+PRODUCTS = [
+    ("SKU-1", "Widget \"Pro\"", "Widgets", 10.0, 25.5, 1),
+    ("SKU-2", "Café mug ☕", None, 2.0, 4.0, None),
+    ("SKU-3", None, "Widgets", None, float("inf"), 2),
+    ("SKU-4", "", "Gadgets", 1e-7, 12345678.9, 1),
+]
+
+
+@pytest.fixture
+def db(tmp_path):
+    path = str(tmp_path / "catalog.db")
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA_SQL)
+    conn.executemany("INSERT INTO products(sku, name, category, wholesale_price, retail_price, supplier_id) "
+                     "VALUES (?,?,?,?,?,?)", PRODUCTS)
+    conn.commit()
+    yield path, conn
+    conn.close()
+
+
+def _products_queries(conn):
+    """Record the statements that read the products table."""
+    queries = []
+    conn.set_trace_callback(lambda sql: queries.append(sql) if "FROM products" in sql else None)
+    return queries
+
+
+class TestSnapshotFile:
+    """Test the columnar file format."""
+
+    def test_round_trip(self, tmp_path):
+        """Test that every column, NULL and non-ASCII value survives, with arrays mapped in place."""
+        columns = dict(zip(("sku", "name", "category", "wholesale_price", "retail_price", "supplier_id"),
+                           zip(*PRODUCTS + [("SKU-5", "nul\x00inside", "Widgets", 1.0, 2.0, 3)])))
+        path = str(tmp_path / "s.catalog")
+        write_snapshot(path, "v1", 5, encode_columns(columns))
+        snapshot = CatalogSnapshot.open(path)
+        assert snapshot.version == "v1" and snapshot.rows == 5
+        assert tuple(snapshot.strings("sku")) == columns["sku"]
+        assert tuple(snapshot.strings("name")) == columns["name"]
+        assert tuple(snapshot.categories()) == columns["category"]
+        assert tuple(snapshot.numbers("wholesale_price")) == columns["wholesale_price"]
+        assert tuple(snapshot.numbers("supplier_id")) == columns["supplier_id"]
+        prices = snapshot.arrays["retail_price"]
+        assert not prices.flags.owndata and not prices.flags.writeable  # A view of the read-only mapping
+        assert prices.ctypes.data % 64 == 0
+        catalog = snapshot.to_catalog()
+        assert catalog.category[0] is catalog.category[2]
+
+    def test_empty_and_invalid(self, tmp_path):
+        """Test an empty catalog, and that values the schema cannot hold and foreign files are rejected."""
+        path = str(tmp_path / "s.catalog")
+        write_snapshot(path, "v0", 0, encode_columns({c: () for c in ("sku", "name", "category", "wholesale_price",
+                                                                      "retail_price", "supplier_id")}))
+        assert len(CatalogSnapshot.open(path).to_catalog()) == 0
+        with pytest.raises(ValueError):
+            encode_columns({"sku": ("A",), "name": ("a",), "category": ("c",), "wholesale_price": ("cheap",),
+                            "retail_price": (1.0,), "supplier_id": (1,)})
+        with open(path, "wb") as f:
+            f.write(b"SQLite format 3\x00")
+        with pytest.raises(ValueError):
+            CatalogSnapshot.open(path)
+
+
+class TestCatalogSnapshots:
+    """Test publishing, versioning and sharing snapshots."""
+
+    def test_published_once_then_shared(self, db):
+        """Test that a second worker serves the catalog from the file without reading products."""
+        path, conn = db
+        expected = context_json(CatalogSnapshots(snapshot_path(path)).catalog(conn))
+        assert os.path.exists(snapshot_path(path))
+        queries = _products_queries(conn)
+        other = CatalogSnapshots(snapshot_path(path))
+        assert context_json(other.catalog(conn)) == expected
+        assert other.catalog(conn) is other.catalog(conn)  # Materialized once per snapshot
+        assert queries == []
+        assert json.loads(expected)["catalog"][1] == {"sku": "SKU-2", "name": "Café mug ☕", "category": None,
+                                                      "wholesale_price": 2.0, "retail_price": 4.0}
+
+    def test_rewritten_only_on_change(self, db):
+        """Test that events and bulk loads change the version, and unchanged versions never rewrite."""
+        path, conn = db
+        store = CatalogSnapshots(snapshot_path(path))
+        store.catalog(conn)
+        mtime = os.stat(snapshot_path(path)).st_mtime_ns
+        version = catalog_version(conn)
+        store.catalog(conn)
+        assert os.stat(snapshot_path(path)).st_mtime_ns == mtime
+
+        with conn:
+            conn.execute("UPDATE products SET retail_price = 30.0 WHERE sku = 'SKU-1'")
+            conn.execute("INSERT INTO price_events(sku, prev_price, new_price) VALUES ('SKU-1', 25.5, 30.0)")
+        assert catalog_version(conn) != version
+        assert store.catalog(conn).retail_price[0] == 30.0
+        version = catalog_version(conn)
+
+        load_records(conn, [{"sku": "SKU-9", "name": "New", "category": "Widgets", "wholesale_price": 1,
+                             "retail_price": 2, "supplier_id": 1}], reconcile=True)
+        assert catalog_version(conn) != version  # A new SKU records no event: the loader bumps the epoch
+        assert "SKU-9" in CatalogSnapshots(snapshot_path(path)).catalog(conn).sku
+
+    def test_regenerated_dataset_never_matches(self, tmp_path):
+        """Test that a dataset regenerated with reset=True gets a new version, so its old snapshot is not served."""
+        pytest.importorskip("numpy")
+        from generate_fixtures import generate_dataset
+        path = str(tmp_path / "generated.db")
+        params = dict(skus=50, suppliers=5, years=0.1, price_events=50, rejected_prices=0, cx_events=0, runs=1)
+        generate_dataset(path, seed=1, **params)
+        conn = sqlite3.connect(path)
+        try:
+            store = CatalogSnapshots(snapshot_path(path))
+            first = store.catalog(conn)
+            version = catalog_version(conn)
+            contexts = ContextCache()
+            contexts.refresh(conn, lambda: store.catalog(conn))
+            generate_dataset(path, seed=2, reset=True, **params)
+            assert catalog_version(conn) != version
+            fresh = [r[0] for r in conn.execute("SELECT retail_price FROM products WHERE is_active=1 ORDER BY id")]
+            assert list(CatalogSnapshots(snapshot_path(path)).catalog(conn).retail_price) == fresh
+            assert list(first.retail_price) != fresh
+            contexts.refresh(conn, lambda: store.catalog(conn))  # The warm context cache reloads too
+            assert [row["retail_price"] for row in json.loads(contexts.to_json())] == fresh
+        finally:
+            conn.close()
+
+    def test_new_database_never_matches(self, db, tmp_path):
+        """Test that a database recreated at the same path does not reuse the old snapshot."""
+        path, conn = db
+        CatalogSnapshots(snapshot_path(path)).catalog(conn)
+        conn.close()
+        os.remove(path)
+        fresh = sqlite3.connect(path)
+        fresh.executescript(SCHEMA_SQL)
+        try:
+            assert len(CatalogSnapshots(snapshot_path(path)).catalog(fresh)) == 0
+        finally:
+            fresh.close()
+
+    def test_not_published_inside_transaction(self, db):
+        """Test that a connection with uncommitted writes reads them but never publishes them."""
+        path, conn = db
+        conn.execute("INSERT INTO price_events(sku, prev_price, new_price) VALUES ('SKU-1', 25.5, 30.0)")
+        assert conn.in_transaction
+        CatalogSnapshots(snapshot_path(path)).catalog(conn)
+        assert not os.path.exists(snapshot_path(path))
+        conn.rollback()
+
+    def test_disabled_by_default(self, db):
+        """Test that no store exists unless CATALOG_SNAPSHOT is on, nor for in-memory databases."""
+        path, _ = db
+        assert get_catalog_snapshots(path, enabled=False) is None
+        assert get_catalog_snapshots(":memory:", enabled=True) is None
+        assert get_catalog_snapshots(path, enabled=True) is get_catalog_snapshots(path, enabled=True)
+
+
+class TestOrchestratorSnapshots:
+    """Test orchestration runs reading the catalog through snapshots."""
+
+    def test_prompts_unchanged_and_final_catalog_published(self, db, monkeypatch):
+        """Test that runs see the same contexts with snapshots, and the next run starts from the file."""
+        path, conn = db
+        monkeypatch.setattr(retrieval, "RAG_RETRIEVAL_ENABLED", False)
+        monkeypatch.setattr(context_cache, "CONTEXT_CACHE", False)  # Every read goes through the snapshot
+
+        def run(orch):
+            prompts, responses = [], iter([{"updates": []}, {"prices": [{"sku": "SKU-1", "new_price": 27.0}]},
+                                           {"actions": []}])
+
+            def model(system, user, model=None):
+                prompts.append(user.split("CONTEXT:\n", 1)[1])
+                return json.dumps(next(responses)), 0, (0, 0)
+            with llm.override_chat_json(model):
+                orch.step()
+            return prompts
+
+        plain = run(Orchestrator(path))
+        conn.execute("UPDATE products SET retail_price = 25.5 WHERE sku = 'SKU-1'")
+        conn.execute("UPDATE catalog_epoch SET epoch = epoch + 1")
+        conn.commit()
+        store = CatalogSnapshots(snapshot_path(path))
+        assert run(Orchestrator(path, snapshots=store)) == plain
+        # The file holds the run's final catalog, so the next run's first read maps it
+        assert store.current(catalog_version(conn)) is not None
+        assert CatalogSnapshot.open(snapshot_path(path)).numbers("retail_price")[0] == 27.0
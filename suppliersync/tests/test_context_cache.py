@@ -0,0 +1,166 @@
+"""
+Context fragment cache tests.
+"""
+
+import sys
+import os
+import json
+import shutil
+import sqlite3
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import pytest
+
+from agents.orchestrator import Orchestrator
+from core import context_cache, llm, retrieval
+from core.catalog_loader import load_records
+from core.context_cache import ContextCache, get_context_cache
+from core.records import CATALOG_SELECT_SQL, Catalog
+from migrate_db import SCHEMA_SQL
+
+PRODUCTS = [(f"SKU-{i}", f"Item {i}", ("Widgets", "Gadgets", None)[i % 3], 10.0 + i, 20.0 + i) for i in range(6)]
+
+
+@pytest.fixture
+def db(tmp_path):
+    path = str(tmp_path / "contexts.db")
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA_SQL)
+    conn.executemany("INSERT INTO products(sku, name, category, wholesale_price, retail_price, supplier_id) "
+                     "VALUES (?,?,?,?,?,1)", PRODUCTS)
+    conn.commit()
+    yield path, conn
+    conn.close()
+
+
+def _load(conn):
+    return lambda: Catalog.from_rows(conn.execute(CATALOG_SELECT_SQL).fetchall())
+
+
+def _assert_current(cache, conn):
+    """The cached text equals a fresh serialization of the database's catalog, in both layouts."""
+    catalog = _load(conn)()
+    for indent, level in ((None, 0), (2, 1)):
+        assert cache.to_json(indent, level) == catalog.to_json(indent, level)
+
+
+class TestContextCache:
+    """Test refreshing cached fragments."""
+
+    def test_own_writes_re_encode_only_their_rows(self, db):
+        """Test that invalidated SKUs are re-read alone when the version moved by exactly their events."""
+        _, conn = db
+        cache = ContextCache()
+        assert cache.refresh(conn, _load(conn)) == len(PRODUCTS)
+        _assert_current(cache, conn)
+        assert cache.refresh(conn, _load(conn)) == 0
+
+        with conn:
+            conn.execute("UPDATE products SET retail_price = 99.5 WHERE sku = 'SKU-2'")
+            conn.execute("INSERT INTO price_events(sku, prev_price, new_price) VALUES ('SKU-2', 22.0, 99.5)")
+            conn.execute("INSERT INTO price_events(sku, prev_price, new_price) VALUES ('SKU-4', 24.0, 24.0)")
+        cache.invalidate(["SKU-2", "SKU-4"], price_events=2)
+        queries = []
+        conn.set_trace_callback(lambda sql: queries.append(sql) if "FROM products" in sql else None)
+        assert cache.refresh(conn, _load(conn)) == 1  # SKU-4 was re-read but is unchanged
+        conn.set_trace_callback(None)
+        assert len(queries) == 1 and "WHERE sku IN (" in queries[0]
+        _assert_current(cache, conn)
+        assert cache.select(["SKU-2", "missing"])["SKU-2"].retail_price == 99.5
+
+    def test_other_writers_reload_and_diff(self, db):
+        """Test that unreported changes, new and deactivated SKUs are found by reloading the catalog."""
+        _, conn = db
+        cache = ContextCache()
+        cache.refresh(conn, _load(conn))
+        cache.to_json()
+        with conn:
+            conn.execute("UPDATE products SET name = 'Renamed' WHERE sku = 'SKU-1'")
+            conn.execute("INSERT INTO supplier_updates(sku, field, old_value, new_value) "
+                         "VALUES ('SKU-1', 'name', 'Item 1', 'Renamed')")
+        assert cache.refresh(conn, _load(conn)) == 1
+        _assert_current(cache, conn)
+
+        load_records(conn, [{"sku": "SKU-9", "name": "New", "category": "Widgets", "wholesale_price": 1,
+                             "retail_price": 2, "supplier_id": 1}], reconcile=True)
+        with conn:
+            conn.execute("UPDATE products SET is_active = 0 WHERE sku = 'SKU-0'")
+            conn.execute("UPDATE catalog_epoch SET epoch = epoch + 1")
+        assert cache.refresh(conn, _load(conn)) == 1  # Only the new SKU is encoded; the others moved
+        _assert_current(cache, conn)
+        assert len(cache) == len(PRODUCTS) and "SKU-0" not in cache.select(["SKU-0"])
+
+    def test_disabled(self, db):
+        """Test that no cache exists when CONTEXT_CACHE is off, nor for in-memory databases."""
+        path, _ = db
+        assert get_context_cache(path, enabled=False) is None
+        assert get_context_cache(":memory:", enabled=True) is None
+        assert get_context_cache(path, enabled=True) is get_context_cache(path, enabled=True)
+
+
+class TestOrchestratorContexts:
+    """Test orchestration runs with cached contexts."""
+
+    def test_runs_match_uncached(self, db, tmp_path, monkeypatch):
+        """Test that consecutive runs send the same contexts with and without the cache."""
+        path, conn = db
+        conn.close()
+        uncached = str(tmp_path / "uncached.db")
+        shutil.copy(path, uncached)
+        monkeypatch.setattr(retrieval, "RAG_RETRIEVAL_ENABLED", False)
+
+        def runs(orch):
+            prompts = []
+            responses = iter([
+                {"updates": [{"sku": "SKU-1", "field": "wholesale_price", "new_value": 12.5}]},
+                {"prices": [{"sku": "SKU-1", "new_price": 30.0}, {"sku": "SKU-3", "new_price": 1.0}]},
+                {"actions": []},
+                {"updates": [{"sku": "SKU-5", "field": "category", "new_value": "Gadgets"}]},
+                {"prices": [{"sku": "SKU-5", "new_price": 26.0}]},
+                {"actions": []},
+            ])
+
+            def model(system, user, model=None):
+                prompts.append(user.split("CONTEXT:\n", 1)[1])
+                return json.dumps(next(responses)), 0, (0, 0)
+            with llm.override_chat_json(model):
+                orch.step()
+                orch.step()
+            return prompts
+
+        cache = ContextCache()
+        cached = runs(Orchestrator(path, contexts=cache))
+        monkeypatch.setattr(context_cache, "CONTEXT_CACHE", False)
+        assert cached == runs(Orchestrator(uncached))
+        assert cache.select(["SKU-5"])["SKU-5"].category == "Gadgets"
+
+    def test_failed_commit_is_not_reported(self, db, monkeypatch):
+        """Test that writes whose commit fails are not reported, and a failed run makes the next refresh reload."""
+        path, conn = db
+        conn.close()
+        monkeypatch.setattr(retrieval, "RAG_RETRIEVAL_ENABLED", False)
+        cache = ContextCache()
+        orch = Orchestrator(path, contexts=cache)
+        orch._fetch_catalog()
+
+        def locked():
+            raise sqlite3.OperationalError("database is locked")
+        monkeypatch.setattr(orch, "_commit", locked)
+        with pytest.raises(sqlite3.OperationalError):
+            orch._apply_price_changes([{"sku": "SKU-1", "new_price": 30.0}], "run")
+        orch.db.rollback()
+        assert cache._events == [0, 0] and not cache._dirty
+
+        responses = iter([{"updates": [{"sku": "SKU-2", "field": "name", "new_value": "Renamed"}]}])
+        with llm.override_chat_json(lambda system, user, model=None: (json.dumps(next(responses)), 0, (0, 0))):
+            with pytest.raises(sqlite3.OperationalError):
+                orch.step()
+        assert cache.version is None
+        monkeypatch.undo()
+        queries = []
+        orch.db.set_trace_callback(lambda sql: queries.append(sql) if "FROM products" in sql else None)
+        orch._fetch_catalog()
+        orch.db.set_trace_callback(None)
+        assert any(CATALOG_SELECT_SQL in q for q in queries)  # A full reload, not a patch
+        _assert_current(cache, orch.db)
+        orch.db.close()
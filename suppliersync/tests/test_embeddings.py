@@ -0,0 +1,110 @@
+"""
+Shared embedding provider tests.
+"""
+
+import sys
+import os
+import threading
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import pytest
+from core.embeddings import MicroBatcher, LocalEmbedder, SocketEmbedder, EmbeddingServer
+from core.embedding_cache import EmbeddingCache
+
+
+def _fake_encode(calls):
+    def encode(texts):
+        calls.append(len(texts))
+        return [[float(len(t)), 1.0] for t in texts]
+    return encode
+
+
+class TestMicroBatcher:
+    """Test request coalescing."""
+
+    def test_results_are_routed_to_callers(self):
+        """Test that every caller receives the vectors for its own texts."""
+        calls = []
+        batcher = MicroBatcher(_fake_encode(calls), max_batch=64, max_wait_ms=50)
+        results = {}
+
+        def worker(i):
+            results[i] = batcher.submit(["x" * i, "y" * (i + 1)])
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(1, 9)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        for i in range(1, 9):
+            assert results[i] == [[float(i), 1.0], [float(i + 1), 1.0]]
+        # Concurrent requests were coalesced into fewer model calls
+        assert sum(calls) == 16
+        assert len(calls) < 8
+
+    def test_errors_propagate(self):
+        """Test that encoder failures are raised in the calling thread."""
+        def boom(texts):
+            raise RuntimeError("model failed")
+        batcher = MicroBatcher(boom)
+        with pytest.raises(RuntimeError):
+            batcher.submit(["a"])
+
+
+class TestEmbeddingProviders:
+    """Test the local and sidecar providers."""
+
+    def test_local_embedder_is_lazy(self):
+        """Test that constructing the provider does not load the model."""
+        embedder = LocalEmbedder()
+        assert embedder.loaded is False
+
+    def test_socket_round_trip(self, tmp_path):
+        """Test that the sidecar serves embeddings over a Unix socket."""
+        calls = []
+        local = LocalEmbedder()
+        local._encode = _fake_encode(calls)
+        local._batcher = MicroBatcher(local._encode)
+        socket_path = str(tmp_path / "embed.sock")
+        server = EmbeddingServer(socket_path, embedder=local)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            client = SocketEmbedder(socket_path)
+            assert client.embed(["abc", "de"]) == [[3.0, 1.0], [2.0, 1.0]]
+            assert client.embed([]) == []
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+class TestEmbeddingCache:
+    """Test the persistent chunk-embedding cache."""
+
+    def test_only_misses_reach_the_model(self, tmp_path):
+        """Test that cached texts are not re-embedded, across cache instances."""
+        calls = []
+        encode = _fake_encode(calls)
+        path = str(tmp_path / "cache.db")
+
+        cache = EmbeddingCache(path)
+        assert cache.embed("m", ["abc", "de", "abc"], encode) == [[3.0, 1.0], [2.0, 1.0], [3.0, 1.0]]
+        assert calls == [2]
+        cache.close()
+
+        cache = EmbeddingCache(path)
+        assert cache.embed("m", ["de", "fghi"], encode) == [[2.0, 1.0], [4.0, 1.0]]
+        assert calls == [2, 1]
+        assert (cache.hits, cache.misses) == (1, 1)
+        assert cache.count("m") == 3
+        cache.close()
+
+    def test_keyed_by_model(self, tmp_path):
+        """Test that vectors from one model are not served for another."""
+        calls = []
+        cache = EmbeddingCache(str(tmp_path / "cache.db"))
+        cache.embed("model-a", ["abc"], _fake_encode(calls))
+        cache.embed("model-b", ["abc"], _fake_encode(calls))
+        assert len(calls) == 2
+        cache.close()
@@ -0,0 +1,74 @@
+"""
+Fake OpenAI server tests (real OpenAI client, local HTTP).
+"""
+
+import sys
+import os
+import json
+import threading
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import pytest
+
+pytest.importorskip("openai")
+
+from openai import APIError
+
+from core import llm
+from core.fake_openai import FakeOpenAIServer
+
+CONTEXT = json.dumps({"catalog": [{"sku": "SKU-1"}, {"sku": "SKU-2"}]})
+
+
+@pytest.fixture
+def fake(monkeypatch):
+    """Fake server with chat_json pointed at it through OPENAI_BASE_URL."""
+    with FakeOpenAIServer(seed=0, retry_after_s=0.01) as server:
+        monkeypatch.setattr(llm, "LLM_BACKEND", "openai")
+        monkeypatch.setattr(llm, "_client", None)
+        monkeypatch.setenv("OPENAI_BASE_URL", server.url)
+        monkeypatch.setenv("OPENAI_API_KEY", "fake")
+        monkeypatch.setenv("OPENAI_TIMEOUT", "0.3")
+        monkeypatch.setenv("OPENAI_MAX_RETRIES", "1")
+        yield server
+    llm._client = None
+
+
+class TestFakeOpenAI:
+    """Test completions, usage and fault injection through core.llm.chat_json."""
+
+    def test_completion_with_usage(self, fake):
+        """Test that agent-shaped JSON and usage token counts come back through the client."""
+        text, latency_ms, (tokens_in, tokens_out) = llm.chat_json("You output JSON list of CX actions.", CONTEXT)
+        assert [a["sku"] for a in json.loads(text)["actions"]] == ["SKU-1", "SKU-2"]
+        assert tokens_in > 0 and tokens_out > 0 and latency_ms >= 0
+        assert fake.stats["ok"] == 1 and fake.stats["completion_tokens"] == tokens_out
+
+    def test_rate_limits_are_retried(self, fake):
+        """Test that 429s are retried by the client and surface as APIError once retries run out."""
+        fake.rate_429 = 1.0
+        with pytest.raises(APIError, match="429"):
+            llm.chat_json("You output JSON list of price changes.", CONTEXT)
+        assert fake.stats["rate_limited"] == 2  # First attempt + OPENAI_MAX_RETRIES
+
+    def test_server_errors_and_timeouts(self, fake):
+        """Test that injected 5xx and hanging requests raise APIError."""
+        fake.rate_5xx = 1.0
+        with pytest.raises(APIError):
+            llm.chat_json("You propose supplier updates as JSON.", CONTEXT)
+        assert fake.stats["server_error"] == 2
+        fake.rate_5xx, fake.rate_timeout = 0.0, 1.0
+        with pytest.raises(APIError, match="timeout"):
+            llm.chat_json("You propose supplier updates as JSON.", CONTEXT)
+        assert fake.stats["timeout"] == 2
+
+    def test_concurrency_is_tracked(self, fake):
+        """Test that overlapping requests show up in max_in_flight."""
+        fake.latency = "150"
+        threads = [threading.Thread(target=llm.chat_json, args=("You output JSON list of CX actions.", CONTEXT))
+                   for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert fake.stats["ok"] == 4 and fake.stats["max_in_flight"] >= 2
@@ -0,0 +1,69 @@
+"""
+Scale fixture generator tests.
+"""
+
+import sys
+import os
+import sqlite3
+from datetime import datetime
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import pytest
+
+pytest.importorskip("numpy")
+from generate_fixtures import generate_dataset
+
+SMALL = dict(skus=500, suppliers=20, years=0.5, price_events=2000, rejected_prices=300, cx_events=400, runs=50)
+
+
+def _digest(db_path):
+    conn = sqlite3.connect(db_path)
+    digest = (
+        conn.execute("SELECT COUNT(*), TOTAL(retail_price), TOTAL(wholesale_price) FROM products").fetchone(),
+        conn.execute("SELECT TOTAL(new_price), MIN(created_at), MAX(created_at) FROM price_events").fetchone(),
+        conn.execute("SELECT TOTAL(tokens_in), COUNT(DISTINCT run_id) FROM agent_logs").fetchone(),
+    )
+    conn.close()
+    return digest
+
+
+class TestGenerateDataset:
+    """Test the NumPy dataset generator."""
+
+    def test_row_counts(self, scale_db):
+        """Test that every table receives the requested number of rows."""
+        db_path = scale_db(**SMALL)
+        conn = sqlite3.connect(db_path)
+        assert conn.execute("SELECT COUNT(*) FROM products").fetchone()[0] == 500
+        assert conn.execute("SELECT COUNT(*) FROM suppliers").fetchone()[0] == 20
+        assert conn.execute("SELECT COUNT(*) FROM price_events").fetchone()[0] == 2000
+        assert conn.execute("SELECT COUNT(*) FROM rejected_prices").fetchone()[0] == 300
+        assert conn.execute("SELECT COUNT(*) FROM cx_events").fetchone()[0] == 400
+        assert conn.execute("SELECT COUNT(*) FROM agent_logs").fetchone()[0] == 150
+        # Event ids follow time order, as in production
+        unordered = conn.execute(
+            "SELECT COUNT(*) FROM price_events a JOIN price_events b ON b.id = a.id + 1 "
+            "WHERE b.created_at < a.created_at"
+        ).fetchone()[0]
+        assert unordered == 0
+        # Same text format as CURRENT_TIMESTAMP, so text ordering against production rows holds
+        created = conn.execute("SELECT created_at FROM price_events LIMIT 1").fetchone()[0]
+        assert created == datetime.strptime(created, "%Y-%m-%d %H:%M:%S").strftime("%Y-%m-%d %H:%M:%S")
+        conn.close()
+
+    def test_same_seed_is_reproducible(self, tmp_path):
+        """Test that identical parameters and seed produce identical data."""
+        a, b, c = (str(tmp_path / f"{name}.db") for name in "abc")
+        generate_dataset(a, seed=7, **SMALL)
+        generate_dataset(b, seed=7, **SMALL)
+        generate_dataset(c, seed=8, **SMALL)
+        assert _digest(a) == _digest(b)
+        assert _digest(a) != _digest(c)
+
+    def test_refuses_non_empty_database(self, tmp_path):
+        """Test that existing data is never silently mixed with generated data."""
+        path = str(tmp_path / "a.db")
+        generate_dataset(path, **SMALL)
+        with pytest.raises(ValueError):
+            generate_dataset(path, **SMALL)
+        generate_dataset(path, reset=True, **SMALL)
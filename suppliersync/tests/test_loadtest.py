@@ -0,0 +1,87 @@
+"""
+API load-test harness tests.
+"""
+
+import sys
+import os
+import asyncio
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import pytest
+
+pytest.importorskip("numpy")
+
+import httpx
+
+from benchmarks import loadtest, run as bench_run, suite
+from core import llm_stub
+
+
+class TestReport:
+    """Test mix parsing and report aggregation."""
+
+    def test_parse_mix(self):
+        """Test that weights are parsed and unknown routes rejected."""
+        assert loadtest.parse_mix("stats=3, orchestrate=1") == {"stats": 3.0, "orchestrate": 1.0}
+        with pytest.raises(ValueError):
+            loadtest.parse_mix("stats=1,nope=2")
+        with pytest.raises(ValueError):
+            loadtest.parse_mix("stats=0")
+
+    def test_parse_faults(self):
+        """Test that fault specs map to fake OpenAI server arguments."""
+        assert loadtest.parse_faults("429=0.05,timeout=0.01") == {"rate_429": 0.05, "rate_timeout": 0.01}
+        with pytest.raises(ValueError):
+            loadtest.parse_faults("418=1")
+
+    def test_summarize_percentiles_and_errors(self):
+        """Test per-route percentiles, error counting (5xx and transport failures) and 429s."""
+        samples = [("stats", 200, float(ms)) for ms in range(1, 101)]
+        samples += [("orchestrate", 500, 900.0), ("orchestrate", 0, 120000.0), ("orchestrate", 429, 1.0),
+                    ("orchestrate", 200, 800.0)]
+        report = loadtest.summarize(samples, elapsed_s=2.0, db_locked=2.0)
+        stats = report["routes"]["stats"]
+        assert (stats["p50_ms"], stats["p95_ms"], stats["p99_ms"]) == (50.0, 95.0, 99.0)
+        assert stats["throughput_rps"] == 50.0
+        orch = report["routes"]["orchestrate"]
+        assert (orch["errors"], orch["rate_limited"], orch["error_rate"]) == (2, 1, 0.5)
+        assert report["requests"] == 104 and report["errors"] == 2
+        assert report["db_locked_rate"] == round(2 / 104, 4)
+
+    def test_locked_errors_from_metrics_text(self):
+        """Test that only error="locked" samples are summed."""
+        text = ('# TYPE db_errors_total counter\n'
+                'db_errors_total{operation="SELECT",error="locked"} 3\n'
+                'db_errors_total{operation="COMMIT",error="locked"} 2\n'
+                'db_errors_total{operation="SELECT",error="operational"} 7\n')
+        assert loadtest.locked_errors(text) == 5.0
+
+    def test_stub_latency_specs(self):
+        """Test the stub LLM latency distributions."""
+        assert llm_stub.latency_sampler("25")() == 25.0
+        assert 10 <= llm_stub.latency_sampler("uniform:10:20")() <= 20
+        assert llm_stub.latency_sampler("lognormal:100:0.5")() > 0
+        with pytest.raises(ValueError):
+            llm_stub.latency_sampler("gamma:1:2")
+
+
+class TestInProcessRun:
+    """Test a short load run against the app in-process."""
+
+    def test_mixed_load(self, tmp_path, monkeypatch):
+        """Test that every route in the mix is exercised and reported without errors."""
+        monkeypatch.setitem(suite.SCALES, "tiny", dict(skus=200, suppliers=5, years=0.1, price_events=300,
+                                                        rejected_prices=50, cx_events=50, runs=10))
+        monkeypatch.setattr("core.llm.LLM_BACKEND", "stub")
+        monkeypatch.setattr("core.retrieval.RAG_RETRIEVAL_ENABLED", False)
+        import api
+        monkeypatch.setattr(api, "DB_PATH", bench_run.dataset_path(str(tmp_path), "tiny"))
+        monkeypatch.setattr(api.limiter, "enabled", False, raising=False)
+
+        mix = loadtest.parse_mix("stats=2,metrics=2,rag_status=1,orchestrate=1")
+        report = asyncio.run(loadtest.run_load("http://loadtest", mix, concurrency=3, duration_s=1.0,
+                                               transport=httpx.ASGITransport(app=api.app)))
+        assert set(report["routes"]) == set(mix)
+        assert report["errors"] == 0
+        assert report["db_locked"] == 0
+        assert all(r["p99_ms"] >= r["p50_ms"] > 0 for r in report["routes"].values())
@@ -0,0 +1,115 @@
+"""
+Prometheus-style metrics tests.
+"""
+
+import sys
+import os
+import json
+import subprocess
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import pytest
+from fastapi.testclient import TestClient
+
+import api
+from core.metrics import Registry, render
+
+SUPPLIERSYNC_DIR = os.path.join(os.path.dirname(__file__), '..')
+
+
+class TestRegistry:
+    """Test metric families and the text exposition format."""
+
+    def test_histogram_exposition(self):
+        """Test that histograms render cumulative buckets, sum and count per label set."""
+        registry = Registry(directory="")
+        latency = registry.histogram("req_seconds", "Latency.", ("route",), buckets=(0.1, 1.0))
+        for value in (0.05, 0.5, 0.5, 3.0):
+            latency.observe(value, '/a"b')
+        text = registry.render()
+        assert "# TYPE req_seconds histogram" in text
+        assert 'req_seconds_bucket{route="/a\\"b",le="0.1"} 1' in text
+        assert 'req_seconds_bucket{route="/a\\"b",le="1.0"} 3' in text
+        assert 'req_seconds_bucket{route="/a\\"b",le="+Inf"} 4' in text
+        assert 'req_seconds_count{route="/a\\"b"} 4' in text
+        assert 'req_seconds_sum{route="/a\\"b"} 4.05' in text
+
+    def test_multiprocess_merge(self, tmp_path):
+        """Test that snapshots of other worker processes are merged; gauges only from live ones."""
+        script = (
+            "from core.metrics import Registry\n"
+            f"r = Registry(directory={str(tmp_path)!r})\n"
+            "r.counter('jobs_total', 'Jobs.', ('kind',)).inc('a', amount=2)\n"
+            "r.gauge('busy', 'Busy.').inc()\n"
+            "r.histogram('lat', 'Latency.', buckets=(1.0,)).observe(0.5)\n"
+            "r.flush()\n"
+        )
+        subprocess.run([sys.executable, "-c", script], cwd=SUPPLIERSYNC_DIR, check=True)
+
+        registry = Registry(directory=str(tmp_path))
+        registry.counter("jobs_total", "Jobs.", ("kind",)).inc("a")
+        registry.gauge("busy", "Busy.").inc()
+        registry.histogram("lat", "Latency.", buckets=(1.0,)).observe(2.0)
+        text = registry.render()
+        assert 'jobs_total{kind="a"} 3' in text
+        assert "busy 1" in text  # The exited worker's gauge is dropped
+        assert 'lat_bucket{le="1.0"} 1' in text
+        assert "lat_count 2" in text
+        # The exited worker's files are folded into exited.json and deleted; its totals remain
+        snapshots = sorted(n for n in os.listdir(tmp_path) if n.endswith(".json"))
+        assert snapshots == sorted([registry._file, "exited.json"])
+        assert 'jobs_total{kind="a"} 3' in registry.render()
+
+    def test_reused_pid_does_not_revive_gauges(self, tmp_path):
+        """Test that liveness follows the writer's lock, not its pid: a dead worker's pid may be reused."""
+        # Written by an exited worker whose pid now belongs to a live process (this one)
+        snapshot = {"pid": os.getpid(), "metrics": {
+            "busy": {"type": "gauge", "help": "Busy.", "labels": [], "samples": [[[], 5.0]]},
+            "jobs_total": {"type": "counter", "help": "Jobs.", "labels": [], "samples": [[[], 2.0]]}}}
+        (tmp_path / f"{os.getpid()}-deadbeef.json").write_text(json.dumps(snapshot))
+        (tmp_path / f"{os.getpid()}-deadbeef.lock").write_text("")
+        registry = Registry(directory=str(tmp_path))
+        registry.gauge("busy", "Busy.").inc()
+        text = registry.render()
+        assert "busy 1" in text and "jobs_total 2" in text
+        assert not (tmp_path / f"{os.getpid()}-deadbeef.json").exists()
+
+    def test_merge_ignores_empty_snapshots(self):
+        """Test that rendering with no samples still emits valid metadata."""
+        text = render([{"pid": os.getpid(), "metrics": {"x_total": {"type": "counter", "help": "X.",
+                                                                      "labels": [], "samples": []}}}])
+        assert text == "# HELP x_total X.\n# TYPE x_total counter\n"
+
+
+class TestMetricsEndpoint:
+    """Test the /metrics endpoint."""
+
+    def test_request_metrics_by_route_template(self):
+        """Test that requests are recorded under their route template with status codes."""
+        client = TestClient(api.app)
+        client.get("/rag/rebuild/" + "0" * 32)
+        response = client.get("/metrics")
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+        assert 'http_requests_total{method="GET",route="/rag/rebuild/{job_id}",status="404"}' in response.text
+        assert 'http_request_duration_seconds_bucket{method="GET",route="/rag/rebuild/{job_id}",le="+Inf"}' in response.text
+        assert "# TYPE db_query_duration_seconds histogram" in response.text
+
+    def test_lock_timeouts_counted(self, tmp_path):
+        """Test that "database is locked" errors are counted in db_errors_total."""
+        import sqlite3
+        from core.database import connect
+        from core.metrics import DB_ERRORS
+        db = str(tmp_path / "locked.db")
+        holder = sqlite3.connect(db)
+        holder.execute("CREATE TABLE t (x INTEGER)")
+        holder.execute("BEGIN EXCLUSIVE")
+        def locked():
+            return dict((tuple(k), v) for k, v in DB_ERRORS.snapshot()["samples"]).get(("SELECT", "locked"), 0)
+        before = locked()
+        conn = connect(db, timeout=0.01)
+        with pytest.raises(sqlite3.OperationalError, match="locked"):
+            conn.execute("SELECT * FROM t")
+        holder.rollback()
+        assert locked() == before + 1
+        assert 'db_errors_total{operation="SELECT",error="locked"}' in TestClient(api.app).get("/metrics").text
@@ -0,0 +1,161 @@
+"""
+On-demand profiler tests.
+"""
+
+import sys
+import os
+import time
+import pstats
+import sqlite3
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import pytest
+from fastapi.testclient import TestClient
+
+import api
+from agents.orchestrator import Orchestrator
+from core import llm, profiling, retrieval
+from core.profiling import PROFILER, Profiler, StackSampler, profile
+from migrate_db import SCHEMA_SQL
+
+ADMIN = {"Authorization": "Bearer s3cret"}
+
+
+@pytest.fixture
+def profiles(tmp_path, monkeypatch):
+    """The process-wide profiler, storing into a temp dir and re-reading its state on every call."""
+    monkeypatch.setattr(PROFILER, "directory", str(tmp_path / "profiles"))
+    monkeypatch.setattr(PROFILER, "poll_interval", 0.0)
+    monkeypatch.setattr(PROFILER, "_arm", None)
+    monkeypatch.setattr(PROFILER, "_arm_mtime", None)
+    yield PROFILER
+    PROFILER.disarm()
+
+
+def _busy(seconds):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        sum(i * i for i in range(200))
+
+
+class TestProfiler:
+    """Test arming, sampling and storage."""
+
+    def test_disabled_is_a_no_op(self, profiles):
+        """Test that an unarmed profiler returns the shared null context and stores nothing."""
+        assert profile("run", "r1") is profiling._NULL
+        assert profiles.armed() is None and profiles.list() == []
+
+    def test_sampler_collapsed_stacks(self):
+        """Test that the sampler records the sampled thread's stack, root first."""
+        import threading
+        sampler = StackSampler(threading.get_ident(), 0.001).start()
+        _busy(0.1)
+        sampler.stop()
+        assert sampler.samples > 10
+        lines = sampler.collapsed().splitlines()
+        assert all(line.rsplit(" ", 1)[1].isdigit() for line in lines)
+        assert any("_busy (test_profiling.py" in line for line in lines)
+        assert sum(int(line.rsplit(" ", 1)[1]) for line in lines) == sampler.samples
+
+    def test_profiles_next_n_then_disarms(self, profiles):
+        """Test that exactly ``count`` blocks are profiled, keyed as given, and the arming then ends."""
+        profiles.arm("run", 2, interval_ms=1)
+        assert profile("request") is profiling._NULL  # Armed for runs only
+        for key in ("run-a", "run-b", "run-c"):
+            with profile("run", key, note=key):
+                _busy(0.03)
+        stored = {p["key"]: p for p in profiles.list()}
+        assert set(stored) == {"run-a", "run-b"}
+        assert stored["run-a"]["format"] == "collapsed" and stored["run-a"]["samples"] > 0
+        assert stored["run-a"]["note"] == "run-a" and stored["run-a"]["duration_ms"] >= 30
+        assert "_busy" in open(profiles.path("run-a")).read()
+        assert profiles.armed() is None
+
+    def test_cprofile_mode(self, profiles):
+        """Test that mode "cprofile" stores a pstats file."""
+        profiles.arm("run", 1, mode="cprofile")
+        with profile("run", "run-p"):
+            _busy(0.01)
+        assert profiles.list()[0]["format"] == "pstats"
+        stats = pstats.Stats(profiles.path("run-p"))
+        assert any(func[2] == "_busy" for func in stats.stats)
+
+    def test_cprofile_sessions_serialized_per_thread(self, profiles):
+        """Test that a cProfile claim while one is active on the thread is skipped, keeping its slot."""
+        profiles.arm("request", 2, mode="cprofile")
+        with profile("request", "outer"):
+            # A concurrent request on the same event loop thread
+            assert profile("request", "inner") is profiling._NULL
+            assert profiles.armed()["used"] == 1
+        with profile("request", "next"):
+            _busy(0.01)
+        assert {p["key"] for p in profiles.list()} == {"outer", "next"}
+
+    def test_slots_shared_between_workers(self, profiles):
+        """Test that processes sharing PROFILE_DIR claim the armed slots only once between them."""
+        other = Profiler(profiles.directory, poll_interval=0.0)
+        profiles.arm("request", 3)
+        claims = [p.claim("request") for p in (profiles, other, other, profiles, other)]
+        assert sum(c is not None for c in claims) == 3
+
+    def test_retention(self, profiles, monkeypatch):
+        """Test that only the newest PROFILE_KEEP profiles are kept."""
+        monkeypatch.setattr(profiles, "keep", 2)
+        for i in range(4):
+            profiles.save(f"k{i}", {"started_at": i}, collapsed="a;b 1\n")
+        assert [p["key"] for p in profiles.list()] == ["k3", "k2"]
+        assert profiles.path("k0") is None
+
+    def test_invalid_arming(self, profiles):
+        """Test that unknown targets and modes are rejected."""
+        with pytest.raises(ValueError):
+            profiles.arm("everything", 1)
+        with pytest.raises(ValueError):
+            profiles.arm("run", 1, mode="perf")
+
+
+class TestRunProfiling:
+    """Test profiling orchestration runs."""
+
+    def test_run_profile_keyed_by_run_id(self, profiles, tmp_path, monkeypatch):
+        """Test that an armed orchestration run stores a profile under its run_id."""
+        path = str(tmp_path / "runs.db")
+        conn = sqlite3.connect(path)
+        conn.executescript(SCHEMA_SQL)
+        conn.close()
+        monkeypatch.setattr(retrieval, "RAG_RETRIEVAL_ENABLED", False)
+        profiles.arm("run", 1, interval_ms=1)
+        with llm.override_chat_json(lambda system, user, model=None: ("{}", 0, (0, 0))):
+            run_id = Orchestrator(path).step()["run_id"]
+        meta = profiles.list()[0]
+        assert meta["key"] == run_id and meta["target"] == "run"
+
+
+class TestAdminEndpoints:
+    """Test the admin profiling endpoints."""
+
+    def test_arm_list_and_download(self, profiles, monkeypatch):
+        """Test auth, arming request profiling, and downloading the stored collapsed stacks."""
+        client = TestClient(api.app)
+        monkeypatch.setattr(api, "ADMIN_TOKEN", "")
+        assert client.post("/admin/profiling").status_code == 403
+        monkeypatch.setattr(api, "ADMIN_TOKEN", "s3cret")
+        assert client.get("/admin/profiling", headers={"Authorization": "Bearer nope"}).status_code == 401
+        assert client.post("/admin/profiling?target=all", headers=ADMIN).status_code == 400
+
+        response = client.post("/admin/profiling?target=request&count=1&interval_ms=1", headers=ADMIN)
+        assert response.status_code == 200
+        assert response.json()["armed"]["target"] == "request"
+        client.get("/admin/profiling", headers=ADMIN)  # Admin routes are never profiled
+        assert client.get("/health").status_code == 200
+
+        body = client.get("/admin/profiling", headers=ADMIN).json()
+        assert body["armed"] is None
+        [meta] = body["profiles"]
+        assert meta["path"] == "/health" and meta["method"] == "GET"
+        download = client.get(f"/admin/profiles/{meta['key']}", headers=ADMIN)
+        assert download.status_code == 200 and download.headers["content-type"].startswith("text/plain")
+        assert client.get("/admin/profiles/..%2Farmed", headers=ADMIN).status_code == 404
+        assert client.get("/admin/profiles/missing", headers=ADMIN).status_code == 404
+        assert client.post("/admin/profiling/stop", headers=ADMIN).json() == {"status": "disarmed"}
@@ -0,0 +1,152 @@
+"""
+SQLite statement statistics and slow-query log tests.
+"""
+
+import sys
+import os
+import logging
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import pytest
+from fastapi.testclient import TestClient
+
+import api
+from core.database import connect
+from core.metrics import DB_QUERY_LATENCY
+from core.query_stats import QUERY_STATS, QueryStats, fingerprint
+
+
+@pytest.fixture
+def stats():
+    """The process-wide statistics, emptied for the test."""
+    QUERY_STATS.reset()
+    yield QUERY_STATS
+    QUERY_STATS.reset()
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = connect(str(tmp_path / "q.db"))
+    conn.execute("CREATE TABLE items (id INTEGER PRIMARY KEY, sku TEXT, price REAL)")
+    conn.execute("CREATE INDEX idx_items_sku ON items(sku)")
+    conn.executemany("INSERT INTO items(sku, price) VALUES (?, ?)", [(f"SKU-{i}", i * 1.5) for i in range(200)])
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+def _entry(report, prefix):
+    return next(q for q in report["queries"] if q["fingerprint"].startswith(prefix))
+
+
+class TestFingerprint:
+    """Test statement normalization."""
+
+    def test_literals_and_in_lists_collapse(self):
+        """Test that literals, IN-list lengths, comments and whitespace do not split fingerprints."""
+        a = fingerprint("SELECT * FROM products WHERE sku IN (?,?,?) AND is_active=1 -- dashboard")
+        b = fingerprint("SELECT *\n  FROM products\n WHERE sku IN (?, ?) AND is_active=0")
+        assert a == b == "SELECT * FROM products WHERE sku IN (...) AND is_active=?"
+        assert fingerprint("SELECT name FROM t WHERE name='o''brien' LIMIT 20") == "SELECT name FROM t WHERE name=? LIMIT ?"
+        assert fingerprint("SELECT pe1.sku FROM price_events pe1") == "SELECT pe1.sku FROM price_events pe1"
+        assert fingerprint("INSERT INTO t(a, b) VALUES (?, ?), (?, ?)") == "INSERT INTO t(a, b) VALUES (...)"
+
+
+class TestQueryStats:
+    """Test per-fingerprint statistics recorded through InstrumentedConnection."""
+
+    def test_select_includes_fetch_and_rows(self, stats, conn):
+        """Test that SELECTs are recorded once fetched, with row counts, plans and index use."""
+        for limit in (10, 20, 30):
+            conn.execute(f"SELECT sku, price FROM items WHERE price > 1 LIMIT {limit}").fetchall()
+        conn.execute("SELECT price FROM items WHERE sku IN (?, ?)", ("SKU-1", "SKU-2")).fetchall()
+        report = stats.report()
+
+        scan = _entry(report, "SELECT sku, price FROM items")
+        assert scan["calls"] == 3 and scan["rows"] == 60
+        assert scan["full_scan"] is True and scan["plan"]
+        assert scan["p50_ms"] is not None and scan["max_ms"] >= scan["mean_ms"]
+
+        lookup = _entry(report, "SELECT price FROM items WHERE sku IN (...)")
+        assert lookup["rows"] == 2 and lookup["full_scan"] is False
+        assert _entry(report, "INSERT INTO items")["calls"] == 1  # executemany: one entry, no plan
+        assert report["queries"] == sorted(report["queries"], key=lambda q: q["total_ms"], reverse=True)
+
+    def test_unfetched_cursor_recorded_on_next_statement(self, stats, conn):
+        """Test that a partially consumed SELECT is still recorded."""
+        cur = conn.cursor()
+        cur.execute("SELECT sku FROM items").fetchone()
+        cur.execute("SELECT COUNT(*) FROM items").fetchone()
+        report = stats.report()
+        assert _entry(report, "SELECT sku FROM items")["rows"] == 1
+
+    def test_slow_log_with_plan(self, stats, conn, monkeypatch, caplog):
+        """Test that statements over the threshold are logged with their plan."""
+        monkeypatch.setattr(stats, "slow_ms", 0.0)
+        with caplog.at_level(logging.WARNING, logger="core.query_stats"):
+            conn.execute("SELECT * FROM items WHERE price > ?", (10,)).fetchall()
+        slow = stats.report()["slow_queries"]
+        entry = next(s for s in slow if s["fingerprint"] == "SELECT * FROM items WHERE price > ?")
+        assert entry["rows"] == 193 and entry["full_scan"] is True
+        assert any("Slow query" in r.message and "SCAN items" in r.message for r in caplog.records)
+
+    def test_plan_captured_once_per_fingerprint(self, stats, conn, monkeypatch):
+        """Test that repeated slow executions reuse the captured plan instead of running EXPLAIN again."""
+        import core.query_stats
+        explain = core.query_stats.explain
+        calls = []
+
+        def counting_explain(*args):
+            calls.append(args[1])
+            return explain(*args)
+        monkeypatch.setattr(core.query_stats, "explain", counting_explain)
+        monkeypatch.setattr(stats, "slow_ms", 0.0)
+        for _ in range(3):
+            conn.execute("SELECT * FROM items WHERE price > ?", (10,)).fetchall()
+        assert calls.count("SELECT * FROM items WHERE price > ?") == 1
+        assert all(s["plan"] for s in stats.report()["slow_queries"])
+
+    def test_commits_of_with_blocks_recorded(self, stats, conn):
+        """Test that commits made by leaving a ``with conn:`` block are timed like explicit ones."""
+        def histogram_commits():
+            return sum(v[-1] for k, v in DB_QUERY_LATENCY.snapshot()["samples"] if k == ["COMMIT"])
+        commits = histogram_commits()
+        stats.reset()  # Drop the fixture's own commit
+        with conn:
+            conn.execute("UPDATE items SET price = price + 1 WHERE sku = 'SKU-1'")
+        with conn:
+            pass  # Nothing to commit: not recorded
+        with pytest.raises(RuntimeError), conn:
+            conn.execute("UPDATE items SET price = -1")
+            raise RuntimeError("rolled back")
+        assert _entry(stats.report(), "COMMIT")["calls"] == 1
+        assert histogram_commits() == commits + 1
+        assert conn.execute("SELECT COUNT(*) FROM items WHERE price = -1").fetchone()[0] == 0
+
+    def test_fingerprint_bound(self):
+        """Test that fingerprints beyond the bound aggregate under <other>."""
+        qs = QueryStats(slow_ms=1e9, max_fingerprints=2)
+        for table in ("a", "b", "c", "d"):
+            qs.record(None, f"SELECT * FROM {table}", (), 0.001)
+        report = qs.report()
+        assert report["fingerprints"] == 3
+        assert _entry(report, "<other>")["calls"] == 2
+
+
+class TestAdminEndpoint:
+    """Test the admin query report endpoint."""
+
+    def test_requires_admin_token(self, stats, conn, monkeypatch):
+        """Test 403 without a configured token, 401 with a wrong one and the report with the right one."""
+        client = TestClient(api.app)
+        monkeypatch.setattr(api, "ADMIN_TOKEN", "")
+        assert client.get("/admin/queries").status_code == 403
+        monkeypatch.setattr(api, "ADMIN_TOKEN", "s3cret")
+        assert client.get("/admin/queries", headers={"Authorization": "Bearer nope"}).status_code == 401
+        conn.execute("SELECT COUNT(*) FROM items").fetchone()
+        response = client.get("/admin/queries?limit=5&order_by=calls", headers={"Authorization": "Bearer s3cret"})
+        assert response.status_code == 200
+        body = response.json()
+        assert 0 < len(body["queries"]) <= 5 and body["fingerprints"] >= len(body["queries"])
+        assert client.get("/admin/queries?order_by=bogus", headers={"Authorization": "Bearer s3cret"}).status_code == 400
+        assert client.post("/admin/queries/reset", headers={"Authorization": "Bearer s3cret"}).status_code == 200
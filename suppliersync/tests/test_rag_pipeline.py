@@ -0,0 +1,50 @@
+"""
+RAG ingestion pipeline tests.
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import pytest
+
+pytest.importorskip("langchain")
+pytest.importorskip("langchain_community")
+
+from core.rag_pipeline import ingest, iter_batches
+
+
+class _FakeCollection:
+    def __init__(self):
+        self.batches = []
+
+    def upsert(self, ids, embeddings, documents, metadatas):
+        assert len(ids) == len(embeddings) == len(documents) == len(metadatas)
+        self.batches.append(ids)
+
+
+class TestRAGPipeline:
+    """Test the streaming load -> split -> embed -> upsert pipeline."""
+
+    def test_batches_are_bounded(self):
+        """Test that per-file chunk lists are re-batched to a fixed size."""
+        split = [("a", [("a:0", "x", {})] * 5), ("b", [("b:0", "y", {})] * 4)]
+        assert [len(b) for b in iter_batches(split, batch_size=4)] == [4, 4, 1]
+
+    def test_ingest_streams_all_chunks(self, tmp_path):
+        """Test that every chunk is embedded and upserted in batches, with stable ids."""
+        for name in ("a.txt", "b.txt"):
+            (tmp_path / name).write_text(" ".join(f"word{i}" for i in range(500)))
+        files = {"a.txt": "a" * 64, "b.txt": "b" * 64}
+        collection = _FakeCollection()
+
+        chunk_ids, stats = ingest(str(tmp_path), files, collection, lambda texts: [[1.0]] * len(texts),
+                                  chunk_size=200, chunk_overlap=20, workers=0, batch_size=7)
+
+        total = sum(len(ids) for ids in chunk_ids.values())
+        assert set(chunk_ids) == {"a.txt", "b.txt"}
+        assert chunk_ids["a.txt"][0] == "a.txt:" + "a" * 16 + ":0"
+        assert all(len(batch) <= 7 for batch in collection.batches)
+        assert sum(len(batch) for batch in collection.batches) == total
+        assert stats.documents == 2
+        assert stats.chunks == stats.embeddings == stats.upserted == total
@@ -0,0 +1,131 @@
+"""
+Hot-path record type tests.
+"""
+
+import sys
+import os
+import json
+import sqlite3
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import pytest
+
+from agents.orchestrator import Orchestrator
+from core import llm, retrieval
+from core.records import (
+    CATALOG_SELECT_SQL, CX_ACTIONS, PRICE_CHANGES, SUPPLIER_UPDATES, Catalog, CatalogRow, context_json, validate_items,
+)
+from core.types import CXAction, PriceChange, SupplierUpdate
+from migrate_db import SCHEMA_SQL
+
+ROWS = [
+    ("SKU-1", "Widget \"Pro\"", "Widgets", 10.0, 25.5),
+    ("SKU-2", "Café mug ☕", None, 2, float("nan")),
+    ("SKU-3", None, "Widgets", None, float("inf")),
+    ("SKU-4", "Tab\tand\nnewline", "Gadgets", 1e-7, 12345678.9),
+]
+EXTRA = {"supplier_updates": [{"sku": "SKU-1", "field": "name", "new_value": 1.0, "reason": None}],
+         "reference_docs": {"category:Widgets": ["Min margin 5%.\nNo MAP.", "ümläut"]}}
+
+
+def _dicts(rows):
+    return [dict(zip(CatalogRow._fields, row)) for row in rows]
+
+
+class TestCatalog:
+    """Test the columnar catalog."""
+
+    @pytest.mark.parametrize("indent", [None, 2])
+    @pytest.mark.parametrize("extra", [{}, EXTRA])
+    def test_json_identical_to_dumps(self, indent, extra):
+        """Test that contexts match json.dumps of the row dicts byte for byte."""
+        catalog = Catalog.from_rows(ROWS)
+        expected = json.dumps({"catalog": _dicts(ROWS), **extra}, indent=indent)
+        assert context_json(catalog, extra, indent) == expected
+        assert context_json(Catalog(), extra, indent) == json.dumps({"catalog": [], **extra}, indent=indent)
+        assert catalog.to_json() == json.dumps(_dicts(ROWS))
+
+    def test_rows_select_and_shared_categories(self):
+        """Test row iteration, SKU selection and that repeated categories share one string."""
+        rows = [(f"SKU-{i}", "n", "".join(["Wid", "gets"]), 1.0, 2.0) for i in range(3)]
+        catalog = Catalog.from_rows(rows)
+        assert len(catalog) == 3 and list(catalog) == [CatalogRow(*r) for r in rows]
+        assert catalog.category[0] is catalog.category[2]
+        selected = catalog.select(["SKU-2", "SKU-0", "missing"])
+        assert set(selected) == {"SKU-0", "SKU-2"} and selected["SKU-2"].retail_price == 2.0
+
+    def test_from_cursor(self, tmp_path):
+        """Test fetching a catalog from the active products."""
+        conn = sqlite3.connect(str(tmp_path / "c.db"))
+        conn.executescript(SCHEMA_SQL)
+        conn.executemany("INSERT INTO products(sku, name, category, wholesale_price, retail_price, is_active) "
+                         "VALUES (?,?,?,?,?,?)", [("A", "a", "X", 1.0, 2.0, 1), ("B", "b", "X", 1.0, 2.0, 0)])
+        catalog = Catalog.from_cursor(conn.execute(CATALOG_SELECT_SQL))
+        assert catalog.sku == ("A",) and catalog.wholesale_price == (1.0,)
+
+
+class TestValidateItems:
+    """Test bulk validation of agent items."""
+
+    @pytest.mark.parametrize("adapter,model,defaults,raw", [
+        (PRICE_CHANGES, PriceChange, {"reason": None},
+         [{"sku": "A", "new_price": 30, "extra": 1}, {"sku": "B", "new_price": -1}, {"sku": 7, "new_price": 2},
+          "junk", {"reason": "r", "new_price": "5.5", "sku": "C"}]),
+        (SUPPLIER_UPDATES, SupplierUpdate, {"reason": None},
+         [{"sku": "A", "field": "wholesale_price", "new_value": "11"}, {"sku": "A", "field": "sku", "new_value": 1},
+          {"sku": "B", "field": "name", "new_value": 11}]),
+        (CX_ACTIONS, CXAction, None,
+         [{"sku": "A", "action": "update_description", "details": "sizing"}, {"sku": "B", "action": "x"}]),
+    ])
+    def test_matches_per_item_models(self, adapter, model, defaults, raw):
+        """Test that bulk validation keeps exactly the items (and dumps) the per-item models produced."""
+        expected = []
+        for r in raw:
+            try:
+                expected.append(model(**r).model_dump())
+            except Exception:
+                continue
+        items = validate_items(adapter, raw, defaults)
+        assert items == expected
+        assert [list(i) for i in items] == [list(e) for e in expected]  # Same key order in prompts
+
+    def test_non_list_yields_nothing(self):
+        """Test that a missing list (e.g. the response dict itself) yields no items."""
+        assert validate_items(PRICE_CHANGES, {"sku": "A", "new_price": 1}) == []
+        assert validate_items(PRICE_CHANGES, None) == []
+
+
+class TestOrchestratorContext:
+    """Test that orchestrator prompts are unchanged by the columnar catalog."""
+
+    def test_prompts_match_dict_serialization(self, tmp_path, monkeypatch):
+        """Test that every agent context equals json.dumps of the dict rows at that point of the run."""
+        path = str(tmp_path / "runs.db")
+        conn = sqlite3.connect(path)
+        conn.executescript(SCHEMA_SQL)
+        conn.execute("INSERT INTO suppliers(id, name) VALUES (1, 'Acme')")
+        conn.executemany(
+            "INSERT INTO products(sku, name, category, wholesale_price, retail_price, supplier_id) VALUES (?,?,?,?,?,1)",
+            [("SKU-1", "Widget", "Widgets", 10.0, 25.0), ("SKU-2", "Café", None, 20.0, 40.0)],
+        )
+        conn.commit()
+        monkeypatch.setattr(retrieval, "RAG_RETRIEVAL_ENABLED", False)
+        update = {"sku": "SKU-1", "field": "wholesale_price", "new_value": 11.0, "reason": None}
+        responses = iter([{"updates": [update]}, {"prices": [{"sku": "SKU-2", "new_price": 45.0}]}, {"actions": []}])
+        prompts = []
+
+        def model(system, user, model=None):
+            prompts.append(user.split("CONTEXT:\n", 1)[1])
+            return json.dumps(next(responses)), 0, (0, 0)
+
+        with llm.override_chat_json(model):
+            result = Orchestrator(path).step()
+        rows = [("SKU-1", "Widget", "Widgets", 10.0, 25.0), ("SKU-2", "Café", None, 20.0, 40.0)]
+        after_supplier = [rows[0][:3] + (11.0, 25.0), rows[1]]
+        after_prices = [after_supplier[0], rows[1][:4] + (45.0,)]
+        assert prompts == [
+            json.dumps({"catalog": _dicts(rows)}, indent=2),
+            json.dumps({"catalog": _dicts(after_supplier), "supplier_updates": [update]}),
+            json.dumps({"catalog": _dicts(after_prices)}),
+        ]
+        assert [p["sku"] for p in result["approved_prices"]] == ["SKU-2"]
@@ -0,0 +1,107 @@
+"""
+Run replay tests.
+"""
+
+import sys
+import os
+import json
+import shutil
+import sqlite3
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import pytest
+from fastapi.testclient import TestClient
+
+import api
+from agents.orchestrator import Orchestrator
+from agents.replay import replay_run
+from core import catalog_snapshot, context_cache, llm, retrieval
+from core.metrics import AGENT_COST, AGENT_LATENCY, AGENT_TOKENS
+from migrate_db import SCHEMA_SQL
+
+RESPONSES = {
+    "supplier": {"updates": [{"sku": "SKU-1", "field": "wholesale_price", "new_value": 11.0}]},
+    "price": {"prices": [{"sku": "SKU-1", "new_price": 30.0}, {"sku": "SKU-2", "new_price": 1.0}]},
+    "cx": {"actions": [{"sku": "SKU-2", "action": "update_description", "details": "clarify sizing"}]},
+}
+
+
+def _recorded_model(system, user, model=None):
+    kind = next(k for k in RESPONSES if k in system.lower())
+    return json.dumps(RESPONSES[kind]), 250, (100, 20)
+
+
+@pytest.fixture
+def recorded_run(tmp_path, monkeypatch):
+    """A database with one recorded run plus a snapshot taken just before it."""
+    path = str(tmp_path / "runs.db")
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA_SQL)
+    conn.execute("INSERT INTO suppliers(id, name) VALUES (1, 'Acme')")
+    conn.executemany(
+        "INSERT INTO products(sku, name, category, wholesale_price, retail_price, supplier_id) VALUES (?,?,?,?,?,1)",
+        [("SKU-1", "Widget", "Widgets", 10.0, 25.0), ("SKU-2", "Gadget", "Gadgets", 20.0, 40.0)],
+    )
+    conn.commit()
+    conn.close()
+    snapshot = str(tmp_path / "before.db")
+    shutil.copy(path, snapshot)
+    monkeypatch.setattr(retrieval, "RAG_RETRIEVAL_ENABLED", False)
+    with llm.override_chat_json(_recorded_model):
+        run_id = Orchestrator(path).step()["run_id"]
+    return path, snapshot, run_id
+
+
+class TestReplay:
+    """Test replaying recorded runs."""
+
+    def test_replay_against_snapshot_is_identical(self, recorded_run):
+        """Test that replaying on the pre-run snapshot reproduces every write."""
+        path, snapshot, run_id = recorded_run
+        metrics = [family.snapshot() for family in (AGENT_LATENCY, AGENT_TOKENS, AGENT_COST)]
+        report = replay_run(path, run_id, snapshot)
+        assert report["identical"]
+        # Replayed LLM calls leave the agent latency, token and cost metrics alone
+        assert [family.snapshot() for family in (AGENT_LATENCY, AGENT_TOKENS, AGENT_COST)] == metrics
+        assert [c["prompt_matches"] for c in report["llm_calls"]] == [True, True, True]
+        assert (report["approved"]["replay"], report["rejected"]["replay"]) == (1, 1)
+        assert report["writes"]["cx_events"]["identical"]
+        paths = {st["path"] for st in report["timings"]["stages"]}
+        assert {"step", "step/enforce_policy", "step/buyer_agent/parse"} <= paths
+        assert all(st["original_ms"] is not None for st in report["timings"]["stages"])
+        # The deleted scratch database leaves nothing in the process-wide caches
+        assert not any("replay-" in key for key in [*context_cache._caches, *catalog_snapshot._stores])
+
+        # The live database is untouched: only the original run's rows exist
+        conn = sqlite3.connect(path)
+        assert conn.execute("SELECT COUNT(DISTINCT run_id) FROM price_events").fetchone()[0] == 1
+        conn.close()
+
+    def test_replay_against_current_state_reports_differences(self, recorded_run):
+        """Test that state drift (the run's own writes) shows up in the diff."""
+        path, _, run_id = recorded_run
+        report = replay_run(path, run_id)
+        assert not report["identical"]
+        assert report["approved"]["identical"]  # Same decisions...
+        diff = report["writes"]["price_events"]  # ...but a different previous price
+        assert diff["missing"][0]["prev_price"] == 25.0 and diff["extra"][0]["prev_price"] == 30.0
+        assert report["llm_calls"][0]["prompt_matches"] is False
+
+    def test_unknown_run(self, recorded_run):
+        """Test that runs without agent logs are rejected."""
+        with pytest.raises(LookupError):
+            replay_run(recorded_run[0], "no-such-run")
+
+    def test_replay_endpoint(self, recorded_run, monkeypatch):
+        """Test POST /api/runs/{run_id}/replay, its admin token check and its 404."""
+        path, _, run_id = recorded_run
+        monkeypatch.setattr(api, "DB_PATH", path)
+        monkeypatch.setattr(api, "ADMIN_TOKEN", "s3cret")
+        client = TestClient(api.app)
+        assert client.post(f"/api/runs/{run_id}/replay").status_code == 401
+        admin = {"Authorization": "Bearer s3cret"}
+        response = client.post(f"/api/runs/{run_id}/replay", headers=admin)
+        assert response.status_code == 200
+        body = response.json()
+        assert body["run_id"] == run_id and body["approved"]["original"] == 1
+        assert client.post("/api/runs/no-such-run/replay", headers=admin).status_code == 404
@@ -0,0 +1,146 @@
+"""
+Retrieval stage tests.
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import pytest
+from core import embeddings
+from core.retrieval import LRUCache, Retriever, category_query
+from core.lexical_index import LexicalIndex, fts_path, match_expression
+
+
+class _FakeEmbedder:
+    def embed(self, texts):
+        return [[float(len(t))] for t in texts]
+
+
+class _FakeCollection:
+    def __init__(self):
+        self.calls = []
+
+    def query(self, query_embeddings, n_results, include):
+        self.calls.append(len(query_embeddings))
+        return {"documents": [["shared policy", f"doc {v[0]:.0f}"][:n_results] for v in query_embeddings]}
+
+
+@pytest.fixture
+def retriever(tmp_path):
+    (tmp_path / "status.json").write_text("{}")
+    previous = embeddings._embedder
+    embeddings.set_embedder(_FakeEmbedder())
+    r = Retriever(persist=str(tmp_path), k=2)
+    r._collection = _FakeCollection()
+    r._collection_version = r.version()
+    yield r
+    embeddings.set_embedder(previous)
+
+
+class TestLRUCache:
+    """Test the LRU cache."""
+
+    def test_evicts_least_recently_used(self):
+        """Test that the least recently used key is evicted first."""
+        cache = LRUCache(maxsize=2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        assert cache.get("a") == 1
+        cache.put("c", 3)
+        assert cache.get("b") is None
+        assert cache.get("a") == 1 and cache.get("c") == 3
+
+
+class TestRetriever:
+    """Test batched, cached retrieval."""
+
+    def test_no_vectorstore_returns_nothing(self, tmp_path):
+        """Test that retrieval is a no-op when no vectorstore has been built."""
+        assert Retriever(persist=str(tmp_path / "missing")).context_for(["Widgets"]) == {}
+
+    def test_one_batched_query_per_run(self, retriever):
+        """Test that all groups are searched in one call and repeats hit the cache."""
+        context = retriever.context_for(["Widgets", "Gizmos and gear", "Widgets"], ["Acme"])
+        assert retriever._collection.calls == [3]
+        assert set(context) == {"category:Gizmos and gear", "category:Widgets", "supplier:Acme"}
+        # Snippets are not repeated across groups
+        assert sum(s == "shared policy" for snippets in context.values() for s in snippets) == 1
+
+        retriever.context_for(["Widgets", "Gizmos and gear"], ["Acme"])
+        assert retriever._collection.calls == [3]
+
+    def test_cache_keyed_on_vectorstore_version(self, retriever):
+        """Test that a rebuild (new status manifest) invalidates cached results."""
+        retriever.retrieve([category_query("Widgets")])
+        stat = os.stat(os.path.join(retriever.persist, "status.json"))
+        os.utime(os.path.join(retriever.persist, "status.json"), ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+        retriever._collection_version = retriever.version()
+        retriever.retrieve([category_query("Widgets")])
+        assert retriever._collection.calls == [1, 1]
+
+
+class TestHybridRetrieval:
+    """Test the BM25 prefilter and dense rerank."""
+
+    def test_match_expression_quotes_terms(self):
+        """Test that query terms are quoted and stopwords dropped."""
+        assert match_expression('Policy for "SKU-001" AND widgets') == '"policy" OR "sku" OR "001" OR "widgets"'
+        assert match_expression("the and of") == ""
+
+    def test_prefilter_then_rerank(self, tmp_path, retriever):
+        """Test that lexical candidates are reranked by vector similarity, with latency recorded."""
+        lexical = LexicalIndex(str(tmp_path / "fts.db"))
+        docs = {"c1": "widgets margin policy", "c2": "widgets returns policy long text", "c3": "gadgets only"}
+        vectors = {"c1": [1.0], "c2": [-1.0], "c3": [1.0]}
+        lexical.add(list(docs), list(docs.values()))
+
+        class Collection(_FakeCollection):
+            def get(self, ids):
+                return {"ids": ids, "embeddings": [vectors[i] for i in ids], "documents": [docs[i] for i in ids]}
+
+        retriever._collection = Collection()
+        retriever._lexical = lexical
+        found = retriever.retrieve(["widgets policy"])
+        # Only lexical matches are candidates; the query vector ([14.0]) points towards c1
+        assert found["widgets policy"] == ["widgets margin policy", "widgets returns policy long text"]
+        assert retriever._collection.calls == []
+        assert set(retriever.latency.snapshot()) == {"embed", "lexical", "dense"}
+        lexical.close()
+
+    def test_templated_queries_prefilter_on_key_term(self, tmp_path, retriever):
+        """Test that template words match nothing lexically, and a category without hits falls back to dense."""
+        lexical = LexicalIndex(str(tmp_path / "fts.db"))
+        docs = {"c1": "Pricing policy for all products", "c2": "Product specifications and quality requirements",
+                "c3": "Widgets ship in cartons of twelve"}
+        lexical.add(list(docs), list(docs.values()))
+
+        class Collection(_FakeCollection):
+            def get(self, ids):
+                return {"ids": ids, "embeddings": [[1.0] for _ in ids], "documents": [docs[i] for i in ids]}
+
+        retriever._collection = Collection()
+        retriever._lexical = lexical
+        context = retriever.context_for(["Widgets", "Gizmos"])
+        assert context["category:Widgets"][0] == docs["c3"]
+        assert not {docs["c1"], docs["c2"]} & {s for snippets in context.values() for s in snippets}
+        # Widgets has one lexical hit (k=2) and Gizmos none: both are completed by one dense query
+        assert retriever._collection.calls == [2]
+        lexical.close()
+
+    def test_swap_keeps_index_open_for_inflight_search(self, retriever, monkeypatch):
+        """Test that a version switch closes the old lexical index only after searches using it release it."""
+        import sqlite3
+        import core.vector_index
+        monkeypatch.setattr(core.vector_index, "open_backend", lambda *args, **kwargs: _FakeCollection())
+        LexicalIndex(fts_path(retriever.persist, retriever.collection_name)).close()
+        _, old = retriever._get_collection("v1")
+        _, new = retriever._get_collection("v2")
+        assert new is not old
+        assert old.search("widgets", 1) == []  # Still open for the search that holds it
+        retriever._release(new)
+        retriever._release(old)
+        with pytest.raises(sqlite3.ProgrammingError):
+            old.search("widgets", 1)
+        assert new.search("widgets", 1) == []
+        new.close()
@@ -0,0 +1,221 @@
+"""
+Run span tracing tests.
+"""
+
+import sys
+import os
+import json
+import sqlite3
+import tracemalloc
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import pytest
+from fastapi.testclient import TestClient
+
+import api
+from core import memory_profile, retrieval
+from core.tracing import trace_run, span, save_trace, load_profile, ensure_spans_table
+from migrate_db import SCHEMA_SQL
+
+RESPONSES = {
+    "supplier": {"updates": [{"sku": "SKU-1", "field": "wholesale_price", "new_value": 11.0}]},
+    "buyer": {"prices": [{"sku": "SKU-1", "new_price": 30.0}, {"sku": "SKU-2", "new_price": 1.0}]},
+    "cx": {"actions": [{"sku": "SKU-2", "action": "update_description", "details": "clarify sizing"}]},
+}
+
+
+def _fake_chat(agent):
+    def chat_json(system, user, model=None):
+        return json.dumps(RESPONSES[agent]), 5, (100, 20)
+    return chat_json
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    path = str(tmp_path / "runs.db")
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA_SQL)
+    conn.execute("INSERT INTO suppliers(id, name) VALUES (1, 'Acme')")
+    conn.executemany(
+        "INSERT INTO products(sku, name, category, wholesale_price, retail_price, supplier_id) VALUES (?,?,?,?,?,1)",
+        [("SKU-1", "Widget", "Widgets", 10.0, 25.0), ("SKU-2", "Gadget", "Gadgets", 20.0, 40.0)],
+    )
+    conn.commit()
+    conn.close()
+    monkeypatch.setattr(retrieval, "RAG_RETRIEVAL_ENABLED", False)
+    for agent in ("supplier", "buyer", "cx"):
+        monkeypatch.setattr(f"agents.{agent}_agent.chat_json", _fake_chat(agent))
+    return path
+
+
+class TestTracing:
+    """Test span recording and persistence."""
+
+    def test_nested_spans_and_noop(self, tmp_path):
+        """Test that spans nest under the active trace and are no-ops outside one."""
+        with span("untraced") as s:
+            s.rows = 5  # Discarded
+
+        with trace_run("run-1") as trace:
+            with span("outer") as outer:
+                with span("inner") as inner:
+                    inner.rows = 3
+                    inner.bytes = 128
+                outer.rows = 1
+        assert [s.path for s in trace.spans] == ["outer", "outer/inner"]
+        assert trace.spans[1].parent == trace.spans[0].seq
+        assert trace.spans[0].duration_ms >= trace.spans[1].duration_ms >= 0
+
+        conn = sqlite3.connect(str(tmp_path / "spans.db"))
+        assert load_profile(conn, "run-1") is None
+        ensure_spans_table(conn)
+        save_trace(conn, trace)
+        profile = load_profile(conn, "run-1")
+        assert profile["total_ms"] == trace.spans[0].duration_ms
+        assert profile["spans"][1]["rows"] == 3 and profile["spans"][1]["bytes"] == 128
+        assert profile["stages"][0]["path"] == "outer"
+
+    def test_retention_drops_oldest_runs(self, tmp_path):
+        """Test that saving a trace deletes spans and memory sites beyond the most recent runs."""
+        conn = sqlite3.connect(str(tmp_path / "spans.db"))
+        ensure_spans_table(conn)
+        for n in range(4):
+            with trace_run(f"run-{n}") as trace:
+                with span("step"):
+                    with span("fetch"):
+                        pass
+            trace.memory_sites = [{"rank": 1, "site": "x.py:1", "stage": "step", "size_bytes": 1, "count": 1}]
+            save_trace(conn, trace, keep_runs=2)
+        assert [load_profile(conn, f"run-{n}") is not None for n in range(4)] == [False, False, True, True]
+        assert {r[0] for r in conn.execute("SELECT run_id FROM run_memory_sites")} == {"run-2", "run-3"}
+        save_trace(conn, trace, keep_runs=0)  # Unlimited
+        assert conn.execute("SELECT COUNT(*) FROM run_spans").fetchone()[0] == 6
+
+
+class TestRunProfile:
+    """Test per-run profiles recorded by the orchestrator."""
+
+    def test_orchestrator_records_stage_spans(self, db_path, monkeypatch):
+        """Test that a run's stages, agent sub-spans and row counts are served by the profile endpoint."""
+        from agents.orchestrator import Orchestrator
+        result = Orchestrator(db_path).step()
+
+        monkeypatch.setattr(api, "DB_PATH", db_path)
+        client = TestClient(api.app)
+        response = client.get(f"/api/runs/{result['run_id']}/profile")
+        assert response.status_code == 200
+        profile = response.json()
+        stages = {st["path"]: st for st in profile["stages"]}
+        assert stages["step/fetch_catalog"]["calls"] == 3
+        assert stages["step/fetch_catalog"]["rows"] == 6
+        assert stages["step/buyer_agent/llm"]["bytes"] > 0
+        assert stages["step/buyer_agent/parse"]["rows"] == 2
+        assert stages["step/enforce_policy"]["rows"] == 2
+        assert stages["step/serialize_context"]["calls"] == 3
+        assert "step/apply_price_changes/commit" in stages
+        assert profile["total_ms"] == stages["step"]["total_ms"]
+
+        assert client.get("/api/runs/unknown-run/profile").status_code == 404
+
+
+class TestMemoryProfile:
+    """Test tracemalloc memory profiling of runs (MEMORY_PROFILE)."""
+
+    def test_stage_net_and_peak(self, tmp_path):
+        """Test per-span net/peak figures, top sites and their persistence."""
+        with trace_run("run-m") as trace, memory_profile.memory_profile(trace, enabled=True):
+            with span("step"):
+                with span("build"):
+                    kept = [str(i) * 10 for i in range(20000)]
+                    with span("scratch"):
+                        scratch = bytearray(4_000_000)
+                        del scratch
+        assert not tracemalloc.is_tracing()
+        step, build, scratch = trace.spans
+        assert scratch.mem_peak_bytes > 3_900_000 and abs(scratch.mem_net_bytes) < 100_000
+        assert build.mem_peak_bytes >= scratch.mem_peak_bytes and build.mem_net_bytes > 1_000_000
+        assert step.mem_peak_bytes >= build.mem_peak_bytes
+        top = trace.memory_sites[0]
+        assert top["rank"] == 1 and top["site"].startswith(os.path.join("tests", "test_tracing.py"))
+        assert top["stage"] == "step/build" and top["size_bytes"] > 1_000_000
+        del kept
+
+        conn = sqlite3.connect(str(tmp_path / "spans.db"))
+        ensure_spans_table(conn)
+        save_trace(conn, trace)
+        profile = load_profile(conn, "run-m")
+        assert profile["spans"][2]["mem_peak_bytes"] == scratch.mem_peak_bytes
+        assert profile["memory_sites"][0]["site"] == top["site"]
+        assert {st["path"]: st for st in profile["stages"]}["step/build"]["mem_net_bytes"] == build.mem_net_bytes
+
+    def test_disabled_and_already_tracing(self):
+        """Test that runs are not profiled when disabled or when tracemalloc is already in use."""
+        with trace_run("run-off") as trace, memory_profile.memory_profile(trace, enabled=False) as tracker:
+            with span("step"):
+                pass
+        assert tracker is None and trace.spans[0].mem_peak_bytes is None and trace.memory_sites == []
+        tracemalloc.start()
+        try:
+            with trace_run("run-busy") as trace, memory_profile.memory_profile(trace, enabled=True) as tracker:
+                assert tracker is None
+            assert tracemalloc.is_tracing()
+        finally:
+            tracemalloc.stop()
+
+    def test_raw_traces_match_public_statistics(self, monkeypatch):
+        """Test that the private trace tuples grouped per line agree with Snapshot.statistics()."""
+        tracemalloc.start(1)
+        try:
+            kept = [str(i) * 10 for i in range(5000)]
+            snapshot = tracemalloc.take_snapshot()
+        finally:
+            tracemalloc.stop()
+        # Fails when a Python release changes tracemalloc's internals: the tracker then falls back
+        # to the (slower) public statistics, and this check needs updating
+        assert memory_profile._raw_traces(snapshot) is not None
+        public = {(stat.traceback[0].filename, stat.traceback[0].lineno): (stat.size, stat.count)
+                  for stat in snapshot.statistics("lineno")}
+        assert memory_profile._line_totals(snapshot) == public
+        monkeypatch.setattr(memory_profile, "_raw_traces", lambda snapshot: None)
+        assert memory_profile._line_totals(snapshot) == public
+        del kept
+
+    def test_schema_files_create_profile_tables(self):
+        """Test that db/schema.sql creates run_spans and run_memory_sites as migrate_db does."""
+        with open(os.path.join(os.path.dirname(__file__), '..', 'db', 'schema.sql')) as f:
+            schema = f.read()
+        layouts = []
+        for script in (schema, SCHEMA_SQL):
+            conn = sqlite3.connect(":memory:")
+            conn.executescript(script)
+            layouts.append({table: [tuple(row) for row in conn.execute(f"PRAGMA table_info({table})")] +
+                            [row[1] for row in conn.execute(f"PRAGMA index_list({table})")]
+                            for table in ("run_spans", "run_memory_sites")})
+            conn.close()
+        assert layouts[0] == layouts[1] and layouts[0]["run_spans"]
+
+    def test_old_spans_table_migrated(self, tmp_path):
+        """Test that run_spans tables without the memory columns are upgraded."""
+        conn = sqlite3.connect(str(tmp_path / "old.db"))
+        conn.execute("CREATE TABLE run_spans (id INTEGER PRIMARY KEY, run_id TEXT NOT NULL, seq INTEGER NOT NULL, "
+                     "parent INTEGER, name TEXT NOT NULL, path TEXT NOT NULL, start_ms REAL, duration_ms REAL, "
+                     "rows INTEGER, bytes INTEGER)")
+        ensure_spans_table(conn)
+        ensure_spans_table(conn)
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(run_spans)")]
+        assert columns[-2:] == ["mem_net_bytes", "mem_peak_bytes"]
+
+    def test_orchestrator_memory_profile(self, db_path, monkeypatch):
+        """Test that MEMORY_PROFILE runs serve per-stage memory and top sites from the profile endpoint."""
+        from agents.orchestrator import Orchestrator
+        monkeypatch.setattr(memory_profile, "MEMORY_PROFILE", True)
+        result = Orchestrator(db_path).step()
+        assert not tracemalloc.is_tracing()
+
+        monkeypatch.setattr(api, "DB_PATH", db_path)
+        profile = TestClient(api.app).get(f"/api/runs/{result['run_id']}/profile").json()
+        stages = {st["path"]: st for st in profile["stages"]}
+        assert stages["step"]["mem_peak_bytes"] > 0
+        assert stages["step/fetch_catalog"]["mem_peak_bytes"] is not None
+        assert 0 < len(profile["memory_sites"]) <= memory_profile.MEMORY_PROFILE_TOP_SITES
+        assert all(site["stage"].startswith("step") for site in profile["memory_sites"])
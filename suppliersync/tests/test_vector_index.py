@@ -0,0 +1,137 @@
+"""
+Vector index backend tests.
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from core.vector_index import ChromaBackend, NumpyIndex, VectorBackend
+
+
+def _corpus(n, dim=16, seed=0):
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((n, dim)).astype(np.float32)
+    ids = [f"doc-{i}" for i in range(n)]
+    return ids, vectors
+
+
+def _fill(index, ids, vectors):
+    index.upsert(ids, vectors.tolist(), [f"text {i}" for i in ids], [{"source": i} for i in ids])
+    index.save()
+
+
+class TestNumpyIndex:
+    """Test the memory-mapped NumPy index."""
+
+    def test_exact_top_k(self, tmp_path):
+        """Test that queries return the nearest vectors by cosine similarity, best first."""
+        ids, vectors = _corpus(200)
+        index = NumpyIndex(str(tmp_path / "idx"))
+        _fill(index, ids, vectors)
+
+        result = NumpyIndex(str(tmp_path / "idx")).query(vectors[[5, 17]].tolist(), n_results=3)
+        assert [hits[0] for hits in result["ids"]] == ["doc-5", "doc-17"]
+        assert result["documents"][0][0] == "text doc-5"
+        assert result["distances"][0] == sorted(result["distances"][0])
+        assert result["distances"][0][0] == pytest.approx(0.0, abs=1e-5)
+
+    def test_upsert_delete_and_reload(self, tmp_path):
+        """Test that changes are persisted and readers reopen a memory-mapped snapshot."""
+        ids, vectors = _corpus(10)
+        index = NumpyIndex(str(tmp_path / "idx"), dtype="float16", rerank_factor=0)
+        _fill(index, ids, vectors)
+        index.delete(["doc-0", "doc-1"])
+        index.upsert(["doc-2"], [vectors[9].tolist()], ["replaced"], [{"source": "x"}])
+        index.save()
+
+        reader = NumpyIndex(str(tmp_path / "idx"), dtype="float16")
+        assert reader.count() == 8
+        assert isinstance(reader._vectors, np.memmap)
+        assert reader._vectors.dtype == np.float16
+        assert set(reader.query([vectors[9].tolist()], n_results=2)["documents"][0]) == {"replaced", "text doc-9"}
+        assert len(os.listdir(tmp_path / "idx")) == 2
+
+    def test_ivf_matches_exact_search(self, tmp_path):
+        """Test that the IVF quantizer finds the same nearest neighbour for indexed vectors."""
+        ids, vectors = _corpus(2000)
+        index = NumpyIndex(str(tmp_path / "idx"), ivf_min_vectors=1000, nprobe=4)
+        _fill(index, ids, vectors)
+        assert index._centroids is not None
+
+        probes = [3, 500, 1999]
+        result = index.query(vectors[probes].tolist(), n_results=1)
+        assert [hits[0] for hits in result["ids"]] == [f"doc-{p}" for p in probes]
+
+
+class TestQuantizedIndex:
+    """Test int8/float16 storage with float32 rerank."""
+
+    def test_int8_storage_and_rerank(self, tmp_path):
+        """Test that int8 codes with per-vector scales plus rerank return exact neighbours."""
+        ids, vectors = _corpus(500, dim=32)
+        index = NumpyIndex(str(tmp_path / "idx"), dtype="int8", rerank_factor=4)
+        _fill(index, ids, vectors)
+
+        reader = NumpyIndex(str(tmp_path / "idx"), dtype="int8")
+        assert reader._vectors.dtype == np.int8
+        assert reader._scales.shape == (500,)
+        exact = NumpyIndex(str(tmp_path / "exact"))
+        _fill(exact, ids, vectors)
+        probes = vectors[:20] + vectors[20:40]
+        got = reader.query(probes.tolist(), n_results=5)
+        want = exact.query(probes.tolist(), n_results=5)
+        assert got["ids"] == want["ids"]
+        assert np.allclose(got["distances"], want["distances"], atol=1e-5)
+        stored = np.array(reader.get(["doc-7"])["embeddings"][0])
+        assert np.allclose(stored, vectors[7] / np.linalg.norm(vectors[7]), atol=1e-6)
+
+    def test_recall_report(self, tmp_path):
+        """Test that saving a quantized index reports recall@k and its footprint."""
+        ids, vectors = _corpus(300, dim=32)
+        index = NumpyIndex(str(tmp_path / "idx"), dtype="int8", rerank_factor=4)
+        _fill(index, ids, vectors)
+        assert index.recall["recall_reranked"] == 1.0
+        assert 0.5 < index.recall["recall_quantized"] <= 1.0
+        assert index.recall["index_bytes"] < index.recall["float32_bytes"] / 3
+
+        no_rerank = NumpyIndex(str(tmp_path / "small"), dtype="int8", rerank_factor=0)
+        _fill(no_rerank, ids, vectors)
+        assert no_rerank.recall["recall_reranked"] is None
+        assert not [f for f in os.listdir(tmp_path / "small") if f.startswith("full-")]
+
+
+class TestBackendParity:
+    """Test that both backends answer on the same distance scale."""
+
+    def test_chroma_reports_cosine_distances(self, tmp_path):
+        """Test that Chroma collections use the cosine space, so distances match NumpyIndex."""
+        pytest.importorskip("chromadb")
+        ids, vectors = _corpus(20)
+        vectors[3] *= 10.0  # Cosine distance ignores magnitude; l2 would not
+        numpy_index = NumpyIndex(str(tmp_path / "idx"))
+        _fill(numpy_index, ids, vectors)
+        chroma = ChromaBackend(str(tmp_path / "chroma"), "parity")
+        _fill(chroma, ids, vectors)
+
+        queries = vectors[[3, 8]].tolist()
+        expected = numpy_index.query(queries, n_results=5)
+        got = chroma.query(queries, n_results=5)
+        assert got["ids"] == expected["ids"]
+        for a, b in zip(got["distances"], expected["distances"]):
+            assert a == pytest.approx(b, abs=1e-4)
+        chroma.reset()
+        assert chroma.collection.metadata["hnsw:space"] == "cosine"
+
+    def test_incomplete_backend_rejected(self):
+        """Test that a backend missing part of the interface fails at construction, not on first use."""
+        class NoQuery(VectorBackend):
+            def count(self):
+                return 0
+
+        with pytest.raises(TypeError, match="query"):
+            NoQuery()